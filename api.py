@@ -1,35 +1,83 @@
 
 import os
+import sys
+import json
 import time
 import uuid
 import asyncio
 import shutil
 import logging
-from typing import Optional, List
+import subprocess
+from contextlib import asynccontextmanager
+from typing import Optional, List, Dict, Any
 from pathlib import Path
 
-from fastapi import FastAPI, BackgroundTasks, HTTPException, Body
+from email.utils import parsedate_to_datetime
+
+from fastapi import FastAPI, HTTPException, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from pydantic import BaseModel
 
 # Import modules
-from config.settings import TEMP_DIR, OUTPUT_DIR, ensure_directories
-from modules.downloader import download_single_video
-from modules.gemini_brain import get_perfect_fit_script
-from modules.voice import generate_voice_sync
-from modules.video_processor import (
-    resize_for_shorts, sync_audio_to_video, render_final_video,
-    prepare_avatar_with_chromakey, cleanup_temp_files
+# API process แค่ enqueue / รายงานสถานะ - งานหนักทั้งหมดรันใน worker.py
+from config.settings import (
+    OUTPUT_DIR, DEFAULT_OUTPUT_PROFILES, API_WORKERS, API_SPAWN_WORKERS,
+    BATCH_MAX_ITEMS, GC_INTERVAL_SECONDS, PROJECT_ROOT, ensure_directories
 )
-from moviepy.editor import VideoFileClip, AudioFileClip
-import google.generativeai as genai
+from modules.broker import JobBroker, QueueFullError, DuplicateJobError
+from modules.downloader import video_key
+from modules.jobs import job_fingerprint, result_available
+from modules.metrics import REGISTRY, render_merged
+from modules.retention import collect_garbage, mark_used
+from modules.checkpoints import prune_checkpoints
+from modules.voice import prune_tts_cache
+from modules.script_cache import prune_script_cache
+from modules.video_processor import resolve_output_profiles
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="AI Video Factory API")
+# Job broker (SQLite) - ใช้ร่วมกับ worker processes
+ensure_directories()
+broker = JobBroker()
+
+async def _gc_loop():
+    """เก็บกวาดสถานะงานหมดอายุ + output เกิน disk budget + checkpoint ที่ค้าง + cache เสียง / บท เป็นระยะ"""
+    while True:
+        try:
+            await asyncio.to_thread(collect_garbage, broker, OUTPUT_DIR)
+            await asyncio.to_thread(prune_checkpoints)
+            await asyncio.to_thread(prune_tts_cache)
+            await asyncio.to_thread(prune_script_cache)
+        except Exception as e:
+            logger.warning(f"GC error: {e}")
+        await asyncio.sleep(GC_INTERVAL_SECONDS)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Spawn worker processes + GC ตอน start (ปิด workers ได้ด้วย API_SPAWN_WORKERS=0)"""
+    gc_task = asyncio.create_task(_gc_loop())
+    worker_proc = None
+    if API_SPAWN_WORKERS and API_WORKERS > 0:
+        worker_proc = subprocess.Popen(
+            [sys.executable, str(PROJECT_ROOT / "worker.py"), "--workers", str(API_WORKERS)],
+            cwd=str(PROJECT_ROOT),
+        )
+        logger.info(f"Spawned {API_WORKERS} render workers (pid {worker_proc.pid})")
+    try:
+        yield
+    finally:
+        gc_task.cancel()
+        if worker_proc is not None:
+            worker_proc.terminate()
+            try:
+                worker_proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                worker_proc.kill()
+
+app = FastAPI(title="AI Video Factory API", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -40,14 +88,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory storage
-tasks = {}
-
 class VideoRequest(BaseModel):
     url: str
     custom_prompt: Optional[str] = None
     use_avatar: bool = True
     api_key: Optional[str] = None  # For Free mode
+    output_profiles: Optional[List[str]] = None  # e.g. ["master", "720p", "poster"]
+    hls: bool = False  # เล่นผ่าน HLS ได้ตั้งแต่ตอนที่ยัง render อยู่
+    force: bool = False  # True = render ใหม่แม้มีงานเดิมที่ input เหมือนกัน
+    refresh_script: bool = False  # True = เขียนบทใหม่ (ไม่ใช้บทจาก script cache)
 
 class TaskStatus(BaseModel):
     id: str
@@ -55,119 +104,334 @@ class TaskStatus(BaseModel):
     progress: int
     message: str
     result_file: Optional[str] = None
+    result_files: Optional[Dict[str, str]] = None  # profile name -> filename (hls = <dir>/index.m3u8)
+    hls_url: Optional[str] = None  # playlist URL (มีตั้งแต่เริ่ม render)
+    download: Optional[Dict[str, Any]] = None  # bytes, seconds, throughput (B/s), cached, stalls
+    queue_position: Optional[int] = None  # ลำดับในคิว (เฉพาะตอน pending)
     error: Optional[str] = None
+    url: Optional[str] = None  # งานย่อยของ batch
+    batch_id: Optional[str] = None
+    reused: bool = False  # ได้ผล/สถานะของงานเดิมที่ input เหมือนกัน
 
-def process_video_task(task_id: str, request: VideoRequest):
-    """Background task logic"""
-    try:
-        tasks[task_id]["status"] = "processing"
-        tasks[task_id]["progress"] = 10
-        tasks[task_id]["message"] = "Downloading video..."
-        
-        # 0. Setup API Key
-        if request.api_key:
-            genai.configure(api_key=request.api_key)
-        
-        ensure_directories()
-        
-        # 1. Download
-        video_path = download_single_video(request.url, TEMP_DIR)
-        if not video_path:
-            raise Exception("Download failed")
-            
-        tasks[task_id]["progress"] = 30
-        tasks[task_id]["message"] = "Analyzing video & generating script..."
-        
-        # Get duration
-        clip = VideoFileClip(video_path)
-        duration = clip.duration
-        clip.close()
-        
-        # 2. Generate Script
-        # TODO: Support custom prompt injection if needed
-        title, script = get_perfect_fit_script(video_path, duration)
-        
-        if not script:
-             raise Exception("Failed to generate script")
-             
-        tasks[task_id]["progress"] = 50
-        tasks[task_id]["message"] = "Generating voice..."
-        
-        # 3. Generate Voice
-        voice_path = str(TEMP_DIR / f"voice_{task_id}.mp3")
-        generate_voice_sync(script, voice_path)
-        
-        if not Path(voice_path).exists():
-            raise Exception("Voice generation failed")
-            
-        tasks[task_id]["progress"] = 70
-        tasks[task_id]["message"] = "Processing video (Rendering)..."
-        
-        # 4. Processing
-        source_clip = VideoFileClip(video_path)
-        audio_clip = AudioFileClip(voice_path)
-        
-        synced_audio = sync_audio_to_video(audio_clip, duration)
-        synced_audio_path = TEMP_DIR / f"synced_{task_id}.mp3"
-        synced_audio.write_audiofile(str(synced_audio_path), logger=None)
-        final_audio = AudioFileClip(str(synced_audio_path))
-        
-        resized_clip = resize_for_shorts(source_clip)
-        
-        has_avatar = False
-        if request.use_avatar:
-            has_avatar = prepare_avatar_with_chromakey(duration)
-            
-        output_filename = f"final_{task_id}.mp4"
-        output_path = OUTPUT_DIR / output_filename
-        
-        render_final_video(resized_clip, final_audio, output_path, add_avatar=has_avatar)
-        
-        # Cleanup
-        source_clip.close()
-        audio_clip.close()
-        final_audio.close()
-        
-        # Remove temps
-        cleanup_temp_files()
-        
-        tasks[task_id]["status"] = "completed"
-        tasks[task_id]["progress"] = 100
-        tasks[task_id]["message"] = "Done!"
-        tasks[task_id]["result_file"] = output_filename
-        
-    except Exception as e:
-        logger.error(f"Task failed: {e}")
-        tasks[task_id]["status"] = "failed"
-        tasks[task_id]["error"] = str(e)
-        tasks[task_id]["message"] = "Error occurred"
+class BatchRequest(BaseModel):
+    urls: List[str]
+    custom_prompt: Optional[str] = None  # ใช้ร่วมกันทุก URL
+    use_avatar: bool = True
+    api_key: Optional[str] = None
+    output_profiles: Optional[List[str]] = None
+    hls: bool = False
+    refresh_script: bool = False
+
+class BatchStatus(BaseModel):
+    id: str
+    status: str  # preparing, processing, completed, partial, failed
+    progress: int
+    message: str
+    total: int
+    counts: Dict[str, int]  # status -> จำนวนงานย่อย
+    items: List[TaskStatus]
+    queue_position: Optional[int] = None
+    error: Optional[str] = None
+
+def _requested_profiles(request) -> Optional[List[str]]:
+    """Profiles ที่ต้อง render (None = pipeline เดิม MP4 ไฟล์เดียว)"""
+    profiles = list(request.output_profiles or [])
+    if request.hls:
+        profiles = (profiles or list(DEFAULT_OUTPUT_PROFILES)) + ["hls"]
+    return profiles or None
+
+def _validate_profiles(request) -> None:
+    """400 ถ้าขอ profile ที่ไม่มี"""
+    if request.output_profiles or request.hls:
+        try:
+            resolve_output_profiles(_requested_profiles(request))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+def _queue_full(e: QueueFullError) -> HTTPException:
+    """429 + Retry-After"""
+    REGISTRY.inc("admission_rejected_total")
+    return HTTPException(
+        status_code=429,
+        detail={
+            "message": "Server busy - queue is full",
+            "queue_depth": e.queue_depth,
+            "max_queue": e.max_queue,
+            "retry_after": e.retry_after,
+        },
+        headers={"Retry-After": str(e.retry_after)},
+    )
 
 @app.post("/api/process", response_model=TaskStatus)
-async def create_process_task(request: VideoRequest, background_tasks: BackgroundTasks):
+async def create_process_task(request: VideoRequest):
+    _validate_profiles(request)
+    
     task_id = str(uuid.uuid4())
-    tasks[task_id] = {
-        "id": task_id,
-        "status": "pending",
-        "progress": 0,
-        "message": "Queued",
-        "result_file": None
+    payload = {
+        "url": request.url,
+        "custom_prompt": request.custom_prompt,
+        "use_avatar": request.use_avatar,
+        "api_key": request.api_key,
+        "profiles": _requested_profiles(request),
+        "refresh_script": request.refresh_script,
+        "force": request.force,  # ไม่ผ่านการตรวจงานซ้ำ = checkpoint แยกต่องาน (ดู jobs._checkpoint_key)
     }
     
-    background_tasks.add_task(process_video_task, task_id, request)
-    return tasks[task_id]
+    # Idempotency: input + config เดิม = ใช้ผลเดิม / รองานที่กำลังทำอยู่
+    fingerprint = None if request.force or request.refresh_script else job_fingerprint(payload)
+    if fingerprint:
+        done = broker.find_completed(fingerprint)
+        if done is not None and result_available(done, OUTPUT_DIR):
+            return {**done, "reused": True}
+    
+    try:
+        position = broker.enqueue(task_id, payload, fingerprint=fingerprint)
+    except QueueFullError as e:
+        raise _queue_full(e)
+    except DuplicateJobError as e:
+        task = broker.get(e.job_id)
+        return {**task, "queue_position": broker.position(e.job_id), "reused": True}
+    
+    return {**broker.get(task_id), "queue_position": position}
+
+@app.post("/api/batch", response_model=BatchStatus)
+async def create_batch(request: BatchRequest):
+    """
+    ส่งหลาย URL ในครั้งเดียว (options ใช้ร่วมกัน)
+    
+    ตรวจ key / ดึง metadata / เตรียม avatar ครั้งเดียวต่อ batch แล้วงานย่อยเข้าคิวต่อกัน
+    ติดตามได้ทั้ง /api/batch/{id} (รวม) และ /api/status/{item id} (รายงาน)
+    """
+    # คลิปเดียวกัน (URL คนละรูปแบบ) ใน batch เดียวกันทำครั้งเดียว
+    unique = {}
+    for url in request.urls:
+        if url.strip():
+            unique.setdefault(video_key(url), url.strip())
+    urls = list(unique.values())
+    if not urls:
+        raise HTTPException(status_code=400, detail="No URLs")
+    if len(urls) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Too many URLs (max {BATCH_MAX_ITEMS})")
+    _validate_profiles(request)
+    
+    batch_id = str(uuid.uuid4())
+    shared = {
+        "custom_prompt": request.custom_prompt,
+        "use_avatar": request.use_avatar,
+        "api_key": request.api_key,
+        "profiles": _requested_profiles(request),
+        "refresh_script": request.refresh_script,
+    }
+    items = [(str(uuid.uuid4()), url) for url in urls]
+    
+    # Idempotency ต่อ URL เหมือน /api/process: ผลเดิมที่ไฟล์ยังอยู่ = งานย่อยเสร็จทันที
+    # (งานเดิมที่ยังไม่จบ = enqueue_batch ผูกงานย่อยกับงานนั้นใน transaction เดียวกัน)
+    fingerprints, reused = {}, {}
+    for item_id, url in items:
+        if request.refresh_script:
+            continue
+        fingerprints[item_id] = job_fingerprint({**shared, "url": url})
+        done = broker.find_completed(fingerprints[item_id])
+        if done is not None and result_available(done, OUTPUT_DIR):
+            reused[item_id] = {k: done.get(k) for k in ("result_file", "result_files")}
+    
+    try:
+        position = broker.enqueue_batch(
+            batch_id,
+            {"kind": "batch", **shared,
+             "items": [{"id": i, "url": url} for i, url in items if i not in reused]},
+            [(i, {**shared, "url": url, "batch_id": batch_id}, {"url": url, "batch_id": batch_id},
+              fingerprints.get(i)) for i, url in items],
+            reused=reused,
+        )
+    except QueueFullError as e:
+        raise _queue_full(e)
+    
+    return {**broker.batch_status(batch_id), "queue_position": position}
+
+@app.get("/api/batch/{batch_id}", response_model=BatchStatus)
+async def get_batch_status(batch_id: str):
+    status = broker.batch_status(batch_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return status
+
+@app.get("/api/status")
+async def get_queue_status():
+    """สถานะคิว: จำนวนงานที่รอ / กำลังรัน / เวลารอเฉลี่ย"""
+    return broker.stats()
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: latency ต่อขั้นตอน, throughput, คิว (รวมทุก worker)"""
+    stats = broker.stats()
+    text = render_merged(
+        [REGISTRY.snapshot(), *broker.load_metrics()],
+        gauges={
+            "queue_depth": stats["queue_depth"],
+            "active_jobs": stats["active"],
+            "workers": stats["workers"],
+        },
+    )
+    return Response(text, media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.get("/api/status/{task_id}", response_model=TaskStatus)
 async def get_status(task_id: str):
-    if task_id not in tasks:
+    task = broker.get(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
-    return tasks[task_id]
+    if task["status"] == "pending":
+        return {**task, "queue_position": broker.position(task_id)}
+    return task
+
+# Server-sent events: push progress แทนการ poll /api/status
+SSE_POLL_INTERVAL = 0.25      # เช็ค event ใหม่ใน broker (local SQLite) ทุกกี่วินาที
+SSE_KEEPALIVE_SECONDS = 15
+TERMINAL_STATUSES = ("completed", "failed")
+
+def _sse(event_type: str, data: dict, seq: int = None) -> str:
+    """Format 1 event ตาม text/event-stream"""
+    lines = []
+    if seq is not None:
+        lines.append(f"id: {seq}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+@app.get("/api/events/{task_id}")
+async def stream_events(task_id: str, request: Request):
+    """
+    Stream progress แบบ real-time (SSE)
+    
+    Events: snapshot, status, download, upload, calibration, tts, render
+    Reconnect ด้วย Last-Event-ID จะได้ event ที่พลาดไปต่อจากเดิม
+    """
+    task = broker.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    last_event_id = request.headers.get("last-event-id", "")
+    
+    async def event_stream():
+        if last_event_id.isdigit():
+            after = int(last_event_id)
+        else:
+            after = await asyncio.to_thread(broker.last_event_seq, task_id)
+            yield _sse("snapshot", task, after)
+            if task["status"] in TERMINAL_STATUSES:
+                return
+        
+        last_sent = time.time()
+        while not await request.is_disconnected():
+            events = await asyncio.to_thread(broker.events_since, task_id, after)
+            for event in events:
+                after = event["seq"]
+                yield _sse(event["type"], event["data"], event["seq"])
+                if event["type"] == "status" and event["data"].get("status") in TERMINAL_STATUSES:
+                    return
+            
+            if events:
+                last_sent = time.time()
+                await asyncio.sleep(SSE_POLL_INTERVAL)
+                continue
+            
+            # ไม่มี event ใหม่: งานจบไปแล้ว (reconnect หลัง event สุดท้าย) / ถูกลบ = ปิด stream
+            current = await asyncio.to_thread(broker.get, task_id)
+            if current is None:
+                return
+            if current["status"] in TERMINAL_STATUSES:
+                # event ที่เขียนพร้อมสถานะจบหลัง poll รอบนี้
+                for event in await asyncio.to_thread(broker.events_since, task_id, after):
+                    yield _sse(event["type"], event["data"], event["seq"])
+                return
+            
+            if time.time() - last_sent > SSE_KEEPALIVE_SECONDS:
+                yield ": keepalive\n\n"
+                last_sent = time.time()
+            
+            await asyncio.sleep(SSE_POLL_INTERVAL)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Output files ไม่เปลี่ยนหลัง render เสร็จ - ให้ browser cache ได้
+DOWNLOAD_CACHE_CONTROL = "public, max-age=86400"
+
+def _not_modified(request: Request, etag: str, last_modified: str) -> bool:
+    """ตรวจ conditional GET (If-None-Match / If-Modified-Since)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in candidates or etag in candidates
+    
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    
+    return False
 
 @app.get("/api/download/{filename}")
-async def download_file(filename: str):
+async def download_file(filename: str, request: Request):
     file_path = OUTPUT_DIR / filename
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(file_path, media_type="video/mp4", filename=filename)
+    media_type = "image/jpeg" if file_path.suffix == ".jpg" else "video/mp4"
+    
+    # FileResponse จัดการ Range / If-Range (206, 416) และสร้าง ETag / Last-Modified
+    response = FileResponse(
+        file_path,
+        media_type=media_type,
+        filename=filename,
+        stat_result=os.stat(file_path),
+        headers={"Cache-Control": DOWNLOAD_CACHE_CONTROL},
+    )
+    
+    mark_used(file_path)
+    etag = response.headers["etag"]
+    last_modified = response.headers["last-modified"]
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers={
+            "ETag": etag,
+            "Last-Modified": last_modified,
+            "Cache-Control": DOWNLOAD_CACHE_CONTROL,
+        })
+    
+    return response
+
+HLS_MEDIA_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+}
+
+@app.get("/api/hls/{task_id}/{name}")
+async def get_hls_file(task_id: str, name: str):
+    """HLS playlist / segment ของ task (ใช้ได้ตั้งแต่ segment แรก render เสร็จ)"""
+    suffix = Path(name).suffix
+    task = broker.get(task_id)
+    if suffix not in HLS_MEDIA_TYPES or name != Path(name).name or task is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    
+    # โฟลเดอร์จริงที่ render เขียน (เก็บไว้ตอนเริ่ม render) - ไม่สร้างชื่อใหม่เอง
+    playlist = (task.get("result_files") or {}).get("hls")
+    file_path = OUTPUT_DIR / Path(playlist).parent / name if playlist else None
+    if file_path is None or not file_path.exists():
+        # ยังไม่เริ่ม render / segment ยังไม่เสร็จ - client ลองใหม่ได้
+        raise HTTPException(status_code=404, detail="Not ready")
+    
+    mark_used(file_path)
+    # Playlist เปลี่ยนระหว่าง render ห้าม cache, segment ไม่เปลี่ยนแล้ว cache ได้
+    cache_control = "no-cache" if suffix == ".m3u8" else DOWNLOAD_CACHE_CONTROL
+    return FileResponse(
+        file_path,
+        media_type=HLS_MEDIA_TYPES[suffix],
+        headers={"Cache-Control": cache_control},
+    )
 
 if __name__ == "__main__":
     import uvicorn
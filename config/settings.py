@@ -22,6 +22,7 @@ INPUT_DIR = Path(os.getenv("INPUT_DIR", BASE_DIR / "1_Input_Raw"))
 ASSETS_DIR = Path(os.getenv("ASSETS_DIR", BASE_DIR / "2_Assets"))
 OUTPUT_DIR = Path(os.getenv("OUTPUT_DIR", BASE_DIR / "3_Output_Ready"))
 TEMP_DIR = BASE_DIR / "temp"
+DATA_DIR = Path(os.getenv("DATA_DIR", BASE_DIR / "data"))  # SQLite DBs, caches
 
 # Files
 URL_FILE = BASE_DIR / "urls.txt"
@@ -59,6 +60,9 @@ VOICE_VOLUME = os.getenv("VOICE_VOLUME", "+10%")
 # =============================================================================
 # ⚙️ PROCESSING CONFIG
 # =============================================================================
+# ffmpeg ที่ใช้ (ว่าง = หาเองจาก PATH / winget / imageio-ffmpeg ครั้งเดียวต่อ process)
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "")
+
 # Video output settings
 VIDEO_WIDTH = 1080
 VIDEO_HEIGHT = 1920
@@ -66,22 +70,139 @@ VIDEO_FPS = 30
 VIDEO_BITRATE = "5000k"
 VIDEO_PRESET = "medium"
 
+# Encoding mode
+# - "bitrate"  = fixed VIDEO_BITRATE (แบบเดิม)
+# - "crf"      = CRF คงที่ + VBV cap ที่ VIDEO_BITRATE
+# - "adaptive" = probe ความซับซ้อนของ source แล้วเลือก CRF/cap ให้เหมาะ
+ENCODE_MODE = os.getenv("ENCODE_MODE", "adaptive")
+VIDEO_CRF = int(os.getenv("VIDEO_CRF", "23"))
+COMPLEXITY_PROBE_SECONDS = 5
+# (max probe kbps, crf, maxrate) - probe ที่ 270px ultrafast CRF 23
+COMPLEXITY_TIERS = [
+    (150, 26, "2500k"),    # talking head / ภาพนิ่ง
+    (450, 23, "4000k"),    # ปกติ
+    (None, 21, "6000k"),   # motion เยอะ
+]
+
+# Output renditions - render ครั้งเดียว (decode + composite รอบเดียว) ได้หลายไฟล์
+# kind: "video" = MP4, "thumbnail" = ภาพปก (JPEG) ที่วินาที "at",
+#       "hls" = HLS playlist + segments (เล่นได้ระหว่างที่ยัง render อยู่)
+RENDITION_PRESETS = {
+    "master": {"kind": "video", "width": VIDEO_WIDTH, "height": VIDEO_HEIGHT, "bitrate": VIDEO_BITRATE},
+    "720p": {"kind": "video", "width": 720, "height": 1280, "bitrate": "2500k"},
+    "poster": {"kind": "thumbnail", "width": 540, "height": 960, "at": 1.0},
+    "hls": {"kind": "hls", "width": 720, "height": 1280, "bitrate": "2500k"},
+}
+DEFAULT_OUTPUT_PROFILES = ["master"]
+HLS_SEGMENT_SECONDS = 2
+
 # Timing settings
 WORDS_PER_SECOND = 2.2  # ปรับใหม่ให้แม่นขึ้น
 SYNC_TOLERANCE = 10.0   # ยอมรับความต่าง +/- 10 วินาที (เน้นเนื้อหาครบ)
-DELAY_BETWEEN_CLIPS = 10  # พักระหว่างคลิป (วินาที)
+
+# Cache บทพากย์ (คลิปเดิม + config เดิม = ไม่เรียก Gemini ซ้ำ) - ปิดได้ด้วย SCRIPT_CACHE=0
+SCRIPT_CACHE = os.getenv("SCRIPT_CACHE", "1") == "1"
+SCRIPT_CACHE_DIR = Path(os.getenv("SCRIPT_CACHE_DIR", DATA_DIR / "script_cache"))
+SCRIPT_CACHE_BUCKET_SECONDS = 0.5  # ความยาวเป้าหมายปัดเป็นช่วงละเท่านี้
+# บทที่ไม่ได้ใช้นานเกิน max age / รวมเกิน budget ถูกลบ (LRU ตาม mark_used)
+SCRIPT_CACHE_MAX_BYTES = int(float(os.getenv("SCRIPT_CACHE_MAX_MB", "50")) * 1024 * 1024)
+SCRIPT_CACHE_MAX_AGE_SECONDS = int(os.getenv("SCRIPT_CACHE_MAX_AGE_SECONDS", str(30 * 24 * 3600)))
+
+# Calibration รอบถัดไปแก้เฉพาะประโยค (แทรก / ลบ) แทนเขียนบทใหม่ทั้งบท - ปิดได้ด้วย SCRIPT_DELTA_REFINE=0
+SCRIPT_DELTA_REFINE = os.getenv("SCRIPT_DELTA_REFINE", "1") == "1"
+# เสียงรายประโยค (วัดความยาวเฉพาะประโยคที่เปลี่ยน) - ลบตัวที่ไม่ได้ใช้นานสุดเมื่อเกิน budget
+TTS_CACHE_DIR = Path(os.getenv("TTS_CACHE_DIR", DATA_DIR / "tts_cache"))
+TTS_CACHE_MAX_BYTES = int(float(os.getenv("TTS_CACHE_MAX_MB", "500")) * 1024 * 1024)
+
+# Rate limit ของ API ภายนอก (ครั้ง/นาที ต่อ key) - ปรับเองแบบ AIMD แทนการพักระหว่างคลิป
+# เริ่มที่ start, สำเร็จ +step (ไม่เกิน max), โดน 429 / quota ลดครึ่ง (ไม่ต่ำกว่า min)
+RATE_LIMITS = {
+    "gemini": {
+        "start": float(os.getenv("GEMINI_RPM", "15")),
+        "min": 2.0,
+        "max": float(os.getenv("GEMINI_MAX_RPM", "60")),
+        "step": 1.0,
+    },
+    "tts": {
+        "start": float(os.getenv("TTS_RPM", "60")),
+        "min": 5.0,
+        "max": float(os.getenv("TTS_MAX_RPM", "300")),
+        "step": 5.0,
+    },
+}
+
+# Download settings (ต่อ process)
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "4"))    # yt-dlp sessions / ดาวน์โหลดพร้อมกันสูงสุด
+DOWNLOAD_PER_HOST = int(os.getenv("DOWNLOAD_PER_HOST", "2"))  # พร้อมกันสูงสุดต่อ platform (กัน rate limit)
+# โหลดเสียงต้นฉบับด้วยไหม (default 1 = Gemini ได้ยินบทพูด/เพลงในคลิปเหมือนเดิม)
+# 0 = วิดีโออย่างเดียว (ไฟล์เล็ก/โหลดเร็วกว่า) แต่บทอิงภาพอย่างเดียว - เปิดเองถ้ายอมรับได้
+DOWNLOAD_SOURCE_AUDIO = os.getenv("DOWNLOAD_SOURCE_AUDIO", "1") == "1"
+# จำกัดคลิปต้นฉบับ (เช็คจาก metadata ก่อนดาวน์โหลด) - 0 = ไม่จำกัด
+MAX_SOURCE_SECONDS = int(os.getenv("MAX_SOURCE_SECONDS", "900"))
+MAX_SOURCE_MB = int(os.getenv("MAX_SOURCE_MB", "500"))
+# เร่งความเร็วต่อไฟล์ + กันค้าง (CDN edge ช้า)
+DOWNLOAD_FRAGMENTS = int(os.getenv("DOWNLOAD_FRAGMENTS", "4"))  # fragment (HLS/DASH) ที่โหลดพร้อมกันต่อไฟล์
+DOWNLOAD_CHUNK_MB = int(os.getenv("DOWNLOAD_CHUNK_MB", "10"))   # ไฟล์ตรงโหลดเป็นช่วง (range) ละกี่ MB (0 = ทั้งไฟล์)
+DOWNLOAD_MIN_SPEED_KBPS = int(os.getenv("DOWNLOAD_MIN_SPEED_KBPS", "64"))  # ช้ากว่านี้ต่อเนื่อง = ค้าง (0 = ปิด)
+DOWNLOAD_STALL_SECONDS = float(os.getenv("DOWNLOAD_STALL_SECONDS", "30"))
+DOWNLOAD_STALL_RETRIES = int(os.getenv("DOWNLOAD_STALL_RETRIES", "2"))  # ค้างแล้วเริ่มใหม่ด้วย session ใหม่กี่ครั้ง
+# Cache ไฟล์ต้นฉบับ (รันซ้ำ / retry ไม่ต้องโหลดใหม่) - 0 GB = ปิด cache
+DOWNLOAD_CACHE_DIR = Path(os.getenv("DOWNLOAD_CACHE_DIR", DATA_DIR / "download_cache"))
+DOWNLOAD_CACHE_MAX_BYTES = int(float(os.getenv("DOWNLOAD_CACHE_MAX_GB", "10")) * 1024 ** 3)
+DOWNLOAD_CACHE_VERIFY = os.getenv("DOWNLOAD_CACHE_VERIFY", "1") == "1"  # ตรวจ SHA-256 ทุกครั้งที่ใช้
 
 # Retry settings
 MAX_UPLOAD_ATTEMPTS = 5
 MAX_SCRIPT_ATTEMPTS = 3   # ลองแค่ 3 รอบ แล้วเอาอันที่ดีที่สุด
 ATTEMPTS_PER_MODEL = 3    # ใช้ model เดียว 3 รอบ
 
+# รอบแรกของบท: ขอหลายความยาวในคำตอบเดียว แล้ววัดเสียงพร้อมกัน (1 = ทีละรอบแบบเดิม)
+SCRIPT_CANDIDATES = int(os.getenv("SCRIPT_CANDIDATES", "3"))
+SCRIPT_HEDGE_SECONDS = float(os.getenv("SCRIPT_HEDGE_SECONDS", "30"))  # Gemini ยังไม่ตอบ = ส่งคำขอสำรองซ้อน
+SCRIPT_REQUEST_TIMEOUT = float(os.getenv("SCRIPT_REQUEST_TIMEOUT", "120"))  # timeout ต่อคำขอ
+
+# =============================================================================
+# 🌐 API SERVER CONFIG
+# =============================================================================
+API_WORKERS = int(os.getenv("API_WORKERS", "2"))        # worker processes ที่ api.py spawn ให้
+API_MAX_QUEUE = int(os.getenv("API_MAX_QUEUE", "20"))   # รอคิวได้สูงสุดกี่งาน (เกิน = 429)
+# 0 = ไม่ spawn เอง (รัน `python worker.py -n N` แยก / คนละเครื่องที่ใช้ DB เดียวกัน)
+API_SPAWN_WORKERS = os.getenv("API_SPAWN_WORKERS", "1") == "1"
+
+# Job broker (SQLite) - API enqueue, worker processes claim
+BROKER_DB = Path(os.getenv("BROKER_DB", DATA_DIR / "jobs.db"))
+WORKER_LEASE_SECONDS = 60     # worker ต้อง heartbeat ภายในเวลานี้ ไม่งั้นงานกลับเข้าคิว
+WORKER_POLL_INTERVAL = 1.0    # คิวว่าง = รอกี่วินาทีก่อนเช็คใหม่
+MAX_JOB_ATTEMPTS = 2          # worker ตายกลางงานได้กี่ครั้งก่อน fail
+EVENT_MIN_INTERVAL = 0.5      # progress event ชนิดเดียวกันส่งได้ถี่สุดทุกกี่วินาที (ต่อ job)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))  # URLs สูงสุดต่อ 1 batch
+
+# URL queue ของ CLI (main.py) - urls.txt ใช้ import/export เท่านั้น
+URL_QUEUE_DB = Path(os.getenv("URL_QUEUE_DB", DATA_DIR / "urls.db"))
+URL_MAX_ATTEMPTS = int(os.getenv("URL_MAX_ATTEMPTS", "3"))  # ลองกี่ครั้งก่อนเป็น failed ถาวร
+
+# Checkpoint ต่อคลิป (source / บท / เสียง) - รันใหม่ทำต่อจากขั้นที่พัง
+CHECKPOINT_DIR = Path(os.getenv("CHECKPOINT_DIR", DATA_DIR / "checkpoints"))
+CHECKPOINT_MAX_AGE_SECONDS = int(os.getenv("CHECKPOINT_MAX_AGE_SECONDS", str(3 * 24 * 3600)))
+
+# =============================================================================
+# 🧹 RETENTION CONFIG (API server)
+# =============================================================================
+# งานที่จบแล้วเก็บสถานะไว้กี่วินาที (ลบทั้ง job + progress events)
+TASK_TTL_SECONDS = int(os.getenv("TASK_TTL_SECONDS", str(7 * 24 * 3600)))
+# Disk budget ของ OUTPUT_DIR - เกิน = ลบไฟล์ที่ไม่ได้ใช้นานสุดก่อน (0 = ไม่จำกัด)
+OUTPUT_MAX_BYTES = int(float(os.getenv("OUTPUT_MAX_GB", "20")) * 1024 ** 3)
+# Output ที่ไม่มีใครโหลดนานเกินนี้ถูกลบ (0 = ไม่ลบตามอายุ)
+OUTPUT_MAX_AGE_SECONDS = int(os.getenv("OUTPUT_MAX_AGE_SECONDS", str(14 * 24 * 3600)))
+OUTPUT_GRACE_SECONDS = 3600   # ไฟล์ที่เพิ่งเขียน (งานอาจยัง render อยู่) ห้ามลบ
+GC_INTERVAL_SECONDS = int(os.getenv("GC_INTERVAL_SECONDS", "600"))
+
 # =============================================================================
 # 🛠️ HELPER FUNCTIONS
 # =============================================================================
 def ensure_directories():
     """สร้าง directories ที่จำเป็นทั้งหมด"""
-    for d in [INPUT_DIR, ASSETS_DIR, OUTPUT_DIR, TEMP_DIR]:
+    for d in [INPUT_DIR, ASSETS_DIR, OUTPUT_DIR, TEMP_DIR, DATA_DIR]:
         d.mkdir(parents=True, exist_ok=True)
 
 def get_config_summary() -> dict:
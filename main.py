@@ -9,10 +9,15 @@
 #   python main.py --add-urls   # เพิ่ม URLs แล้วรัน
 #   python main.py --test       # ทดสอบ API keys
 #   python main.py --status     # ดู config status
+#
+# URLs อยู่ในคิว SQLite (data/urls.db) - urls.txt ถูก import ตอนเริ่ม
+# และเขียนกลับ (เฉพาะ URL ที่ยังไม่เสร็จ) ครั้งเดียวตอนจบ
 
 import sys
+import socket
 import argparse
 import asyncio
+import threading
 import nest_asyncio
 
 # Apply nest_asyncio for Jupyter/async compatibility
@@ -20,18 +25,20 @@ nest_asyncio.apply()
 
 from config.settings import (
     ensure_directories, get_config_summary,
-    URL_FILE, OUTPUT_DIR, DELAY_BETWEEN_CLIPS
-)
-from modules.downloader import (
-    get_urls, remove_url_from_file, add_urls_to_file, 
-    download_single_video
+    URL_FILE, OUTPUT_DIR, WORKER_LEASE_SECONDS,
+    VOICE_NAME, VOICE_RATE, VOICE_PITCH, VOICE_VOLUME
 )
+from modules.downloader import download_single_video, video_key
+from modules.url_queue import UrlQueue
+from modules.checkpoints import Checkpoint, prune_checkpoints
 from modules.gemini_brain import (
     test_api_keys, get_perfect_fit_script, reset_model_fallback,
-    available_keys, MODEL_HIERARCHY
+    get_default_brain, MODEL_HIERARCHY
 )
-from modules.voice import generate_voice_sync
+from modules.voice import generate_voice_sync, prune_tts_cache
+from modules.script_cache import prune_script_cache
 from modules.video_processor import process_video_pipeline, cleanup_temp_files
+from modules.metrics import REGISTRY, observe_stage, count_job
 
 import time
 import os
@@ -59,6 +66,9 @@ def show_status():
     print(f"   🎤 Voice: {config['voice']}")
     print(f"   🤖 Models: {', '.join(config['models'])}")
     print(f"   🎤 Voice: {config['voice']}")
+    counts = UrlQueue().counts()
+    print(f"   📋 URL Queue: {counts['queued']} queued, {counts['running']} running, "
+          f"{counts['done']} done, {counts['failed']} failed")
     print()
 
 
@@ -82,18 +92,24 @@ def add_urls_interactive():
             break
     
     if urls:
-        add_urls_to_file(urls)
-        print(f"\n✅ เพิ่ม {len(urls)} URLs สำเร็จ!")
+        added = UrlQueue().add(urls, requeue=True)
+        print(f"\n✅ เพิ่ม {added} URLs สำเร็จ!")
     
     return urls
 
 
-def process_single_video(url: str, index: int, total: int) -> bool:
+def process_single_video(url: str, index: int, total: int, use_script_cache: bool = True) -> str | None:
     """
     Process วิดีโอ 1 คลิป (full pipeline)
     
+    ผลของแต่ละขั้น (source, บท, เสียง) ถูกเก็บเป็น checkpoint - ถ้าพังตอน render
+    รอบหน้าทำต่อจากขั้นที่ค้าง ไม่ต้องโหลด / เรียก Gemini / TTS ซ้ำ
+    
+    Args:
+        use_script_cache: False = เขียนบทใหม่ (ไม่ใช้บทจาก script cache)
+    
     Returns:
-        True ถ้าสำเร็จ
+        None ถ้าสำเร็จ, ไม่งั้นข้อความ error (เก็บไว้ในคิว)
     """
     print(f"\n{'='*60}")
     print(f"📦 [{index}/{total}] : {url}")
@@ -102,57 +118,95 @@ def process_single_video(url: str, index: int, total: int) -> bool:
     # Reset model fallback ก่อนเริ่มคลิปใหม่
     reset_model_fallback()
     
-    # Step 1: Download
-    video_path = download_single_video(url)
-    if not video_path:
-        print("❌ Download Failed - ข้ามคลิปนี้")
-        return False
+    checkpoint = Checkpoint(f"cli:{video_key(url)}")
+    if checkpoint.stages():
+        print(f"    ♻️ ทำต่อจาก checkpoint: {', '.join(checkpoint.stages())}")
+    
+    # Step 1: Download (ลงโฟลเดอร์ checkpoint - เก็บไว้จนคลิปสำเร็จ)
+    source = checkpoint.get("download")
+    if source:
+        video_path, duration = source["path"], source["duration"]
+    else:
+        video_path = download_single_video(url, checkpoint.dir)
+        if not video_path:
+            print("❌ Download Failed - ข้ามคลิปนี้")
+            return "Download failed"
     
     try:
-        # Get video duration
-        from moviepy.editor import VideoFileClip
-        clip = VideoFileClip(video_path)
-        duration = clip.duration
-        clip.close()
+        if not source:
+            # Get video duration
+            from moviepy.editor import VideoFileClip
+            clip = VideoFileClip(video_path)
+            duration = clip.duration
+            clip.close()
+            checkpoint.save("download", path=video_path, duration=duration)
         
         # Step 2: Generate Script (AI)
-        title, script = get_perfect_fit_script(video_path, duration)
+        written = checkpoint.get("script")
+        if written:
+            title, script = written["title"], written["script"]
+        else:
+            title, script = get_perfect_fit_script(video_path, duration, use_cache=use_script_cache)
+            if script:
+                checkpoint.save("script", title=title, script=script)
         
         print(f"\n    📜 บทพากย์:")
         print(f"    {script[:120]}{'...' if len(script) > 120 else ''}\n")
         
-        # Step 3: Generate Voice
-        voice_path = "temp_voice.mp3"
-        generate_voice_sync(script, voice_path)
+        # Step 3: Generate Voice (เปลี่ยนเสียงพากย์ใน settings = สร้างใหม่)
+        voice_settings = [VOICE_NAME, VOICE_RATE, VOICE_PITCH, VOICE_VOLUME]
+        voice = checkpoint.get("voice", voice=voice_settings)
+        if voice:
+            voice_path = voice["path"]
+        else:
+            voice_path = str(checkpoint.path("voice.mp3"))
+            generate_voice_sync(script, voice_path)
+            checkpoint.save("voice", path=voice_path, voice=voice_settings)
         
         # Step 4: Process Video (resize, sync, overlay)
         result = process_video_pipeline(video_path, script, title, voice_path)
+        if not result:
+            return "Processing failed"
         
-        if result:
-            # Success - remove from queue
-            remove_url_from_file(url)
-            return True
-        else:
-            return False
+        checkpoint.clear()
+        return None
             
     except Exception as e:
         print(f"❌ Error: {e}")
         import traceback
         traceback.print_exc()
-        return False
-        
-    finally:
-        # Cleanup temp files
-        for f in [video_path, "temp_voice.mp3"]:
+        return str(e) or type(e).__name__
+
+
+def _heartbeat_loop(queue: UrlQueue, worker_id: str, state: dict, stop: threading.Event) -> None:
+    """ต่อ lease ของ URL ที่กำลังทำ (process ตาย = URL กลับเข้าคิวเมื่อ lease หมด)"""
+    while not stop.wait(WORKER_LEASE_SECONDS / 3):
+        if state.get("item_id"):
             try:
-                if os.path.exists(f):
-                    os.remove(f)
-            except:
-                pass
+                queue.heartbeat(state["item_id"], worker_id)
+            except Exception as e:
+                print(f"⚠️ heartbeat error: {e}")
 
 
-def run_factory():
-    """รัน factory เต็ม pipeline ทุก URLs ใน queue"""
+def _prefetch(queue: UrlQueue) -> None:
+    """ดึง metadata ของ URL ใหม่ในคิวพร้อมกัน (คลิปสั้นก่อน + ตัดคลิปที่เกิน limit)"""
+    start = time.perf_counter()
+    result = queue.prefetch()
+    if not result["probed"]:
+        return
+    print(f"🔎 ดึงข้อมูล {result['probed']} คลิปล่วงหน้า ({time.perf_counter() - start:.1f}s) - เรียงคลิปสั้นก่อน")
+    for url, reason in result["rejected"]:
+        print(f"    ⛔ ข้าม (ไม่ดาวน์โหลด): {url} - {reason}")
+
+
+def run_factory(metrics_file: str = None, use_script_cache: bool = True):
+    """
+    รัน factory เต็ม pipeline ทุก URLs ใน queue
+    
+    Args:
+        metrics_file: เขียน metrics (Prometheus text) ลงไฟล์นี้หลังจบแต่ละคลิป
+        use_script_cache: False = เขียนบทใหม่ทุกคลิป
+    """
     ensure_directories()
     
     # Test API keys ก่อน
@@ -163,35 +217,89 @@ def run_factory():
         print("💡 กรุณาเพิ่ม API keys ใน .env file")
         return
     
-    urls = get_urls()
+    prune_checkpoints()
+    prune_tts_cache()
     
-    if not urls:
+    queue = UrlQueue()
+    imported = queue.import_file(URL_FILE)
+    if imported:
+        print(f"\n📥 เพิ่ม {imported} URLs ใหม่จาก {URL_FILE.name}")
+    _prefetch(queue)
+    
+    counts = queue.counts()
+    if not counts["queued"]:
         print("\n📭 ไม่มี URLs ใน queue")
         print(f"   ใส่ลิงก์ใน: {URL_FILE}")
         print("   หรือรัน: python main.py --add-urls")
+        if counts["failed"]:
+            print(f"   ({counts['failed']} URLs ล้มเหลวครบจำนวนครั้ง - ลองใหม่: python main.py --retry-failed)")
         return
     
-    print(f"\n🔥 เริ่มประมวลผล {len(urls)} คลิป")
+    print(f"\n🔥 เริ่มประมวลผล {counts['queued']} คลิป")
     print(f"🤖 Models: {', '.join(MODEL_HIERARCHY)}")
-    print(f"🔑 API Keys: {len(available_keys)}")
+    print(f"🔑 API Keys: {len(get_default_brain().keys)}")
     print(f"📂 Output: {OUTPUT_DIR}\n")
     
     success_count = 0
     fail_count = 0
     
-    for i, url in enumerate(urls, 1):
-        if process_single_video(url, i, len(urls)):
-            success_count += 1
-        else:
-            fail_count += 1
-        
-        # พักระหว่างคลิป
-        if i < len(urls):
-            print(f"\n    ⏸️ พัก {DELAY_BETWEEN_CLIPS}วิ ก่อนคลิปถัดไป...")
-            time.sleep(DELAY_BETWEEN_CLIPS)
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    state = {"item_id": None}
+    stop = threading.Event()
+    threading.Thread(
+        target=_heartbeat_loop, args=(queue, worker_id, state, stop), daemon=True
+    ).start()
+    
+    i = 0
+    seen_queued = None  # จำนวน queued ล่าสุดที่รู้ (หลัง claim) - เพิ่มขึ้น = มี URL ใหม่/ลองใหม่
+    try:
+        while True:
+            queued = queue.counts()["queued"]
+            if seen_queued is None or queued > seen_queued:
+                _prefetch(queue)  # ดึงเฉพาะตอนคิวเปลี่ยน ไม่ใช่ทุกคลิป
+            item = queue.claim(worker_id)
+            if item is None:
+                break
+            i += 1
+            state["item_id"] = item["id"]
+            seen_queued = queue.counts()["queued"]
+            clip_start = time.perf_counter()
+            error = process_single_video(
+                item["url"], i, i + seen_queued, use_script_cache=use_script_cache
+            )
+            state["item_id"] = None
+            
+            if error is None:
+                owned = queue.complete(item["id"], worker_id)
+                if owned:
+                    success_count += 1
+            else:
+                status = queue.fail(item["id"], error, worker_id)
+                owned = status is not None
+                if status == "failed":
+                    fail_count += 1
+                elif owned:
+                    print(f"    🔁 จะลองใหม่ภายหลัง (ครั้งที่ {item['attempts']}/{queue.max_attempts})")
+            if not owned:
+                # lease หมดระหว่างทำ (เช่น เครื่องค้าง) - worker อื่น claim ต่อแล้ว สถานะเป็นของ worker นั้น
+                print("    ⚠️ lease หลุด - worker อื่นรับ URL นี้ไปแล้ว (ไม่อัปเดตสถานะ)")
+            
+            observe_stage("job", time.perf_counter() - clip_start)
+            count_job("completed" if error is None else "failed")
+            if metrics_file:
+                REGISTRY.write(metrics_file)
+            # ไม่พักระหว่างคลิป - Gemini / TTS รอเองเมื่อใกล้ limit (modules/rate_limiter)
+    finally:
+        stop.set()
+        if state["item_id"]:
+            queue.release(state["item_id"], worker_id)  # Ctrl+C กลางคลิป - ไม่นับเป็น attempt
+        # URL ที่เพิ่มลงไฟล์ระหว่างรัน + เขียน URL ที่ยังไม่เสร็จกลับ (ครั้งเดียว)
+        queue.import_file(URL_FILE)
+        queue.export_file(URL_FILE)
     
     # Cleanup
     cleanup_temp_files()
+    prune_script_cache()
     
     # Summary
     print(f"\n{'='*60}")
@@ -239,6 +347,20 @@ Examples:
         nargs='+',
         help='ใส่ URLs โดยตรง (คั่นด้วย space)'
     )
+    parser.add_argument(
+        '--retry-failed',
+        action='store_true',
+        help='ให้ URLs ที่ล้มเหลวครบจำนวนครั้งกลับเข้าคิว'
+    )
+    parser.add_argument(
+        '--metrics-file',
+        help='เขียน metrics (Prometheus text) ลงไฟล์นี้ระหว่างรัน'
+    )
+    parser.add_argument(
+        '--no-script-cache',
+        action='store_true',
+        help='เขียนบทใหม่ทุกคลิป (ไม่ใช้บทจาก script cache)'
+    )
     
     args = parser.parse_args()
     
@@ -258,14 +380,17 @@ Examples:
         return
     
     if args.urls:
-        add_urls_to_file(args.urls)
-        print(f"✅ เพิ่ม {len(args.urls)} URLs")
+        added = UrlQueue().add(args.urls, requeue=True)
+        print(f"✅ เพิ่ม {added} URLs")
+    
+    if args.retry_failed:
+        print(f"🔁 {UrlQueue().retry_failed()} URLs กลับเข้าคิว")
     
     if args.add_urls:
         add_urls_interactive()
     
     # Run factory
-    run_factory()
+    run_factory(metrics_file=args.metrics_file, use_script_cache=not args.no_script_cache)
 
 
 if __name__ == "__main__":
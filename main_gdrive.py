@@ -22,18 +22,16 @@ from pathlib import Path
 
 nest_asyncio.apply()
 
-from config.settings import (
-    ensure_directories, get_config_summary,
-    TEMP_DIR, DELAY_BETWEEN_CLIPS
-)
+from config.settings import ensure_directories, get_config_summary, TEMP_DIR
 from modules.downloader import download_single_video, sanitize_filename
 from modules.gemini_brain import (
     test_api_keys, get_perfect_fit_script, reset_model_fallback,
-    available_keys, MODEL_HIERARCHY
+    get_default_brain, MODEL_HIERARCHY
 )
 from modules.voice import generate_voice_sync
 from modules.video_processor import process_video_pipeline, cleanup_temp_files
 from modules.gdrive import GoogleDriveClient, is_gdrive_available, CREDENTIALS_FILE
+from modules.metrics import REGISTRY, observe_stage, count_job
 
 # =============================================================================
 # 🎯 MAIN FUNCTIONS
@@ -220,8 +218,13 @@ def process_single_video_gdrive(url: str, index: int, total: int, gdrive: Google
                 pass
 
 
-def run_factory_gdrive():
-    """รัน factory กับ Google Drive"""
+def run_factory_gdrive(metrics_file: str = None):
+    """
+    รัน factory กับ Google Drive
+    
+    Args:
+        metrics_file: เขียน metrics (Prometheus text) ลงไฟล์นี้หลังจบแต่ละคลิป
+    """
     ensure_directories()
     
     # Check Google Drive
@@ -265,14 +268,16 @@ def run_factory_gdrive():
     
     print(f"\nProcessing {len(urls)} videos")
     print(f"Models: {', '.join(MODEL_HIERARCHY)}")
-    print(f"API Keys: {len(available_keys)}\n")
+    print(f"API Keys: {len(get_default_brain().keys)}\n")
     
     success_count = 0
     fail_count = 0
     remaining_urls = urls.copy()
     
     for i, url in enumerate(urls, 1):
-        if process_single_video_gdrive(url, i, len(urls), gdrive, folders['output']):
+        clip_start = time.perf_counter()
+        ok = process_single_video_gdrive(url, i, len(urls), gdrive, folders['output'])
+        if ok:
             success_count += 1
             remaining_urls.remove(url)
             # Update urls.txt on Drive (remove processed)
@@ -280,10 +285,10 @@ def run_factory_gdrive():
         else:
             fail_count += 1
         
-        # Delay between clips
-        if i < len(urls):
-            print(f"\n    Wait {DELAY_BETWEEN_CLIPS}s...")
-            time.sleep(DELAY_BETWEEN_CLIPS)
+        observe_stage("job", time.perf_counter() - clip_start)
+        count_job("completed" if ok else "failed")
+        if metrics_file:
+            REGISTRY.write(metrics_file)
     
     # Cleanup local temp
     cleanup_temp_files()
@@ -316,6 +321,10 @@ def main():
         action='store_true',
         help='Test API keys'
     )
+    parser.add_argument(
+        '--metrics-file',
+        help='Write Prometheus metrics to this file while running'
+    )
     
     args = parser.parse_args()
     
@@ -335,7 +344,7 @@ def main():
         return
     
     # Run factory
-    run_factory_gdrive()
+    run_factory_gdrive(metrics_file=args.metrics_file)
 
 
 if __name__ == "__main__":
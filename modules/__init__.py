@@ -1,6 +1,127 @@
 # Modules Package
-from .downloader import *
-from .gemini_brain import *
-from .voice import *
-from .video_processor import *
-from .gdrive import *
+# Submodules โหลดตอนใช้ชื่อครั้งแรก (PEP 562) - `import modules.broker` ไม่ลาก
+# MoviePy / Gemini SDK / yt-dlp / Google Drive API มาด้วย
+
+import importlib
+
+_SUBMODULES = (
+    'downloader',
+    'gemini_brain',
+    'voice',
+    'video_processor',
+    'gdrive',
+    'broker',
+    'metrics',
+    'retention',
+    'url_queue',
+    'download_cache',
+    'rate_limiter',
+    'checkpoints',
+    'script_cache',
+)
+
+# ชื่อที่ export -> submodule (ต้องตรงกับ __all__ ของแต่ละ submodule)
+_EXPORTS = {
+    # downloader
+    'get_urls': 'downloader',
+    'remove_url_from_file': 'downloader',
+    'add_urls_to_file': 'downloader',
+    'sanitize_filename': 'downloader',
+    'normalize_url': 'downloader',
+    'video_key': 'downloader',
+    'download_single_video': 'downloader',
+    'format_selector': 'downloader',
+    'estimate_size': 'downloader',
+    'source_limit_error': 'downloader',
+    'DownloadManager': 'downloader',
+    'DownloadStalled': 'downloader',
+    'get_download_manager': 'downloader',
+    # gemini_brain
+    'test_api_keys': 'gemini_brain',
+    'get_default_brain': 'gemini_brain',
+    'get_perfect_fit_script': 'gemini_brain',
+    'clean_script_final': 'gemini_brain',
+    'AIBrain': 'gemini_brain',
+    'PROMPT_VERSION': 'gemini_brain',
+    # voice
+    'generate_voice': 'voice',
+    'generate_voice_sync': 'voice',
+    'get_audio_duration': 'voice',
+    'sentence_durations': 'voice',
+    'clip_padding': 'voice',
+    'prune_tts_cache': 'voice',
+    # video_processor
+    'prepare_avatar_with_chromakey': 'video_processor',
+    'sync_audio_to_video': 'video_processor',
+    'render_final_video': 'video_processor',
+    'process_video_pipeline': 'video_processor',
+    'process_video_renditions': 'video_processor',
+    'render_renditions': 'video_processor',
+    'resolve_output_profiles': 'video_processor',
+    'hls_dir_for': 'video_processor',
+    'resize_for_shorts': 'video_processor',
+    'choose_encoding': 'video_processor',
+    'probe_complexity': 'video_processor',
+    'cleanup_temp_files': 'video_processor',
+    # gdrive
+    'GoogleDriveClient': 'gdrive',
+    'setup_google_drive': 'gdrive',
+    'is_gdrive_available': 'gdrive',
+    # broker
+    'JobBroker': 'broker',
+    'QueueFullError': 'broker',
+    'DuplicateJobError': 'broker',
+    # metrics
+    'Registry': 'metrics',
+    'REGISTRY': 'metrics',
+    'stage_timer': 'metrics',
+    'observe_stage': 'metrics',
+    'count_bytes': 'metrics',
+    'count_rate_limit': 'metrics',
+    'count_rate_limit_wait': 'metrics',
+    'count_job': 'metrics',
+    'observe_calibration_rounds': 'metrics',
+    'observe_download_throughput': 'metrics',
+    'count_download_cache': 'metrics',
+    'count_download_stall': 'metrics',
+    'count_script_cache': 'metrics',
+    'count_script_hedge': 'metrics',
+    'key_label': 'metrics',
+    'render_merged': 'metrics',
+    # retention
+    'mark_used': 'retention',
+    'enforce_output_budget': 'retention',
+    'collect_garbage': 'retention',
+    # url_queue
+    'UrlQueue': 'url_queue',
+    # download_cache
+    'DownloadCache': 'download_cache',
+    'format_key': 'download_cache',
+    # rate_limiter
+    'AdaptiveLimiter': 'rate_limiter',
+    'get_limiter': 'rate_limiter',
+    'is_rate_limited': 'rate_limiter',
+    'retry_after': 'rate_limiter',
+    # checkpoints
+    'Checkpoint': 'checkpoints',
+    'prune_checkpoints': 'checkpoints',
+    # script_cache
+    'ScriptCache': 'script_cache',
+    'prune_script_cache': 'script_cache',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+        globals()[name] = value
+        return value
+    if name in _SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS) | set(_SUBMODULES))
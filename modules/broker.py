@@ -0,0 +1,789 @@
+# =============================================================================
+# 📮 JOB BROKER MODULE
+# =============================================================================
+# คิวงานบน SQLite (ไม่ต้องมี service ภายนอก)
+# - API process: enqueue + อ่านสถานะเท่านั้น
+# - Worker processes: claim งาน (มี lease), รายงาน progress, complete/fail
+
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+from config.settings import (
+    BROKER_DB, API_MAX_QUEUE, WORKER_LEASE_SECONDS, MAX_JOB_ATTEMPTS,
+    EVENT_MIN_INTERVAL, TASK_TTL_SECONDS
+)
+
+__all__ = [
+    'JobBroker',
+    'QueueFullError',
+    'DuplicateJobError',
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    queue       TEXT NOT NULL,
+    status      TEXT NOT NULL,            -- waiting (รอ batch เตรียมเสร็จ), pending, processing, completed, failed
+    payload     TEXT NOT NULL,            -- JSON (input ของงาน)
+    progress    INTEGER NOT NULL DEFAULT 0,
+    message     TEXT NOT NULL DEFAULT '',
+    data        TEXT NOT NULL DEFAULT '{}', -- JSON (field อื่นๆ ที่ client เห็น เช่น result_file)
+    error       TEXT,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    worker      TEXT,
+    lease_until REAL,
+    created_at  REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL,
+    batch_id    TEXT,                     -- งานย่อยของ batch ไหน (NULL = งานเดี่ยว)
+    fingerprint TEXT                      -- input + config (งานซ้ำ = ใช้ผลร่วมกัน)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_queue_status ON jobs (queue, status, created_at);
+
+-- Progress events (stream ไปให้ client ผ่าน SSE)
+CREATE TABLE IF NOT EXISTS events (
+    seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id  TEXT NOT NULL,
+    type    TEXT NOT NULL,
+    data    TEXT NOT NULL,
+    ts      REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_job ON events (job_id, seq);
+
+-- Metrics snapshot ของแต่ละ worker (api.py รวมแล้วเสิร์ฟที่ /metrics)
+CREATE TABLE IF NOT EXISTS metrics (
+    source     TEXT PRIMARY KEY,
+    snapshot   TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS workers (
+    id           TEXT PRIMARY KEY,
+    pid          INTEGER,
+    heartbeat_at REAL NOT NULL,
+    current_job  TEXT
+);
+"""
+
+# Field ที่ client เห็น (นอกเหนือจาก column หลัก) - เก็บใน data JSON
+PUBLIC_COLUMNS = ("id", "status", "progress", "message", "error")
+
+# สถานะที่ยังไม่จบ (นับเป็นงานในคิว / งานค้างของ batch)
+OPEN_STATUSES = ("waiting", "pending", "processing")
+
+# Field ที่บอกว่า event เปลี่ยนสถานะ (ห้าม throttle ทิ้ง)
+EVENT_STATE_KEYS = ("status", "state", "round")
+
+
+class QueueFullError(Exception):
+    """คิวเต็ม - ให้ client ลองใหม่ภายหลัง (HTTP 429)"""
+    
+    def __init__(self, queue_depth: int, max_queue: int, retry_after: int):
+        super().__init__(f"Queue full ({queue_depth}/{max_queue})")
+        self.queue_depth = queue_depth
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+
+
+class DuplicateJobError(Exception):
+    """มีงาน fingerprint เดียวกันที่ยังไม่จบอยู่แล้ว - ให้รอผลงานนั้นแทน"""
+    
+    def __init__(self, job_id: str):
+        super().__init__(f"Duplicate of job {job_id}")
+        self.job_id = job_id
+
+
+class JobBroker:
+    """
+    SQLite job queue ที่หลาย process ใช้ร่วมกันได้ (WAL mode)
+    
+    Usage:
+        broker = JobBroker()
+        broker.enqueue(job_id, {"url": ...})          # API
+        job = broker.claim("worker-1")                # Worker
+        broker.update(job["id"], progress=50, message="...")
+        broker.complete(job["id"], result_file="x.mp4")
+    """
+    
+    def __init__(self, db_path: Path = None, queue: str = "api"):
+        self.db_path = Path(db_path or BROKER_DB)
+        self.queue = queue
+        self._local = threading.local()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn().executescript(SCHEMA)
+        self._migrate()
+    
+    # -------------------------------------------------------------------------
+    # Connection
+    # -------------------------------------------------------------------------
+    
+    def _conn(self) -> sqlite3.Connection:
+        """1 connection ต่อ thread (autocommit, จัดการ transaction เอง)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+    
+    def _migrate(self) -> None:
+        """เพิ่ม column ใหม่ให้ DB ที่สร้างจาก schema เก่า"""
+        conn = self._conn()
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for column in ("batch_id", "fingerprint"):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_fingerprint ON jobs (fingerprint, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at)")
+    
+    def _write(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        """คำสั่งเขียนแบบ atomic"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.execute(sql, params)
+            conn.execute("COMMIT")
+            return cursor
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    
+    # -------------------------------------------------------------------------
+    # API side
+    # -------------------------------------------------------------------------
+    
+    def enqueue(self, job_id: str, payload: dict, max_queue: int = None,
+                fingerprint: str = None, **data) -> int:
+        """
+        ส่งงานเข้าคิว (ตรวจ admission / งานซ้ำ ใน transaction เดียวกัน)
+        
+        Args:
+            fingerprint: ถ้าระบุ และมีงาน fingerprint เดียวกันที่ยังไม่จบ = ไม่สร้างงานใหม่
+        
+        Returns:
+            ลำดับในคิว (1 = งานถัดไป)
+        
+        Raises:
+            QueueFullError: ถ้ามีงานรออยู่ครบ max_queue แล้ว
+            DuplicateJobError: ถ้ามีงานซ้ำที่ยังไม่จบ (job_id = งานนั้น)
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if fingerprint:
+                row = conn.execute(
+                    f"SELECT id FROM jobs WHERE fingerprint = ? AND status IN {OPEN_STATUSES} "
+                    "ORDER BY created_at DESC LIMIT 1",
+                    (fingerprint,)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("ROLLBACK")
+                    raise DuplicateJobError(row["id"])
+            
+            depth = self._admit(conn, 1, max_queue)
+            conn.execute(
+                "INSERT INTO jobs (id, queue, status, payload, message, data, created_at, fingerprint) "
+                "VALUES (?, ?, 'pending', ?, 'Queued', ?, ?, ?)",
+                (job_id, self.queue, json.dumps(payload), json.dumps(data), time.time(), fingerprint)
+            )
+            conn.execute("COMMIT")
+        except (QueueFullError, DuplicateJobError):
+            raise
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        
+        return depth + 1
+    
+    def enqueue_batch(self, batch_id: str, payload: dict, items: list, max_queue: int = None,
+                      reused: dict = None) -> int:
+        """
+        ส่ง batch เข้าคิว: งานเตรียม batch 1 งาน + งานย่อยสถานะ waiting
+        
+        งานย่อยถูกปล่อยเป็น pending ด้วย release_batch() หลังเตรียมของที่ใช้ร่วมกันเสร็จ
+        งานย่อยที่ fingerprint ตรงกับงานที่ยังไม่จบ = ไม่สร้างใหม่ ผูกกับงานนั้นแทน
+        (เหมือน DuplicateJobError ของ enqueue - batch_items คืนงานนั้นในตำแหน่งของงานย่อย)
+        
+        Args:
+            batch_id: id ของงานเตรียม batch (ใช้เป็น id ของ batch ด้วย)
+            payload: payload ของงานเตรียม batch (items [{id, url}] - งานย่อยที่ผูกกับงานเดิมถูกตัดออก)
+            items: [(item_id, item_payload, data dict[, fingerprint]), ...]
+            max_queue: admission นับทุกงานย่อย (ยกเว้นที่ใช้ผลเดิม / ผูกกับงานเดิม)
+            reused: {item_id: ผลของงานเดิมที่ fingerprint ตรงกัน} - งานย่อยนี้เสร็จทันที ไม่เข้าคิว
+        
+        Returns:
+            ลำดับในคิวของงานเตรียม batch
+        
+        Raises:
+            QueueFullError: ถ้าคิวรับงานย่อยทั้งหมดไม่ได้
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            reused = reused or {}
+            # งานย่อยที่มีงานเดิมกำลังทำอยู่ (ตรวจใน transaction เดียวกับ insert)
+            attached = []
+            for index, (item_id, _, data, *fingerprint) in enumerate(items):
+                if item_id in reused or not fingerprint or not fingerprint[0]:
+                    continue
+                row = conn.execute(
+                    f"SELECT id FROM jobs WHERE fingerprint = ? AND status IN {OPEN_STATUSES} "
+                    "ORDER BY created_at DESC LIMIT 1",
+                    (fingerprint[0],)
+                ).fetchone()
+                if row is not None:
+                    attached.append({"id": row["id"], "index": index, "item": item_id, "url": data.get("url")})
+            skipped = {entry["item"] for entry in attached}
+            if skipped and "items" in payload:
+                payload = {**payload, "items": [item for item in payload["items"] if item["id"] not in skipped]}
+            
+            depth = self._admit(conn, len(items) - len(reused) - len(attached), max_queue)
+            now = time.time()
+            batch_data = {"total": len(items)}
+            if attached:
+                batch_data["attached"] = [
+                    {k: entry[k] for k in ("id", "index", "url")} for entry in attached
+                ]
+            conn.execute(
+                "INSERT INTO jobs (id, queue, status, payload, message, data, created_at) "
+                "VALUES (?, ?, 'pending', ?, 'Queued', ?, ?)",
+                (batch_id, self.queue, json.dumps(payload), json.dumps(batch_data), now)
+            )
+            # created_at เรียงตามลำดับที่ส่งมา -> งานย่อยถูก claim ต่อเนื่องกัน
+            for i, (item_id, item_payload, data, *fingerprint) in enumerate(items, 1):
+                fingerprint = fingerprint[0] if fingerprint else None
+                if item_id in skipped:
+                    continue
+                if item_id in reused:
+                    item_payload = {k: v for k, v in item_payload.items() if k != "api_key"}
+                    conn.execute(
+                        "INSERT INTO jobs (id, queue, status, progress, payload, message, data, created_at, "
+                        "finished_at, batch_id) VALUES (?, ?, 'completed', 100, ?, 'Done!', ?, ?, ?, ?)",
+                        (item_id, self.queue, json.dumps(item_payload),
+                         json.dumps({**data, **reused[item_id], "reused": True}),
+                         now + i * 1e-6, now, batch_id)
+                    )
+                    continue
+                conn.execute(
+                    "INSERT INTO jobs (id, queue, status, payload, message, data, created_at, batch_id, "
+                    "fingerprint) VALUES (?, ?, 'waiting', ?, 'Waiting for batch preparation', ?, ?, ?, ?)",
+                    (item_id, self.queue, json.dumps(item_payload), json.dumps(data),
+                     now + i * 1e-6, batch_id, fingerprint)
+                )
+            conn.execute("COMMIT")
+        except QueueFullError:
+            raise
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        
+        return depth + 1
+    
+    def _admit(self, conn: sqlite3.Connection, count: int, max_queue: int = None) -> int:
+        """
+        ตรวจ admission (เรียกใน transaction) - ROLLBACK แล้ว raise ถ้าคิวเต็ม
+        
+        Returns:
+            จำนวนงานที่รออยู่ก่อนหน้า
+        """
+        if max_queue is None:
+            max_queue = API_MAX_QUEUE
+        depth = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE queue = ? AND status IN ('pending', 'waiting')",
+            (self.queue,)
+        ).fetchone()[0]
+        if depth + count > max_queue:
+            conn.execute("ROLLBACK")
+            raise QueueFullError(depth, max_queue, self._retry_after(depth))
+        return depth
+    
+    def get(self, job_id: str) -> dict | None:
+        """สถานะงาน (primary key lookup)"""
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_task(row) if row else None
+    
+    def find_completed(self, fingerprint: str) -> dict | None:
+        """งานล่าสุดที่เสร็จแล้วและมี fingerprint นี้ (None = ไม่มี)"""
+        row = self._conn().execute(
+            "SELECT * FROM jobs WHERE fingerprint = ? AND status = 'completed' "
+            "ORDER BY finished_at DESC LIMIT 1",
+            (fingerprint,)
+        ).fetchone()
+        return self._to_task(row) if row else None
+    
+    def position(self, job_id: str) -> int | None:
+        """ลำดับในคิว (None = ไม่ได้รออยู่)"""
+        row = self._conn().execute(
+            "SELECT created_at FROM jobs WHERE id = ? AND status = 'pending'", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        ahead = self._conn().execute(
+            "SELECT COUNT(*) FROM jobs WHERE queue = ? AND status = 'pending' AND created_at < ?",
+            (self.queue, row["created_at"])
+        ).fetchone()[0]
+        return ahead + 1
+    
+    def stats(self, max_queue: int = None) -> dict:
+        """สถานะคิวสำหรับ /api/status"""
+        conn = self._conn()
+        now = time.time()
+        counts = dict(conn.execute(
+            "SELECT status, COUNT(*) FROM jobs WHERE queue = ? GROUP BY status", (self.queue,)
+        ).fetchall())
+        oldest = conn.execute(
+            "SELECT MIN(created_at) FROM jobs WHERE queue = ? AND status = 'pending'", (self.queue,)
+        ).fetchone()[0]
+        avg_wait = conn.execute(
+            "SELECT AVG(started_at - created_at) FROM ("
+            "  SELECT started_at, created_at FROM jobs"
+            "  WHERE queue = ? AND started_at IS NOT NULL ORDER BY started_at DESC LIMIT 100)",
+            (self.queue,)
+        ).fetchone()[0]
+        
+        return {
+            "workers": self.alive_workers(),
+            "active": counts.get("processing", 0),
+            "queue_depth": counts.get("pending", 0) + counts.get("waiting", 0),
+            "max_queue": max_queue if max_queue is not None else API_MAX_QUEUE,
+            "avg_wait_seconds": round(avg_wait or 0.0, 2),
+            "oldest_wait_seconds": round(now - oldest, 2) if oldest else 0.0,
+        }
+    
+    # -------------------------------------------------------------------------
+    # Worker side
+    # -------------------------------------------------------------------------
+    
+    def claim(self, worker_id: str, lease_seconds: float = None) -> dict | None:
+        """
+        รับงานที่เก่าที่สุด (หรืองานที่ worker เดิมตายไปแล้ว lease หมด)
+        
+        Returns:
+            {"id", "payload", "attempts"} หรือ None ถ้าไม่มีงาน
+        """
+        lease_seconds = lease_seconds or WORKER_LEASE_SECONDS
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # งานที่ worker ตายแล้วลองครบจำนวน = fail (ลบ api_key + status event เหมือน fail ปกติ)
+            lost = conn.execute(
+                "SELECT id, payload FROM jobs WHERE queue = ? AND status = 'processing' "
+                "AND lease_until < ? AND attempts >= ?",
+                (self.queue, now, MAX_JOB_ATTEMPTS)
+            ).fetchall()
+            for job in lost:
+                payload = json.loads(job["payload"])
+                payload.pop("api_key", None)
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'Worker lost', message = 'Error occurred', "
+                    "payload = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+                    (json.dumps(payload), now, job["id"])
+                )
+                self._insert_event(conn, job["id"], "status", {
+                    "status": "failed", "error": "Worker lost", "message": "Error occurred"
+                })
+            row = conn.execute(
+                "SELECT id, payload, attempts, created_at FROM jobs WHERE queue = ? AND ("
+                "  status = 'pending' OR (status = 'processing' AND lease_until < ?)"
+                ") ORDER BY created_at LIMIT 1",
+                (self.queue, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            
+            conn.execute(
+                "UPDATE jobs SET status = 'processing', worker = ?, lease_until = ?, "
+                "attempts = attempts + 1, started_at = COALESCE(started_at, ?) WHERE id = ?",
+                (worker_id, now + lease_seconds, now, row["id"])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        
+        return {
+            "id": row["id"],
+            "payload": json.loads(row["payload"]),
+            "attempts": row["attempts"] + 1,
+            "created_at": row["created_at"],
+        }
+    
+    def heartbeat(self, worker_id: str, job_id: str = None, lease_seconds: float = None) -> None:
+        """ต่อ lease ของงาน + บอกว่า worker ยังอยู่"""
+        lease_seconds = lease_seconds or WORKER_LEASE_SECONDS
+        now = time.time()
+        self._write(
+            "INSERT INTO workers (id, pid, heartbeat_at, current_job) VALUES (?, NULL, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at, "
+            "current_job = excluded.current_job",
+            (worker_id, now, job_id)
+        )
+        if job_id:
+            self._write(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'processing'",
+                (now + lease_seconds, job_id, worker_id)
+            )
+    
+    def register_worker(self, worker_id: str, pid: int) -> None:
+        self._write(
+            "INSERT OR REPLACE INTO workers (id, pid, heartbeat_at, current_job) VALUES (?, ?, ?, NULL)",
+            (worker_id, pid, time.time())
+        )
+    
+    def unregister_worker(self, worker_id: str) -> None:
+        self._write("DELETE FROM workers WHERE id = ?", (worker_id,))
+    
+    def alive_workers(self) -> int:
+        """จำนวน worker ที่ heartbeat ภายใน lease"""
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM workers WHERE heartbeat_at > ?",
+            (time.time() - WORKER_LEASE_SECONDS,)
+        ).fetchone()[0]
+    
+    def update(self, job_id: str, **fields) -> None:
+        """
+        อัปเดต progress / message / field อื่นๆ ที่ client เห็น
+        
+        Usage:
+            broker.update(job_id, progress=30, message="...", hls_url="...")
+        """
+        columns = {k: fields.pop(k) for k in ("status", "progress", "message", "error") if k in fields}
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if fields:
+                row = conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row is not None:
+                    data = {**json.loads(row["data"]), **fields}
+                    columns["data"] = json.dumps(data)
+            if columns:
+                assignments = ", ".join(f"{k} = ?" for k in columns)
+                conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*columns.values(), job_id))
+            
+            # การเปลี่ยนแปลงทุกครั้งเป็น event "status" ด้วย (ให้ SSE client เห็น)
+            changes = {k: v for k, v in columns.items() if k != "data"}
+            changes.update(fields)
+            if changes:
+                self._insert_event(conn, job_id, "status", changes)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    
+    # -------------------------------------------------------------------------
+    # Progress events
+    # -------------------------------------------------------------------------
+    
+    @staticmethod
+    def _insert_event(conn: sqlite3.Connection, job_id: str, event_type: str, data: dict) -> None:
+        conn.execute(
+            "INSERT INTO events (job_id, type, data, ts) VALUES (?, ?, ?, ?)",
+            (job_id, event_type, json.dumps(data), time.time())
+        )
+    
+    def publish(self, job_id: str, event_type: str, **data) -> None:
+        """บันทึก progress event ละเอียด (download bytes, render frame ฯลฯ)"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._insert_event(conn, job_id, event_type, data)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    
+    def events_since(self, job_id: str, after_seq: int = 0, limit: int = 200) -> list:
+        """
+        Events ของงานที่ใหม่กว่า after_seq
+        
+        Returns:
+            [{"seq", "type", "data", "ts"}]
+        """
+        rows = self._conn().execute(
+            "SELECT seq, type, data, ts FROM events WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+            (job_id, after_seq, limit)
+        ).fetchall()
+        return [
+            {"seq": row["seq"], "type": row["type"], "data": json.loads(row["data"]), "ts": row["ts"]}
+            for row in rows
+        ]
+    
+    def last_event_seq(self, job_id: str) -> int:
+        """seq ล่าสุดของงาน (0 = ยังไม่มี event)"""
+        return self._conn().execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM events WHERE job_id = ?", (job_id,)
+        ).fetchone()[0]
+    
+    def emitter(self, job_id: str, min_interval: float = None):
+        """
+        สร้าง callable(event, **data) สำหรับส่ง progress แบบ throttle
+        
+        Event ชนิดเดียวกันถูกบันทึกได้ไม่ถี่กว่า min_interval ยกเว้นเมื่อ
+        status/state/round เปลี่ยน (จะไม่มี state transition ไหนหายไป)
+        """
+        if min_interval is None:
+            min_interval = EVENT_MIN_INTERVAL
+        last_sent = {}  # event type -> (time, state tuple)
+        
+        def emit(event_type: str, **data) -> None:
+            now = time.time()
+            state = tuple(data.get(k) for k in EVENT_STATE_KEYS)
+            previous = last_sent.get(event_type)
+            if previous and now - previous[0] < min_interval and previous[1] == state:
+                return
+            last_sent[event_type] = (now, state)
+            try:
+                self.publish(job_id, event_type, **data)
+            except sqlite3.Error as e:
+                # progress event หายได้ แต่ห้ามทำให้งานล้ม
+                print(f"⚠️ publish event error: {e}")
+        
+        return emit
+    
+    # -------------------------------------------------------------------------
+    # Batches
+    # -------------------------------------------------------------------------
+    
+    def release_batch(self, batch_id: str, items: dict = None, shared: dict = None,
+                      error: str = None) -> int:
+        """
+        ปล่อยงานย่อยที่ waiting ของ batch (หลังงานเตรียม batch จบ)
+        
+        Args:
+            items: {item_id: {"error": ...} หรือ field ที่จะเพิ่มเข้า payload}
+            shared: field ที่เพิ่มเข้า payload ของทุกงานย่อย (เช่น avatar_path)
+            error: งานเตรียมล้มเหลว -> งานย่อยทั้งหมด fail ด้วย error นี้
+        
+        Returns:
+            จำนวนงานย่อยที่เข้าคิว (pending)
+        """
+        items = items or {}
+        now = time.time()
+        released = 0
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, payload FROM jobs WHERE batch_id = ? AND status = 'waiting' ORDER BY created_at",
+                (batch_id,)
+            ).fetchall()
+            for row in rows:
+                payload = json.loads(row["payload"])
+                extra = items.get(row["id"], {})
+                item_error = error or extra.get("error")
+                if item_error:
+                    payload.pop("api_key", None)
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, message = 'Error occurred', "
+                        "payload = ?, finished_at = ? WHERE id = ?",
+                        (item_error, json.dumps(payload), now, row["id"])
+                    )
+                    self._insert_event(conn, row["id"], "status", {"status": "failed", "error": item_error})
+                else:
+                    payload.update(shared or {})
+                    payload.update(extra)
+                    conn.execute(
+                        "UPDATE jobs SET status = 'pending', message = 'Queued', payload = ? WHERE id = ?",
+                        (json.dumps(payload), row["id"])
+                    )
+                    self._insert_event(conn, row["id"], "status", {"status": "pending", "message": "Queued"})
+                    released += 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return released
+    
+    def batch_items(self, batch_id: str) -> list:
+        """สถานะงานย่อยทั้งหมดของ batch (เรียงตามลำดับที่ส่งมา - รวมงานเดิมที่งานย่อยผูกไว้)"""
+        rows = self._conn().execute(
+            "SELECT * FROM jobs WHERE batch_id = ? ORDER BY created_at", (batch_id,)
+        ).fetchall()
+        items = [self._to_task(row) for row in rows]
+        batch = self.get(batch_id)
+        for entry in (batch or {}).get("attached", []):
+            task = self.get(entry["id"])
+            if task is not None:
+                items.insert(min(entry["index"], len(items)), {**task, "url": entry["url"], "reused": True})
+        return items
+    
+    def batch_open_items(self, batch_id: str) -> int:
+        """จำนวนงานย่อยที่ยังไม่จบ"""
+        return self._conn().execute(
+            f"SELECT COUNT(*) FROM jobs WHERE batch_id = ? AND status IN {OPEN_STATUSES}",
+            (batch_id,)
+        ).fetchone()[0]
+    
+    def batch_status(self, batch_id: str) -> dict | None:
+        """
+        สถานะรวมของ batch
+        
+        status: preparing -> processing -> completed / partial / failed
+        """
+        batch = self.get(batch_id)
+        if batch is None or "total" not in batch:
+            return None
+        items = self.batch_items(batch_id)
+        
+        counts = {}
+        for item in items:
+            counts[item["status"]] = counts.get(item["status"], 0) + 1
+        
+        if batch["status"] in ("pending", "processing"):
+            status = "preparing"
+        elif batch["status"] == "failed":
+            status = "failed"
+        elif any(counts.get(s) for s in OPEN_STATUSES):
+            status = "processing"
+        elif counts.get("completed", 0) == len(items):
+            status = "completed"
+        elif not counts.get("completed"):
+            status = "failed"
+        else:
+            status = "partial"
+        
+        done = counts.get("completed", 0) + counts.get("failed", 0)
+        return {
+            "id": batch_id,
+            "status": status,
+            "progress": int(sum(item["progress"] for item in items) / len(items)) if items else 0,
+            "message": batch["message"] if status == "preparing" else f"{done}/{len(items)} done",
+            "total": len(items),
+            "counts": counts,
+            "items": items,
+            "error": batch["error"],
+        }
+    
+    def complete(self, job_id: str, worker_id: str = None, **fields) -> bool:
+        """
+        งานเสร็จ (fields = ผลลัพธ์ เช่น result_file)
+        
+        Args:
+            worker_id: worker ที่รันงาน - ต้องยังถืองานอยู่ (ดู _finish)
+        
+        Returns:
+            False ถ้า worker ไม่ได้ถืองานนี้แล้ว (ไม่บันทึกผล)
+        """
+        return self._finish(job_id, worker_id, {"status": "completed", "progress": 100, "message": "Done!"}, fields)
+    
+    def fail(self, job_id: str, error: str, worker_id: str = None) -> bool:
+        """งานล้มเหลว (Returns เหมือน complete)"""
+        return self._finish(job_id, worker_id, {"status": "failed", "error": error, "message": "Error occurred"})
+    
+    def _finish(self, job_id: str, worker_id: str, columns: dict, fields: dict = None) -> bool:
+        """
+        จบงาน + ลบ secrets (เช่น api_key) ออกจาก payload ใน transaction เดียว
+        
+        worker_id ที่ระบุต้องยังเป็นเจ้าของงาน (status = processing) - worker ที่ช้าจน lease หมด
+        แล้วมี worker อื่นรับงานไป / ถูก fail เป็น "Worker lost" จะไม่ทับสถานะ
+        """
+        fields = fields or {}
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT data, payload FROM jobs WHERE id = ? AND "
+                "(? IS NULL OR (worker = ? AND status = 'processing'))",
+                (job_id, worker_id, worker_id)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return False
+            
+            payload = json.loads(row["payload"])
+            payload.pop("api_key", None)
+            values = {
+                **columns,
+                "data": json.dumps({**json.loads(row["data"]), **fields}),
+                "payload": json.dumps(payload),
+                "finished_at": time.time(),
+                "lease_until": None,
+            }
+            assignments = ", ".join(f"{k} = ?" for k in values)
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*values.values(), job_id))
+            self._insert_event(conn, job_id, "status", {**columns, **fields})
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+    
+    # -------------------------------------------------------------------------
+    # Metrics
+    # -------------------------------------------------------------------------
+    
+    def save_metrics(self, source: str, snapshot: dict) -> None:
+        """เก็บ metrics snapshot ของ process (แทนที่ของเดิม)"""
+        self._write(
+            "INSERT INTO metrics (source, snapshot, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(source) DO UPDATE SET snapshot = excluded.snapshot, updated_at = excluded.updated_at",
+            (source, json.dumps(snapshot), time.time())
+        )
+    
+    def load_metrics(self) -> list:
+        """metrics snapshot ของทุก process"""
+        rows = self._conn().execute("SELECT snapshot FROM metrics").fetchall()
+        return [json.loads(row["snapshot"]) for row in rows]
+    
+    # -------------------------------------------------------------------------
+    # Retention
+    # -------------------------------------------------------------------------
+    
+    def evict_finished(self, ttl_seconds: float = None) -> int:
+        """
+        ลบงานที่จบนานเกิน TTL (พร้อม progress events)
+        
+        งานเตรียม batch ถูกเก็บไว้จนกว่างานย่อยจะจบหมด
+        
+        Returns:
+            จำนวนงานที่ลบ
+        """
+        if ttl_seconds is None:
+            ttl_seconds = TASK_TTL_SECONDS
+        expired = (
+            "SELECT id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ? "
+            "AND NOT EXISTS (SELECT 1 FROM jobs AS item WHERE item.batch_id = jobs.id "
+            "AND item.finished_at IS NULL)"
+        )
+        cutoff = time.time() - ttl_seconds
+        
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(f"DELETE FROM events WHERE job_id IN ({expired})", (cutoff,))
+            deleted = conn.execute(f"DELETE FROM jobs WHERE id IN ({expired})", (cutoff,)).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return deleted
+    
+    # -------------------------------------------------------------------------
+    # Helpers
+    # -------------------------------------------------------------------------
+    
+    def _retry_after(self, depth: int) -> int:
+        """ประมาณเวลาที่ควรลองใหม่ (วินาที) จากเวลารันเฉลี่ยของงานล่าสุด"""
+        avg_run = self._conn().execute(
+            "SELECT AVG(finished_at - started_at) FROM ("
+            "  SELECT finished_at, started_at FROM jobs"
+            "  WHERE queue = ? AND finished_at IS NOT NULL AND started_at IS NOT NULL"
+            "  ORDER BY finished_at DESC LIMIT 50)",
+            (self.queue,)
+        ).fetchone()[0] or 60
+        workers = max(1, self.alive_workers())
+        return max(1, int(avg_run * depth / workers))
+    
+    @staticmethod
+    def _to_task(row: sqlite3.Row) -> dict:
+        task = {k: row[k] for k in PUBLIC_COLUMNS}
+        task.update(json.loads(row["data"]))
+        return task
@@ -0,0 +1,108 @@
+# =============================================================================
+# 💾 CHECKPOINTS MODULE
+# =============================================================================
+# เก็บผลของแต่ละขั้นต่อคลิป (source, บท, เสียง) - งานที่พังตอน render
+# รันใหม่แล้วทำต่อจากขั้นที่ค้าง ไม่ต้องโหลด / upload Gemini / calibrate / TTS ซ้ำ
+#
+# โครงสร้าง: <CHECKPOINT_DIR>/<sha256(key)[:32]>/{state.json, ไฟล์ของแต่ละขั้น}
+# งานสำเร็จ = ลบทิ้ง / งานที่ไม่ถูกรันต่อนานเกิน CHECKPOINT_MAX_AGE_SECONDS ถูกเก็บกวาด
+
+import os
+import json
+import shutil
+import hashlib
+from pathlib import Path
+
+from config.settings import CHECKPOINT_DIR, CHECKPOINT_MAX_AGE_SECONDS
+from modules.retention import enforce_output_budget
+
+__all__ = [
+    'Checkpoint',
+    'prune_checkpoints',
+]
+
+# ลำดับขั้น - save ขั้นไหน = ขั้นหลังจากนั้นใช้ไม่ได้แล้ว (input เปลี่ยน)
+STAGES = ("download", "script", "voice")
+
+STATE_FILE = "state.json"
+
+
+class Checkpoint:
+    """
+    Checkpoint ของงาน 1 ชิ้น (key เดียวกัน = งานเดียวกัน ข้าม process / การรันใหม่)
+    
+    Usage:
+        checkpoint = Checkpoint(f"cli:{video_key(url)}")
+        source = checkpoint.get("download")
+        if source is None:
+            path = download_single_video(url, checkpoint.dir)
+            checkpoint.save("download", path=path, duration=duration)
+        ...
+        checkpoint.clear()   # งานสำเร็จ
+    """
+    
+    def __init__(self, key: str, root: Path = None):
+        self.key = key
+        self.dir = Path(root or CHECKPOINT_DIR) / hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+        self._stages = self._load()
+    
+    def _load(self) -> dict:
+        try:
+            state = json.loads((self.dir / STATE_FILE).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        return state.get("stages", {}) if state.get("key") == self.key else {}
+    
+    def stages(self) -> list:
+        """ขั้นที่เสร็จแล้ว (ตามลำดับ)"""
+        return [stage for stage in STAGES if stage in self._stages]
+    
+    def get(self, stage: str, **expected) -> dict | None:
+        """
+        ผลของขั้นนี้ (None = ยังไม่เคยทำ / ใช้ไม่ได้)
+        
+        Args:
+            expected: ค่าที่ต้องตรง (เช่น voice=[...] - เปลี่ยนเสียงพากย์ = ทำขั้นนี้ใหม่)
+        """
+        data = self._stages.get(stage)
+        if data is None:
+            return None
+        if any(data.get(name) != value for name, value in expected.items()):
+            return None
+        if data.get("path") and not os.path.exists(data["path"]):
+            return None
+        return data
+    
+    def path(self, name: str) -> Path:
+        """path ของไฟล์ในโฟลเดอร์ checkpoint (ไฟล์ที่ขั้นถัดไปต้องใช้ เช่น voice.mp3)"""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        return self.dir / name
+    
+    def save(self, stage: str, **data) -> None:
+        """บันทึกผลของขั้นนี้ (atomic) - ขั้นหลังจากนี้ถูกล้าง"""
+        later = STAGES[STAGES.index(stage) + 1:]
+        self._stages = {
+            name: value for name, value in self._stages.items() if name not in later
+        }
+        self._stages[stage] = json.loads(json.dumps(data, default=str))
+        
+        state = self.path(STATE_FILE)
+        tmp = state.with_name(STATE_FILE + ".tmp")
+        tmp.write_text(
+            json.dumps({"key": self.key, "stages": self._stages}, ensure_ascii=False),
+            encoding="utf-8"
+        )
+        os.replace(tmp, state)
+    
+    def clear(self) -> None:
+        """งานสำเร็จ - ลบ checkpoint + ไฟล์ทั้งหมด"""
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self._stages = {}
+
+
+def prune_checkpoints(root: Path = None, max_age: float = None) -> dict:
+    """ลบ checkpoint ของงานที่ไม่ถูกรันต่อนานเกิน max_age (ไม่นับตัวที่เพิ่งเขียน)"""
+    max_age = CHECKPOINT_MAX_AGE_SECONDS if max_age is None else max_age
+    return enforce_output_budget(
+        root or CHECKPOINT_DIR, max_bytes=0, max_age=max_age, grace=max_age, label="checkpoint"
+    )
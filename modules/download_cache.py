@@ -0,0 +1,169 @@
+# =============================================================================
+# 🗃️ DOWNLOAD CACHE MODULE
+# =============================================================================
+# เก็บไฟล์ต้นฉบับที่ดาวน์โหลดแล้ว (key = video_key + format)
+# - คลิปที่ fail ตอน Gemini / render แล้วรันใหม่ ไม่ต้องโหลดใหม่
+# - ใช้ hardlink เข้า workspace ของงาน (ไม่ copy) - งานลบไฟล์ของตัวเองได้ตามปกติ
+# - ตรวจขนาด + SHA-256 ก่อนใช้ / เกิน disk budget ลบตัวที่ไม่ได้ใช้นานสุดก่อน
+
+import os
+import json
+import shutil
+import hashlib
+import time
+from pathlib import Path
+
+from config.settings import (
+    DOWNLOAD_CACHE_DIR, DOWNLOAD_CACHE_MAX_BYTES, DOWNLOAD_CACHE_VERIFY,
+    VIDEO_WIDTH, VIDEO_HEIGHT, VIDEO_FPS, DOWNLOAD_SOURCE_AUDIO
+)
+from modules.downloader import video_key
+from modules.retention import mark_used, enforce_output_budget
+
+__all__ = [
+    'DownloadCache',
+    'format_key',
+]
+
+META_FILE = "meta.json"
+
+# entry ที่เพิ่งเขียนไม่ถูกลบ (งานอื่นอาจกำลัง link อยู่)
+CACHE_GRACE_SECONDS = 60
+
+
+def format_key() -> str:
+    """ส่วนของ key ที่ขึ้นกับ format ที่เลือก (เปลี่ยนขนาด output = ไฟล์ cache เดิมใช้ไม่ได้)"""
+    return f"{VIDEO_WIDTH}x{VIDEO_HEIGHT}@{VIDEO_FPS}" + ("+audio" if DOWNLOAD_SOURCE_AUDIO else "")
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DownloadCache:
+    """
+    Cache ของไฟล์ที่ดาวน์โหลด (หลาย process ใช้โฟลเดอร์เดียวกันได้)
+    
+    โครงสร้าง: <cache_dir>/<sha256(key)[:32]>/{<ชื่อไฟล์เดิม>, meta.json}
+    
+    Usage:
+        cache = DownloadCache()
+        path = cache.fetch(url, TEMP_DIR)     # hit = hardlink เข้า TEMP_DIR, miss = None
+        cache.store(url, downloaded_path)      # หลังดาวน์โหลดเสร็จ
+    """
+    
+    def __init__(self, cache_dir: Path = None, max_bytes: int = None, verify: bool = None):
+        self.cache_dir = Path(cache_dir or DOWNLOAD_CACHE_DIR)
+        self.max_bytes = DOWNLOAD_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.verify = DOWNLOAD_CACHE_VERIFY if verify is None else verify
+    
+    def key(self, url: str) -> str:
+        return f"{video_key(url)}#{format_key()}"
+    
+    def _entry(self, url: str) -> Path:
+        return self.cache_dir / hashlib.sha256(self.key(url).encode("utf-8")).hexdigest()[:32]
+    
+    # -------------------------------------------------------------------------
+    # Lookup
+    # -------------------------------------------------------------------------
+    
+    def get(self, url: str) -> Path | None:
+        """ไฟล์ใน cache ที่ผ่านการตรวจ (None = ไม่มี / เสีย - entry เสียถูกลบ)"""
+        entry = self._entry(url)
+        try:
+            meta = json.loads((entry / META_FILE).read_text(encoding="utf-8"))
+            path = entry / meta["file"]
+            valid = (
+                meta["key"] == self.key(url)
+                and path.stat().st_size == meta["size"]
+                and (not self.verify or _sha256(path) == meta["sha256"])
+            )
+        except (OSError, ValueError, KeyError):
+            valid, path = False, None
+        
+        if not valid:
+            if entry.exists():
+                print(f"    ⚠️ Cache เสีย ลบทิ้ง: {entry.name}")
+                shutil.rmtree(entry, ignore_errors=True)
+            return None
+        
+        mark_used(path)
+        return path
+    
+    def fetch(self, url: str, output_dir: Path) -> Path | None:
+        """
+        เอาไฟล์จาก cache เข้า output_dir (hardlink - ไม่ copy ถ้าอยู่ disk เดียวกัน)
+        
+        Returns:
+            path ใน output_dir หรือ None ถ้า cache miss
+        """
+        cached = self.get(url)
+        if cached is None:
+            return None
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            return _link(cached, output_dir / cached.name)
+        except OSError:
+            return None  # ถูกลบระหว่างทาง (budget) = ถือว่า miss
+    
+    # -------------------------------------------------------------------------
+    # Store
+    # -------------------------------------------------------------------------
+    
+    def store(self, url: str, path: Path, info: dict = None) -> Path | None:
+        """
+        เก็บไฟล์ที่เพิ่งดาวน์โหลดเข้า cache (hardlink จากไฟล์เดิม) แล้วคุม disk budget
+        
+        Returns:
+            path ใน cache หรือ None ถ้าเก็บไม่ได้
+        """
+        path = Path(path)
+        entry = self._entry(url)
+        tmp = entry.with_name(f".{entry.name}.{os.getpid()}.tmp")
+        try:
+            if entry.exists():
+                shutil.rmtree(entry, ignore_errors=True)
+            tmp.mkdir(parents=True, exist_ok=True)
+            cached = _link(path, tmp / path.name)
+            meta = {
+                "key": self.key(url),
+                "url": url,
+                "file": path.name,
+                "size": cached.stat().st_size,
+                "sha256": _sha256(cached),
+                "title": (info or {}).get("title"),
+                "duration": (info or {}).get("duration"),
+                "stored_at": time.time(),
+            }
+            (tmp / META_FILE).write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, entry)
+        except OSError as e:
+            print(f"    ⚠️ เก็บเข้า cache ไม่ได้: {e}")
+            shutil.rmtree(tmp, ignore_errors=True)
+            return None
+        
+        self.enforce_budget()
+        return entry / path.name
+    
+    def enforce_budget(self) -> dict:
+        """ลบ entry ที่ไม่ได้ใช้นานสุดจนอยู่ใน max_bytes"""
+        return enforce_output_budget(
+            self.cache_dir, max_bytes=self.max_bytes, max_age=0,
+            grace=CACHE_GRACE_SECONDS, label="download cache"
+        )
+
+
+def _link(source: Path, dest: Path) -> Path:
+    """hardlink (ข้าม disk ไม่ได้ = copy)"""
+    if dest.exists():
+        dest.unlink()
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copy2(source, dest)
+    return dest
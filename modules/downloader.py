@@ -2,19 +2,42 @@
 # 📥 DOWNLOADER MODULE
 # =============================================================================
 # จัดการการดาวน์โหลดวิดีโอจาก YouTube / TikTok
+# yt-dlp โหลดตอนดาวน์โหลดจริง (import module นี้ต้องเร็ว - normalize_url ใช้ใน api.py)
 
 import re
 import os
-import yt_dlp
+import time
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from config.settings import URL_FILE, INPUT_DIR, COOKIES_FILE
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from config.settings import (
+    URL_FILE, INPUT_DIR, COOKIES_FILE, DOWNLOAD_WORKERS, DOWNLOAD_PER_HOST,
+    VIDEO_WIDTH, VIDEO_HEIGHT, VIDEO_FPS, DOWNLOAD_SOURCE_AUDIO, DOWNLOAD_CACHE_MAX_BYTES,
+    DOWNLOAD_FRAGMENTS, DOWNLOAD_CHUNK_MB, DOWNLOAD_MIN_SPEED_KBPS, DOWNLOAD_STALL_SECONDS,
+    DOWNLOAD_STALL_RETRIES, MAX_SOURCE_SECONDS, MAX_SOURCE_MB
+)
+from modules.metrics import (
+    stage_timer, count_bytes, observe_download_throughput, count_download_cache,
+    count_download_stall
+)
 
 __all__ = [
     'get_urls',
     'remove_url_from_file',
     'add_urls_to_file',
     'sanitize_filename',
+    'normalize_url',
+    'video_key',
     'download_single_video',
+    'format_selector',
+    'estimate_size',
+    'source_limit_error',
+    'DownloadManager',
+    'DownloadStalled',
+    'get_download_manager',
 ]
 
 # =============================================================================
@@ -30,21 +53,24 @@ def get_urls() -> list:
 
 
 def remove_url_from_file(target_url: str) -> None:
-    """ลบ URL ที่ทำเสร็จแล้วออกจากไฟล์"""
+    """ลบ URL ที่ทำเสร็จแล้วออกจากไฟล์ (เขียนไฟล์ใหม่แบบ atomic)"""
     urls = get_urls()
-    with open(URL_FILE, "w", encoding='utf-8') as f:
+    tmp = URL_FILE.with_name(URL_FILE.name + ".tmp")
+    with open(tmp, "w", encoding='utf-8') as f:
         for url in urls:
             if url != target_url:
                 f.write(url + "\n")
+    os.replace(tmp, URL_FILE)
 
 
 def add_urls_to_file(urls: list) -> None:
-    """เพิ่ม URLs ลงในไฟล์ (append)"""
-    existing = get_urls()
+    """เพิ่ม URLs ลงในไฟล์ (append) - ข้ามคลิปที่มีอยู่แล้ว (เทียบด้วย video_key)"""
+    existing = {video_key(url) for url in get_urls()}
     with open(URL_FILE, "a", encoding='utf-8') as f:
         for url in urls:
             url = url.strip()
-            if url and url not in existing:
+            if url and video_key(url) not in existing:
+                existing.add(video_key(url))
                 f.write(url + "\n")
 
 
@@ -65,67 +91,543 @@ def sanitize_filename(name: str) -> str:
     return name[:50]  # จำกัดความยาว
 
 
+# Query params ที่ไม่เปลี่ยนวิดีโอ (tracking / share / เวลาเริ่ม)
+IGNORED_URL_PARAMS = ("si", "feature", "pp", "t", "is_from_webapp", "sender_device")
+
+
+def normalize_url(url: str) -> str:
+    """
+    ทำ URL ให้อยู่รูปเดียวกัน (ใช้เทียบว่าเป็นคลิปเดียวกันไหม)
+    
+    - https, host ตัวพิมพ์เล็ก, ตัด www. / m.
+    - youtu.be/ID และ /shorts/ID -> youtube.com/watch?v=ID
+    - ตัด tracking params และเรียง query
+    """
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    for prefix in ("www.", "m."):
+        host = host.removeprefix(prefix)
+    path = parts.path.rstrip("/")
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query)
+        if k not in IGNORED_URL_PARAMS and not k.startswith("utm_")
+    ]
+    
+    if host == "youtu.be" and path:
+        host, query = "youtube.com", [("v", path.lstrip("/"))] + query
+        path = "/watch"
+    elif host == "youtube.com" and path.startswith("/shorts/"):
+        query = [("v", path.split("/")[2])] + query
+        path = "/watch"
+    
+    return urlunsplit(("https", host, path, urlencode(sorted(query)), ""))
+
+
+# path ของ YouTube ที่มี video id เป็น segment ที่ 2 (/shorts/ID, /embed/ID, ...)
+YOUTUBE_ID_PATHS = ("shorts", "embed", "live", "v")
+YOUTUBE_HOSTS = ("youtube.com", "music.youtube.com", "youtube-nocookie.com")
+VIDEO_ID_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+TIKTOK_ID_RE = re.compile(r"/(?:video|v)/(\d+)")
+
+
+def video_key(url: str) -> str:
+    """
+    key ของคลิป (ใช้กันงานซ้ำ): "youtube:<id>" / "tiktok:<id>"
+    
+    URL ที่ไม่รู้จัก (หรือ short link เช่น vm.tiktok.com ที่ต้อง resolve ก่อน)
+    ใช้ normalize_url แทน
+    """
+    normalized = normalize_url(url)
+    parts = urlsplit(normalized)
+    host, path = parts.netloc, parts.path
+    
+    if host in YOUTUBE_HOSTS:
+        segments = path.split("/")
+        video_id = dict(parse_qsl(parts.query)).get("v") if path == "/watch" else None
+        if not video_id and len(segments) > 2 and segments[1] in YOUTUBE_ID_PATHS:
+            video_id = segments[2]
+        if video_id and VIDEO_ID_RE.match(video_id):
+            return f"youtube:{video_id}"
+    
+    elif host == "tiktok.com" or host.endswith(".tiktok.com"):
+        match = TIKTOK_ID_RE.search(path)
+        if match:
+            return f"tiktok:{match.group(1)}"
+    
+    return normalized
+
+
+# =============================================================================
+# 🎞️ FORMAT SELECTION
+# =============================================================================
+
+# ต้นทุน decode ของ codec (น้อย = ถูกกว่า) - h264 ก่อน, av1 หลังสุด
+CODEC_COST = (("avc", 0), ("h264", 0), ("vp9", 1), ("vp09", 1), ("hev", 2), ("hvc", 2), ("av01", 3))
+
+
+def _codec_cost(vcodec: str) -> int:
+    vcodec = (vcodec or "").lower()
+    return next((cost for prefix, cost in CODEC_COST if vcodec.startswith(prefix)), 2)
+
+
+def _has_video(f: dict) -> bool:
+    return f.get('vcodec') not in (None, 'none') and bool(f.get('width') and f.get('height'))
+
+
+def _has_audio(f: dict) -> bool:
+    return f.get('acodec') not in (None, 'none')
+
+
+def format_selector(width: int = None, height: int = None, fps: int = None, need_audio: bool = None):
+    """
+    สร้าง format selector (callable ของ yt-dlp) ตามขนาด output
+    
+    เลือก stream ที่เล็กที่สุดที่ยังครอบคลุม output (ด้านสั้น >= ด้านสั้นของ output -
+    pipeline resize + crop เป็น 9:16 เอง) ถ้าไม่มีตัวไหนถึงใช้ตัวที่ใหญ่ที่สุด
+    ขนาดเท่ากัน: fps ที่พอ (ไม่เกินจำเป็น) > codec ที่ decode ถูก > bitrate ต่ำ
+    
+    Args:
+        need_audio: ต้องใช้เสียงต้นฉบับไหม (default: DOWNLOAD_SOURCE_AUDIO)
+                    False = ใช้ stream วิดีโออย่างเดียว (เสียงพากย์ใหม่ทั้งหมด)
+    """
+    width = width or VIDEO_WIDTH
+    height = height or VIDEO_HEIGHT
+    fps = fps or VIDEO_FPS
+    need_audio = DOWNLOAD_SOURCE_AUDIO if need_audio is None else need_audio
+    target_short = min(width, height)
+    
+    def rank(f: dict) -> tuple:
+        short = min(f['width'], f['height'])
+        covers = short >= target_short
+        rate = f.get('fps') or fps
+        return (
+            not covers,
+            short if covers else -short,             # ครอบคลุม: เล็กสุดก่อน / ไม่ครอบคลุม: ใหญ่สุดก่อน
+            rate < fps, rate,                         # fps พอก่อน แล้วต่ำสุด
+            _codec_cost(f.get('vcodec')),
+            f.get('tbr') or f.get('filesize') or f.get('filesize_approx') or 0,
+        )
+    
+    def select(ctx: dict):
+        formats = [f for f in ctx.get('formats', []) if _has_video(f)]
+        if not formats:
+            # ไม่รู้ขนาด - ใช้ตัวที่ yt-dlp ถือว่าดีที่สุด (เรียงจากแย่ -> ดี)
+            yield from ctx.get('formats', [])[-1:]
+            return
+        
+        video_only = [f for f in formats if not _has_audio(f)]
+        muxed = [f for f in formats if _has_audio(f)]
+        
+        if not need_audio:
+            yield min(video_only or muxed, key=rank)
+            return
+        
+        audio_only = [f for f in ctx['formats'] if _has_audio(f) and f.get('vcodec') in (None, 'none')]
+        best_muxed = min(muxed, key=rank) if muxed else None
+        best_video = min(video_only, key=rank) if video_only else None
+        
+        # muxed ที่ครอบคลุม = ไม่ต้อง merge
+        if best_muxed and not rank(best_muxed)[0]:
+            yield best_muxed
+            return
+        
+        if best_video and audio_only:
+            # เสียงที่เล็กที่สุดพอ (พากย์ทับอยู่แล้ว)
+            audio = min(audio_only, key=lambda f: f.get('abr') or f.get('tbr') or 0)
+            yield {
+                'format_id': f"{best_video['format_id']}+{audio['format_id']}",
+                'ext': best_video['ext'],
+                'requested_formats': [best_video, audio],
+                'protocol': f"{best_video['protocol']}+{audio['protocol']}",
+            }
+            return
+        
+        yield best_muxed or best_video
+    
+    return select
+
+
+def estimate_size(info: dict) -> int | None:
+    """ขนาดที่จะดาวน์โหลด (bytes) ของ format ที่ถูกเลือก - None = ไม่รู้"""
+    total = 0
+    for f in info.get('requested_formats') or [info]:
+        size = f.get('filesize') or f.get('filesize_approx')
+        if not size and f.get('tbr') and info.get('duration'):
+            size = f['tbr'] * 1000 / 8 * info['duration']  # tbr = kbit/s
+        if not size:
+            return None
+        total += size
+    return int(total)
+
+
+def source_limit_error(info: dict) -> str | None:
+    """
+    คลิปเกิน MAX_SOURCE_SECONDS / MAX_SOURCE_MB ไหม (ตรวจจาก metadata ก่อนดาวน์โหลด)
+    
+    Returns:
+        เหตุผลที่ไม่รับ หรือ None ถ้าผ่าน (ไม่รู้ความยาว / ขนาด = ผ่าน)
+    """
+    duration = info.get('duration')
+    if MAX_SOURCE_SECONDS and duration and duration > MAX_SOURCE_SECONDS:
+        return f"Too long: {duration:.0f}s > {MAX_SOURCE_SECONDS}s"
+    size = estimate_size(info)
+    if MAX_SOURCE_MB and size and size > MAX_SOURCE_MB * 1024 * 1024:
+        return f"Too large: {size / (1024 * 1024):.0f} MB > {MAX_SOURCE_MB} MB"
+    return None
+
+
+# =============================================================================
+# ⬇️ DOWNLOAD MANAGER
+# =============================================================================
+
+class DownloadStalled(Exception):
+    """ความเร็วต่ำกว่า DOWNLOAD_MIN_SPEED_KBPS ต่อเนื่องนานเกิน DOWNLOAD_STALL_SECONDS"""
+
+
+class _StallWatchdog:
+    """
+    ตรวจความเร็วจาก progress hook ของ yt-dlp (raise DownloadStalled เมื่อค้าง)
+    
+    ได้ bytes ไม่ถึง min_speed * window ภายใน window วินาที = ค้าง
+    (connection ตายเงียบๆ ไม่มี hook เลย -> socket_timeout ของ yt-dlp จัดการ)
+    """
+    
+    def __init__(self, min_speed: float, window: float, clock=time.monotonic):
+        self.min_speed = min_speed  # bytes/s
+        self.window = window
+        self.clock = clock
+        self._mark = None  # (เวลา, bytes) ตอนเริ่ม window ปัจจุบัน
+    
+    def __call__(self, d: dict) -> None:
+        if d.get('status') != 'downloading' or self.min_speed <= 0:
+            return
+        now = self.clock()
+        done = d.get('downloaded_bytes') or 0
+        if self._mark is None or done < self._mark[1]:
+            self._mark = (now, done)  # เริ่มไฟล์ใหม่ (เช่น video -> audio)
+            return
+        
+        mark_time, mark_bytes = self._mark
+        if done - mark_bytes >= self.min_speed * self.window:
+            self._mark = (now, done)
+        elif now - mark_time >= self.window:
+            speed = (done - mark_bytes) / (now - mark_time)
+            raise DownloadStalled(
+                f"{speed / 1024:.0f} KB/s < {self.min_speed / 1024:.0f} KB/s "
+                f"for {now - mark_time:.0f}s"
+            )
+
+
+class _Session:
+    """
+    yt-dlp session ที่ตั้งค่าแล้ว 1 ตัว (ใช้ซ้ำได้หลาย URL)
+    
+    extractor, cookies (COOKIES_FILE) และ HTTP connections ถูกสร้างครั้งเดียว
+    ใช้ได้ทีละ thread - DownloadManager ยืม/คืนจาก pool
+    """
+    
+    def __init__(self, options: dict):
+        import yt_dlp
+        self.on_progress = None
+        self.ydl = yt_dlp.YoutubeDL({**options, 'progress_hooks': [self._hook]})
+    
+    def _hook(self, d: dict) -> None:
+        if self.on_progress:
+            self.on_progress(d)
+    
+    def close(self) -> None:
+        try:
+            self.ydl.close()  # บันทึก cookies กลับลงไฟล์
+        except Exception:
+            pass
+
+
+class DownloadManager:
+    """
+    ดาวน์โหลดหลาย URL พร้อมกันด้วย pool ของ yt-dlp sessions
+    
+    - sessions สูงสุด max_workers ตัว (สร้างเมื่อจำเป็น แล้วใช้ซ้ำ)
+    - จำกัดจำนวนที่โหลดพร้อมกันต่อ platform (per_host) กันโดน rate limit
+    - รายงาน throughput ของแต่ละไฟล์ (log, event "download", metrics)
+    
+    Usage:
+        manager = get_download_manager()
+        result = manager.download(url, TEMP_DIR)           # {"path", "bytes", "seconds", "throughput", ...}
+        results = manager.download_many(urls, INPUT_DIR)   # พร้อมกัน, ลำดับตาม urls
+        infos = manager.info_many(urls)                    # metadata อย่างเดียว
+    """
+    
+    def __init__(self, max_workers: int = None, per_host: int = None, cache=None):
+        self.max_workers = max_workers or DOWNLOAD_WORKERS
+        self.per_host = per_host or DOWNLOAD_PER_HOST
+        self.cache = cache  # DownloadCache หรือ None
+        self._idle = []
+        self._slots = threading.Semaphore(self.max_workers)
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self._executor = None
+    
+    # -------------------------------------------------------------------------
+    # Sessions / limits
+    # -------------------------------------------------------------------------
+    
+    def _session_options(self) -> dict:
+        options = {
+            'format': format_selector(),  # stream เล็กสุดที่ยังครอบคลุม output
+            'outtmpl': '%(title).100s.%(ext)s',  # โฟลเดอร์กำหนดต่อครั้งผ่าน paths
+            'noplaylist': True,
+            'quiet': True,
+            'no_warnings': True,
+            'restrictfilenames': True,
+            'nocheckcertificate': True,
+            'merge_output_format': None,  # ไม่ merge
+            'concurrent_fragment_downloads': DOWNLOAD_FRAGMENTS,  # HLS/DASH โหลดหลาย fragment พร้อมกัน
+            'socket_timeout': DOWNLOAD_STALL_SECONDS,  # connection เงียบ = error แทนค้างตลอดไป
+        }
+        if DOWNLOAD_CHUNK_MB > 0:
+            # ไฟล์ตรงขอเป็นช่วงๆ (CDN บีบความเร็ว connection ยาวๆ น้อยกว่า + resume ได้)
+            options['http_chunk_size'] = DOWNLOAD_CHUNK_MB * 1024 * 1024
+        # เพิ่ม cookies ถ้ามี
+        if COOKIES_FILE.exists():
+            options['cookiefile'] = str(COOKIES_FILE)
+        return options
+    
+    @contextmanager
+    def _session(self):
+        """ยืม session จาก pool (รอถ้าใช้ครบ max_workers แล้ว)"""
+        self._slots.acquire()
+        session = None
+        try:
+            with self._lock:
+                session = self._idle.pop() if self._idle else None
+            if session is None:
+                session = _Session(self._session_options())
+            yield session
+        except DownloadStalled:
+            session.close()  # connection ค้าง - ไม่คืนเข้า pool
+            session = None
+            raise
+        finally:
+            if session is not None:
+                session.on_progress = None
+                with self._lock:
+                    self._idle.append(session)
+            self._slots.release()
+    
+    @contextmanager
+    def _host_slot(self, url: str):
+        """จำกัดจำนวนที่โหลดพร้อมกันต่อ platform"""
+        host = _host_of(url)
+        with self._lock:
+            limit = self._hosts.setdefault(host, threading.Semaphore(self.per_host))
+        with limit:
+            yield
+    
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="download")
+            return self._executor
+    
+    def close(self) -> None:
+        """ปิด sessions ทั้งหมด (บันทึก cookies)"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            sessions, self._idle = self._idle, []
+        if executor:
+            executor.shutdown(wait=True)
+        for session in sessions:
+            session.close()
+    
+    # -------------------------------------------------------------------------
+    # Download
+    # -------------------------------------------------------------------------
+    
+    def download(self, url: str, output_dir: Path = None, on_progress=None) -> dict:
+        """
+        ดาวน์โหลด 1 URL
+        
+        Args:
+            output_dir: โฟลเดอร์ปลายทาง (default: INPUT_DIR)
+            on_progress: callable(event, **data) - ได้ event "download"
+        
+        Returns:
+            {"url", "path", "bytes", "seconds", "throughput", "cached", "stalls", "error"}
+            (path = None ถ้าล้มเหลว)
+        
+        ดาวน์โหลดค้าง (ช้ากว่า DOWNLOAD_MIN_SPEED_KBPS) = ตัดทิ้งแล้วเริ่มใหม่ด้วย session ใหม่
+        (ดึง URL ใหม่จาก platform -> มักได้ CDN edge อื่น, ไฟล์ .part ต่อจากเดิม)
+        สูงสุด DOWNLOAD_STALL_RETRIES ครั้ง
+        """
+        output_dir = Path(output_dir or INPUT_DIR)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        result = {
+            "url": url, "path": None, "bytes": 0, "seconds": 0.0,
+            "throughput": None, "cached": False, "stalls": 0, "error": None,
+        }
+        
+        if self.cache:
+            cached = self.cache.fetch(url, output_dir)
+            count_download_cache(cached is not None)
+            if cached:
+                size = cached.stat().st_size
+                print(f"    ♻️ ใช้ไฟล์จาก cache: {cached.name} ({size / (1024 * 1024):.1f} MB)")
+                if on_progress:
+                    on_progress("download", status="cached", downloaded_bytes=size)
+                return {**result, "path": str(cached), "bytes": size, "cached": True}
+        
+        print(f"    ⬇️ กำลังโหลด: {url}")
+        
+        start = time.perf_counter()
+        error = None
+        for attempt in range(DOWNLOAD_STALL_RETRIES + 1):
+            try:
+                with self._host_slot(url), self._session() as session:
+                    session.ydl.params['paths'] = {'home': str(output_dir)}
+                    session.on_progress = _progress_hook(on_progress)
+                    with stage_timer("download"):
+                        info = session.ydl.extract_info(url, download=True)
+                    requested = (info.get('requested_downloads') or [{}])[0]
+                    filepath = requested.get('filepath') or session.ydl.prepare_filename(info)
+                error = None
+                break
+            except DownloadStalled as e:
+                error = f"Download stalled: {e}"
+                result["stalls"] = attempt + 1
+                count_download_stall()
+                if attempt < DOWNLOAD_STALL_RETRIES:
+                    print(f"    🐢 ดาวน์โหลดค้าง ({e}) - เริ่มใหม่ ({attempt + 1}/{DOWNLOAD_STALL_RETRIES})")
+                    if on_progress:
+                        on_progress("download", status="restarted", reason=str(e))
+            except Exception as e:
+                error = str(e)
+                break
+        result["seconds"] = time.perf_counter() - start
+        
+        if error:
+            print(f"    ⚠️ Download Error: {error}")
+            result["error"] = error
+            return result
+        
+        size = os.path.getsize(filepath) if os.path.exists(filepath) else 0
+        result.update(path=filepath, bytes=size)
+        if size and result["seconds"] > 0:
+            result["throughput"] = size / result["seconds"]
+            observe_download_throughput(result["throughput"])
+        count_bytes("download", size)
+        if self.cache and size:
+            self.cache.store(url, filepath, info)
+        
+        speed = f" @ {result['throughput'] / (1024 * 1024):.1f} MB/s" if result["throughput"] else ""
+        print(f"    ✅ ดาวน์โหลดสำเร็จ: {Path(filepath).name} ({size / (1024 * 1024):.1f} MB{speed})")
+        if on_progress:
+            on_progress(
+                "download", status="complete", downloaded_bytes=size,
+                seconds=round(result["seconds"], 2), throughput=result["throughput"]
+            )
+        return result
+    
+    def download_many(self, urls: list, output_dir: Path = None, on_progress=None) -> list:
+        """
+        ดาวน์โหลดหลาย URL พร้อมกัน (ไม่เกิน max_workers / per_host)
+        
+        Args:
+            on_progress: callable(event, url=..., **data)
+        
+        Returns:
+            list ผลลัพธ์ของ download() ตามลำดับ urls
+        """
+        def run(url):
+            report = (lambda event, **data: on_progress(event, url=url, **data)) if on_progress else None
+            return self.download(url, output_dir, report)
+        
+        return list(self._pool().map(run, urls))
+    
+    # -------------------------------------------------------------------------
+    # Metadata
+    # -------------------------------------------------------------------------
+    
+    def info(self, url: str) -> dict | None:
+        """ดึงข้อมูลวิดีโอโดยไม่ดาวน์โหลด (None ถ้าใช้ไม่ได้)"""
+        try:
+            with self._host_slot(url), self._session() as session:
+                return session.ydl.extract_info(url, download=False)
+        except Exception:
+            return None
+    
+    def info_many(self, urls: list) -> dict:
+        """ดึงข้อมูลหลาย URL พร้อมกัน -> {url: info หรือ None}"""
+        return dict(zip(urls, self._pool().map(self.info, urls)))
+
+
+def _host_of(url: str) -> str:
+    """platform ของ URL (youtu.be / youtube.com / shorts = youtube เดียวกัน)"""
+    key = video_key(url)
+    if not key.startswith("https://"):
+        return key.split(":", 1)[0]
+    return urlsplit(key).netloc
+
+
+def _progress_hook(on_progress=None):
+    """progress hook ของ 1 ครั้งที่โหลด: watchdog + ส่งต่อเป็น event "download" """
+    watchdog = _StallWatchdog(DOWNLOAD_MIN_SPEED_KBPS * 1024, DOWNLOAD_STALL_SECONDS)
+    
+    def hook(d: dict) -> None:
+        watchdog(d)
+        if on_progress:
+            _report_download(d, on_progress)
+    
+    return hook
+
+
+def _report_download(d: dict, on_progress) -> None:
+    """แปลง yt-dlp progress hook เป็น event "download" """
+    if d.get('status') not in ('downloading', 'finished'):
+        return
+    on_progress(
+        "download",
+        status=d['status'],
+        downloaded_bytes=d.get('downloaded_bytes') or 0,
+        total_bytes=d.get('total_bytes') or d.get('total_bytes_estimate'),
+        speed=d.get('speed'),
+    )
+
+
+_default_manager = None
+_default_manager_lock = threading.Lock()
+
+
+def get_download_manager() -> DownloadManager:
+    """DownloadManager กลางของ process (sessions ใช้ร่วมกันทุกงาน)"""
+    global _default_manager
+    with _default_manager_lock:
+        if _default_manager is None:
+            from modules.download_cache import DownloadCache
+            cache = DownloadCache() if DOWNLOAD_CACHE_MAX_BYTES > 0 else None
+            _default_manager = DownloadManager(cache=cache)
+            atexit.register(_default_manager.close)
+        return _default_manager
+
+
 # =============================================================================
 # ⬇️ VIDEO DOWNLOAD
 # =============================================================================
 
-def download_single_video(url: str, output_dir: Path = None) -> str | None:
+def download_single_video(url: str, output_dir: Path = None, on_progress=None) -> str | None:
     """
     ดาวน์โหลดวิดีโอจาก YouTube/TikTok
     
     Args:
         url: URL ของวิดีโอ
         output_dir: โฟลเดอร์ปลายทาง (default: INPUT_DIR)
+        on_progress: callable(event, **data) - ได้ event "download" (bytes ที่โหลดแล้ว)
         
     Returns:
         Path ของไฟล์ที่ดาวน์โหลด หรือ None ถ้าล้มเหลว
     """
-    if output_dir is None:
-        output_dir = INPUT_DIR
-    
-    output_dir = Path(output_dir)
-    output_dir.mkdir(parents=True, exist_ok=True)
-    
-    print(f"    ⬇️ กำลังโหลด: {url}")
-    
-    # ใช้ format ที่มี video+audio รวมกันแล้ว (ไม่ต้อง merge ด้วย ffmpeg)
-    ydl_opts = {
-        'format': 'best[ext=mp4]/best',  # เลือก mp4 ที่ดีที่สุดที่มี video+audio
-        'outtmpl': str(output_dir / '%(title).100s.%(ext)s'),
-        'noplaylist': True,
-        'quiet': True,
-        'no_warnings': True,
-        'restrictfilenames': True,
-        'nocheckcertificate': True,
-        'merge_output_format': None,  # ไม่ merge
-    }
-    
-    # เพิ่ม cookies ถ้ามี
-    if COOKIES_FILE.exists():
-        ydl_opts['cookiefile'] = str(COOKIES_FILE)
-    
-    try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            filepath = ydl.prepare_filename(info)
-            print(f"    ✅ ดาวน์โหลดสำเร็จ: {Path(filepath).name}")
-            return filepath
-            
-    except Exception as e:
-        print(f"    ⚠️ Download Error: {e}")
-        return None
+    return get_download_manager().download(url, output_dir, on_progress)["path"]
 
 
 def get_video_info(url: str) -> dict | None:
     """ดึงข้อมูลวิดีโอโดยไม่ดาวน์โหลด"""
-    ydl_opts = {
-        'quiet': True,
-        'no_warnings': True,
-        'extract_flat': True,
-    }
-    
-    try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            return ydl.extract_info(url, download=False)
-    except:
-        return None
+    return get_download_manager().info(url)
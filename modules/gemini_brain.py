@@ -2,112 +2,114 @@
 # 🧠 GEMINI BRAIN MODULE - AI Script Generation
 # =============================================================================
 # Gemini API สำหรับสร้างบทพากย์
+# google.generativeai โหลดตอนใช้ครั้งแรก (import SDK ใช้เวลาเกือบวินาที)
+
+from __future__ import annotations
 
 import os
 import re
 import time
 import random
-import requests
-import google.generativeai as genai
-from google.api_core import retry
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 from config.settings import (
     API_KEYS, MODEL_HIERARCHY, 
     WORDS_PER_SECOND, SYNC_TOLERANCE,
     MAX_UPLOAD_ATTEMPTS, MAX_SCRIPT_ATTEMPTS, ATTEMPTS_PER_MODEL,
-    TEMP_DIR
+    TEMP_DIR, SCRIPT_CACHE, SCRIPT_DELTA_REFINE, SCRIPT_CANDIDATES, SCRIPT_HEDGE_SECONDS, SCRIPT_REQUEST_TIMEOUT,
+    VOICE_NAME, VOICE_RATE, VOICE_PITCH, VOICE_VOLUME
+)
+from modules.voice import get_audio_duration, sentence_durations, clip_padding
+from modules.metrics import (
+    observe_stage, count_bytes, count_rate_limit, observe_calibration_rounds, count_script_cache,
+    count_script_hedge
 )
-from modules.voice import get_audio_duration
+from modules.rate_limiter import get_limiter, is_rate_limited, retry_after
+from modules.script_cache import ScriptCache
+
+if TYPE_CHECKING:
+    import google.generativeai as genai
+    from google.generativeai.types import file_types
 
 __all__ = [
+    'PROMPT_VERSION',
     'test_api_keys',
+    'get_default_brain',
     'get_perfect_fit_script',
     'clean_script_final',
     'AIBrain',
 ]
 
-# =============================================================================
-# 🔧 GLOBAL STATE
-# =============================================================================
-available_keys = []
-current_key_index = 0
-current_model_index = 0
+# เพิ่มเมื่อ prompt / วิธี calibrate เปลี่ยน (บทใน script cache ที่สร้างด้วย prompt เก่าไม่ถูกใช้)
+PROMPT_VERSION = 1
+
+# บทที่เสียงต่างจากความยาววิดีโอไม่เกินเท่านี้ (วินาที) = ใช้ได้เลย
+CALIBRATION_TOLERANCE = 3.0
+
+# ระยะห่างของความยาวแต่ละเวอร์ชันในรอบ hedged (สัดส่วนของจำนวนคำเป้าหมาย)
+VARIANT_SPREAD = 0.15
+
+# บทที่ผ่าน clean_script_final เหลือแค่เว้นวรรคเดียวระหว่างวลี (ภาษาไทยไม่มีจุดจบประโยค)
+# วลีที่ลงท้ายด้วยเครื่องหมาย / คำลงท้ายประโยค = จบประโยค
+SENTENCE_END = re.compile(r'(?:[.!?…]|ครับ|ค่ะ|คะ|นะ|จ้า|เลย|ล่ะ|แหละ|เนอะ)["\')]*$')
+
+# ประโยคที่ไม่มีคำลงท้ายเลย (เล่ายาวต่อกัน) = ตัดทุกเท่านี้วลี
+SENTENCE_MAX_PHRASES = 6
 
 # =============================================================================
 # 🔑 API KEY MANAGEMENT
 # =============================================================================
 
 def configure_gemini(key: str) -> None:
-    """ตั้งค่า Gemini API key"""
+    """ตั้งค่า Gemini API key แบบ global ของ SDK (AIBrain ไม่ใช้ - มี client ของตัวเอง)"""
+    import google.generativeai as genai
     genai.configure(api_key=key)
 
 
-def test_api_keys() -> list:
-    """
-    ทดสอบทุก API keys ก่อนรันจริง
-    
-    Returns:
-        list ของ keys ที่ทำงานได้
-    """
-    global available_keys
-    print("🔍 กำลังทดสอบ API Keys...")
-    
-    test_prompt = "พูดว่า 'สวัสดี' เป็นภาษาไทย"
-    test_model = MODEL_HIERARCHY[0]
-    working_keys = []
-    
-    for idx, key in enumerate(API_KEYS):
-        try:
-            configure_gemini(key)
-            model = genai.GenerativeModel(test_model)
-            response = model.generate_content(test_prompt)
-            if response.text:
-                working_keys.append(key)
-                print(f"    ✅ Key {idx+1} ทำงานได้")
-        except Exception as e:
-            error_msg = str(e).lower()
-            print(f"    ❌ Key {idx+1} ล้มเหลว")
-            if "quota" in error_msg:
-                print("       └─ Quota หมด")
-            elif "invalid" in error_msg:
-                print("       └─ Key ไม่ถูกต้อง")
-    
-    available_keys = working_keys
-    
-    if not available_keys:
-        raise ValueError("❌ ไม่มี Gemini API Key ที่ใช้งานได้!")
-    else:
-        print(f"✅ มี {len(available_keys)} keys พร้อมใช้งาน")
-    
-    return available_keys
-
-
-def rotate_key() -> None:
-    """สลับไปใช้ key ถัดไป"""
-    global current_key_index
-    if not available_keys:
-        return
-    current_key_index = (current_key_index + 1) % len(available_keys)
-    print(f"    🔄 สลับ Key -> {current_key_index + 1}")
-    configure_gemini(available_keys[current_key_index])
+def _video_mime_type(path) -> str:
+    """MIME type ของไฟล์ที่ upload (stream วิดีโออย่างเดียวมักเป็น .webm VP9/AV1 ไม่ใช่ mp4)"""
+    mime_type, _ = mimetypes.guess_type(str(path))
+    return mime_type if mime_type and mime_type.startswith("video/") else "video/mp4"
 
 
-# =============================================================================
-# 🤖 MODEL MANAGEMENT
-# =============================================================================
-
-def get_next_model() -> str:
-    """เปลี่ยนไป Model ถัดไปใน hierarchy"""
-    global current_model_index
-    current_model_index = (current_model_index + 1) % len(MODEL_HIERARCHY)
-    return MODEL_HIERARCHY[current_model_index]
+_sdk_checked = False
 
 
-def reset_model_fallback() -> None:
-    """รีเซ็ตกลับไปใช้ Model เก่งสุด"""
-    global current_model_index
-    current_model_index = 0
+def _check_sdk_isolation() -> None:
+    """
+    ตรวจว่า SDK ยังมี API ภายในที่ AIBrain ใช้แยก client ต่อ key
+    
+    ถ้า SDK เปลี่ยน (เช่น _ClientManager หาย) ห้ามถอยไปใช้ client กลาง -
+    หลายงานที่ใช้ key ต่างกันจะปน credential กัน -> error ทันที
+    
+    Raises:
+        RuntimeError ถ้า SDK ไม่ตรงกับที่ทดสอบไว้ (ดู requirements.txt)
+    """
+    global _sdk_checked
+    if _sdk_checked:
+        return
+    import google.generativeai as genai
+    from google.generativeai import client as genai_client
+    
+    manager = getattr(genai_client, "_ClientManager", None)
+    missing = [
+        name for name, ok in (
+            ("client._ClientManager", manager is not None),
+            ("_ClientManager.configure", hasattr(manager, "configure")),
+            ("_ClientManager.get_default_client", hasattr(manager, "get_default_client")),
+            ("GenerativeModel._client", "_client" in vars(genai.GenerativeModel("gemini-check"))),
+        ) if not ok
+    ]
+    if missing:
+        raise RuntimeError(
+            f"google-generativeai {getattr(genai, '__version__', '?')} ไม่รองรับการแยก client ต่อ key "
+            f"(ไม่มี {', '.join(missing)}) - ติดตั้งเวอร์ชันตาม requirements.txt"
+        )
+    _sdk_checked = True
 
 
 # =============================================================================
@@ -135,108 +137,445 @@ def clean_script_final(text: str) -> str:
     return text.strip()
 
 
-# =============================================================================
-# 📤 VIDEO UPLOAD
-# =============================================================================
+def _parse_script_response(text: str) -> tuple:
+    """แยกชื่อ + บทจากคำตอบของ Gemini -> (title, script ที่ทำความสะอาดแล้ว)"""
+    current_title = "คลิปเด็ด"
+    current_script = ""
+    
+    # แยกชื่อและบท
+    if "---" in text:
+        parts = text.split("---", 1)
+        header = parts[0].strip()
+        current_script = parts[1].strip() if len(parts) > 1 else ""
+        # หาชื่อจาก header
+        for line in header.split('\n'):
+            if line.strip().startswith("ชื่อ"):
+                current_title = re.sub(r'^ชื่อ[คลิป]*:', '', line).strip()
+    else:
+        # ลองหา pattern อื่น
+        lines = [l.strip() for l in text.split('\n') if l.strip()]
+        for i, line in enumerate(lines):
+            if line.startswith("ชื่อ") and ":" in line:
+                current_title = line.split(":", 1)[1].strip()
+            elif line.startswith("บท") and ":" in line:
+                current_script = line.split(":", 1)[1].strip()
+                # รวมบรรทัดถัดไปด้วย
+                current_script += " " + " ".join(lines[i+1:])
+                break
+        
+        # ถ้ายังไม่มี script ให้ใช้ทั้งหมดยกเว้นบรรทัดแรก
+        if not current_script and len(lines) > 1:
+            current_script = " ".join(lines[1:])
+        elif not current_script:
+            current_script = text
+    
+    return current_title, clean_script_final(current_script)
 
-def upload_to_gemini(path: str, max_attempts: int = None) -> object:
+
+def _parse_variants(text: str, count: int) -> list:
     """
-    Upload video ไปยัง Gemini พร้อม retry logic
+    แยกคำตอบแบบหลายเวอร์ชัน (ชื่อ: ... / === 1 === / บท / === 2 === / ...)
     
-    Args:
-        path: path ของไฟล์วิดีโอ
-        max_attempts: จำนวนครั้งที่ลองใหม่
-        
     Returns:
-        Gemini File object
+        [(title, script)] - ไม่ตรง format = ถือเป็นบทเดียว
     """
-    if max_attempts is None:
-        max_attempts = MAX_UPLOAD_ATTEMPTS
-    
-    attempt = 0
-    while attempt < max_attempts:
-        try:
-            print(f"       📤 Uploading... ({attempt+1}/{max_attempts})")
-            file = genai.upload_file(path, mime_type="video/mp4")
-            
-            # Poll จนกว่าจะ process เสร็จ
-            start_time = time.time()
-            while file.state.name == "PROCESSING":
-                elapsed = time.time() - start_time
-                if elapsed > 600:  # 10 นาที timeout
-                    raise TimeoutError("Video processing timeout")
-                
-                sleep_time = 4 + random.uniform(0, 3)
-                print(f"       ⏳ Processing... ({elapsed:.0f}s)")
-                time.sleep(sleep_time)
-                
-                @retry.Retry(predicate=retry.if_transient_error, initial=2, maximum=30, multiplier=1.5)
-                def safe_get_file(name):
-                    return genai.get_file(name)
-                
-                file = safe_get_file(file.name)
-            
-            if file.state.name == "FAILED":
-                raise ValueError("Upload Failed - Gemini processing error")
-            
-            print("       ✅ Upload สำเร็จ!")
-            return file
-            
-        except (ConnectionResetError, ConnectionError, requests.exceptions.ConnectionError, TimeoutError) as e:
-            print(f"       ⚠️ Connection issue: {str(e)[:60]}")
-            attempt += 1
-            delay = (2 ** attempt) + random.uniform(0, 3)
-            print(f"       ⏳ รอ {delay:.1f}s แล้วลองใหม่...")
-            time.sleep(delay)
-            
-        except Exception as e:
-            print(f"       ❌ Error: {str(e)[:80]}")
-            raise
+    title = "คลิปเด็ด"
+    match = re.search(r'^\s*ชื่อ[คลิป]*\s*:\s*(.+)$', text, re.M)
+    if match:
+        title = match.group(1).strip()
     
-    raise RuntimeError(f"Upload ล้มเหลวหลังจากลอง {max_attempts} ครั้ง")
+    parts = re.split(r'^\s*=+\s*\d+\s*=+\s*$', text, flags=re.M)[1:]
+    scripts = [script for script in map(clean_script_final, parts) if script][:count]
+    if not scripts:
+        return [_parse_script_response(text)]
+    return [(title, script) for script in scripts]
+
+
+def _variant_targets(target_words: int, count: int) -> list:
+    """จำนวนคำของแต่ละเวอร์ชัน: เป้าหมาย แล้วสั้น/ยาวขึ้นทีละ 15% สลับกัน"""
+    targets = []
+    for i in range(count):
+        step = (i + 1) // 2 * VARIANT_SPREAD
+        targets.append(max(1, round(target_words * (1 - step if i % 2 else 1 + step))))
+    return targets
+
+
+# -----------------------------------------------------------------------------
+# ✂️ Delta refinement: แก้บทเดิมทีละประโยคแทนเขียนใหม่ทั้งบท
+# -----------------------------------------------------------------------------
+# บทภาษาไทยเว้นวรรคระหว่างประโยค/วลี -> 1 ช่วงที่คั่นด้วยช่องว่าง = 1 ประโยค
+
+INSERT_PATTERN = re.compile(r'^[\s\-*]*แทรกหลัง\s*\[?(\d+)\]?\s*:\s*(.+)$')
+REMOVE_PATTERN = re.compile(r'^[\s\-*]*ลบ\s*((?:\[?\d+\]?[\s,]*)+)$')
+
+
+def _split_sentences(script: str) -> list:
+    """แบ่งบท (ที่ทำความสะอาดแล้ว) เป็นประโยค: จบที่วลีตาม SENTENCE_END หรือครบ SENTENCE_MAX_PHRASES วลี"""
+    sentences, current = [], []
+    for phrase in script.split():
+        current.append(phrase)
+        if SENTENCE_END.search(phrase) or len(current) >= SENTENCE_MAX_PHRASES:
+            sentences.append(" ".join(current))
+            current = []
+    if current:
+        sentences.append(" ".join(current))
+    return sentences
+
+
+def _delta_prompt(script: str, audio_len: float, duration: float, word_adjustment: int) -> str:
+    """prompt ขอเฉพาะคำสั่งแก้ไข (แทรก / ลบ ประโยค) ของบทเดิม"""
+    numbered = "\n".join(f"[{i}] {sentence}" for i, sentence in enumerate(_split_sentences(script), 1))
+    if word_adjustment >= 0:
+        goal = f"สั้นไป ต้องเพิ่มประมาณ {word_adjustment} คำ - แทรกประโยคที่บรรยายรายละเอียดในวิดีโอเพิ่ม"
+    else:
+        goal = f"ยาวไป ต้องตัดประมาณ {-word_adjustment} คำ - ลบประโยคที่ไม่จำเป็นออก"
+    return f"""บทตอนนี้ได้ {audio_len:.0f} วินาที (ต้องการ {duration:.0f} วินาที) {goal}
 
+ห้ามเขียนบทใหม่ทั้งบท แก้เฉพาะบางประโยคของบทนี้:
+{numbered}
 
+ตอบเฉพาะคำสั่งแก้ไข บรรทัดละ 1 คำสั่ง:
+แทรกหลัง [หมายเลข]: ประโยคใหม่ (แทรกหลัง [0] = ต้นบท)
+ลบ [หมายเลข]"""
+
+
+def _parse_edits(text: str) -> tuple | None:
+    """
+    แยกคำสั่งแก้ไขจากคำตอบ
+    
+    Returns:
+        ([(หลังประโยคที่, ประโยคใหม่)], {ประโยคที่ลบ}) หรือ None ถ้าไม่มีคำสั่ง
+    """
+    inserts, removes = [], set()
+    for line in text.splitlines():
+        line = line.strip()
+        insert = INSERT_PATTERN.match(line)
+        remove = REMOVE_PATTERN.match(line)
+        if insert:
+            sentence = clean_script_final(insert.group(2))
+            if sentence:
+                inserts.append((int(insert.group(1)), sentence))
+        elif remove:
+            removes.update(int(n) for n in re.findall(r'\d+', remove.group(1)))
+    if not inserts and not removes:
+        return None
+    return inserts, removes
+
+
+def _apply_edits(script: str, audio_len: float, edits: tuple, on_progress=None) -> tuple:
+    """
+    ใช้คำสั่งแก้ไขกับบทเดิม แล้วประมาณความยาวใหม่
+    
+    ความยาวใหม่ = ความยาวเดิม + เสียงประโยคที่แทรก - เสียงประโยคที่ลบ
+    (สังเคราะห์เฉพาะประโยคที่เปลี่ยน ผ่าน TTS cache - ประโยคที่ไม่แตะไม่ต้องวัดใหม่)
+    เสียงรายประโยคมีช่วงเงียบหัว/ท้ายที่บทเต็มไม่มี - หัก clip_padding() ทุกคลิป
+    
+    Returns:
+        (บทใหม่, ความยาวเสียงโดยประมาณ - ต้องวัดจริงก่อนใช้)
+    """
+    inserts, removes = edits
+    sentences = _split_sentences(script)
+    removes = {i for i in removes if 1 <= i <= len(sentences)}
+    inserts = [(min(max(after, 0), len(sentences)), sentence) for after, sentence in inserts]
+    
+    result = [sentence for after, sentence in inserts if after == 0]
+    for i, sentence in enumerate(sentences, 1):
+        if i not in removes:
+            result.append(sentence)
+        result.extend(new for after, new in inserts if after == i)
+    
+    added = [sentence for _, sentence in inserts]
+    removed = [sentences[i - 1] for i in sorted(removes)]
+    padding = clip_padding() if added or removed else 0.0
+    durations = [max(d - padding, 0.0) for d in sentence_durations(added + removed, on_progress)]
+    delta = sum(durations[:len(added)]) - sum(durations[len(added):])
+    print(f"       ✂️ แก้บท: แทรก {len(added)} / ลบ {len(removed)} ประโยค ({delta:+.2f}s)")
+    return " ".join(result), max(audio_len + delta, 0.0)
 
 
 # =============================================================================
-# 🧠 MAIN SCRIPT GENERATION
+# 🎯 AI BRAIN CLASS
 # =============================================================================
 
-def get_perfect_fit_script(video_path: str, duration: float) -> tuple:
+class AIBrain:
     """
-    สร้างบทพากย์ที่ความยาวพอดีกับวิดีโอ
+    Gemini client ที่แยกขาดต่อ instance
     
-    ใช้ Gemini AI + Calibration loop เพื่อปรับความยาวให้ตรง
+    แต่ละ instance ถือ keys, model fallback state และ SDK clients ของตัวเอง
+    (ไม่แตะ genai.configure) -> หลายงานที่ใช้ key ต่างกันรันพร้อมกันได้
+    """
     
-    Args:
-        video_path: path ของวิดีโอ
-        duration: ความยาวเป้าหมาย (วินาที)
+    def __init__(self, api_keys: list = None, models: list = None):
+        """
+        Args:
+            api_keys: keys ที่จะใช้ (default: API_KEYS จาก settings)
+            models: ลำดับ model fallback (default: MODEL_HIERARCHY)
+        """
+        self.api_keys = list(api_keys) if api_keys is not None else list(API_KEYS)
+        self.models = list(models) if models else list(MODEL_HIERARCHY)
+        self.keys = []
+        self.current_key_idx = 0
+        self.current_model_idx = 0
+        self.initialized = False
+        self._client_managers = {}  # key -> _ClientManager
+    
+    # -------------------------------------------------------------------------
+    # 🔑 Keys & Clients
+    # -------------------------------------------------------------------------
+    
+    def initialize(self, validate: bool = True) -> bool:
+        """
+        เตรียม keys
         
-    Returns:
-        (title, script) tuple
-    """
-    global current_model_index
+        Args:
+            validate: ทดสอบทุก key ก่อน (False = ใช้ทั้งหมด, key เสียจะถูกสลับทิ้งตอน 429)
+        
+        Raises:
+            RuntimeError ถ้า SDK แยก client ต่อ key ไม่ได้ (ดู _check_sdk_isolation)
+        """
+        _check_sdk_isolation()
+        if validate:
+            self.keys = self.test_keys()
+        else:
+            self.keys = list(self.api_keys)
+        self.current_key_idx = 0
+        self.initialized = True
+        return len(self.keys) > 0
     
-    print(f"    🧠 AI: กำลังวิเคราะห์วิดีโอ (Target: {duration:.2f}s)...")
+    @property
+    def current_key(self) -> str:
+        """key ที่ใช้อยู่ตอนนี้"""
+        if not self.keys:
+            raise RuntimeError("ไม่มี Gemini API Key ที่ใช้งานได้")
+        return self.keys[self.current_key_idx]
+    
+    def client(self, name: str, key: str = None):
+        """
+        SDK service client ("generative", "file") ที่ผูกกับ key ของ instance นี้
+        
+        ใช้ _ClientManager แยกต่อ key แทน client กลางที่ genai.configure() ตั้ง
+        """
+        from google.generativeai import client as genai_client
+        
+        _check_sdk_isolation()
+        key = key or self.current_key
+        manager = self._client_managers.get(key)
+        if manager is None:
+            manager = genai_client._ClientManager()
+            manager.configure(api_key=key)
+            self._client_managers[key] = manager
+        return manager.get_default_client(name)
+    
+    def model(self, name: str, key: str = None) -> genai.GenerativeModel:
+        """GenerativeModel ที่ยิง request ด้วย key ของ instance นี้"""
+        import google.generativeai as genai
+        model = genai.GenerativeModel(name)
+        # GenerativeModel ใช้ client กลางถ้า _client เป็น None
+        model._client = self.client("generative", key)
+        return model
+    
+    def test_keys(self) -> list:
+        """
+        ทดสอบทุก API keys ก่อนรันจริง
+        
+        Returns:
+            list ของ keys ที่ทำงานได้
+        
+        Raises:
+            ValueError ถ้าไม่มี key ไหนใช้ได้
+        """
+        print("🔍 กำลังทดสอบ API Keys...")
+        
+        test_prompt = "พูดว่า 'สวัสดี' เป็นภาษาไทย"
+        test_model = self.models[0]
+        working_keys = []
+        
+        for idx, key in enumerate(self.api_keys):
+            try:
+                response = self.model(test_model, key).generate_content(test_prompt)
+                if response.text:
+                    working_keys.append(key)
+                    print(f"    ✅ Key {idx+1} ทำงานได้")
+            except Exception as e:
+                error_msg = str(e).lower()
+                print(f"    ❌ Key {idx+1} ล้มเหลว")
+                if "quota" in error_msg:
+                    print("       └─ Quota หมด")
+                elif "invalid" in error_msg:
+                    print("       └─ Key ไม่ถูกต้อง")
+        
+        if not working_keys:
+            raise ValueError("❌ ไม่มี Gemini API Key ที่ใช้งานได้!")
+        
+        print(f"✅ มี {len(working_keys)} keys พร้อมใช้งาน")
+        return working_keys
+    
+    def rotate_key(self) -> None:
+        """สลับไปใช้ key ถัดไป"""
+        if not self.keys:
+            return
+        self.current_key_idx = (self.current_key_idx + 1) % len(self.keys)
+        print(f"    🔄 สลับ Key -> {self.current_key_idx + 1}")
+    
+    # -------------------------------------------------------------------------
+    # 🤖 Model fallback
+    # -------------------------------------------------------------------------
     
-    # ตรวจสอบว่ามี Gemini keys
-    if not available_keys:
-        raise RuntimeError("ไม่มี Gemini API Key ที่ใช้งานได้")
+    def next_model(self) -> str:
+        """เปลี่ยนไป Model ถัดไปใน hierarchy"""
+        self.current_model_idx = (self.current_model_idx + 1) % len(self.models)
+        return self.models[self.current_model_idx]
     
-    # Configure Gemini
-    configure_gemini(available_keys[current_key_index])
+    def reset_model_fallback(self) -> None:
+        """รีเซ็ตกลับไปใช้ Model เก่งสุด"""
+        self.current_model_idx = 0
+    
+    # -------------------------------------------------------------------------
+    # 📤 Video upload
+    # -------------------------------------------------------------------------
+    
+    def upload(self, path: str, max_attempts: int = None, on_progress=None,
+               key: str = None) -> file_types.File:
+        """
+        Upload video ไปยัง Gemini พร้อม retry logic
+        
+        Args:
+            path: path ของไฟล์วิดีโอ
+            max_attempts: จำนวนครั้งที่ลองใหม่
+            on_progress: callable(event, **data) - ได้ event "upload" (uploading/processing/active)
+            key: key ที่จะใช้ไฟล์นี้ (default: key ปัจจุบัน) - ไฟล์ใช้ได้เฉพาะ project ของ key ที่ upload
+            
+        Returns:
+            Gemini File object
+        """
+        import requests
+        from google.api_core import retry
+        from google.generativeai.types import file_types
+        
+        if max_attempts is None:
+            max_attempts = MAX_UPLOAD_ATTEMPTS
+        
+        def report(state, **data):
+            if on_progress:
+                on_progress("upload", state=state, **data)
+        
+        file_client = self.client("file", key)
+        
+        @retry.Retry(predicate=retry.if_transient_error, initial=2, maximum=30, multiplier=1.5)
+        def safe_get_file(name):
+            return file_types.File(file_client.get_file(name=name))
+        
+        upload_start = time.perf_counter()
+        attempt = 0
+        while attempt < max_attempts:
+            try:
+                print(f"       📤 Uploading... ({attempt+1}/{max_attempts})")
+                report("uploading", attempt=attempt + 1, bytes=os.path.getsize(path))
+                file = file_types.File(file_client.create_file(
+                    path=Path(path), mime_type=_video_mime_type(path), display_name=Path(path).name
+                ))
+                
+                # Poll จนกว่าจะ process เสร็จ
+                start_time = time.time()
+                while file.state.name == "PROCESSING":
+                    elapsed = time.time() - start_time
+                    if elapsed > 600:  # 10 นาที timeout
+                        raise TimeoutError("Video processing timeout")
+                    
+                    sleep_time = 4 + random.uniform(0, 3)
+                    print(f"       ⏳ Processing... ({elapsed:.0f}s)")
+                    report("processing", elapsed=round(elapsed, 1))
+                    time.sleep(sleep_time)
+                    
+                    file = safe_get_file(file.name)
+                
+                if file.state.name == "FAILED":
+                    report("failed")
+                    raise ValueError("Upload Failed - Gemini processing error")
+                
+                print("       ✅ Upload สำเร็จ!")
+                report("active")
+                observe_stage("gemini_upload", time.perf_counter() - upload_start)
+                count_bytes("upload", os.path.getsize(path))
+                return file
+                
+            except (ConnectionResetError, ConnectionError, requests.exceptions.ConnectionError, TimeoutError) as e:
+                print(f"       ⚠️ Connection issue: {str(e)[:60]}")
+                attempt += 1
+                delay = (2 ** attempt) + random.uniform(0, 3)
+                print(f"       ⏳ รอ {delay:.1f}s แล้วลองใหม่...")
+                time.sleep(delay)
+                
+            except Exception as e:
+                print(f"       ❌ Error: {str(e)[:80]}")
+                raise
+        
+        raise RuntimeError(f"Upload ล้มเหลวหลังจากลอง {max_attempts} ครั้ง")
     
-    # Upload video
-    video_file = upload_to_gemini(video_path)
+    def delete_upload(self, file, key: str = None) -> None:
+        """ลบไฟล์ที่ upload ไว้ (ด้วย key ที่ upload) - ลบไม่ได้ก็ไม่เป็นไร Gemini ลบเองใน 48 ชม."""
+        try:
+            self.client("file", key).delete_file(name=file.name)
+        except Exception:
+            pass
     
-    # Calculate target words - ปรับให้แม่นยำขึ้น
-    # Thai speech at +5% rate ≈ 2.4 words/sec, but shorter words = faster
-    target_words = int(duration * 2.2)  # ลดลงนิดเพราะคำไทยสั้นกว่า
-    min_words = int(duration * 2.0)
-    max_words = int(duration * 2.5)
+    # -------------------------------------------------------------------------
+    # 🧠 Script generation
+    # -------------------------------------------------------------------------
     
-    # Initial prompt - เน้นจำนวนคำให้ชัดเจน
-    initial_prompt = f"""คุณคือนักพากย์มืออาชีพ ต้องพากย์คลิปนี้ให้พอดี {duration:.0f} วินาที
+    def generate_script(self, video_path: str, duration: float, on_progress=None,
+                        use_cache: bool = True) -> tuple:
+        """
+        สร้างบทพากย์ที่ความยาวพอดีกับวิดีโอ
+        
+        ใช้ Gemini AI + Calibration loop เพื่อปรับความยาวให้ตรง
+        บทที่เคยสร้างจากไฟล์เดียวกัน (+ model / prompt / เสียงพากย์เดิม) มาจาก script cache
+        
+        Args:
+            video_path: path ของวิดีโอ
+            duration: ความยาวเป้าหมาย (วินาที)
+            on_progress: callable(event, **data) - ได้ event "upload", "calibration", "tts"
+            use_cache: False = เขียนบทใหม่เสมอ (ผลใหม่ทับของเดิมใน cache)
+            
+        Returns:
+            (title, script) tuple
+        """
+        print(f"    🧠 AI: กำลังวิเคราะห์วิดีโอ (Target: {duration:.2f}s)...")
+        
+        # Script cache (ก่อน upload - hit = ไม่เรียก Gemini เลย)
+        cache = ScriptCache() if SCRIPT_CACHE else None
+        cache_key = None
+        if cache:
+            cache_key = cache.key(
+                video_path, duration, self.models[self.current_model_idx], PROMPT_VERSION,
+                voice=[VOICE_NAME, VOICE_RATE, VOICE_PITCH, VOICE_VOLUME]
+            )
+            cached = cache.get(cache_key) if use_cache else None
+            count_script_cache(cached is not None)
+            if cached:
+                print(f"    ♻️ ใช้บทจาก cache: {cached['title']} ({cached['audio_seconds']:.1f}s) - ไม่เรียก Gemini")
+                if on_progress:
+                    on_progress("calibration", state="cached", audio_seconds=cached["audio_seconds"])
+                return cached["title"], cached["script"]
+        
+        # ตรวจสอบว่ามี Gemini keys
+        if not self.initialized:
+            self.initialize()
+        if not self.keys:
+            raise RuntimeError("ไม่มี Gemini API Key ที่ใช้งานได้")
+        
+        # Upload video (ใช้ client ของ instance นี้)
+        # key -> ไฟล์ของ key นั้น (ไฟล์ใช้ได้เฉพาะ project ของ key ที่ upload / ลบตอนจบ)
+        uploads = {self.current_key: self.upload(video_path, on_progress=on_progress)}
+        
+        # Calculate target words - ปรับให้แม่นยำขึ้น
+        # Thai speech at +5% rate ≈ 2.4 words/sec, but shorter words = faster
+        target_words = int(duration * 2.2)  # ลดลงนิดเพราะคำไทยสั้นกว่า
+        min_words = int(duration * 2.0)
+        max_words = int(duration * 2.5)
+        
+        # Initial prompt - เน้นจำนวนคำให้ชัดเจน
+        initial_prompt = f"""คุณคือนักพากย์มืออาชีพ ต้องพากย์คลิปนี้ให้พอดี {duration:.0f} วินาที
 
 📏 **ข้อกำหนดความยาว (สำคัญมาก!):**
 - เป้าหมาย: {target_words} คำ (ต่ำสุด {min_words}, สูงสุด {max_words})
@@ -254,47 +593,70 @@ def get_perfect_fit_script(video_path: str, duration: float) -> tuple:
 ชื่อคลิป: [ชื่อสั้นๆ 3-5 คำ]
 บท: [บทพากย์ต่อเนื่องในย่อหน้าเดียว ประมาณ {target_words} คำ]"""
 
-    final_script = ""
-    final_title = "คลิปเด็ด"
-    current_model = MODEL_HIERARCHY[current_model_index]
-    chat = None
-    
-    # เก็บผลลัพธ์สำหรับ calibration
-    all_results = []  # [(title, script, audio_len, word_count)]
-    
-    # Calibration Loop - ใช้ผลรอบก่อนมาปรับจำนวนคำ
-    for attempt in range(MAX_SCRIPT_ATTEMPTS):
-        try:
-            # สร้าง/ใช้ chat session
-            if chat is None:
-                print(f"       🤖 ใช้ {current_model}")
-                model = genai.GenerativeModel(current_model)
-                chat = model.start_chat(history=[])
-            
-            # คำนวณ target words จากผลรอบก่อน
-            if attempt == 0:
-                # รอบแรก - ใช้ค่าประมาณ
-                current_target_words = target_words
-            else:
-                # รอบถัดไป - คำนวณจากผลลัพธ์ก่อนหน้า
-                prev_title, prev_script, prev_audio_len, prev_word_count = all_results[-1]
+        final_script = ""
+        final_title = "คลิปเด็ด"
+        final_len = 0.0
+        current_model = self.models[self.current_model_idx]
+        chat = None
+        
+        # เก็บผลลัพธ์สำหรับ calibration
+        all_results = []  # [(title, script, audio_len, word_count)]
+        estimated = set()  # บทที่ audio_len เป็นค่าประมาณจาก _apply_edits (ยังไม่วัดทั้งบท)
+        
+        # Calibration Loop - ใช้ผลรอบก่อนมาปรับจำนวนคำ
+        for attempt in range(MAX_SCRIPT_ATTEMPTS):
+            try:
+                round_start = time.perf_counter()
+                
+                # รอบแรกแบบ hedged: หลายความยาวในคำตอบเดียว + วัดเสียงพร้อมกัน
+                if not all_results and SCRIPT_CANDIDATES > 1:
+                    chat, results, winner = self._hedged_round(
+                        current_model, video_path, uploads, duration, target_words, on_progress
+                    )
+                    observe_stage("script_attempt", time.perf_counter() - round_start)
+                    # ใกล้สุดอยู่ท้าย = รอบถัดไป calibrate จากตัวนี้
+                    all_results.extend(sorted(results, key=lambda r: abs(duration - r[2]), reverse=True))
+                    if winner:
+                        print("       ✅ บทใกล้เคียงมาก! ใช้เลย")
+                        final_title, final_script, final_len, _ = winner
+                        break
+                    continue
                 
-                # คำนวณ words per second จริงจากรอบก่อน
-                actual_wps = prev_word_count / prev_audio_len if prev_audio_len > 0 else 2.2
+                # สร้าง/ใช้ chat session (chat ใหม่หลังสลับ key / model = ไม่มีวิดีโอใน history)
+                new_chat = chat is None
+                if new_chat:
+                    print(f"       🤖 ใช้ {current_model}")
+                    model = self.model(current_model)
+                    chat = model.start_chat(history=[])
                 
-                # คำนวณจำนวนคำที่ต้องการจริงๆ
-                current_target_words = int(duration * actual_wps)
+                # คำนวณ target words จากผลรอบก่อน
+                if not all_results:
+                    # รอบแรก (หรือรอบก่อนหน้า error ก่อนได้บท) - ใช้ค่าประมาณ
+                    current_target_words = target_words
+                else:
+                    # รอบถัดไป - คำนวณจากผลลัพธ์ก่อนหน้า
+                    prev_title, prev_script, prev_audio_len, prev_word_count = all_results[-1]
+                    
+                    # คำนวณ words per second จริงจากรอบก่อน
+                    actual_wps = prev_word_count / prev_audio_len if prev_audio_len > 0 else 2.2
+                    
+                    # คำนวณจำนวนคำที่ต้องการจริงๆ
+                    current_target_words = int(duration * actual_wps)
+                    
+                    # ปรับตามส่วนต่าง
+                    diff_seconds = duration - prev_audio_len
+                    word_adjustment = int(diff_seconds * actual_wps)
+                    current_target_words = prev_word_count + word_adjustment
+                    
+                    print(f"       📊 Calibration: {prev_word_count} คำ = {prev_audio_len:.1f}s, ต้องการอีก {word_adjustment:+d} คำ")
                 
-                # ปรับตามส่วนต่าง
-                diff_seconds = duration - prev_audio_len
-                word_adjustment = int(diff_seconds * actual_wps)
-                current_target_words = prev_word_count + word_adjustment
+                if on_progress:
+                    on_progress("calibration", round=attempt + 1, state="generating",
+                                model=current_model, target_words=current_target_words)
                 
-                print(f"       📊 Calibration: {prev_word_count} คำ = {prev_audio_len:.1f}s, ต้องการอีก {word_adjustment:+d} คำ")
-            
-            # สร้าง prompt ที่ระบุจำนวนคำชัดเจน
-            if attempt == 0:
-                prompt = f"""ดูวิดีโอนี้แล้วเขียนบทพากย์ภาษาไทย ความยาว {duration:.0f} วินาที
+                # สร้าง prompt ที่ระบุจำนวนคำชัดเจน
+                if not all_results:
+                    prompt = f"""ดูวิดีโอนี้แล้วเขียนบทพากย์ภาษาไทย ความยาว {duration:.0f} วินาที
 
 สำคัญมาก: ต้องเขียนประมาณ {current_target_words} คำ
 
@@ -308,9 +670,12 @@ def get_perfect_fit_script(video_path: str, duration: float) -> tuple:
 ชื่อ: [ชื่อคลิปสั้นๆ]
 ---
 [บทพากย์ยาวๆ ประมาณ {current_target_words} คำ ที่นี่]"""
-                response = chat.send_message([video_file, prompt])
-            else:
-                prompt = f"""บทที่แล้วสั้นไป ได้แค่ {prev_audio_len:.0f} วินาที (ต้องการ {duration:.0f} วินาที)
+                    message = [self._file_for(self.current_key, video_path, uploads, on_progress), prompt]
+                elif SCRIPT_DELTA_REFINE:
+                    # แก้เฉพาะบางประโยค (output สั้น + วัดเสียงเฉพาะส่วนที่เปลี่ยน)
+                    message = _delta_prompt(prev_script, prev_audio_len, duration, word_adjustment)
+                else:
+                    prompt = f"""บทที่แล้วสั้นไป ได้แค่ {prev_audio_len:.0f} วินาที (ต้องการ {duration:.0f} วินาที)
 
 เขียนบทใหม่ให้ยาวขึ้น ต้องมีประมาณ {current_target_words} คำ
 
@@ -320,122 +685,306 @@ def get_perfect_fit_script(video_path: str, duration: float) -> tuple:
 - รายละเอียดของวัตถุและบุคคล
 
 ตอบเป็นบทพากย์เพียงอย่างเดียว ไม่ต้องมี label:"""
-                response = chat.send_message(prompt)
-            
-            text = response.text.strip()
-            
-            # Parse response - ปรับปรุงให้ดีขึ้น
-            current_title = "คลิปเด็ด"
-            current_script = ""
-            
-            # แยกชื่อและบท
-            if "---" in text:
-                parts = text.split("---", 1)
-                header = parts[0].strip()
-                current_script = parts[1].strip() if len(parts) > 1 else ""
-                # หาชื่อจาก header
-                for line in header.split('\n'):
-                    if line.strip().startswith("ชื่อ"):
-                        current_title = re.sub(r'^ชื่อ[คลิป]*:', '', line).strip()
-            else:
-                # ลองหา pattern อื่น
-                lines = [l.strip() for l in text.split('\n') if l.strip()]
-                for i, line in enumerate(lines):
-                    if line.startswith("ชื่อ") and ":" in line:
-                        current_title = line.split(":", 1)[1].strip()
-                    elif line.startswith("บท") and ":" in line:
-                        current_script = line.split(":", 1)[1].strip()
-                        # รวมบรรทัดถัดไปด้วย
-                        current_script += " " + " ".join(lines[i+1:])
-                        break
+                    message = prompt
+                if new_chat and all_results:
+                    message = [self._file_for(self.current_key, video_path, uploads, on_progress), message]
                 
-                # ถ้ายังไม่มี script ให้ใช้ทั้งหมดยกเว้นบรรทัดแรก
-                if not current_script and len(lines) > 1:
-                    current_script = " ".join(lines[1:])
-                elif not current_script:
-                    current_script = text
-            
-            current_script = clean_script_final(current_script)
-            
-            # นับคำและวัดเสียง
-            word_count = len(current_script.split())
-            audio_len = get_audio_duration(current_script)
-            diff = duration - audio_len
-            
-            print(f"       >> รอบ {attempt+1}: {word_count} คำ = {audio_len:.2f}s | เป้า {duration:.2f}s | ต่าง {diff:+.2f}s")
-            
-            # เก็บผลลัพธ์
-            all_results.append((current_title, current_script, audio_len, word_count))
-            
-            # ถ้าใกล้เคียงมาก (ต่าง < 3 วิ) หยุดเลย
-            if abs(diff) <= 3.0:
-                print("       ✅ บทใกล้เคียงมาก! ใช้เลย")
-                final_script = current_script
-                final_title = current_title
-                break
+                # รอเฉพาะตอนที่ key นี้เรียกถี่เกิน rate ปัจจุบัน
+                get_limiter("gemini", self.current_key).acquire()
+                response = chat.send_message(message)
+                get_limiter("gemini", self.current_key).success()
+                
+                text = response.text.strip()
+                observe_stage("script_attempt", time.perf_counter() - round_start)
+                
+                edits = _parse_edits(text) if all_results and SCRIPT_DELTA_REFINE else None
+                if edits:
+                    current_title = prev_title
+                    current_script, audio_len = _apply_edits(prev_script, prev_audio_len, edits, on_progress)
+                    if abs(duration - audio_len) <= CALIBRATION_TOLERANCE:
+                        # ค่าประมาณบอกว่าพอดี - วัดทั้งบทจริงครั้งเดียวก่อนรับ (บทที่รับ = ความยาวจริง)
+                        estimate, audio_len = audio_len, get_audio_duration(current_script, on_progress)
+                        print(f"       📏 วัดจริง: {audio_len:.2f}s (ประมาณไว้ {estimate:.2f}s)")
+                    else:
+                        estimated.add(current_script)
+                else:
+                    # รอบแรก / ไม่ตอบเป็นคำสั่งแก้ไข (เขียนใหม่ทั้งบท) = วัดทั้งบท
+                    current_title, current_script = _parse_script_response(text)
+                    audio_len = get_audio_duration(current_script, on_progress)
                 
-        except Exception as e:
-            error_msg = str(e)
-            print(f"    ⚠️ Error: {error_msg[:80]}")
+                # นับคำ
+                word_count = len(current_script.split())
+                diff = duration - audio_len
+                
+                print(f"       >> รอบ {attempt+1}: {word_count} คำ = {audio_len:.2f}s | เป้า {duration:.2f}s | ต่าง {diff:+.2f}s")
+                if on_progress:
+                    on_progress("calibration", round=attempt + 1, state="measured", words=word_count,
+                                audio_seconds=round(audio_len, 2), diff_seconds=round(diff, 2))
+                
+                # เก็บผลลัพธ์
+                all_results.append((current_title, current_script, audio_len, word_count))
+                
+                # ถ้าใกล้เคียงมาก (ต่าง < 3 วิ) หยุดเลย
+                if abs(diff) <= CALIBRATION_TOLERANCE:
+                    print("       ✅ บทใกล้เคียงมาก! ใช้เลย")
+                    final_script = current_script
+                    final_title = current_title
+                    final_len = audio_len
+                    break
+                    
+            except Exception as e:
+                error_msg = str(e)
+                print(f"    ⚠️ Error: {error_msg[:80]}")
+                
+                if is_rate_limited(e):
+                    print("       🚨 Rate Limit! สลับ Key")
+                    count_rate_limit(self.current_key)
+                    # key นี้ช้าลง + พักตามที่ server บอก / key ถัดไปเรียกได้ทันที
+                    get_limiter("gemini", self.current_key).throttled(retry_after(e))
+                    self.rotate_key()
+                    chat = None
+                elif "404" in error_msg or "not found" in error_msg.lower():
+                    print(f"       💀 Model {current_model} ไม่พร้อมใช้งาน")
+                    current_model = self.next_model()
+                    chat = None
+                else:
+                    time.sleep(1)
+        
+        # เลือกผลลัพธ์ที่ดีที่สุด (ใกล้เคียง duration มากที่สุด)
+        if all_results and not final_script:
+            # sort by diff (ascending) - เอาอันที่ใกล้เคียงที่สุด
+            all_results.sort(key=lambda x: abs(duration - x[2]))
+            best = all_results[0]
+            final_title, final_script, best_len, best_words = best
+            if final_script in estimated:
+                best_len = get_audio_duration(final_script, on_progress)  # cache เก็บความยาวจริงเท่านั้น
+            final_len = best_len
+            print(f"       ✅ เลือกบทที่ดีที่สุด: {best_words} คำ = {best_len:.1f}s (ต่าง {duration - best_len:+.1f}s)")
+        
+        observe_calibration_rounds(len(all_results))
+        if cache and final_script:
+            cache.put(cache_key, final_title, final_script, final_len, model=current_model)
+        
+        # Cleanup (ไฟล์ของทุก key ที่ upload - รวมของคำขอสำรอง)
+        for key, file in list(uploads.items()):
+            self.delete_upload(file, key)
+        
+        return final_title, final_script
+    
+    # -------------------------------------------------------------------------
+    # 🎯 Hedged candidates (รอบแรก)
+    # -------------------------------------------------------------------------
+    
+    def _file_for(self, key: str, video_path: str, uploads: dict, on_progress=None):
+        """ไฟล์วิดีโอที่ key นี้ใช้ได้ (upload ให้ key นั้นตอนใช้ครั้งแรก เช่น หลัง rotate_key)"""
+        if key not in uploads:
+            uploads[key] = self.upload(video_path, on_progress=on_progress, key=key)
+        return uploads[key]
+    
+    def _ask(self, model_name: str, video_file, prompt: str, key: str = None) -> tuple:
+        """ส่งวิดีโอ + prompt ใน chat ใหม่ 1 ครั้ง (ด้วย key ที่ upload video_file) -> (chat, text)"""
+        key = key or self.current_key
+        chat = self.model(model_name, key).start_chat(history=[])
+        get_limiter("gemini", key).acquire()
+        response = chat.send_message(
+            [video_file, prompt], request_options={"timeout": SCRIPT_REQUEST_TIMEOUT}
+        )
+        get_limiter("gemini", key).success()
+        return chat, response.text.strip()
+    
+    def _hedged_request(self, model_name: str, video_path: str, uploads: dict, prompt: str) -> tuple:
+        """
+        ส่งคำขอ ถ้ายังไม่ตอบใน SCRIPT_HEDGE_SECONDS ส่งคำขอสำรองซ้อน แล้วใช้คำตอบที่มาก่อน
+        
+        คำขอสำรองไปที่ key ถัดไป (quota / rate limit แยกจาก key ที่ช้าอยู่)
+        ไฟล์ Gemini ใช้ได้เฉพาะ project ของ key ที่ upload - key สำรองจึง upload วิดีโอของตัวเอง
+        (เพิ่มลง uploads ให้ผู้เรียกลบตอนจบ) / มี key เดียว = ส่งไป model ถัดไปบน key เดิม
+        
+        Args:
+            uploads: {key: ไฟล์ที่ upload แล้ว} - ต้องมีไฟล์ของ key ปัจจุบัน
+        
+        Returns:
+            (chat, text, key) ของคำตอบที่ได้ก่อน - chat ผูกกับ key นี้
+        """
+        key = self.current_key
+        backup_key = self.keys[(self.current_key_idx + 1) % len(self.keys)]
+        lock = threading.Lock()
+        decided = threading.Event()
+        
+        def ask(model, key):
+            with lock:
+                video_file = uploads.get(key)
+            if video_file is None:
+                video_file = self.upload(video_path, key=key)
+                with lock:
+                    if decided.is_set():  # upload เสร็จหลังได้คำตอบแล้ว - ผู้เรียกไม่รู้จักไฟล์นี้
+                        self.delete_upload(video_file, key)
+                        raise RuntimeError("hedge ไม่ถูกใช้")
+                    uploads[key] = video_file
+            chat, text = self._ask(model, video_file, prompt, key)
+            return chat, text, key
+        
+        pool = ThreadPoolExecutor(max_workers=2)
+        futures = [pool.submit(ask, model_name, key)]
+        try:
+            done, _ = wait(futures, timeout=SCRIPT_HEDGE_SECONDS)
+            if not done:
+                if backup_key != key:
+                    backup_model, target = model_name, f"key {self.keys.index(backup_key) + 1}"
+                else:
+                    index = self.models.index(model_name) if model_name in self.models else -1
+                    backup_model = target = self.models[(index + 1) % len(self.models)]
+                print(f"       ⏱️ {model_name} ยังไม่ตอบใน {SCRIPT_HEDGE_SECONDS:.0f}s - ส่งคำขอสำรอง ({target})")
+                count_script_hedge()
+                futures.append(pool.submit(ask, backup_model, backup_key))
             
-            if "429" in error_msg or "quota" in error_msg.lower():
-                print("       🚨 Rate Limit! สลับ Key")
-                rotate_key()
-                chat = None
-                time.sleep(2)
-            elif "404" in error_msg or "not found" in error_msg.lower():
-                print(f"       💀 Model {current_model} ไม่พร้อมใช้งาน")
-                current_model = get_next_model()
-                chat = None
-            else:
-                time.sleep(1)
-    
-    # เลือกผลลัพธ์ที่ดีที่สุด (ใกล้เคียง duration มากที่สุด)
-    if all_results and not final_script:
-        # sort by diff (ascending) - เอาอันที่ใกล้เคียงที่สุด
-        all_results.sort(key=lambda x: abs(duration - x[2]))
-        best = all_results[0]
-        final_title, final_script, best_len, best_words = best
-        print(f"       ✅ เลือกบทที่ดีที่สุด: {best_words} คำ = {best_len:.1f}s (ต่าง {duration - best_len:+.1f}s)")
-    
-    # Cleanup
-    try:
-        genai.delete_file(video_file.name)
-    except:
-        pass
-    
-    return final_title, final_script
+            error = None
+            for future in as_completed(futures):
+                try:
+                    return future.result()
+                except Exception as e:
+                    error = e
+            raise error
+        finally:
+            with lock:
+                decided.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+    
+    def _measure_candidates(self, candidates: list, duration: float, on_progress=None) -> tuple:
+        """
+        วัดเสียงทีละ 2 เวอร์ชัน - ตัวแรกที่อยู่ใน tolerance ชนะ (ตัวที่ยังไม่เริ่มวัดถูกยกเลิก)
+        
+        Returns:
+            ([(title, script, audio_len, word_count)] ที่วัดแล้ว, ตัวที่ชนะหรือ None)
+        """
+        results = []
+        # worker น้อยกว่าจำนวนเวอร์ชัน = ชนะก่อนแล้วประหยัด TTS ของตัวที่เหลือได้จริง
+        pool = ThreadPoolExecutor(max_workers=min(2, len(candidates)))
+        futures = {
+            pool.submit(get_audio_duration, script, on_progress): (i, title, script)
+            for i, (title, script) in enumerate(candidates)
+        }
+        try:
+            for future in as_completed(futures):
+                i, title, script = futures[future]
+                audio_len = future.result()
+                word_count = len(script.split())
+                diff = duration - audio_len
+                results.append((title, script, audio_len, word_count))
+                
+                print(f"       >> เวอร์ชัน {i+1}: {word_count} คำ = {audio_len:.2f}s | เป้า {duration:.2f}s | ต่าง {diff:+.2f}s")
+                if on_progress:
+                    on_progress("calibration", round=1, state="measured", candidate=i + 1, words=word_count,
+                                audio_seconds=round(audio_len, 2), diff_seconds=round(diff, 2))
+                
+                if abs(diff) <= CALIBRATION_TOLERANCE:
+                    return results, results[-1]
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        return results, None
+    
+    def _hedged_round(self, model_name: str, video_path: str, uploads: dict, duration: float,
+                      target_words: int, on_progress=None) -> tuple:
+        """
+        รอบแรกแบบ hedged: ขอบท SCRIPT_CANDIDATES ความยาวในคำตอบเดียว แล้ววัดเสียงพร้อมกัน
+        
+        คำตอบมาจาก key สำรอง = สลับไปใช้ key นั้นต่อ (chat ของรอบถัดไปผูกกับ key นั้น)
+        
+        Returns:
+            (chat ของคำตอบที่ใช้, ผลที่วัดแล้ว, ตัวที่ชนะหรือ None)
+        """
+        targets = _variant_targets(target_words, SCRIPT_CANDIDATES)
+        if on_progress:
+            on_progress("calibration", round=1, state="generating", model=model_name, target_words=targets)
+        
+        versions = "\n".join(f"- เวอร์ชัน {i+1}: ประมาณ {words} คำ" for i, words in enumerate(targets))
+        layout = "\n".join(f"=== {i+1} ===\n[บทพากย์เวอร์ชัน {i+1} ประมาณ {words} คำ]"
+                           for i, words in enumerate(targets))
+        prompt = f"""ดูวิดีโอนี้แล้วเขียนบทพากย์ภาษาไทย ความยาว {duration:.0f} วินาที จำนวน {len(targets)} เวอร์ชัน
+(เนื้อหาเดียวกัน ต่างกันแค่ความยาว)
 
+สำคัญมาก: แต่ละเวอร์ชันต้องมีจำนวนคำตามนี้
+{versions}
 
-# =============================================================================
-# 🎯 AI BRAIN CLASS (Alternative OOP Interface)
-# =============================================================================
+กฎ:
+- บรรยายสิ่งที่เห็นในวิดีโอตามลำดับเวลา
+- แต่ละเวอร์ชันเขียนต่อเนื่องเป็นย่อหน้าเดียว
+- ใช้ภาษาเป็นธรรมชาติ เหมือนเล่าเรื่องให้เพื่อนฟัง
+- ห้ามขึ้นต้นว่า "สวัสดี"
 
-class AIBrain:
-    """Object-oriented wrapper สำหรับ AI functions"""
-    
-    def __init__(self):
-        self.keys = []
-        self.current_key_idx = 0
-        self.current_model_idx = 0
-        self.initialized = False
-    
-    def initialize(self) -> bool:
-        """ทดสอบและเตรียม AI"""
-        self.keys = test_api_keys()
-        self.initialized = True
-        return len(self.keys) > 0
-    
-    def generate_script(self, video_path: str, duration: float) -> tuple:
-        """สร้างบทพากย์"""
-        if not self.initialized:
-            self.initialize()
-        return get_perfect_fit_script(video_path, duration)
+ตอบในรูปแบบ:
+ชื่อ: [ชื่อคลิปสั้นๆ]
+{layout}"""
+        
+        print(f"       🤖 ใช้ {model_name} ({len(targets)} เวอร์ชัน: {', '.join(map(str, targets))} คำ)")
+        chat, text, key = self._hedged_request(model_name, video_path, uploads, prompt)
+        if key != self.current_key:
+            self.current_key_idx = self.keys.index(key)
+        candidates = _parse_variants(text, len(targets))
+        results, winner = self._measure_candidates(candidates, duration, on_progress)
+        return chat, results, winner
     
     @property
     def status(self) -> dict:
         """สถานะปัจจุบัน"""
         return {
-            "gemini_keys": len(available_keys),
-            "current_model": MODEL_HIERARCHY[current_model_index],
+            "gemini_keys": len(self.keys),
+            "current_model": self.models[self.current_model_idx],
         }
+
+
+# =============================================================================
+# 🔧 DEFAULT INSTANCE (CLI: main.py / main_gdrive.py)
+# =============================================================================
+# งานจาก API สร้าง AIBrain ของตัวเองต่องาน - instance นี้ใช้เฉพาะ CLI process เดียว
+
+_default_brain = None
+
+
+def get_default_brain() -> AIBrain:
+    """AIBrain ที่ใช้ API_KEYS จาก settings (สร้างครั้งแรกที่เรียก)"""
+    global _default_brain
+    if _default_brain is None:
+        _default_brain = AIBrain()
+    return _default_brain
+
+
+def test_api_keys() -> list:
+    """ทดสอบ keys ของ default brain - Returns: list ของ keys ที่ทำงานได้"""
+    brain = get_default_brain()
+    brain.initialize()
+    return brain.keys
+
+
+def rotate_key() -> None:
+    """สลับ key ของ default brain"""
+    get_default_brain().rotate_key()
+
+
+def get_next_model() -> str:
+    """เปลี่ยน model ของ default brain"""
+    return get_default_brain().next_model()
+
+
+def reset_model_fallback() -> None:
+    """รีเซ็ต model ของ default brain"""
+    get_default_brain().reset_model_fallback()
+
+
+def upload_to_gemini(path: str, max_attempts: int = None, on_progress=None) -> object:
+    """Upload video ด้วย default brain"""
+    return get_default_brain().upload(path, max_attempts, on_progress)
+
+
+def get_perfect_fit_script(video_path: str, duration: float, on_progress=None,
+                           brain: AIBrain = None, use_cache: bool = True) -> tuple:
+    """
+    สร้างบทพากย์ (ดู AIBrain.generate_script)
+    
+    Args:
+        brain: AIBrain ที่จะใช้ (default: default brain)
+        use_cache: False = ไม่ใช้บทจาก script cache
+    """
+    return (brain or get_default_brain()).generate_script(
+        video_path, duration, on_progress, use_cache=use_cache
+    )
@@ -0,0 +1,323 @@
+# =============================================================================
+# 🧾 JOBS MODULE
+# =============================================================================
+# Logic ของงาน 1 ชิ้นจาก API (download -> script -> voice -> render)
+# รันใน worker process (worker.py) ไม่ใช่ใน API server
+
+import os
+import json
+import hashlib
+from pathlib import Path
+
+from config.settings import (
+    TEMP_DIR, OUTPUT_DIR, AVATAR_FILE, MODEL_HIERARCHY,
+    VOICE_NAME, VOICE_RATE, VOICE_PITCH, VOICE_VOLUME,
+    VIDEO_WIDTH, VIDEO_HEIGHT, VIDEO_FPS, VIDEO_BITRATE, VIDEO_PRESET,
+    ENCODE_MODE, VIDEO_CRF, RENDITION_PRESETS, ensure_directories
+)
+from modules.downloader import get_download_manager, video_key, source_limit_error
+from modules.checkpoints import Checkpoint
+from modules.gemini_brain import AIBrain
+from modules.voice import generate_voice_sync
+from modules.video_processor import (
+    resize_for_shorts, sync_audio_to_video, render_final_video,
+    prepare_avatar_with_chromakey, process_video_renditions, choose_encoding
+)
+
+__all__ = [
+    'run_video_job',
+    'job_fingerprint',
+    'result_available',
+    'prepare_batch',
+    'shared_avatar_for',
+]
+
+
+# เพิ่มเมื่อ pipeline เปลี่ยนจน output เดิมใช้ซ้ำไม่ได้
+FINGERPRINT_VERSION = 3
+
+
+def job_fingerprint(params: dict) -> str:
+    """
+    Fingerprint ของงาน: input + config ที่มีผลต่อ output
+    
+    งานที่ fingerprint ตรงกันได้ผลลัพธ์เหมือนกัน -> ใช้ซ้ำ / รอร่วมกันได้
+    (api_key ไม่นับ - key ไหนก็ได้บทแบบเดียวกัน / custom_prompt ไม่นับจนกว่า pipeline จะใช้จริง)
+    """
+    use_avatar = bool(params.get("use_avatar", True))
+    profiles = params.get("profiles")
+    avatar = None
+    if use_avatar and AVATAR_FILE.exists():
+        stat = AVATAR_FILE.stat()
+        avatar = [stat.st_size, int(stat.st_mtime)]
+    
+    spec = {
+        "version": FINGERPRINT_VERSION,
+        "url": video_key(params["url"]),
+        "use_avatar": use_avatar,
+        "profiles": profiles,
+        "renditions": {name: RENDITION_PRESETS.get(name) for name in profiles or []},
+        "voice": [VOICE_NAME, VOICE_RATE, VOICE_PITCH, VOICE_VOLUME],
+        "video": [VIDEO_WIDTH, VIDEO_HEIGHT, VIDEO_FPS, VIDEO_BITRATE, VIDEO_PRESET, ENCODE_MODE, VIDEO_CRF],
+        "models": MODEL_HIERARCHY,
+        "avatar": avatar,
+    }
+    encoded = json.dumps(spec, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def result_available(task: dict, output_dir: Path = None) -> bool:
+    """งานที่เสร็จแล้วยังมีไฟล์ผลลัพธ์ครบไหม (ใช้ซ้ำได้)"""
+    output_dir = Path(output_dir or OUTPUT_DIR)
+    files = list((task.get("result_files") or {}).values()) or [task.get("result_file")]
+    return all(f and (output_dir / f).exists() for f in files)
+
+
+def _checkpoint_key(job_id: str, params: dict) -> str:
+    """
+    key ของ checkpoint งาน: คลิปเดียวกัน + config เดียวกัน = ทำต่อจากกันได้
+    
+    ไม่ผูกกับ job_id - งานที่ fail แล้วส่งใหม่ (job ใหม่) ทำต่อจากขั้นที่ค้างได้
+    (งานเดี่ยว / งานย่อย batch ที่ fingerprint ตรงกันถูกผูกกับงานที่ยังไม่จบ ไม่เปิดซ้อนกัน)
+    force / refresh_script ไม่ผ่านการตรวจงานซ้ำ - รันพร้อมงานคลิปเดียวกันได้ = checkpoint ของงานนี้เท่านั้น
+    """
+    if params.get("force") or params.get("refresh_script"):
+        return f"job:{job_id}"
+    return f"job:{video_key(params['url'])}:{job_fingerprint(params)[:16]}"
+
+
+def run_video_job(job_id: str, params: dict, report, emit=None) -> dict:
+    """
+    ทำงาน 1 ชิ้นจนเสร็จ
+    
+    Args:
+        job_id: id ของงาน (ใช้ตั้งชื่อไฟล์ output / temp)
+        params: payload จาก API - url, use_avatar, api_key, profiles
+        report: callable(**fields) สำหรับรายงาน progress/message
+        emit: callable(event, **data) สำหรับ progress ละเอียด (download, upload,
+              calibration, tts, render)
+    
+    Returns:
+        dict ผลลัพธ์ (result_file, result_files)
+    
+    Raises:
+        Exception ถ้าขั้นตอนไหนล้มเหลว
+    """
+    # ผลของ download / script / voice เก็บเป็น checkpoint ของคลิปนี้:
+    # worker ตายกลาง render (lease หมด) / งาน fail แล้วส่งใหม่ -> ทำต่อจาก render เลย
+    # (ลบเมื่อสำเร็จเท่านั้น - ที่ fail ค้างไว้ให้ prune_checkpoints เก็บกวาดตามอายุ)
+    checkpoint = Checkpoint(_checkpoint_key(job_id, params))
+    voice_path = checkpoint.path("voice.mp3")
+    voice_settings = [VOICE_NAME, VOICE_RATE, VOICE_PITCH, VOICE_VOLUME]
+    
+    # temp files ของงานนี้เท่านั้น (หลาย worker รันพร้อมกันได้)
+    synced_audio_path = TEMP_DIR / f"synced_{job_id}.mp3"
+    avatar_path = TEMP_DIR / f"avatar_{job_id}.mov"
+    shared_avatar = None
+    
+    try:
+        report(progress=10, message="Downloading video...")
+        
+        from moviepy.editor import VideoFileClip, AudioFileClip
+        
+        # 0. Gemini client ของงานนี้ (key ของ user ไม่ปนกับงานอื่นที่รันพร้อมกัน)
+        brain = AIBrain([params["api_key"]] if params.get("api_key") else None)
+        brain.initialize(validate=False)
+        
+        if not params.get("batch_id"):
+            ensure_directories()  # งานใน batch: งานเตรียม batch ทำไปแล้ว
+        
+        if checkpoint.stages():
+            report(checkpoint=checkpoint.stages())  # ขั้นที่ไม่ต้องทำซ้ำ
+        
+        # 1. Download
+        source = checkpoint.get("download")
+        if source:
+            video_path, duration = source["path"], source["duration"]
+        else:
+            download = get_download_manager().download(params["url"], checkpoint.dir, on_progress=emit)
+            video_path = download["path"]
+            if not video_path:
+                raise Exception(f"Download failed: {download['error']}" if download["error"] else "Download failed")
+            
+            # ความเร็วดาวน์โหลดของงานนี้ (ดู edge ที่ช้า / cache hit ได้จาก /api/status)
+            report(download={
+                "bytes": download["bytes"],
+                "seconds": round(download["seconds"], 2),
+                "throughput": round(download["throughput"]) if download["throughput"] else None,
+                "cached": download["cached"],
+                "stalls": download["stalls"],
+            })
+            
+            # Get duration
+            clip = VideoFileClip(video_path)
+            duration = clip.duration
+            clip.close()
+            checkpoint.save("download", path=video_path, duration=duration)
+        
+        report(progress=30, message="Analyzing video & generating script...")
+        
+        # 2. Generate Script
+        # TODO: Support custom prompt injection if needed
+        written = checkpoint.get("script")
+        if written:
+            title, script = written["title"], written["script"]
+        else:
+            title, script = brain.generate_script(
+                video_path, duration, on_progress=emit, use_cache=not params.get("refresh_script")
+            )
+            if not script:
+                raise Exception("Failed to generate script")
+            checkpoint.save("script", title=title, script=script)
+        
+        report(progress=50, message="Generating voice...")
+        
+        # 3. Generate Voice
+        if not checkpoint.get("voice", voice=voice_settings):
+            generate_voice_sync(script, str(voice_path), on_progress=emit)
+            if not voice_path.exists():
+                raise Exception("Voice generation failed")
+            checkpoint.save("voice", path=str(voice_path), voice=voice_settings)
+        
+        report(progress=70, message="Processing video (Rendering)...")
+        
+        # Avatar ที่ batch เตรียมไว้ให้ (ถ้ายาวพอ) ไม่ต้อง key ใหม่ทุกงาน
+        if params.get("use_avatar", True):
+            shared_avatar = shared_avatar_for(params, duration)
+        
+        # 4a. Multi-rendition: decode + composite รอบเดียว ได้ทุก output
+        profiles = params.get("profiles")
+        if profiles:
+            def on_render(event, **data):
+                # Playlist ถูกเขียนระหว่าง render - เก็บ path จริง (อาจมี _1, _2) ให้ /api/hls
+                if event == "render" and "hls" in data.get("outputs", {}):
+                    report(result_files={"hls": data["outputs"]["hls"]},
+                           hls_url=f"/api/hls/{job_id}/index.m3u8")
+                if emit:
+                    emit(event, **data)
+            
+            outputs = process_video_renditions(
+                video_path, f"final_{job_id}", str(voice_path),
+                profiles=profiles,
+                use_avatar=params.get("use_avatar", True),
+                on_progress=on_render,
+                avatar_path=shared_avatar
+            )
+            if not outputs:
+                raise Exception("Rendering failed")
+            
+            # hls = <dir>/index.m3u8 (relative กับ OUTPUT_DIR), อื่นๆ = ชื่อไฟล์
+            result_files = {
+                name: Path(p).relative_to(Path(p).parent.parent).as_posix() if name == "hls" else Path(p).name
+                for name, p in outputs.items()
+            }
+            files = [f for name, f in result_files.items() if name != "hls"]
+            checkpoint.clear()
+            return {
+                "result_files": result_files,
+                "result_file": result_files.get("master") or next(iter(files), None),
+            }
+        
+        # 4. Processing
+        source_clip = VideoFileClip(video_path)
+        audio_clip = AudioFileClip(str(voice_path))
+        
+        synced_audio = sync_audio_to_video(audio_clip, duration)
+        synced_audio.write_audiofile(str(synced_audio_path), logger=None)
+        final_audio = AudioFileClip(str(synced_audio_path))
+        
+        resized_clip = resize_for_shorts(source_clip)
+        
+        has_avatar = False
+        if shared_avatar:
+            has_avatar, avatar_path = True, shared_avatar
+        elif params.get("use_avatar", True):
+            has_avatar = prepare_avatar_with_chromakey(duration, avatar_path)
+        
+        output_filename = f"final_{job_id}.mp4"
+        output_path = OUTPUT_DIR / output_filename
+        
+        try:
+            render_final_video(
+                resized_clip, final_audio, output_path,
+                add_avatar=has_avatar, encoding=choose_encoding(video_path),
+                avatar_path=avatar_path, on_progress=emit
+            )
+        finally:
+            source_clip.close()
+            audio_clip.close()
+            final_audio.close()
+        
+        checkpoint.clear()
+        return {
+            "result_file": output_filename,
+            "result_files": {"master": output_filename},
+        }
+    
+    finally:
+        for f in (synced_audio_path, None if shared_avatar else avatar_path):
+            try:
+                if f and os.path.exists(f):
+                    os.remove(f)
+            except OSError:
+                pass
+
+
+def shared_avatar_for(params: dict, duration: float) -> Path | None:
+    """Avatar ของ batch ถ้ามีและยาวพอสำหรับคลิปนี้ (None = เตรียมเอง)"""
+    path = params.get("avatar_path")
+    if path and Path(path).exists() and duration <= params.get("avatar_seconds", 0):
+        return Path(path)
+    return None
+
+
+def prepare_batch(job_id: str, params: dict, report, emit=None) -> dict:
+    """
+    เตรียมของที่งานย่อยทั้ง batch ใช้ร่วมกัน (ทำครั้งเดียว)
+    
+    - ตรวจ Gemini key (key เสีย = ทั้ง batch fail ทันที ไม่ต้องดาวน์โหลดก่อน)
+    - ดึง metadata ทุก URL (URL ที่ใช้ไม่ได้ fail ทันที)
+    - เตรียม avatar (chroma key) ยาวพอสำหรับคลิปที่ยาวที่สุด
+    
+    Args:
+        params: payload ของ batch - items [{id, url}], use_avatar, api_key
+    
+    Returns:
+        {"shared": field ที่เพิ่มให้ทุกงานย่อย,
+         "items": {item_id: {"title", "duration"} หรือ {"error"}}}
+    
+    Raises:
+        ValueError ถ้าไม่มี Gemini key ที่ใช้ได้
+    """
+    ensure_directories()
+    
+    report(progress=10, message="Validating API key...")
+    brain = AIBrain([params["api_key"]] if params.get("api_key") else None)
+    brain.initialize()
+    
+    report(progress=30, message="Fetching video metadata...")
+    # ดึงพร้อมกันทุก URL (pool ของ yt-dlp sessions)
+    infos = get_download_manager().info_many([item["url"] for item in params["items"]])
+    items = {}
+    longest = 0.0
+    for item in params["items"]:
+        info = infos[item["url"]]
+        if not info:
+            items[item["id"]] = {"error": "Video unavailable"}
+            continue
+        reason = source_limit_error(info)
+        if reason:
+            items[item["id"]] = {"error": reason}  # ไม่ต้องดาวน์โหลดทิ้ง
+            continue
+        duration = info.get("duration") or 0
+        items[item["id"]] = {"title": info.get("title"), "duration": duration}
+        longest = max(longest, duration)
+    
+    shared = {}
+    if params.get("use_avatar", True) and longest > 0:
+        report(progress=60, message="Preparing avatar...")
+        avatar_path = TEMP_DIR / f"avatar_{job_id}.mov"
+        if prepare_avatar_with_chromakey(longest + 1, avatar_path):
+            shared = {"avatar_path": str(avatar_path), "avatar_seconds": longest + 1}
+    
+    return {"shared": shared, "items": items}
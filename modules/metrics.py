@@ -0,0 +1,323 @@
+# =============================================================================
+# 📈 METRICS MODULE
+# =============================================================================
+# Latency / throughput metrics ในรูปแบบ Prometheus text (ไม่ต้องมี dependency)
+# - แต่ละ process เก็บใน REGISTRY ของตัวเอง
+# - Worker ส่ง snapshot เข้า job broker -> api.py รวมแล้วเสิร์ฟที่ /metrics
+# - CLI (main.py / main_gdrive.py) เขียนลงไฟล์ได้ด้วย --metrics-file
+
+import os
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from config.settings import MAX_SCRIPT_ATTEMPTS
+
+__all__ = [
+    'Registry',
+    'REGISTRY',
+    'stage_timer',
+    'observe_stage',
+    'count_bytes',
+    'count_rate_limit',
+    'count_rate_limit_wait',
+    'count_job',
+    'observe_calibration_rounds',
+    'observe_download_throughput',
+    'count_download_cache',
+    'count_download_stall',
+    'count_script_cache',
+    'count_script_hedge',
+    'key_label',
+    'render_merged',
+]
+
+PREFIX = "videofactory"
+
+# วินาที: ครอบคลุมตั้งแต่ TTS สั้นๆ ถึง render คลิปยาว
+STAGE_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1200)
+
+# bytes/s: 256 KB/s ถึง 100 MB/s
+THROUGHPUT_BUCKETS = tuple(int(mb * 1024 * 1024) for mb in (0.25, 0.5, 1, 2, 5, 10, 20, 50, 100))
+
+# =============================================================================
+# 📊 REGISTRY
+# =============================================================================
+
+class Registry:
+    """
+    ที่เก็บ counter / gauge / histogram (thread-safe)
+    
+    Usage:
+        registry.histogram("stage_duration_seconds", "...", labels=("stage",))
+        registry.observe("stage_duration_seconds", 1.5, stage="tts")
+        text = registry.render()
+    """
+    
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+    
+    # -------------------------------------------------------------------------
+    # Definitions
+    # -------------------------------------------------------------------------
+    
+    def _define(self, kind: str, name: str, help_text: str, labels: tuple, buckets: tuple = None) -> None:
+        self._metrics.setdefault(name, {
+            "kind": kind,
+            "help": help_text,
+            "labels": list(labels),
+            "buckets": list(buckets) if buckets else None,
+            "samples": {},
+        })
+    
+    def counter(self, name: str, help_text: str, labels: tuple = ()) -> None:
+        self._define("counter", name, help_text, labels)
+    
+    def gauge(self, name: str, help_text: str, labels: tuple = ()) -> None:
+        self._define("gauge", name, help_text, labels)
+    
+    def histogram(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = STAGE_BUCKETS) -> None:
+        self._define("histogram", name, help_text, labels, buckets)
+    
+    # -------------------------------------------------------------------------
+    # Updates
+    # -------------------------------------------------------------------------
+    
+    def _key(self, metric: dict, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in metric["labels"])
+    
+    def inc(self, name: str, amount: float = 1.0, **labels) -> None:
+        """เพิ่มค่า counter"""
+        metric = self._metrics[name]
+        key = self._key(metric, labels)
+        with self._lock:
+            metric["samples"][key] = metric["samples"].get(key, 0.0) + amount
+    
+    def set(self, name: str, value: float, **labels) -> None:
+        """ตั้งค่า gauge"""
+        metric = self._metrics[name]
+        with self._lock:
+            metric["samples"][self._key(metric, labels)] = float(value)
+    
+    def observe(self, name: str, value: float, **labels) -> None:
+        """บันทึกค่าลง histogram"""
+        metric = self._metrics[name]
+        key = self._key(metric, labels)
+        with self._lock:
+            # [count ต่อ bucket..., +Inf count, sum]
+            sample = metric["samples"].setdefault(key, [0] * (len(metric["buckets"]) + 1) + [0.0])
+            for i, bound in enumerate(metric["buckets"]):
+                if value <= bound:
+                    sample[i] += 1
+            sample[-2] += 1
+            sample[-1] += value
+    
+    # -------------------------------------------------------------------------
+    # Snapshot / merge (ข้าม process)
+    # -------------------------------------------------------------------------
+    
+    def snapshot(self) -> dict:
+        """ค่าทั้งหมดแบบ JSON-serializable"""
+        with self._lock:
+            return {
+                name: {
+                    **metric,
+                    "samples": [[list(k), list(v) if isinstance(v, list) else v]
+                                for k, v in metric["samples"].items()],
+                }
+                for name, metric in self._metrics.items()
+            }
+    
+    def merge(self, snapshot: dict) -> None:
+        """บวก counter / histogram จาก snapshot ของ process อื่น (gauge ข้าม)"""
+        with self._lock:
+            for name, other in snapshot.items():
+                if other["kind"] == "gauge":
+                    continue
+                self._metrics.setdefault(name, {**other, "samples": {}})
+                metric = self._metrics[name]
+                if metric["kind"] != other["kind"] or metric.get("buckets") != other.get("buckets"):
+                    continue
+                for labels, value in other["samples"]:
+                    key = tuple(labels)
+                    if metric["kind"] == "histogram":
+                        current = metric["samples"].get(key, [0] * len(value))
+                        metric["samples"][key] = [a + b for a, b in zip(current, value)]
+                    else:
+                        metric["samples"][key] = metric["samples"].get(key, 0.0) + value
+    
+    # -------------------------------------------------------------------------
+    # Output
+    # -------------------------------------------------------------------------
+    
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        with self._lock:
+            for name, metric in sorted(self._metrics.items()):
+                full = f"{PREFIX}_{name}"
+                lines.append(f"# HELP {full} {metric['help']}")
+                lines.append(f"# TYPE {full} {metric['kind']}")
+                for key, value in sorted(metric["samples"].items()):
+                    labels = list(zip(metric["labels"], key))
+                    if metric["kind"] != "histogram":
+                        lines.append(f"{full}{_labels(labels)} {_number(value)}")
+                        continue
+                    for bound, count in zip(metric["buckets"], value):
+                        lines.append(f"{full}_bucket{_labels(labels + [('le', _number(bound))])} {count}")
+                    lines.append(f"{full}_bucket{_labels(labels + [('le', '+Inf')])} {value[-2]}")
+                    lines.append(f"{full}_sum{_labels(labels)} {_number(value[-1])}")
+                    lines.append(f"{full}_count{_labels(labels)} {value[-2]}")
+        return "\n".join(lines) + "\n"
+    
+    def write(self, path: Path) -> None:
+        """เขียนลงไฟล์แบบ atomic (ใช้กับ node_exporter textfile collector ได้)"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(self.render(), encoding="utf-8")
+        os.replace(tmp, path)
+
+
+def _labels(pairs: list) -> str:
+    if not pairs:
+        return ""
+    
+    def escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def define_metrics(registry: Registry) -> Registry:
+    """Metrics มาตรฐานของ factory"""
+    registry.histogram(
+        "stage_duration_seconds",
+        "Duration of pipeline stages (download, gemini_upload, queue_wait, script_attempt, tts, render, job)",
+        labels=("stage",),
+    )
+    registry.histogram(
+        "calibration_rounds",
+        "Script calibration rounds needed per clip",
+        buckets=tuple(range(1, MAX_SCRIPT_ATTEMPTS + 1)),
+    )
+    registry.histogram(
+        "download_throughput_bytes_per_second",
+        "Download throughput per file",
+        buckets=THROUGHPUT_BUCKETS,
+    )
+    registry.counter("download_cache_total", "Download cache lookups (hit / miss)", labels=("result",))
+    registry.counter("script_cache_total", "Script cache lookups (hit / miss)", labels=("result",))
+    registry.counter("script_hedges_total", "Backup Gemini requests sent after the hedge delay")
+    registry.counter("download_stalls_total", "Downloads restarted / failed by the stall watchdog")
+    registry.counter("rate_limited_total", "Gemini 429 / quota errors per API key", labels=("key",))
+    registry.counter("rate_limit_wait_seconds_total", "Time spent waiting for the adaptive rate limiter", labels=("api",))
+    registry.counter("bytes_total", "Bytes moved per direction (download, upload, output)", labels=("direction",))
+    registry.counter("jobs_total", "Finished jobs per status", labels=("status",))
+    registry.counter("admission_rejected_total", "Submissions rejected because the queue was full")
+    registry.gauge("queue_depth", "Jobs waiting for a worker")
+    registry.gauge("active_jobs", "Jobs being processed")
+    registry.gauge("workers", "Workers with a recent heartbeat")
+    return registry
+
+
+# Metrics ของ process นี้
+REGISTRY = define_metrics(Registry())
+
+# =============================================================================
+# 🧰 HELPERS
+# =============================================================================
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """บันทึกเวลาของขั้นตอน"""
+    REGISTRY.observe("stage_duration_seconds", seconds, stage=stage)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """จับเวลาขั้นตอน (บันทึกแม้ขั้นตอน error)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def count_bytes(direction: str, amount: int) -> None:
+    """นับ bytes ที่รับ/ส่ง (download, upload, output)"""
+    if amount:
+        REGISTRY.inc("bytes_total", amount, direction=direction)
+
+
+def key_label(key: str) -> str:
+    """ชื่อ key สำหรับ label (hash - ห้ามใส่ key จริงลง metrics)"""
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:8] if key else "none"
+
+
+def count_rate_limit(key: str) -> None:
+    """นับ 429 ต่อ key"""
+    REGISTRY.inc("rate_limited_total", key=key_label(key))
+
+
+def count_rate_limit_wait(api: str, seconds: float) -> None:
+    """เวลาที่รอ rate limiter (ต่อ API)"""
+    REGISTRY.inc("rate_limit_wait_seconds_total", seconds, api=api)
+
+
+def count_job(status: str) -> None:
+    """นับงานที่จบ (completed / failed)"""
+    REGISTRY.inc("jobs_total", status=status)
+
+
+def observe_calibration_rounds(rounds: int) -> None:
+    """จำนวนรอบ calibration ที่ใช้ต่อคลิป"""
+    if rounds:
+        REGISTRY.observe("calibration_rounds", rounds)
+
+
+def observe_download_throughput(bytes_per_second: float) -> None:
+    """throughput ของการดาวน์โหลด 1 ไฟล์"""
+    REGISTRY.observe("download_throughput_bytes_per_second", bytes_per_second)
+
+
+def count_download_cache(hit: bool) -> None:
+    """นับ cache hit / miss ของไฟล์ต้นฉบับ"""
+    REGISTRY.inc("download_cache_total", result="hit" if hit else "miss")
+
+
+def count_download_stall() -> None:
+    """นับดาวน์โหลดที่ค้าง (watchdog ตัดแล้วเริ่มใหม่ / fail)"""
+    REGISTRY.inc("download_stalls_total")
+
+
+def count_script_cache(hit: bool) -> None:
+    """นับ cache hit / miss ของบทพากย์"""
+    REGISTRY.inc("script_cache_total", result="hit" if hit else "miss")
+
+
+def count_script_hedge() -> None:
+    """นับคำขอสำรองที่ส่งเพราะ Gemini ตอบช้า"""
+    REGISTRY.inc("script_hedges_total")
+
+
+def render_merged(snapshots: list, gauges: dict = None) -> str:
+    """
+    รวม snapshot จากหลาย process แล้ว render
+    
+    Args:
+        snapshots: list ของ Registry.snapshot()
+        gauges: {ชื่อ gauge: ค่า} ณ ตอน scrape (เช่น queue_depth)
+    """
+    merged = define_metrics(Registry())
+    for snapshot in snapshots:
+        merged.merge(snapshot)
+    for name, value in (gauges or {}).items():
+        merged.set(name, value)
+    return merged.render()
@@ -0,0 +1,143 @@
+# =============================================================================
+# 🚦 RATE LIMITER MODULE
+# =============================================================================
+# จังหวะการเรียก API ภายนอก (Gemini, Edge TTS) แบบปรับตัวเอง (AIMD)
+# - เรียกสำเร็จ = เพิ่ม rate ทีละ step (additive increase)
+# - โดน 429 / quota = ลด rate ลงครึ่งหนึ่ง + พักตาม retry delay (multiplicative decrease)
+# - รอเฉพาะตอนที่เรียกถี่เกิน rate ปัจจุบัน (แทนการพักคงที่ระหว่างคลิป)
+# ใช้ร่วมกันทุก thread / ทุกงานใน process เดียวกันผ่าน get_limiter()
+
+import re
+import time
+import asyncio
+import threading
+
+from config.settings import RATE_LIMITS
+from modules.metrics import count_rate_limit_wait
+
+__all__ = [
+    'AdaptiveLimiter',
+    'get_limiter',
+    'is_rate_limited',
+    'retry_after',
+]
+
+# retry delay จาก server ที่ยอมรอ (quota รายวันบอกเป็นชั่วโมง - ให้สลับ key แทน)
+MAX_RETRY_AFTER = 120.0
+
+# =============================================================================
+# 🚦 LIMITER
+# =============================================================================
+
+class AdaptiveLimiter:
+    """
+    เว้นระยะการเรียก API ตาม rate (ครั้ง/นาที) ที่ปรับตาม 429
+    
+    Usage:
+        limiter = get_limiter("gemini", key)
+        limiter.acquire()              # รอถ้าเรียกถี่เกิน
+        try:
+            response = call_api()
+        except Exception as e:
+            if is_rate_limited(e):
+                limiter.throttled(retry_after(e))
+            raise
+        limiter.success()
+    """
+    
+    def __init__(self, name: str, start: float, min_rate: float, max_rate: float,
+                 step: float, decrease: float = 0.5, clock=time.monotonic):
+        self.name = name
+        self.rate = float(start)  # ครั้ง/นาที
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.step = float(step)
+        self.decrease = decrease
+        self.clock = clock
+        self._next = 0.0  # เวลา (clock) ที่เรียกครั้งถัดไปได้
+        self._lock = threading.Lock()
+    
+    def reserve(self) -> float:
+        """จองการเรียก 1 ครั้ง -> ต้องรออีกกี่วินาที (0 = เรียกได้เลย)"""
+        with self._lock:
+            now = self.clock()
+            at = max(now, self._next)
+            self._next = at + 60.0 / self.rate
+        return at - now
+    
+    def acquire(self) -> float:
+        """รอจนถึงคิวของตัวเอง (blocking) -> วินาทีที่รอ"""
+        delay = self.reserve()
+        if delay > 0:
+            count_rate_limit_wait(self.name, delay)
+            time.sleep(delay)
+        return delay
+    
+    async def acquire_async(self) -> float:
+        """acquire สำหรับโค้ด async (ไม่บล็อก event loop)"""
+        delay = self.reserve()
+        if delay > 0:
+            count_rate_limit_wait(self.name, delay)
+            await asyncio.sleep(delay)
+        return delay
+    
+    def success(self) -> None:
+        """เรียกสำเร็จ -> เพิ่ม rate ทีละ step"""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.step)
+    
+    def throttled(self, retry_after: float = None) -> None:
+        """
+        โดน 429 / quota -> ลด rate + หยุดเรียกชั่วคราว
+        
+        Args:
+            retry_after: วินาทีที่ server บอกให้รอ (None = รอ 1 ช่วงของ rate ใหม่)
+        """
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            pause = min(retry_after, MAX_RETRY_AFTER) if retry_after else 60.0 / self.rate
+            self._next = max(self._next, self.clock() + pause)
+        print(f"       🚦 {self.name}: ลดเหลือ {self.rate:.0f} ครั้ง/นาที (พัก {pause:.0f}s)")
+
+
+# =============================================================================
+# 🔧 HELPERS
+# =============================================================================
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str, key: str = None) -> AdaptiveLimiter:
+    """
+    Limiter กลางของ API นี้ (สร้างครั้งแรกจาก RATE_LIMITS[name])
+    
+    Args:
+        name: "gemini" / "tts"
+        key: API key (quota แยกต่อ key -> limiter แยกต่อ key)
+    """
+    with _limiters_lock:
+        limiter = _limiters.get((name, key))
+        if limiter is None:
+            config = RATE_LIMITS[name]
+            limiter = AdaptiveLimiter(
+                name, config["start"], config["min"], config["max"], config["step"]
+            )
+            _limiters[(name, key)] = limiter
+        return limiter
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """error นี้คือโดนจำกัด rate / quota ไหม"""
+    message = str(error).lower()
+    return any(s in message for s in ("429", "quota", "resource exhausted", "too many requests"))
+
+
+def retry_after(error: Exception) -> float | None:
+    """เวลาที่ server บอกให้รอ (วินาที) จากข้อความ error หรือ None"""
+    message = str(error)
+    match = (
+        re.search(r"retry_delay\s*\{\s*seconds:\s*(\d+)", message)
+        or re.search(r"retry (?:in|after) (\d+(?:\.\d+)?)\s*s", message, re.IGNORECASE)
+    )
+    return float(match.group(1)) if match else None
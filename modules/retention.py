@@ -0,0 +1,140 @@
+# =============================================================================
+# 🧹 RETENTION MODULE
+# =============================================================================
+# เก็บกวาด API server ที่รันยาวๆ
+# - สถานะงานที่จบแล้วนานเกิน TTL (job broker)
+# - ไฟล์ใน OUTPUT_DIR: ลบตามอายุ แล้วลบตัวที่ไม่ได้ใช้นานสุดจนอยู่ใน disk budget
+
+import os
+import time
+import shutil
+from pathlib import Path
+
+from config.settings import (
+    OUTPUT_DIR, OUTPUT_MAX_BYTES, OUTPUT_MAX_AGE_SECONDS, OUTPUT_GRACE_SECONDS
+)
+
+__all__ = [
+    'mark_used',
+    'enforce_output_budget',
+    'collect_garbage',
+]
+
+# =============================================================================
+# 📂 OUTPUT FILES
+# =============================================================================
+
+def mark_used(path: Path) -> None:
+    """
+    บันทึกว่าไฟล์เพิ่งถูกใช้ (สำหรับ LRU)
+    
+    อัปเดตแค่ atime - mtime คงเดิม ETag / Last-Modified จึงไม่เปลี่ยน
+    """
+    try:
+        stat = os.stat(path)
+        os.utime(path, (time.time(), stat.st_mtime))
+    except OSError:
+        pass
+
+
+def _entry_stats(path: Path) -> tuple:
+    """(ขนาดรวม, เวลาที่ใช้ล่าสุด, เวลาที่เขียนล่าสุด) ของไฟล์ หรือโฟลเดอร์ (HLS)"""
+    files = [path] if path.is_file() else [p for p in path.rglob("*") if p.is_file()]
+    size, last_used, last_written = 0, 0.0, 0.0
+    for f in files:
+        try:
+            stat = f.stat()
+        except OSError:
+            continue
+        size += stat.st_size
+        last_used = max(last_used, stat.st_atime, stat.st_mtime)
+        last_written = max(last_written, stat.st_mtime)
+    if not files:
+        last_written = last_used = path.stat().st_mtime
+    return size, last_used, last_written
+
+
+def _remove(path: Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def enforce_output_budget(
+    output_dir: Path = None,
+    max_bytes: int = None,
+    max_age: float = None,
+    grace: float = None,
+    now: float = None,
+    label: str = "output"
+) -> dict:
+    """
+    ลบ output เก่า / เกิน budget
+    
+    1. ลบตัวที่ไม่ได้ใช้นานเกิน max_age
+    2. ถ้ายังเกิน max_bytes ลบตัวที่ใช้ล่าสุดนานที่สุดก่อน (LRU)
+    ไฟล์ที่เพิ่งเขียนภายใน grace วินาทีไม่ถูกลบ (งานอาจยัง render / stream HLS อยู่)
+    
+    Args:
+        max_bytes / max_age: 0 = ไม่จำกัด (default จาก settings)
+        label: ชื่อที่ใช้ใน log (ใช้กับโฟลเดอร์อื่นได้ เช่น download cache)
+    
+    Returns:
+        {"deleted", "freed_bytes", "remaining_bytes"}
+    """
+    output_dir = Path(output_dir or OUTPUT_DIR)
+    max_bytes = OUTPUT_MAX_BYTES if max_bytes is None else max_bytes
+    max_age = OUTPUT_MAX_AGE_SECONDS if max_age is None else max_age
+    grace = OUTPUT_GRACE_SECONDS if grace is None else grace
+    now = now or time.time()
+    
+    if not output_dir.exists():
+        return {"deleted": 0, "freed_bytes": 0, "remaining_bytes": 0}
+    
+    entries = []
+    for path in output_dir.iterdir():
+        if path.name.startswith("."):
+            continue
+        try:
+            entries.append((path, *_entry_stats(path)))
+        except OSError:
+            continue
+    
+    # เก่าสุด (ใช้ล่าสุดนานสุด) อยู่หน้า
+    entries.sort(key=lambda e: e[2])
+    total = sum(e[1] for e in entries)
+    deleted, freed = 0, 0
+    
+    for path, size, last_used, last_written in entries:
+        if now - last_written < grace:
+            continue
+        expired = max_age and now - last_used > max_age
+        over_budget = max_bytes and total > max_bytes
+        if not (expired or over_budget):
+            continue
+        _remove(path)
+        deleted += 1
+        freed += size
+        total -= size
+    
+    if deleted:
+        print(f"🧹 ลบ {label} {deleted} รายการ ({freed / (1024 * 1024):.1f} MB)")
+    return {"deleted": deleted, "freed_bytes": freed, "remaining_bytes": total}
+
+
+# =============================================================================
+# 🧹 GARBAGE COLLECTION
+# =============================================================================
+
+def collect_garbage(broker, output_dir: Path = None) -> dict:
+    """
+    เก็บกวาดรอบเดียว: สถานะงานหมดอายุ + output เกิน budget
+    
+    Returns:
+        {"evicted_tasks", "deleted", "freed_bytes", "remaining_bytes"}
+    """
+    evicted = broker.evict_finished()
+    if evicted:
+        print(f"🧹 ลบสถานะงานที่หมดอายุ {evicted} งาน")
+    return {"evicted_tasks": evicted, **enforce_output_budget(output_dir)}
@@ -0,0 +1,110 @@
+# =============================================================================
+# 📜 SCRIPT CACHE MODULE
+# =============================================================================
+# เก็บบทพากย์ที่ calibrate แล้ว (title, script, ความยาวเสียงที่วัดได้)
+# key = เนื้อไฟล์วิดีโอ (SHA-256) + ความยาวเป้าหมาย (ปัดเป็นช่วง) + model + prompt version + เสียงพากย์
+# render ใหม่ (เปลี่ยน avatar / encoder / profile) จากคลิปเดิม = ไม่เรียก Gemini เลย
+
+import os
+import json
+import time
+import hashlib
+from pathlib import Path
+
+from config.settings import (
+    SCRIPT_CACHE_DIR, SCRIPT_CACHE_BUCKET_SECONDS,
+    SCRIPT_CACHE_MAX_BYTES, SCRIPT_CACHE_MAX_AGE_SECONDS
+)
+from modules.retention import mark_used, enforce_output_budget
+
+__all__ = [
+    'ScriptCache',
+    'prune_script_cache',
+]
+
+SCRIPT_CACHE_GRACE_SECONDS = 60
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ScriptCache:
+    """
+    Cache ของบทพากย์ (ไฟล์ JSON ละ key - หลาย process ใช้โฟลเดอร์เดียวกันได้)
+    
+    Usage:
+        cache = ScriptCache()
+        key = cache.key(video_path, duration, model, PROMPT_VERSION, voice=[...])
+        hit = cache.get(key)         # {"title", "script", "audio_seconds", ...} หรือ None
+        cache.put(key, title, script, audio_seconds)
+    """
+    
+    def __init__(self, cache_dir: Path = None):
+        self.cache_dir = Path(cache_dir or SCRIPT_CACHE_DIR)
+    
+    def key(self, video_path: str, duration: float, model: str, prompt_version: int, **params) -> str:
+        """
+        Key ของบท (ไฟล์เดียวกันที่ดาวน์โหลดซ้ำ / อยู่คนละ path = key เดียวกัน)
+        
+        Args:
+            params: ค่าอื่นที่มีผลต่อบท / ความยาวที่วัด (เช่น voice)
+        """
+        bucket = round(duration / SCRIPT_CACHE_BUCKET_SECONDS) * SCRIPT_CACHE_BUCKET_SECONDS
+        spec = {
+            "content": _file_sha256(video_path),
+            "duration": round(bucket, 3),
+            "model": model,
+            "prompt": prompt_version,
+            **params,
+        }
+        encoded = json.dumps(spec, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+    
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+    
+    def get(self, key: str) -> dict | None:
+        """บทที่เก็บไว้ (None = ไม่มี / ไฟล์เสีย)"""
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if not entry.get("script"):
+            return None
+        mark_used(path)
+        return entry
+    
+    def put(self, key: str, title: str, script: str, audio_seconds: float, **meta) -> None:
+        """เก็บบท (atomic - process อื่นไม่เห็นไฟล์ครึ่งๆ)"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        entry = {
+            "title": title,
+            "script": script,
+            "audio_seconds": audio_seconds,
+            "stored_at": time.time(),
+            **meta,
+        }
+        path = self._path(key)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        try:
+            tmp.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"       ⚠️ เก็บบทเข้า cache ไม่ได้: {e}")
+            tmp.unlink(missing_ok=True)
+
+
+def prune_script_cache(cache_dir: Path = None, max_bytes: int = None, max_age: float = None) -> dict:
+    """ลบบทที่ไม่ได้ใช้นานเกิน SCRIPT_CACHE_MAX_AGE_SECONDS / ตัวที่ใช้ล่าสุดนานสุดเมื่อเกิน SCRIPT_CACHE_MAX_BYTES"""
+    return enforce_output_budget(
+        cache_dir or SCRIPT_CACHE_DIR,
+        max_bytes=SCRIPT_CACHE_MAX_BYTES if max_bytes is None else max_bytes,
+        max_age=SCRIPT_CACHE_MAX_AGE_SECONDS if max_age is None else max_age,
+        grace=SCRIPT_CACHE_GRACE_SECONDS, label="script cache"
+    )
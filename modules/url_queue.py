@@ -0,0 +1,444 @@
+# =============================================================================
+# 📋 URL QUEUE MODULE
+# =============================================================================
+# คิว URL ของ CLI บน SQLite (แทนการเขียน urls.txt ใหม่ทั้งไฟล์ทุกคลิป)
+# - สถานะ: queued -> running -> done / failed (พร้อม attempts + error ล่าสุด)
+# - running มี lease: process ตายกลางคลิป = URL กลับเข้าคิวเมื่อ lease หมด
+# - urls.txt: import ตอนเริ่ม, export URL ที่ยังไม่เสร็จตอนจบ (เขียนครั้งเดียว)
+# - กันซ้ำด้วย video_key (youtube:<id> / tiktok:<id>) ทั้งคิวและประวัติ (done)
+# - prefetch metadata ทั้งคิวพร้อมกัน -> claim คลิปสั้นก่อน (SJF) + ตัดคลิปที่ยาว/ใหญ่เกินก่อนโหลด
+
+import os
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+from config.settings import URL_QUEUE_DB, URL_MAX_ATTEMPTS, WORKER_LEASE_SECONDS
+from modules.downloader import video_key, estimate_size, source_limit_error
+
+__all__ = [
+    'UrlQueue',
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    queue       TEXT NOT NULL,
+    url         TEXT NOT NULL,
+    url_key     TEXT NOT NULL,            -- video_key(url) (กันซ้ำ)
+    status      TEXT NOT NULL,            -- queued, running, done, failed
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    last_error  TEXT,
+    worker      TEXT,
+    lease_until REAL,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL,
+    duration    REAL,                     -- วินาที (จาก prefetch, NULL = ไม่รู้)
+    size        INTEGER,                  -- bytes โดยประมาณของ format ที่จะโหลด
+    probed_at   REAL                      -- prefetch แล้วเมื่อไร (NULL = ยังไม่ได้ดึง)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_urls_key ON urls (queue, url_key);
+CREATE INDEX IF NOT EXISTS idx_urls_status ON urls (queue, status, attempts, id);
+"""
+
+# คอลัมน์ที่เพิ่มทีหลัง (DB เก่าถูก ALTER ตอนเปิด) + index ที่ใช้คอลัมน์เหล่านั้น
+ADDED_COLUMNS = (("duration", "REAL"), ("size", "INTEGER"), ("probed_at", "REAL"))
+SJF_INDEX = "CREATE INDEX IF NOT EXISTS idx_urls_sjf ON urls (queue, status, attempts, duration, id)"
+
+STATUSES = ("queued", "running", "done", "failed")
+
+# เพิ่มเมื่อวิธีคำนวณ url_key เปลี่ยน (DB เก่าถูกคำนวณ key ใหม่ตอนเปิด)
+KEY_VERSION = 1
+
+# URL ที่ยังไม่เสร็จ (export กลับลง urls.txt)
+PENDING_STATUSES = ("queued", "running", "failed")
+
+
+class UrlQueue:
+    """
+    คิว URL แบบ durable (หลาย process ใช้ DB เดียวกันได้ - WAL mode)
+    
+    Usage:
+        queue = UrlQueue()
+        queue.import_file(URL_FILE)
+        while (item := queue.claim("host-123")):
+            ...
+            queue.complete(item["id"], "host-123")     # หรือ queue.fail(item["id"], "error", "host-123")
+        queue.export_file(URL_FILE)
+    """
+    
+    def __init__(self, db_path: Path = None, queue: str = "factory", max_attempts: int = None):
+        self.db_path = Path(db_path or URL_QUEUE_DB)
+        self.queue = queue
+        self.max_attempts = max_attempts or URL_MAX_ATTEMPTS
+        self._local = threading.local()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn().executescript(SCHEMA)
+        self._migrate()
+    
+    # -------------------------------------------------------------------------
+    # Connection
+    # -------------------------------------------------------------------------
+    
+    def _conn(self) -> sqlite3.Connection:
+        """1 connection ต่อ thread (autocommit, จัดการ transaction เอง)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+    
+    def _migrate(self) -> None:
+        """
+        อัปเกรด DB เก่า
+        - เพิ่มคอลัมน์ metadata (duration, size, probed_at)
+        - คำนวณ url_key ใหม่ให้ DB ที่สร้างด้วย key แบบเก่า (รวมรายการที่กลายเป็นคลิปเดียวกัน)
+        """
+        conn = self._conn()
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(urls)")}
+        for name, decl in ADDED_COLUMNS:
+            if name not in columns:
+                try:
+                    conn.execute(f"ALTER TABLE urls ADD COLUMN {name} {decl}")
+                except sqlite3.OperationalError:
+                    pass  # process อื่นเพิ่มไปพร้อมกันแล้ว
+        conn.execute(SJF_INDEX)
+        
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= KEY_VERSION:
+            return
+        
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # เก็บรายการที่ไปไกลสุดของแต่ละคลิป (done > running > queued > failed)
+            rows = conn.execute(
+                "SELECT id, queue, url FROM urls ORDER BY CASE status "
+                "WHEN 'done' THEN 0 WHEN 'running' THEN 1 WHEN 'queued' THEN 2 ELSE 3 END, id"
+            ).fetchall()
+            keep, duplicates = {}, []
+            for row in rows:
+                key = (row["queue"], video_key(row["url"]))
+                if key in keep:
+                    duplicates.append((row["id"],))
+                else:
+                    keep[key] = row["id"]
+            conn.executemany("DELETE FROM urls WHERE id = ?", duplicates)
+            conn.executemany(
+                "UPDATE urls SET url_key = ? WHERE id = ?",
+                [(key, item_id) for (_, key), item_id in keep.items()]
+            )
+            conn.execute(f"PRAGMA user_version = {KEY_VERSION}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    
+    def _write(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        """คำสั่งเขียนแบบ atomic"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.execute(sql, params)
+            conn.execute("COMMIT")
+            return cursor
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    
+    # -------------------------------------------------------------------------
+    # Enqueue
+    # -------------------------------------------------------------------------
+    
+    def add(self, urls: list, requeue: bool = False) -> int:
+        """
+        เพิ่ม URLs เข้าคิว (transaction เดียว - URL ซ้ำถูกข้ามด้วย unique index)
+        
+        Args:
+            requeue: URL ที่เคย done / failed แล้วให้กลับเข้าคิวใหม่ (attempts เริ่มใหม่)
+        
+        Returns:
+            จำนวน URL ที่เข้าคิว (ใหม่ + requeue)
+        """
+        now = time.time()
+        rows = []
+        for url in urls:
+            url = url.strip()
+            if url:
+                rows.append((self.queue, url, video_key(url), now, now))
+        if not rows:
+            return 0
+        
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO urls (queue, url, url_key, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?)",
+                rows
+            )
+            if requeue:
+                conn.executemany(
+                    "UPDATE urls SET status = 'queued', attempts = 0, last_error = NULL, "
+                    "worker = NULL, lease_until = NULL, probed_at = NULL, updated_at = ? "
+                    "WHERE queue = ? AND url_key = ? AND status IN ('done', 'failed')",
+                    [(now, self.queue, key) for _, _, key, _, _ in rows]
+                )
+            added = conn.total_changes - before
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return added
+    
+    def retry_failed(self) -> int:
+        """URL ที่ failed ถาวรกลับเข้าคิว (attempts เริ่มใหม่, ตรวจ limit ใหม่ตอน prefetch)"""
+        return self._write(
+            "UPDATE urls SET status = 'queued', attempts = 0, probed_at = NULL, updated_at = ? "
+            "WHERE queue = ? AND status = 'failed'",
+            (time.time(), self.queue)
+        ).rowcount
+    
+    def remove(self, url: str) -> bool:
+        """เอา URL ออกจากคิว (ทุกสถานะ)"""
+        return self._write(
+            "DELETE FROM urls WHERE queue = ? AND url_key = ?",
+            (self.queue, video_key(url))
+        ).rowcount > 0
+    
+    def lookup(self, url: str) -> dict | None:
+        """สถานะของคลิปนี้ในคิว / ประวัติ (URL รูปแบบไหนก็ได้) หรือ None ถ้าไม่เคยเพิ่ม"""
+        row = self._conn().execute(
+            "SELECT id, url, status, attempts, last_error FROM urls WHERE queue = ? AND url_key = ?",
+            (self.queue, video_key(url))
+        ).fetchone()
+        return dict(row) if row else None
+    
+    # -------------------------------------------------------------------------
+    # Metadata prefetch
+    # -------------------------------------------------------------------------
+    
+    def prefetch(self, info_many=None) -> dict:
+        """
+        ดึง metadata ของ URL ในคิวที่ยังไม่เคยดึง (พร้อมกันทุก URL)
+        
+        - ได้ duration -> claim เรียงคลิปสั้นก่อน (คลิปยาวไม่บังคลิปสั้นที่ตามมา)
+        - คลิปที่เกิน MAX_SOURCE_SECONDS / MAX_SOURCE_MB = failed ทันที (ไม่ดาวน์โหลดทิ้ง)
+        - ดึงไม่ได้ = ไม่รู้ความยาว (ยังอยู่ในคิว ให้ขั้น download ตัดสินเหมือนเดิม)
+        
+        Args:
+            info_many: callable(urls) -> {url: info | None}
+                       (default: get_download_manager().info_many)
+        
+        Returns:
+            {"probed": จำนวนที่ดึง, "rejected": [(url, เหตุผล), ...]}
+        """
+        rows = self._conn().execute(
+            "SELECT id, url FROM urls WHERE queue = ? AND status = 'queued' AND probed_at IS NULL "
+            "ORDER BY id",
+            (self.queue,)
+        ).fetchall()
+        if not rows:
+            return {"probed": 0, "rejected": []}
+        
+        if info_many is None:
+            from modules.downloader import get_download_manager
+            info_many = get_download_manager().info_many
+        infos = info_many([row["url"] for row in rows])
+        
+        now = time.time()
+        updates, rejected = [], []
+        for row in rows:
+            info = infos.get(row["url"]) or {}
+            reason = source_limit_error(info) if info else None
+            if reason:
+                rejected.append((row["url"], reason))
+            updates.append((
+                info.get("duration"), estimate_size(info) if info else None, now,
+                "failed" if reason else "queued", reason, row["id"]
+            ))
+        
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # status = 'queued' - ไม่ทับ URL ที่ process อื่น claim ไประหว่างดึง
+            conn.executemany(
+                "UPDATE urls SET duration = ?, size = ?, probed_at = ?, status = ?, "
+                "last_error = ? WHERE id = ? AND status = 'queued'",
+                updates
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return {"probed": len(rows), "rejected": rejected}
+    
+    # -------------------------------------------------------------------------
+    # Worker side
+    # -------------------------------------------------------------------------
+    
+    def claim(self, worker_id: str, lease_seconds: float = None) -> dict | None:
+        """
+        รับ URL ถัดไป (URL ใหม่ก่อน URL ที่กำลัง retry, รวม URL ที่ lease หมด)
+        
+        URL ใหม่เรียงคลิปสั้นก่อน (shortest-job-first ตาม duration จาก prefetch)
+        -> latency เฉลี่ยต่อคลิปต่ำสุด / URL ที่ไม่รู้ความยาวมาก่อน (มักล้มเหลวเร็ว)
+        
+        Returns:
+            {"id", "url", "attempts"} หรือ None ถ้าคิวว่าง
+        """
+        lease_seconds = lease_seconds or WORKER_LEASE_SECONDS
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # process ตายกลางคลิปจนครบจำนวนครั้ง = failed
+            conn.execute(
+                "UPDATE urls SET status = 'failed', last_error = 'Worker lost', updated_at = ? "
+                "WHERE queue = ? AND status = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, self.queue, now, self.max_attempts)
+            )
+            # แยก 2 query ให้ใช้ index ได้ (ไม่ sort ทั้งคิว) - URL ที่ค้างจาก process ที่ตายก่อน
+            row = conn.execute(
+                "SELECT id, url, attempts FROM urls WHERE queue = ? AND status = 'running' "
+                "AND lease_until < ? ORDER BY attempts, id LIMIT 1",
+                (self.queue, now)
+            ).fetchone() or conn.execute(
+                "SELECT id, url, attempts FROM urls WHERE queue = ? AND status = 'queued' "
+                "ORDER BY attempts, duration, id LIMIT 1",
+                (self.queue,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            
+            conn.execute(
+                "UPDATE urls SET status = 'running', worker = ?, lease_until = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (worker_id, now + lease_seconds, now, row["id"])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        
+        return {"id": row["id"], "url": row["url"], "attempts": row["attempts"] + 1}
+    
+    def heartbeat(self, item_id: int, worker_id: str, lease_seconds: float = None) -> None:
+        """ต่อ lease ของ URL ที่กำลังทำ"""
+        lease_seconds = lease_seconds or WORKER_LEASE_SECONDS
+        self._write(
+            "UPDATE urls SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time() + lease_seconds, item_id, worker_id)
+        )
+    
+    def release(self, item_id: int, worker_id: str) -> None:
+        """คืน URL เข้าคิวโดยไม่นับ attempt (เช่น ผู้ใช้กด Ctrl+C กลางคลิป)"""
+        self._write(
+            "UPDATE urls SET status = 'queued', attempts = MAX(attempts - 1, 0), worker = NULL, "
+            "lease_until = NULL, updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time(), item_id, worker_id)
+        )
+    
+    def complete(self, item_id: int, worker_id: str) -> bool:
+        """
+        ทำเสร็จแล้ว
+        
+        Returns:
+            False ถ้า lease หลุดไปแล้ว (worker อื่น claim URL นี้ต่อ - สถานะเป็นของ worker นั้น)
+        """
+        cursor = self._write(
+            "UPDATE urls SET status = 'done', last_error = NULL, lease_until = NULL, updated_at = ? "
+            "WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time(), item_id, worker_id)
+        )
+        return cursor.rowcount > 0
+    
+    def fail(self, item_id: int, error: str, worker_id: str) -> str | None:
+        """
+        ทำไม่สำเร็จ - กลับเข้าคิว (ต่อท้าย URL ใหม่) จนกว่าจะครบ max_attempts
+        
+        Returns:
+            สถานะใหม่ ("queued" หรือ "failed") / None ถ้า lease หลุดไปแล้ว (ไม่แตะสถานะของ worker อื่น)
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT attempts FROM urls WHERE id = ? AND worker = ? AND status = 'running'",
+                (item_id, worker_id)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            status = "failed" if row["attempts"] >= self.max_attempts else "queued"
+            conn.execute(
+                "UPDATE urls SET status = ?, last_error = ?, lease_until = NULL, updated_at = ? "
+                "WHERE id = ?",
+                (status, error, time.time(), item_id)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return status
+    
+    # -------------------------------------------------------------------------
+    # Status
+    # -------------------------------------------------------------------------
+    
+    def counts(self) -> dict:
+        """จำนวน URL ในแต่ละสถานะ"""
+        counts = dict.fromkeys(STATUSES, 0)
+        rows = self._conn().execute(
+            "SELECT status, COUNT(*) AS n FROM urls WHERE queue = ? GROUP BY status",
+            (self.queue,)
+        )
+        for row in rows:
+            counts[row["status"]] = row["n"]
+        return counts
+    
+    def items(self, statuses: tuple = STATUSES) -> list:
+        """URL ตามลำดับที่เพิ่ม [{"id", "url", "status", "attempts", "last_error", "duration"}]"""
+        placeholders = ",".join("?" * len(statuses))
+        rows = self._conn().execute(
+            f"SELECT id, url, status, attempts, last_error, duration FROM urls "
+            f"WHERE queue = ? AND status IN ({placeholders}) ORDER BY id",
+            (self.queue, *statuses)
+        )
+        return [dict(row) for row in rows]
+    
+    # -------------------------------------------------------------------------
+    # urls.txt import / export
+    # -------------------------------------------------------------------------
+    
+    def import_file(self, path: Path) -> int:
+        """
+        เพิ่ม URLs จากไฟล์ (บรรทัดละ URL) - URL ที่อยู่ในคิวแล้วทุกสถานะถูกข้าม
+        
+        Returns:
+            จำนวน URL ใหม่
+        """
+        path = Path(path)
+        if not path.exists():
+            return 0
+        with open(path, "r", encoding="utf-8") as f:
+            return self.add(f)
+    
+    def export_file(self, path: Path, statuses: tuple = PENDING_STATUSES) -> int:
+        """
+        เขียน URL ที่ยังไม่เสร็จลงไฟล์แบบ atomic (ไฟล์ไม่พังแม้ process ตายกลางทาง)
+        
+        Returns:
+            จำนวน URL ที่เขียน
+        """
+        path = Path(path)
+        urls = [item["url"] for item in self.items(statuses)]
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(url + "\n" for url in urls)
+        os.replace(tmp, path)
+        return len(urls)
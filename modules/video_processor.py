@@ -3,29 +3,46 @@
 # =============================================================================
 # ประมวลผลวิดีโอ: resize, crop, overlay avatar, sync audio
 
+# MoviePy / proglog โหลดเมื่อใช้จริงเท่านั้น (import module นี้ต้องเร็ว - api.py / worker spawn)
+
+from __future__ import annotations
+
 import os
+import re
 import subprocess
 import time
 import shutil
+from functools import lru_cache
 from pathlib import Path
-from moviepy.editor import (
-    VideoFileClip, AudioFileClip, CompositeVideoClip,
-    concatenate_audioclips, AudioClip
-)
+from typing import TYPE_CHECKING
 
 from config.settings import (
+    FFMPEG_BINARY,
     AVATAR_FILE, AVATAR_LOOPED_TEMP, AVATAR_CHROMA_TEMP,
     OUTPUT_DIR, TEMP_DIR,
-    VIDEO_WIDTH, VIDEO_HEIGHT, VIDEO_FPS, VIDEO_BITRATE, VIDEO_PRESET
+    VIDEO_WIDTH, VIDEO_HEIGHT, VIDEO_FPS, VIDEO_BITRATE, VIDEO_PRESET,
+    RENDITION_PRESETS, DEFAULT_OUTPUT_PROFILES,
+    ENCODE_MODE, VIDEO_CRF, COMPLEXITY_PROBE_SECONDS, COMPLEXITY_TIERS,
+    HLS_SEGMENT_SECONDS
 )
 from modules.downloader import sanitize_filename
+from modules.metrics import stage_timer, count_bytes
+
+if TYPE_CHECKING:
+    from moviepy.editor import VideoFileClip, AudioFileClip
 
 __all__ = [
     'prepare_avatar_with_chromakey',
     'sync_audio_to_video',
     'render_final_video',
     'process_video_pipeline',
+    'process_video_renditions',
+    'render_renditions',
+    'resolve_output_profiles',
+    'hls_dir_for',
     'resize_for_shorts',
+    'choose_encoding',
+    'probe_complexity',
     'cleanup_temp_files',
 ]
 
@@ -33,8 +50,13 @@ __all__ = [
 # 🔧 FFMPEG HELPER
 # =============================================================================
 
+@lru_cache(maxsize=None)
 def get_ffmpeg_path() -> str:
-    """หา path ของ ffmpeg (รองรับ winget installation)"""
+    """หา path ของ ffmpeg (รองรับ winget installation) - หาครั้งเดียวต่อ process"""
+    # 0. กำหนดเองผ่าน env
+    if FFMPEG_BINARY:
+        return FFMPEG_BINARY
+    
     # 1. ลองหาจาก PATH ปกติ
     ffmpeg = shutil.which("ffmpeg")
     if ffmpeg:
@@ -63,20 +85,180 @@ def get_ffmpeg_path() -> str:
                 for exe in folder.rglob("ffmpeg.exe"):
                     return str(exe)
     
+    # 4. binary ที่มากับ imageio-ffmpeg (dependency ของ MoviePy)
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        pass
+    
     return "ffmpeg"  # ใช้ค่า default ถ้าหาไม่เจอ
 
-FFMPEG_PATH = get_ffmpeg_path()
+
+def __getattr__(name: str):
+    # FFMPEG_PATH เดิมเป็นค่าคงที่ระดับ module - หาตอนถูกเรียกครั้งแรกแทนตอน import
+    if name == "FFMPEG_PATH":
+        return get_ffmpeg_path()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# ย้าย moov atom ไปต้นไฟล์ - browser เล่นได้ทันทีโดยไม่ต้องโหลดทั้งไฟล์
+FASTSTART_ARGS = ["-movflags", "+faststart"]
+
+# =============================================================================
+# 🎚️ ENCODING PARAMETERS (content-adaptive)
+# =============================================================================
+
+def _kbps(rate: str) -> int:
+    """'5000k' -> 5000"""
+    rate = str(rate).lower()
+    if rate.endswith("m"):
+        return int(float(rate[:-1]) * 1000)
+    if rate.endswith("k"):
+        return int(float(rate[:-1]))
+    return int(float(rate) / 1000)
+
+
+def probe_complexity(source_path: str, seconds: float = None) -> float | None:
+    """
+    วัดความซับซ้อนของ source แบบเร็ว: encode ช่วงสั้นๆ ที่ 270px (ultrafast, CRF 23)
+    แล้วดูว่าใช้กี่ kbps - ภาพนิ่งได้ค่าต่ำ, motion เยอะได้ค่าสูง
+    
+    Returns:
+        kbps ของ probe หรือ None ถ้า probe ไม่ได้
+    """
+    if seconds is None:
+        seconds = COMPLEXITY_PROBE_SECONDS
+    
+    try:
+        # -progress ทาง stderr: out_time_us = ความยาวที่ encode จริง (ไม่ต้องเปิด source อีกรอบ)
+        result = subprocess.run([
+            get_ffmpeg_path(), "-v", "error", "-progress", "pipe:2", "-nostats",
+            "-t", str(seconds),
+            "-i", str(source_path),
+            "-an",
+            "-vf", f"scale=270:-2,fps={VIDEO_FPS}",
+            "-c:v", "libx264",
+            "-preset", "ultrafast",
+            "-crf", "23",
+            "-f", "mpegts", "pipe:1"
+        ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        print(f"    ⚠️ Complexity probe error: {e}")
+        return None
+    
+    if not result.stdout:
+        return None
+    
+    # ความยาวจริงอาจสั้นกว่า probe window
+    times = re.findall(rb"^out_time_us=(\d+)", result.stderr, re.MULTILINE)
+    probed = (min(seconds, int(times[-1]) / 1_000_000) if times else 0) or seconds
+    return len(result.stdout) * 8 / 1000 / probed
+
+
+def choose_encoding(source_path: str = None, mode: str = None) -> dict:
+    """
+    เลือก rate control สำหรับ x264 ตาม ENCODE_MODE
+    
+    Args:
+        source_path: วิดีโอต้นฉบับ (ใช้ probe ในโหมด adaptive)
+        mode: override ENCODE_MODE
+        
+    Returns:
+        dict เช่น {"mode": "crf", "crf": 23, "maxrate": "4000k", "bufsize": "8000k"}
+        หรือ {"mode": "bitrate", "bitrate": "5000k"}
+    """
+    mode = mode or ENCODE_MODE
+    
+    if mode == "bitrate":
+        return {"mode": "bitrate", "bitrate": VIDEO_BITRATE}
+    
+    if mode == "crf":
+        cap = _kbps(VIDEO_BITRATE)
+        return {"mode": "crf", "crf": VIDEO_CRF, "maxrate": f"{cap}k", "bufsize": f"{cap * 2}k"}
+    
+    if mode != "adaptive":
+        raise ValueError(f"Unknown ENCODE_MODE: {mode}")
+    
+    complexity = probe_complexity(source_path) if source_path else None
+    if complexity is None:
+        # probe ไม่ได้ - ใช้ค่าเดิมที่ปลอดภัย
+        return {"mode": "bitrate", "bitrate": VIDEO_BITRATE}
+    
+    for max_kbps, crf, maxrate in COMPLEXITY_TIERS:
+        if max_kbps is None or complexity <= max_kbps:
+            cap = _kbps(maxrate)
+            return {
+                "mode": "crf",
+                "crf": crf,
+                "maxrate": f"{cap}k",
+                "bufsize": f"{cap * 2}k",
+                "complexity_kbps": round(complexity, 1),
+            }
+
+
+def encoding_args(encoding: dict, pixel_scale: float = 1.0) -> list:
+    """
+    แปลง encoding dict เป็น ffmpeg args
+    
+    Args:
+        encoding: ผลจาก choose_encoding
+        pixel_scale: สัดส่วนจำนวน pixel เทียบกับ master (ใช้ลด cap ของ rendition เล็ก)
+    """
+    if encoding["mode"] == "bitrate":
+        return ["-b:v", f"{int(_kbps(encoding['bitrate']) * pixel_scale)}k"]
+    
+    maxrate = int(_kbps(encoding["maxrate"]) * pixel_scale)
+    return [
+        "-crf", str(encoding["crf"]),
+        "-maxrate", f"{maxrate}k",
+        "-bufsize", f"{maxrate * 2}k",
+    ]
+
+
+def describe_encoding(encoding: dict) -> str:
+    """ข้อความสั้นๆ สำหรับ log"""
+    if encoding["mode"] == "bitrate":
+        return f"bitrate {encoding['bitrate']}"
+    text = f"CRF {encoding['crf']} (cap {encoding['maxrate']})"
+    if "complexity_kbps" in encoding:
+        text += f", complexity {encoding['complexity_kbps']} kbps"
+    return text
+
+
+def log_output_size(path: str, encoding: dict) -> None:
+    """แสดง encoding ที่ใช้ + ขนาดไฟล์ output"""
+    try:
+        size_mb = Path(path).stat().st_size / (1024 * 1024)
+    except OSError:
+        return
+    print(f"    📦 {Path(path).name}: {size_mb:.1f} MB [{describe_encoding(encoding)}]")
+
+
+def _count_output_bytes(paths) -> None:
+    """นับขนาด output ลง metrics (HLS = ทุกไฟล์ในโฟลเดอร์)"""
+    total = 0
+    for path in paths:
+        path = Path(path)
+        files = path.parent.iterdir() if path.suffix == ".m3u8" else [path]
+        for f in files:
+            try:
+                total += f.stat().st_size
+            except OSError:
+                pass
+    count_bytes("output", total)
 
 # =============================================================================
 # 👤 AVATAR PROCESSING
 # =============================================================================
 
-def prepare_avatar_with_chromakey(duration_needed: float) -> bool:
+def prepare_avatar_with_chromakey(duration_needed: float, output_path: Path = None) -> bool:
     """
     เตรียม Avatar โดย loop และลบ green screen
     
     Args:
         duration_needed: ความยาวที่ต้องการ (วินาที)
+        output_path: ไฟล์ .mov ที่ได้ (default: AVATAR_CHROMA_TEMP)
+                     งานที่รันพร้อมกันต้องใช้ path ของตัวเอง
         
     Returns:
         True ถ้าสำเร็จ, False ถ้าไม่มี avatar หรือ error
@@ -85,13 +267,19 @@ def prepare_avatar_with_chromakey(duration_needed: float) -> bool:
         print("    ⚠️ ไม่พบไฟล์ Avatar")
         return False
     
+    if output_path is None:
+        output_path, looped_path = AVATAR_CHROMA_TEMP, AVATAR_LOOPED_TEMP
+    else:
+        output_path = Path(output_path)
+        looped_path = output_path.with_name(f"{output_path.stem}_looped.mp4")
+    
     TEMP_DIR.mkdir(parents=True, exist_ok=True)
     safe_duration = duration_needed + 2  # เผื่อไว้
     
     try:
         # Step 1: Loop video ให้ยาวพอ
         subprocess.run([
-            FFMPEG_PATH, "-y",
+            get_ffmpeg_path(), "-y",
             "-stream_loop", "-1",
             "-i", str(AVATAR_FILE),
             "-t", str(safe_duration),
@@ -99,20 +287,23 @@ def prepare_avatar_with_chromakey(duration_needed: float) -> bool:
             "-c:v", "libx264",
             "-preset", "ultrafast",
             "-an",
-            str(AVATAR_LOOPED_TEMP)
+            str(looped_path)
         ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         
         # Step 2: Chromakey ลบ green screen
         subprocess.run([
-            FFMPEG_PATH, "-y",
-            "-i", str(AVATAR_LOOPED_TEMP),
+            get_ffmpeg_path(), "-y",
+            "-i", str(looped_path),
             "-filter_complex", "[0:v]chromakey=0x00FF00:0.33:0.05,scale=700:-1[out]",
             "-map", "[out]",
             "-c:v", "qtrle",
             "-pix_fmt", "argb",
-            str(AVATAR_CHROMA_TEMP)
+            str(output_path)
         ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         
+        if looped_path != AVATAR_LOOPED_TEMP:
+            looped_path.unlink(missing_ok=True)
+        
         print("    ✅ เตรียม Avatar สำเร็จ")
         return True
         
@@ -120,7 +311,7 @@ def prepare_avatar_with_chromakey(duration_needed: float) -> bool:
         print(f"    ⚠️ Avatar processing error: {e}")
         return False
     except FileNotFoundError:
-        print(f"    ⚠️ ไม่พบ ffmpeg ที่ {FFMPEG_PATH}")
+        print(f"    ⚠️ ไม่พบ ffmpeg ที่ {get_ffmpeg_path()}")
         return False
 
 
@@ -142,6 +333,8 @@ def sync_audio_to_video(audio_clip: AudioFileClip, target_duration: float) -> Au
     Returns:
         AudioFileClip ที่ปรับแล้ว
     """
+    from moviepy.editor import AudioClip, concatenate_audioclips
+    
     audio_duration = audio_clip.duration
     diff = target_duration - audio_duration
     
@@ -169,6 +362,41 @@ def sync_audio_to_video(audio_clip: AudioFileClip, target_duration: float) -> Au
 # 🎥 VIDEO RENDERING
 # =============================================================================
 
+@lru_cache(maxsize=None)
+def _render_progress_logger_class():
+    """Logger class ของ MoviePy (สร้างตอนใช้ - proglog มากับ MoviePy)"""
+    from proglog import ProgressBarLogger
+    
+    class _RenderProgressLogger(ProgressBarLogger):
+        """ส่ง frame count จาก MoviePy ออกไปเป็น event "render" """
+        
+        def __init__(self, on_progress):
+            super().__init__()
+            self.on_progress = on_progress
+        
+        def bars_callback(self, bar, attr, value, old_value=None):
+            if bar == "t" and attr == "index":
+                self.on_progress("render", frame=value + 1, total_frames=self.bars[bar]["total"])
+    
+    return _RenderProgressLogger
+
+
+def _run_ffmpeg_with_progress(cmd: list, total_frames: int, on_progress=None) -> None:
+    """รัน ffmpeg; ถ้ามี on_progress จะอ่าน -progress แล้วส่ง event "render" """
+    if on_progress is None:
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return
+    
+    cmd = [cmd[0], "-progress", "pipe:1", "-nostats", *cmd[1:]]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    for line in proc.stdout:
+        key, _, value = line.strip().partition("=")
+        if key == "frame" and value.isdigit():
+            on_progress("render", frame=int(value), total_frames=total_frames)
+    if proc.wait() != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
 def resize_for_shorts(clip: VideoFileClip) -> VideoFileClip:
     """Resize & crop วิดีโอให้เป็น 9:16 (1080x1920)"""
     clip = clip.resize(height=VIDEO_HEIGHT)
@@ -198,7 +426,10 @@ def render_final_video(
     video_clip: VideoFileClip,
     audio_clip: AudioFileClip,
     output_path: Path,
-    add_avatar: bool = True
+    add_avatar: bool = True,
+    encoding: dict = None,
+    avatar_path: Path = None,
+    on_progress=None
 ) -> str:
     """
     Render วิดีโอสุดท้าย
@@ -208,10 +439,15 @@ def render_final_video(
         audio_clip: Audio ที่ sync แล้ว
         output_path: Path output
         add_avatar: ใส่ Avatar หรือไม่
+        encoding: rate control จาก choose_encoding (default: fixed VIDEO_BITRATE)
+        avatar_path: avatar ที่ลบ green screen แล้ว (default: AVATAR_CHROMA_TEMP)
+        on_progress: callable(event, **data) - ได้ event "render" (frame ที่ encode แล้ว)
         
     Returns:
         Path ของไฟล์ output
     """
+    from moviepy.editor import VideoFileClip, CompositeVideoClip
+    
     duration = video_clip.duration
     
     # Combine video + audio
@@ -221,9 +457,10 @@ def render_final_video(
     layers = [final_clip]
     
     # Add Avatar overlay
-    if add_avatar and AVATAR_CHROMA_TEMP.exists():
+    avatar_path = Path(avatar_path or AVATAR_CHROMA_TEMP)
+    if add_avatar and avatar_path.exists():
         try:
-            avatar = VideoFileClip(str(AVATAR_CHROMA_TEMP), has_mask=True)
+            avatar = VideoFileClip(str(avatar_path), has_mask=True)
             if avatar.duration < duration:
                 avatar = avatar.loop(n=int(duration/avatar.duration) + 1)
             avatar = avatar.subclip(0, duration).set_position(("center", "bottom"))
@@ -237,20 +474,255 @@ def render_final_video(
     composite = CompositeVideoClip(layers, size=(VIDEO_WIDTH, VIDEO_HEIGHT))
     composite = composite.set_duration(duration)
     
-    composite.write_videofile(
-        str(output_path),
-        fps=VIDEO_FPS,
-        codec='libx264',
-        audio_codec='aac',
-        bitrate=VIDEO_BITRATE,
-        preset=VIDEO_PRESET,
-        threads=4,
-        logger='bar'
-    )
+    if encoding is None:
+        encoding = choose_encoding(mode="bitrate")
+    print(f"    🎚️ Encoding: {describe_encoding(encoding)}")
+    
+    with stage_timer("render"):
+        composite.write_videofile(
+            str(output_path),
+            fps=VIDEO_FPS,
+            codec='libx264',
+            audio_codec='aac',
+            preset=VIDEO_PRESET,
+            ffmpeg_params=encoding_args(encoding) + FASTSTART_ARGS,
+            threads=4,
+            logger=_render_progress_logger_class()(on_progress) if on_progress else 'bar'
+        )
     
+    log_output_size(output_path, encoding)
+    _count_output_bytes([output_path])
     return str(output_path)
 
 
+# =============================================================================
+# 🎞️ MULTI-RENDITION RENDERING (single decode pass)
+# =============================================================================
+
+def resolve_output_profiles(profiles: list = None) -> list:
+    """
+    แปลงรายการ profile (ชื่อ preset หรือ dict) ให้เป็น dict ที่ครบทุก field
+    
+    Args:
+        profiles: เช่น ["master", "720p", "poster"] หรือ
+                  [{"name": "square", "width": 1080, "height": 1080}]
+                  
+    Returns:
+        list ของ dict ที่มี name, kind, width, height (+ bitrate / at)
+    """
+    if not profiles:
+        profiles = DEFAULT_OUTPUT_PROFILES
+    
+    resolved = []
+    for profile in profiles:
+        if isinstance(profile, str):
+            if profile not in RENDITION_PRESETS:
+                raise ValueError(f"Unknown output profile: {profile}")
+            profile = {"name": profile, **RENDITION_PRESETS[profile]}
+        else:
+            profile = dict(profile)
+            if "name" not in profile:
+                raise ValueError("Output profile ต้องมี 'name'")
+        
+        profile.setdefault("kind", "video")
+        profile.setdefault("width", VIDEO_WIDTH)
+        profile.setdefault("height", VIDEO_HEIGHT)
+        if profile["kind"] in ("video", "hls"):
+            profile.setdefault("bitrate", VIDEO_BITRATE)
+        elif profile["kind"] == "thumbnail":
+            profile.setdefault("at", 1.0)
+        else:
+            raise ValueError(f"Unknown profile kind: {profile['kind']}")
+        resolved.append(profile)
+    
+    names = [p["name"] for p in resolved]
+    if len(set(names)) != len(names):
+        raise ValueError(f"ชื่อ output profile ซ้ำกัน: {names}")
+    
+    return resolved
+
+
+def hls_dir_for(output_base: Path, name: str = "hls") -> Path:
+    """โฟลเดอร์ของ HLS playlist (index.m3u8) + segments สำหรับ output_base"""
+    output_base = Path(output_base)
+    return output_base.with_name(f"{output_base.name}_{name}")
+
+
+def _rendition_paths(output_base: Path, profiles: list) -> dict:
+    """path ของแต่ละ output {profile name: path} (hls = <base>_<name>/index.m3u8)"""
+    output_base = Path(output_base)
+    paths = {}
+    for profile in profiles:
+        name = profile["name"]
+        if profile["kind"] == "thumbnail":
+            paths[name] = output_base.with_name(f"{output_base.name}_{name}.jpg")
+        elif profile["kind"] == "hls":
+            paths[name] = hls_dir_for(output_base, name) / "index.m3u8"
+        else:
+            suffix = "" if name == "master" else f"_{name}"
+            paths[name] = output_base.with_name(f"{output_base.name}{suffix}.mp4")
+    return paths
+
+
+def _outputs_taken(output_base: Path, profiles: list) -> bool:
+    """มี output ไหนของ output_base นี้อยู่แล้วบ้าง (hls = มีโฟลเดอร์แล้ว)"""
+    paths = _rendition_paths(output_base, profiles)
+    return any(
+        (paths[p["name"]].parent if p["kind"] == "hls" else paths[p["name"]]).exists()
+        for p in profiles
+    )
+
+
+def build_rendition_graph(profiles: list, has_avatar: bool) -> tuple:
+    """
+    สร้าง ffmpeg filter graph: decode + resize/crop + overlay avatar ครั้งเดียว
+    แล้ว split ออกไปแต่ละ rendition
+    
+    Inputs: 0 = source video, 1 = synced audio, 2 = avatar (ถ้ามี)
+    
+    Returns:
+        (filter_complex, [output label ของแต่ละ profile])
+    """
+    chains = [
+        f"[0:v]scale={VIDEO_WIDTH}:{VIDEO_HEIGHT}:force_original_aspect_ratio=increase,"
+        f"crop={VIDEO_WIDTH}:{VIDEO_HEIGHT},fps={VIDEO_FPS},setsar=1[base]"
+    ]
+    
+    if has_avatar:
+        chains.append("[2:v]format=rgba[avatar]")
+        chains.append("[base][avatar]overlay=(main_w-overlay_w)/2:main_h-overlay_h:format=auto[comp]")
+    else:
+        chains.append("[base]null[comp]")
+    
+    split_labels = [f"[s{i}]" for i in range(len(profiles))]
+    chains.append(f"[comp]split={len(profiles)}{''.join(split_labels)}")
+    
+    out_labels = []
+    for i, profile in enumerate(profiles):
+        out = f"[o{i}]"
+        scale = f"scale={profile['width']}:{profile['height']}"
+        if profile["kind"] == "thumbnail":
+            chains.append(f"[s{i}]trim=start={profile['at']},setpts=PTS-STARTPTS,{scale}{out}")
+        else:
+            chains.append(f"[s{i}]{scale},format=yuv420p{out}")
+        out_labels.append(out)
+    
+    return ";".join(chains), out_labels
+
+
+def _rate_args_for(profile: dict, encoding: dict = None) -> list:
+    """rate control ของแต่ละ rendition (cap ลดลงตามจำนวน pixel)"""
+    if encoding is None or encoding["mode"] == "bitrate":
+        return ["-b:v", profile["bitrate"]]
+    pixel_scale = (profile["width"] * profile["height"]) / (VIDEO_WIDTH * VIDEO_HEIGHT)
+    return encoding_args(encoding, pixel_scale=min(pixel_scale, 1.0))
+
+
+def render_renditions(
+    source_path: str,
+    audio_path: str,
+    output_base: Path,
+    profiles: list,
+    duration: float,
+    add_avatar: bool = True,
+    encoding: dict = None,
+    avatar_path: Path = None,
+    on_progress=None
+) -> dict:
+    """
+    Render ทุก rendition + thumbnail ด้วย ffmpeg คำสั่งเดียว
+    
+    Source ถูก decode และ composite กับ avatar แค่รอบเดียว ไม่ว่าจะมีกี่ output
+    
+    Args:
+        source_path: วิดีโอต้นฉบับ
+        audio_path: เสียงที่ sync แล้ว
+        output_base: path ไม่รวมนามสกุล (master = <base>.mp4, อื่นๆ = <base>_<name>.ext,
+                     hls = <base>_<name>/index.m3u8)
+        profiles: output profiles (ผ่าน resolve_output_profiles แล้ว)
+        duration: ความยาวของ output
+        add_avatar: ใส่ Avatar หรือไม่
+        encoding: rate control จาก choose_encoding (None = bitrate ของแต่ละ profile)
+        avatar_path: avatar ที่ลบ green screen แล้ว (default: AVATAR_CHROMA_TEMP)
+        on_progress: callable(event, **data) - ได้ event "render" (frame ที่ encode แล้ว)
+        
+    Returns:
+        dict {profile name: path}
+    """
+    avatar_path = Path(avatar_path or AVATAR_CHROMA_TEMP)
+    has_avatar = add_avatar and avatar_path.exists()
+    # thumbnail ที่เลยความยาวคลิปไม่ได้ frame เลย -> ขยับเข้ามาไม่เกินกลางคลิป
+    profiles = [
+        {**p, "at": min(p["at"], duration / 2)} if p["kind"] == "thumbnail" else p
+        for p in profiles
+    ]
+    filter_complex, out_labels = build_rendition_graph(profiles, has_avatar)
+    
+    cmd = [get_ffmpeg_path(), "-y", "-i", str(source_path), "-i", str(audio_path)]
+    if has_avatar:
+        cmd += ["-i", str(avatar_path)]
+    cmd += ["-filter_complex", filter_complex]
+    
+    output_base = Path(output_base)
+    output_base.parent.mkdir(parents=True, exist_ok=True)
+    outputs = {}
+    paths = _rendition_paths(output_base, profiles)
+    
+    for profile, label in zip(profiles, out_labels):
+        name = profile["name"]
+        path = paths[name]
+        if profile["kind"] == "thumbnail":
+            cmd += ["-map", label, "-frames:v", "1", "-q:v", "2", str(path)]
+        elif profile["kind"] == "hls":
+            # event playlist: segment ถูกเพิ่มเข้า index.m3u8 ทันทีที่ encode เสร็จ
+            hls_dir = path.parent
+            hls_dir.mkdir(parents=True, exist_ok=True)
+            cmd += [
+                "-map", label, "-map", "1:a",
+                "-t", f"{duration:.3f}",
+                "-c:v", "libx264",
+                "-preset", VIDEO_PRESET,
+                *_rate_args_for(profile, encoding),
+                "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+                "-c:a", "aac",
+                "-f", "hls",
+                "-hls_time", str(HLS_SEGMENT_SECONDS),
+                "-hls_list_size", "0",
+                "-hls_playlist_type", "event",
+                "-hls_flags", "independent_segments+temp_file",
+                "-hls_segment_filename", str(hls_dir / "seg_%04d.ts"),
+                str(path)
+            ]
+        else:
+            cmd += [
+                "-map", label, "-map", "1:a",
+                "-t", f"{duration:.3f}",
+                "-c:v", "libx264",
+                "-preset", VIDEO_PRESET,
+                *_rate_args_for(profile, encoding),
+                "-c:a", "aac",
+                *FASTSTART_ARGS,
+                str(path)
+            ]
+        outputs[name] = str(path)
+    
+    if on_progress:
+        # path จริงของแต่ละ output (รวม _1, _2 ที่กันชื่อซ้ำ) - เช่น HLS เล่นได้ตั้งแต่ตอนนี้
+        on_progress("render", state="started",
+                    outputs={name: Path(p).relative_to(output_base.parent).as_posix() for name, p in outputs.items()})
+    
+    with stage_timer("render"):
+        _run_ffmpeg_with_progress(cmd, int(duration * VIDEO_FPS), on_progress)
+    _count_output_bytes(outputs.values())
+    
+    if encoding is not None:
+        print(f"    🎚️ Encoding: {describe_encoding(encoding)}")
+    for profile in profiles:
+        if profile["kind"] == "video":
+            log_output_size(outputs[profile["name"]], encoding or {"mode": "bitrate", "bitrate": profile["bitrate"]})
+    return outputs
+
+
 # =============================================================================
 # 🏭 MAIN PIPELINE
 # =============================================================================
@@ -273,6 +745,8 @@ def process_video_pipeline(
     Returns:
         Path ของไฟล์ output หรือ None ถ้า error
     """
+    from moviepy.editor import VideoFileClip, AudioFileClip
+    
     clips_to_close = []
     temp_files = []
     
@@ -322,7 +796,8 @@ def process_video_pipeline(
             resized_clip,
             final_audio,
             output_path,
-            add_avatar=has_avatar
+            add_avatar=has_avatar,
+            encoding=choose_encoding(video_path)
         )
         
         print(f"    ✅ Output: {output_path.name}")
@@ -350,6 +825,99 @@ def process_video_pipeline(
                 pass
 
 
+def process_video_renditions(
+    video_path: str,
+    title: str,
+    voice_path: str,
+    profiles: list = None,
+    output_dir: Path = None,
+    use_avatar: bool = True,
+    on_progress=None,
+    avatar_path: Path = None
+) -> dict | None:
+    """
+    Pipeline แบบหลาย output: ได้ทุก rendition + thumbnail จากการ render รอบเดียว
+    
+    Args:
+        video_path: Path ของวิดีโอต้นฉบับ
+        title: ชื่อคลิป (ใช้ตั้งชื่อไฟล์)
+        voice_path: Path ของไฟล์เสียงพากย์
+        profiles: ชื่อ preset หรือ dict (default: DEFAULT_OUTPUT_PROFILES)
+        output_dir: โฟลเดอร์ output (default: OUTPUT_DIR)
+        use_avatar: ใส่ Avatar หรือไม่
+        on_progress: callable(event, **data) - ได้ event "render"
+        avatar_path: avatar ที่เตรียมไว้แล้ว (เช่น ใช้ร่วมกันทั้ง batch) - ไม่เตรียมใหม่และไม่ลบ
+        
+    Returns:
+        dict {profile name: path} หรือ None ถ้า error
+    """
+    from moviepy.editor import VideoFileClip, AudioFileClip
+    
+    profiles = resolve_output_profiles(profiles)
+    output_dir = Path(output_dir or OUTPUT_DIR)
+    # temp files ผูกกับไฟล์เสียงของงานนี้ - รันหลายงานพร้อมกันได้
+    synced_audio_path = TEMP_DIR / f"synced_{Path(voice_path).stem}.m4a"
+    shared_avatar = avatar_path is not None
+    if not shared_avatar:
+        avatar_path = TEMP_DIR / f"avatar_{Path(voice_path).stem}.mov"
+    
+    try:
+        source_clip = VideoFileClip(video_path, audio=False)
+        duration = source_clip.duration
+        source_clip.close()
+        
+        print(f"    🎬 Processing: {duration:.2f}s -> {len(profiles)} outputs")
+        
+        # Sync audio (เฉพาะเสียง - ไม่ต้อง decode วิดีโอ)
+        audio_clip = AudioFileClip(voice_path)
+        try:
+            synced_audio = sync_audio_to_video(audio_clip, duration)
+            TEMP_DIR.mkdir(parents=True, exist_ok=True)
+            synced_audio.write_audiofile(str(synced_audio_path), codec="aac", logger=None)
+        finally:
+            audio_clip.close()
+        
+        if shared_avatar:
+            has_avatar = use_avatar and Path(avatar_path).exists()
+        else:
+            has_avatar = use_avatar and prepare_avatar_with_chromakey(duration, avatar_path)
+        
+        safe_title = sanitize_filename(title) or f"Clip_{int(time.time())}"
+        output_base = output_dir / safe_title
+        counter = 1
+        # ทุก output ของ profiles นี้ต้องว่าง (ffmpeg -y เขียนทับ rendition ของคลิปก่อนได้)
+        # hls = ทั้งโฟลเดอร์ / ไม่ใช้ with_suffix - ชื่อที่มีจุด ("Ep.2 final") จะถูกตัดเป็น "Ep.mp4"
+        while _outputs_taken(output_base, profiles):
+            output_base = output_dir / f"{safe_title}_{counter}"
+            counter += 1
+        
+        outputs = render_renditions(
+            video_path, str(synced_audio_path), output_base,
+            profiles, duration, add_avatar=has_avatar,
+            encoding=choose_encoding(video_path),
+            avatar_path=avatar_path,
+            on_progress=on_progress
+        )
+        
+        for name, path in outputs.items():
+            print(f"    ✅ Output [{name}]: {Path(path).name}")
+        return outputs
+        
+    except Exception as e:
+        print(f"    ❌ Processing Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+        
+    finally:
+        for f in (synced_audio_path, None if shared_avatar else avatar_path):
+            try:
+                if f and f.exists():
+                    os.remove(f)
+            except:
+                pass
+
+
 def cleanup_temp_files():
     """ลบไฟล์ temp ทั้งหมด"""
     temp_files = [
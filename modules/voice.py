@@ -2,28 +2,45 @@
 # 🎤 VOICE MODULE
 # =============================================================================
 # สร้างเสียงพากย์ด้วย Edge TTS
+# edge-tts / MoviePy โหลดตอนใช้จริง (import module นี้ต้องเร็ว)
 
 import os
+import json
+import shutil
+import uuid
 import asyncio
-import edge_tts
+import hashlib
+from functools import lru_cache
 from pathlib import Path
-from moviepy.editor import AudioFileClip
 
 from config.settings import (
-    VOICE_NAME, VOICE_RATE, VOICE_PITCH, VOICE_VOLUME, TEMP_DIR
+    VOICE_NAME, VOICE_RATE, VOICE_PITCH, VOICE_VOLUME,
+    TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES
 )
+from modules.metrics import stage_timer
+from modules.rate_limiter import get_limiter, is_rate_limited, retry_after
+from modules.retention import mark_used, enforce_output_budget
 
 __all__ = [
     'generate_voice',
     'generate_voice_sync',
     'get_audio_duration',
+    'sentence_durations',
+    'clip_padding',
+    'prune_tts_cache',
 ]
 
+# ไฟล์ที่เพิ่งเขียนไม่ถูกลบ (งานอื่นอาจกำลังวัดอยู่)
+TTS_CACHE_GRACE_SECONDS = 60
+
+# คู่ประโยคสั้นที่ใช้วัดช่วงเงียบหัว/ท้ายของเสียงแต่ละคลิป (ดู clip_padding)
+PADDING_PROBE = ("ฝนตกหนัก", "รถติดยาว")
+
 # =============================================================================
 # 🎤 VOICE GENERATION
 # =============================================================================
 
-async def generate_voice(text: str, output_path: str) -> str:
+async def generate_voice(text: str, output_path: str, on_progress=None) -> str:
     """
     สร้างเสียงพากย์ด้วย Edge TTS (async)
     
@@ -35,10 +52,13 @@ async def generate_voice(text: str, output_path: str) -> str:
     Args:
         text: บทพากย์
         output_path: path ไฟล์ output (mp3)
+        on_progress: callable(event, **data) - ได้ event "tts" (bytes เสียงที่ได้แล้ว)
         
     Returns:
         path ของไฟล์เสียง
     """
+    import edge_tts
+    
     communicate = edge_tts.Communicate(
         text,
         VOICE_NAME,
@@ -46,44 +66,147 @@ async def generate_voice(text: str, output_path: str) -> str:
         pitch=VOICE_PITCH,
         volume=VOICE_VOLUME
     )
-    await communicate.save(output_path)
+    limiter = get_limiter("tts")
+    await limiter.acquire_async()
+    try:
+        with stage_timer("tts"):
+            if on_progress is None:
+                await communicate.save(output_path)
+            else:
+                # Stream เอง เพื่อรายงาน progress ระหว่างสังเคราะห์เสียง
+                audio_bytes = 0
+                with open(output_path, "wb") as f:
+                    async for chunk in communicate.stream():
+                        if chunk["type"] == "audio":
+                            f.write(chunk["data"])
+                            audio_bytes += len(chunk["data"])
+                            on_progress("tts", status="synthesizing", audio_bytes=audio_bytes)
+    except Exception as e:
+        if is_rate_limited(e):
+            limiter.throttled(retry_after(e))
+        raise
+    limiter.success()
+    
+    if on_progress:
+        on_progress("tts", status="done", audio_bytes=audio_bytes)
     return output_path
 
 
-def generate_voice_sync(text: str, output_path: str) -> str:
-    """Sync wrapper สำหรับ generate_voice"""
-    return asyncio.run(generate_voice(text, output_path))
+def generate_voice_sync(text: str, output_path: str, on_progress=None) -> str:
+    """
+    Sync wrapper สำหรับ generate_voice
+    
+    เสียงจริงต้องเป็นเสียงทั้งบทที่สังเคราะห์ต่อเนื่องครั้งเดียว - ไม่ต่อจากคลิปรายประโยคใน TTS cache
+    (ทุกคลิปมีช่วงเงียบหัว/ท้าย + น้ำเสียงเริ่มใหม่ทุกประโยค = ความยาวไม่ตรงที่ calibrate ไว้)
+    แต่ get_audio_duration เก็บเสียงทั้งบทที่ใช้วัดไว้ใน cache แล้ว -> บทที่ผ่าน calibration ไม่ต้องสังเคราะห์ซ้ำ
+    """
+    cached = _sentence_path(text, TTS_CACHE_DIR)
+    if cached.exists():
+        shutil.copyfile(cached, output_path)
+        mark_used(cached)
+        if on_progress:
+            on_progress("tts", status="done", audio_bytes=cached.stat().st_size, cached=True)
+        return output_path
+    return asyncio.run(generate_voice(text, output_path, on_progress))
 
 
 # =============================================================================
 # ⏱️ AUDIO DURATION
 # =============================================================================
 
-def get_audio_duration(text: str) -> float:
+def get_audio_duration(text: str, on_progress=None) -> float:
     """
-    สร้างเสียงชั่วคราวเพื่อวัดความยาวจริง
+    สร้างเสียงทั้งบทเพื่อวัดความยาวจริง (เก็บใน TTS cache - generate_voice_sync ใช้ต่อได้เลย)
     
     Args:
         text: บทพากย์
+        on_progress: callable(event, **data) - ส่งต่อให้ generate_voice
         
     Returns:
-        ความยาวเสียงเป็นวินาที
+        ความยาวเสียงเป็นวินาที (0.0 ถ้าสร้างเสียงไม่ได้)
     """
-    TEMP_DIR.mkdir(parents=True, exist_ok=True)
-    temp_file = TEMP_DIR / "temp_measure.mp3"
-    
     try:
-        asyncio.run(generate_voice(text, str(temp_file)))
-        audio = AudioFileClip(str(temp_file))
-        duration = audio.duration
-        audio.close()
-        return duration
+        return sentence_durations([text], on_progress)[0]
     except Exception as e:
         print(f"    ⚠️ Error measuring audio: {e}")
         return 0.0
-    finally:
-        if temp_file.exists():
-            os.remove(temp_file)
+
+
+def _sentence_path(sentence: str, cache_dir: Path) -> Path:
+    """ไฟล์เสียงของประโยค (key = ข้อความ + เสียงพากย์)"""
+    spec = json.dumps([sentence, VOICE_NAME, VOICE_RATE, VOICE_PITCH, VOICE_VOLUME], ensure_ascii=False)
+    return Path(cache_dir) / f"{hashlib.sha256(spec.encode('utf-8')).hexdigest()[:32]}.mp3"
+
+
+@lru_cache(maxsize=4096)
+def _file_duration(path: str) -> float:
+    """ความยาวไฟล์เสียงใน cache (เนื้อไฟล์ของ key หนึ่งไม่เปลี่ยน = จำได้ทั้ง process)"""
+    from moviepy.editor import AudioFileClip
+    audio = AudioFileClip(path)
+    duration = audio.duration
+    audio.close()
+    return duration
+
+
+async def _synthesize_sentences(missing: dict, on_progress=None) -> None:
+    """สังเคราะห์หลายประโยคพร้อมกัน (ผ่าน rate limiter ของ TTS) ลง cache แบบ atomic"""
+    async def synthesize(path: Path, sentence: str):
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            await generate_voice(sentence, str(tmp), on_progress)
+            os.replace(tmp, path)
+        finally:
+            if tmp.exists():
+                os.remove(tmp)
+    
+    await asyncio.gather(*(synthesize(path, sentence) for path, sentence in missing.items()))
+
+
+def sentence_durations(sentences: list, on_progress=None, cache_dir: Path = None) -> list:
+    """
+    ความยาวเสียงของแต่ละประโยค (วินาที)
+    
+    ใช้เสียงใน TTS cache - สังเคราะห์เฉพาะประโยคที่ยังไม่เคยมี
+    (calibration แก้บททีละประโยค -> รอบถัดไปจ่าย TTS แค่ส่วนที่เปลี่ยน)
+    
+    Raises:
+        Exception ของ edge-tts ถ้าสังเคราะห์ไม่ได้
+    """
+    cache_dir = Path(cache_dir or TTS_CACHE_DIR)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    paths = [_sentence_path(sentence, cache_dir) for sentence in sentences]
+    
+    missing = {}
+    for path, sentence in zip(paths, sentences):
+        if path.exists():
+            mark_used(path)
+        else:
+            missing[path] = sentence
+    if missing:
+        asyncio.run(_synthesize_sentences(missing, on_progress))
+    
+    return [_file_duration(str(path)) for path in paths]
+
+
+@lru_cache(maxsize=None)
+def clip_padding(cache_dir: Path = None) -> float:
+    """
+    เวลาที่เกินมาต่อคลิป เมื่อสังเคราะห์ประโยคแยกกันแทนที่จะพูดต่อกันในคลิปเดียว
+    
+    edge-tts ใส่ช่วงเงียบหัว/ท้ายทุกคลิป -> ผลรวมเสียงรายประโยคยาวกว่าเสียงทั้งบท
+    วัดจาก d(A) + d(B) - d("A B") (ใช้ TTS cache - วัดจริงครั้งเดียวต่อเสียงพากย์)
+    """
+    first, second = PADDING_PROBE
+    a, b, joined = sentence_durations([first, second, f"{first} {second}"], cache_dir=cache_dir)
+    return max(a + b - joined, 0.0)
+
+
+def prune_tts_cache(cache_dir: Path = None, max_bytes: int = None) -> dict:
+    """ลบเสียงรายประโยคที่ไม่ได้ใช้นานสุดจนอยู่ใน TTS_CACHE_MAX_BYTES"""
+    return enforce_output_budget(
+        cache_dir or TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES if max_bytes is None else max_bytes,
+        max_age=0, grace=TTS_CACHE_GRACE_SECONDS, label="TTS cache"
+    )
 
 
 def estimate_duration(text: str, words_per_second: float = 2.4) -> float:
@@ -0,0 +1,367 @@
+# =============================================================================
+# 🧪 TESTS - API Server
+# =============================================================================
+
+import pytest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+fastapi = pytest.importorskip("fastapi")
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """TestClient ที่ใช้ OUTPUT_DIR + job broker ชั่วคราว (ไม่ spawn workers)"""
+    import api
+    from modules.broker import JobBroker
+    
+    monkeypatch.setattr(api, 'OUTPUT_DIR', tmp_path)
+    monkeypatch.setattr(api, 'broker', JobBroker(tmp_path / 'jobs.db'))
+    return TestClient(api.app)
+
+
+class TestDownload:
+    """Test /api/download (range + conditional GET)"""
+    
+    def test_full_download_has_validators(self, client, tmp_path):
+        """ตอบ 200 พร้อม ETag / Last-Modified / Accept-Ranges"""
+        (tmp_path / 'final_a.mp4').write_bytes(b'0123456789' * 100)
+        
+        response = client.get('/api/download/final_a.mp4')
+        assert response.status_code == 200
+        assert len(response.content) == 1000
+        assert 'etag' in response.headers
+        assert 'last-modified' in response.headers
+        assert response.headers['accept-ranges'] == 'bytes'
+    
+    def test_range_request(self, client, tmp_path):
+        """Range: bytes=10-19 ได้ 206 + เฉพาะส่วนที่ขอ"""
+        (tmp_path / 'final_b.mp4').write_bytes(b'0123456789' * 100)
+        
+        response = client.get('/api/download/final_b.mp4', headers={'Range': 'bytes=10-19'})
+        assert response.status_code == 206
+        assert response.content == b'0123456789'
+        assert response.headers['content-range'] == 'bytes 10-19/1000'
+    
+    def test_if_none_match_returns_304(self, client, tmp_path):
+        """ETag ตรงกัน = 304 ไม่ส่ง body"""
+        (tmp_path / 'final_c.mp4').write_bytes(b'x' * 100)
+        
+        etag = client.get('/api/download/final_c.mp4').headers['etag']
+        response = client.get('/api/download/final_c.mp4', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.content == b''
+    
+    def test_if_modified_since_returns_304(self, client, tmp_path):
+        """Last-Modified ไม่ใหม่กว่า = 304"""
+        (tmp_path / 'final_d.mp4').write_bytes(b'x' * 100)
+        
+        last_modified = client.get('/api/download/final_d.mp4').headers['last-modified']
+        response = client.get('/api/download/final_d.mp4', headers={'If-Modified-Since': last_modified})
+        assert response.status_code == 304
+    
+    def test_missing_file(self, client):
+        """ไม่มีไฟล์ = 404"""
+        assert client.get('/api/download/nope.mp4').status_code == 404
+
+
+class TestHLS:
+    """Test /api/hls playlist endpoint"""
+    
+    def test_playlist_served_during_render(self, client, tmp_path, monkeypatch):
+        """playlist ที่ยัง render ไม่เสร็จก็เสิร์ฟได้ (no-cache)"""
+        import api
+        
+        api.broker.enqueue('job1', {})
+        # ชื่อซ้ำกับไฟล์เดิม -> render เขียนลง final_job1_1_hls
+        api.broker.update('job1', result_files={'hls': 'final_job1_1_hls/index.m3u8'})
+        (tmp_path / 'final_job1_hls').mkdir()
+        hls_dir = tmp_path / 'final_job1_1_hls'
+        hls_dir.mkdir()
+        (hls_dir / 'index.m3u8').write_text('#EXTM3U\n#EXT-X-PLAYLIST-TYPE:EVENT\n')
+        (hls_dir / 'seg_0000.ts').write_bytes(b'\x47' * 188)
+        
+        playlist = client.get('/api/hls/job1/index.m3u8')
+        assert playlist.status_code == 200
+        assert playlist.headers['cache-control'] == 'no-cache'
+        assert 'mpegurl' in playlist.headers['content-type']
+        
+        segment = client.get('/api/hls/job1/seg_0000.ts')
+        assert segment.status_code == 200
+        assert segment.headers['content-type'] == 'video/mp2t'
+    
+    def test_not_ready_yet(self, client, monkeypatch):
+        """ยังไม่มี playlist = 404 (client ลองใหม่)"""
+        import api
+        
+        api.broker.enqueue('job2', {})
+        assert client.get('/api/hls/job2/index.m3u8').status_code == 404
+    
+    def test_rejects_other_files(self, client, monkeypatch):
+        """เสิร์ฟเฉพาะ .m3u8 / .ts"""
+        import api
+        
+        api.broker.enqueue('job3', {})
+        assert client.get('/api/hls/job3/secret.txt').status_code == 404
+        assert client.get('/api/hls/unknown/index.m3u8').status_code == 404
+
+
+class TestAdmissionControl:
+    """Test bounded queue / 429"""
+    
+    def test_enqueue_only(self, client):
+        """API แค่ enqueue - งานรอ worker มารับ"""
+        response = client.post('/api/process', json={'url': 'https://youtu.be/abc'})
+        assert response.status_code == 200
+        
+        task = response.json()
+        assert task['status'] == 'pending'
+        assert task['queue_position'] == 1
+        
+        status = client.get(f"/api/status/{task['id']}").json()
+        assert status['status'] == 'pending'
+        assert status['queue_position'] == 1
+    
+    def test_queue_full_returns_429(self, client, monkeypatch):
+        """คิวเต็ม = 429 + Retry-After + ข้อมูลคิว"""
+        import modules.broker as broker_module
+        
+        monkeypatch.setattr(broker_module, 'API_MAX_QUEUE', 1)
+        assert client.post('/api/process', json={'url': 'https://youtu.be/a'}).status_code == 200
+        response = client.post('/api/process', json={'url': 'https://youtu.be/b'})
+        
+        assert response.status_code == 429
+        assert 'retry-after' in response.headers
+        assert response.json()['detail']['queue_depth'] == 1
+        assert response.json()['detail']['max_queue'] == 1
+    
+    def test_queue_status(self, client):
+        """/api/status รายงานความลึกคิวและเวลารอ"""
+        client.post('/api/process', json={'url': 'https://youtu.be/abc'})
+        stats = client.get('/api/status').json()
+        assert stats['queue_depth'] == 1
+        assert 'avg_wait_seconds' in stats
+        assert 'workers' in stats
+    
+    def test_unknown_task(self, client):
+        """task ไม่มีอยู่ = 404"""
+        assert client.get('/api/status/nope').status_code == 404
+
+
+class TestEventStream:
+    """Test /api/events (SSE)"""
+    
+    def _parse(self, body: str) -> list:
+        events = []
+        for block in body.strip().split('\n\n'):
+            fields = dict(line.split(': ', 1) for line in block.split('\n') if not line.startswith(':'))
+            events.append(fields)
+        return events
+    
+    def test_finished_task_sends_snapshot(self, client):
+        """งานจบแล้ว = ได้ snapshot แล้วปิด stream"""
+        import api
+        
+        api.broker.enqueue('job1', {})
+        api.broker.complete('job1', result_file='final_job1.mp4')
+        
+        response = client.get('/api/events/job1')
+        assert response.headers['content-type'].startswith('text/event-stream')
+        
+        events = self._parse(response.text)
+        assert events[0]['event'] == 'snapshot'
+        assert '"completed"' in events[0]['data']
+    
+    def test_resume_with_last_event_id(self, client):
+        """Last-Event-ID = replay event ละเอียดที่พลาดไป"""
+        import api
+        
+        api.broker.enqueue('job2', {})
+        api.broker.publish('job2', 'download', downloaded_bytes=1024, total_bytes=4096)
+        api.broker.publish('job2', 'render', frame=30, total_frames=300)
+        api.broker.fail('job2', 'boom')
+        
+        response = client.get('/api/events/job2', headers={'Last-Event-ID': '0'})
+        types = [e['event'] for e in self._parse(response.text)]
+        
+        assert types[:2] == ['download', 'render']
+        assert types[-1] == 'status'
+    
+    def test_reconnect_after_terminal_event_closes(self, client):
+        """Last-Event-ID ที่เลย event สุดท้ายของงานที่จบแล้ว = ปิด stream (ไม่ keepalive ค้าง)"""
+        import api
+        
+        api.broker.enqueue('job3', {})
+        api.broker.fail('job3', 'boom')
+        last = api.broker.last_event_seq('job3')
+        
+        response = client.get('/api/events/job3', headers={'Last-Event-ID': str(last)})
+        assert response.status_code == 200
+        assert response.text == ''
+    
+    def test_evicted_task_closes(self, client, monkeypatch):
+        """งานถูกลบ (TTL) ระหว่าง stream = ปิด stream"""
+        import api
+        
+        api.broker.enqueue('job4', {})
+        task = api.broker.get('job4')
+        calls = []
+        monkeypatch.setattr(api.broker, 'get', lambda task_id: None if calls.append(task_id) or len(calls) > 1 else task)
+        monkeypatch.setattr(api.broker, 'events_since', lambda task_id, after=0: [])
+        
+        response = client.get('/api/events/job4', headers={'Last-Event-ID': '0'})
+        assert response.status_code == 200
+        assert len(calls) == 2
+    
+    def test_unknown_task(self, client):
+        assert client.get('/api/events/nope').status_code == 404
+
+
+class TestBatch:
+    """Test /api/batch"""
+    
+    def test_submit_batch(self, client):
+        """ส่งหลาย URL = 1 request ได้ id ของทุกงานย่อย"""
+        response = client.post('/api/batch', json={
+            'urls': ['https://youtu.be/a', 'https://youtu.be/b'],
+            'use_avatar': False,
+        })
+        assert response.status_code == 200
+        
+        batch = response.json()
+        assert batch['status'] == 'preparing'
+        assert batch['total'] == 2
+        assert [item['url'] for item in batch['items']] == ['https://youtu.be/a', 'https://youtu.be/b']
+        
+        item = client.get(f"/api/status/{batch['items'][0]['id']}").json()
+        assert item['status'] == 'waiting'
+        assert item['batch_id'] == batch['id']
+        
+        assert client.get(f"/api/batch/{batch['id']}").json()['counts'] == {'waiting': 2}
+    
+    def test_batch_collapses_duplicates(self, client):
+        """คลิปเดียวกันหลายรูปแบบ URL ใน batch = งานเดียว"""
+        response = client.post('/api/batch', json={
+            'urls': ['https://youtu.be/a', 'https://www.youtube.com/watch?v=a&t=5', 'https://youtu.be/b'],
+            'use_avatar': False,
+        })
+        
+        assert [item['url'] for item in response.json()['items']] == ['https://youtu.be/a', 'https://youtu.be/b']
+    
+    def test_invalid_batches(self, client, monkeypatch):
+        """ไม่มี URL / เกิน limit / profile ไม่มี = 400"""
+        import api
+        
+        monkeypatch.setattr(api, 'BATCH_MAX_ITEMS', 2)
+        assert client.post('/api/batch', json={'urls': []}).status_code == 400
+        assert client.post('/api/batch', json={'urls': ['a', 'b', 'c']}).status_code == 400
+        assert client.post('/api/batch', json={'urls': ['a'], 'output_profiles': ['8k']}).status_code == 400
+    
+    def test_batch_larger_than_queue(self, client, monkeypatch):
+        """คิวรับไม่พอทั้ง batch = 429"""
+        import modules.broker as broker_module
+        
+        monkeypatch.setattr(broker_module, 'API_MAX_QUEUE', 2)
+        response = client.post('/api/batch', json={'urls': ['a', 'b', 'c']})
+        assert response.status_code == 429
+    
+    def test_unknown_batch(self, client):
+        assert client.get('/api/batch/nope').status_code == 404
+
+
+class TestIdempotency:
+    """Test ส่งงานเดิมซ้ำ"""
+    
+    def test_attach_to_inflight_job(self, client):
+        """URL + options เดิมระหว่างงานแรกยังไม่เสร็จ = ได้งานเดิม"""
+        first = client.post('/api/process', json={'url': 'https://youtu.be/abc'}).json()
+        second = client.post('/api/process', json={'url': 'https://youtu.be/abc?si=share'}).json()
+        
+        assert second['id'] == first['id']
+        assert second['reused'] is True
+        assert client.get('/api/status').json()['queue_depth'] == 1
+    
+    def test_batch_attaches_to_inflight_job(self, client):
+        """URL ใน batch ที่มีงานเดิมกำลังทำอยู่ = ใช้งานเดิม ไม่เข้าคิวซ้ำ"""
+        first = client.post('/api/process', json={'url': 'https://youtu.be/abc'}).json()
+        batch = client.post('/api/batch', json={
+            'urls': ['https://youtu.be/abc?si=share', 'https://youtu.be/def'],
+        }).json()
+        
+        assert batch['total'] == 2
+        assert batch['items'][0]['id'] == first['id']
+        assert batch['items'][0]['reused'] is True
+        assert batch['counts'] == {'pending': 1, 'waiting': 1}
+        # งานเดิม 1 + งานเตรียม batch 1 + งานย่อยใหม่ 1
+        assert client.get('/api/status').json()['queue_depth'] == 3
+    
+    def test_reuse_completed_result(self, client, tmp_path):
+        """งานเดิมเสร็จแล้วและไฟล์ยังอยู่ = ได้ผลทันที"""
+        import api
+        
+        first = client.post('/api/process', json={'url': 'https://youtu.be/abc'}).json()
+        (tmp_path / 'final_x.mp4').write_bytes(b'video')
+        api.broker.complete(first['id'], result_file='final_x.mp4', result_files={'master': 'final_x.mp4'})
+        
+        second = client.post('/api/process', json={'url': 'https://youtu.be/abc'}).json()
+        assert second['id'] == first['id']
+        assert second['status'] == 'completed'
+        assert second['reused'] is True
+        
+        # ไฟล์ถูกลบแล้ว = render ใหม่
+        (tmp_path / 'final_x.mp4').unlink()
+        third = client.post('/api/process', json={'url': 'https://youtu.be/abc'}).json()
+        assert third['id'] != first['id']
+        assert third['reused'] is False
+    
+    def test_different_options_or_force(self, client):
+        """options ต่าง / force = งานใหม่"""
+        first = client.post('/api/process', json={'url': 'https://youtu.be/abc'}).json()
+        other = client.post('/api/process', json={'url': 'https://youtu.be/abc', 'use_avatar': False}).json()
+        forced = client.post('/api/process', json={'url': 'https://youtu.be/abc', 'force': True}).json()
+        
+        assert len({first['id'], other['id'], forced['id']}) == 3
+    
+    def test_batch_item_reuses_completed_result(self, client, tmp_path):
+        """URL ใน batch ที่เคย render ด้วย options เดิม = งานย่อยเสร็จทันที ไม่เข้าคิว"""
+        import api
+        
+        first = client.post('/api/process', json={'url': 'https://youtu.be/abc'}).json()
+        (tmp_path / 'final_x.mp4').write_bytes(b'video')
+        api.broker.complete(first['id'], result_file='final_x.mp4', result_files={'master': 'final_x.mp4'})
+        
+        batch = client.post('/api/batch', json={
+            'urls': ['https://youtu.be/abc', 'https://youtu.be/new'], 'custom_prompt': 'ตลกๆ'
+        }).json()
+        items = {item['url']: item for item in batch['items']}
+        
+        assert items['https://youtu.be/abc']['status'] == 'completed'
+        assert items['https://youtu.be/abc']['result_file'] == 'final_x.mp4'
+        assert items['https://youtu.be/abc']['reused'] is True
+        assert items['https://youtu.be/new']['status'] == 'waiting'
+        prep = api.broker._conn().execute("SELECT payload FROM jobs WHERE id = ?", (batch['id'],)).fetchone()
+        assert 'youtu.be/abc' not in prep['payload']
+
+
+class TestMetricsEndpoint:
+    """Test /metrics"""
+    
+    def test_merges_worker_metrics(self, client):
+        """รวม metrics ของ worker + สถานะคิว"""
+        import api
+        from modules.metrics import Registry, define_metrics
+        
+        worker = define_metrics(Registry())
+        worker.observe('stage_duration_seconds', 12, stage='render')
+        worker.inc('rate_limited_total', key='abcd1234')
+        api.broker.save_metrics('w1', worker.snapshot())
+        client.post('/api/process', json={'url': 'https://youtu.be/abc'})
+        
+        response = client.get('/metrics')
+        assert response.headers['content-type'].startswith('text/plain')
+        assert 'videofactory_stage_duration_seconds_count{stage="render"} 1' in response.text
+        assert 'videofactory_rate_limited_total{key="abcd1234"} 1' in response.text
+        assert 'videofactory_queue_depth 1' in response.text
@@ -0,0 +1,317 @@
+# =============================================================================
+# 🧪 TESTS - Job Broker Module
+# =============================================================================
+
+import pytest
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+@pytest.fixture
+def broker(tmp_path):
+    from modules.broker import JobBroker
+    return JobBroker(tmp_path / 'jobs.db')
+
+
+class TestEnqueue:
+    """Test API side"""
+    
+    def test_enqueue_and_get(self, broker):
+        """enqueue แล้วอ่านสถานะได้"""
+        position = broker.enqueue('a', {'url': 'x'}, result_file=None)
+        task = broker.get('a')
+        
+        assert position == 1
+        assert task['status'] == 'pending'
+        assert task['progress'] == 0
+        assert task['result_file'] is None
+    
+    def test_queue_positions(self, broker):
+        """ลำดับคิวตามเวลาที่ส่ง"""
+        broker.enqueue('a', {})
+        broker.enqueue('b', {})
+        assert broker.position('a') == 1
+        assert broker.position('b') == 2
+    
+    def test_admission_control(self, broker):
+        """คิวเต็ม = QueueFullError"""
+        from modules.broker import QueueFullError
+        
+        broker.enqueue('a', {}, max_queue=1)
+        with pytest.raises(QueueFullError) as exc:
+            broker.enqueue('b', {}, max_queue=1)
+        assert exc.value.queue_depth == 1
+        assert broker.get('b') is None
+    
+    def test_shared_between_instances(self, tmp_path):
+        """คนละ instance (คนละ process) เห็นคิวเดียวกัน"""
+        from modules.broker import JobBroker
+        
+        JobBroker(tmp_path / 'jobs.db').enqueue('a', {'url': 'x'})
+        job = JobBroker(tmp_path / 'jobs.db').claim('w1')
+        assert job['id'] == 'a'
+        assert job['payload'] == {'url': 'x'}
+
+
+class TestWorkerSide:
+    """Test claim / progress / complete"""
+    
+    def test_claim_is_exclusive(self, broker):
+        """งานเดียวถูก claim ได้ครั้งเดียว"""
+        broker.enqueue('a', {})
+        assert broker.claim('w1')['id'] == 'a'
+        assert broker.claim('w2') is None
+        assert broker.get('a')['status'] == 'processing'
+        assert broker.position('a') is None
+    
+    def test_progress_and_complete(self, broker):
+        """update + complete ผลลัพธ์เห็นจากฝั่ง API"""
+        broker.enqueue('a', {})
+        broker.claim('w1')
+        broker.update('a', progress=50, message='Generating voice...', hls_url='/x.m3u8')
+        
+        task = broker.get('a')
+        assert task['progress'] == 50
+        assert task['hls_url'] == '/x.m3u8'
+        
+        broker.complete('a', result_file='final_a.mp4')
+        task = broker.get('a')
+        assert task['status'] == 'completed'
+        assert task['progress'] == 100
+        assert task['result_file'] == 'final_a.mp4'
+        assert task['hls_url'] == '/x.m3u8'
+    
+    def test_fail_redacts_api_key(self, broker):
+        """งานจบแล้วไม่เก็บ api_key ไว้ใน DB"""
+        broker.enqueue('a', {'url': 'x', 'api_key': 'secret'})
+        broker.claim('w1')
+        broker.fail('a', 'boom')
+        
+        assert broker.get('a')['status'] == 'failed'
+        assert broker.get('a')['error'] == 'boom'
+        row = broker._conn().execute("SELECT payload FROM jobs WHERE id = 'a'").fetchone()
+        assert 'secret' not in row['payload']
+    
+    def test_expired_lease_is_reclaimed(self, broker):
+        """worker ตาย (lease หมด) = งานกลับมาให้ worker อื่น"""
+        broker.enqueue('a', {})
+        broker.claim('w1', lease_seconds=0.01)
+        time.sleep(0.05)
+        
+        job = broker.claim('w2')
+        assert job['id'] == 'a'
+        assert job['attempts'] == 2
+    
+    def test_stale_worker_cannot_finish(self, broker):
+        """worker ที่ lease หมดแล้วงานถูกรับไปใหม่ complete / fail ทับไม่ได้"""
+        broker.enqueue('a', {})
+        broker.claim('w1', lease_seconds=0.01)
+        time.sleep(0.05)
+        broker.claim('w2')
+        
+        assert broker.complete('a', 'w1', result_file='old.mp4') is False
+        assert broker.fail('a', 'timeout', 'w1') is False
+        assert broker.get('a')['status'] == 'processing'
+        
+        assert broker.complete('a', 'w2', result_file='new.mp4') is True
+        assert broker.get('a')['result_file'] == 'new.mp4'
+    
+    def test_worker_lost_redacts_and_publishes(self, broker, monkeypatch):
+        """ครบจำนวนครั้งแล้ว lease หมด = fail พร้อมลบ api_key + status event"""
+        import modules.broker as broker_module
+        
+        monkeypatch.setattr(broker_module, 'MAX_JOB_ATTEMPTS', 1)
+        broker.enqueue('a', {'url': 'x', 'api_key': 'secret'})
+        broker.claim('w1', lease_seconds=0.01)
+        time.sleep(0.05)
+        
+        assert broker.claim('w2') is None
+        assert broker.get('a')['error'] == 'Worker lost'
+        row = broker._conn().execute("SELECT payload FROM jobs WHERE id = 'a'").fetchone()
+        assert 'secret' not in row['payload']
+        assert broker.events_since('a')[-1]['data']['status'] == 'failed'
+    
+    def test_worker_liveness(self, broker):
+        """นับ worker ที่ยัง heartbeat"""
+        broker.register_worker('w1', 123)
+        assert broker.alive_workers() == 1
+        broker.unregister_worker('w1')
+        assert broker.alive_workers() == 0
+
+
+class TestEvents:
+    """Test progress events"""
+    
+    def test_update_publishes_status_event(self, broker):
+        """ทุก update กลายเป็น event "status" """
+        broker.enqueue('a', {})
+        broker.update('a', progress=30, message='Analyzing...')
+        
+        events = broker.events_since('a')
+        assert events[-1]['type'] == 'status'
+        assert events[-1]['data'] == {'progress': 30, 'message': 'Analyzing...'}
+    
+    def test_events_since(self, broker):
+        """อ่านต่อจาก seq ล่าสุดได้"""
+        broker.publish('a', 'download', downloaded_bytes=1)
+        seq = broker.last_event_seq('a')
+        broker.publish('a', 'download', downloaded_bytes=2)
+        
+        events = broker.events_since('a', seq)
+        assert len(events) == 1
+        assert events[0]['data']['downloaded_bytes'] == 2
+    
+    def test_emitter_throttles_but_keeps_state_changes(self, broker):
+        """event ถี่ๆ ถูก throttle แต่การเปลี่ยน state ไม่หาย"""
+        emit = broker.emitter('a', min_interval=60)
+        for frame in range(100):
+            emit('render', frame=frame, total_frames=100)
+        emit('upload', state='uploading')
+        emit('upload', state='processing')
+        emit('upload', state='processing')
+        
+        events = broker.events_since('a')
+        assert [e['type'] for e in events] == ['render', 'upload', 'upload']
+
+
+class TestBatches:
+    """Test batch: งานเตรียม 1 งาน + งานย่อยที่รอ"""
+    
+    def _batch(self, broker, n=3, max_queue=None):
+        items = [(f'i{k}', {'url': f'u{k}', 'batch_id': 'b'}, {'url': f'u{k}'}) for k in range(n)]
+        return broker.enqueue_batch('b', {'kind': 'batch'}, items, max_queue=max_queue)
+    
+    def test_items_wait_for_preparation(self, broker):
+        """งานย่อยยังไม่ถูก claim จนกว่าจะ release"""
+        self._batch(broker)
+        
+        assert broker.claim('w1')['id'] == 'b'
+        assert broker.claim('w2') is None
+        assert broker.batch_status('b')['status'] == 'preparing'
+    
+    def test_admission_counts_every_item(self, broker):
+        """batch ที่ใหญ่กว่าที่คิวเหลือ = QueueFullError ทั้ง batch"""
+        from modules.broker import QueueFullError
+        
+        broker.enqueue('a', {}, max_queue=3)
+        with pytest.raises(QueueFullError):
+            self._batch(broker, n=3, max_queue=3)
+        assert broker.get('b') is None
+        assert broker.batch_items('b') == []
+    
+    def test_release_merges_shared_and_fails_bad_items(self, broker):
+        """release: ของร่วมเข้า payload, URL ที่ใช้ไม่ได้ fail ทันที"""
+        self._batch(broker)
+        broker.claim('w1')
+        
+        released = broker.release_batch(
+            'b', {'i1': {'error': 'Video unavailable'}, 'i2': {'duration': 30}},
+            shared={'avatar_path': '/tmp/a.mov'}
+        )
+        broker.complete('b', released=released)
+        
+        assert released == 2
+        assert broker.get('i1')['status'] == 'failed'
+        
+        jobs = [broker.claim('w1'), broker.claim('w1')]
+        assert [j['id'] for j in jobs] == ['i0', 'i2']
+        assert jobs[0]['payload']['avatar_path'] == '/tmp/a.mov'
+        assert jobs[1]['payload']['duration'] == 30
+        assert broker.batch_open_items('b') == 2
+    
+    def test_failed_preparation_fails_all_items(self, broker):
+        """เตรียม batch ไม่ผ่าน (เช่น key เสีย) = งานย่อย fail หมด"""
+        self._batch(broker)
+        broker.claim('w1')
+        broker.release_batch('b', error='No valid key')
+        broker.fail('b', 'No valid key')
+        
+        status = broker.batch_status('b')
+        assert status['status'] == 'failed'
+        assert status['counts'] == {'failed': 3}
+        assert all(item['error'] == 'No valid key' for item in status['items'])
+    
+    def test_aggregate_status(self, broker):
+        """สถานะรวม: processing -> partial"""
+        self._batch(broker, n=2)
+        broker.claim('w1')
+        broker.release_batch('b')
+        broker.complete('b')
+        
+        broker.claim('w1')
+        broker.update('i0', progress=50)
+        status = broker.batch_status('b')
+        assert status['status'] == 'processing'
+        assert status['progress'] == 25
+        
+        broker.complete('i0', result_file='a.mp4')
+        broker.fail('i1', 'boom')
+        status = broker.batch_status('b')
+        assert status['status'] == 'partial'
+        assert status['counts'] == {'completed': 1, 'failed': 1}
+    
+    def test_not_a_batch(self, broker):
+        """งานเดี่ยวไม่ใช่ batch"""
+        broker.enqueue('a', {})
+        assert broker.batch_status('a') is None
+
+
+class TestFingerprints:
+    """Test งานซ้ำ (fingerprint)"""
+    
+    def test_duplicate_while_open(self, broker):
+        """งานซ้ำที่ยังไม่จบ = DuplicateJobError ชี้งานเดิม"""
+        from modules.broker import DuplicateJobError
+        
+        broker.enqueue('a', {}, fingerprint='fp')
+        with pytest.raises(DuplicateJobError) as exc:
+            broker.enqueue('b', {}, fingerprint='fp')
+        assert exc.value.job_id == 'a'
+        assert broker.get('b') is None
+    
+    def test_failed_job_not_reused(self, broker):
+        """งานที่ fail แล้ว ส่งใหม่ได้"""
+        broker.enqueue('a', {}, fingerprint='fp')
+        broker.fail('a', 'boom')
+        broker.enqueue('b', {}, fingerprint='fp')
+        assert broker.find_completed('fp') is None
+    
+    def test_batch_item_attaches_to_open_job(self, broker):
+        """งานย่อยที่ซ้ำกับงานที่ยังไม่จบ = ไม่สร้างใหม่ ผูกกับงานเดิม (นับใน batch ตามตำแหน่ง)"""
+        broker.enqueue('a', {'url': 'u1'}, fingerprint='fp1')
+        items = [
+            ('i0', {'url': 'u0'}, {'url': 'u0'}, 'fp0'),
+            ('i1', {'url': 'u1'}, {'url': 'u1'}, 'fp1'),
+        ]
+        payload = {'kind': 'batch', 'items': [{'id': 'i0', 'url': 'u0'}, {'id': 'i1', 'url': 'u1'}]}
+        broker.enqueue_batch('b', payload, items, max_queue=2)
+        
+        assert broker.get('i1') is None
+        status = broker.batch_status('b')
+        assert [item['id'] for item in status['items']] == ['i0', 'a']
+        assert status['items'][1]['reused'] is True
+        assert status['items'][1]['url'] == 'u1'
+        
+        assert broker.claim('w1')['id'] == 'a'
+        assert broker.claim('w2')['payload']['items'] == [{'id': 'i0', 'url': 'u0'}]
+        broker.complete('a', 'w1', result_file='a.mp4')
+        assert broker.batch_items('b')[1]['status'] == 'completed'
+    
+    def test_find_completed(self, broker):
+        broker.enqueue('a', {}, fingerprint='fp')
+        broker.complete('a', result_file='a.mp4')
+        assert broker.find_completed('fp')['id'] == 'a'
+        assert broker.find_completed('other') is None
+
+
+class TestMetricsStore:
+    """Test metrics snapshot ของ worker"""
+    
+    def test_save_replaces_per_source(self, broker):
+        broker.save_metrics('w1', {'a': 1})
+        broker.save_metrics('w1', {'a': 2})
+        broker.save_metrics('w2', {'a': 3})
+        assert sorted(s['a'] for s in broker.load_metrics()) == [2, 3]
@@ -0,0 +1,101 @@
+# =============================================================================
+# 🧪 TESTS - Checkpoints Module
+# =============================================================================
+
+import pytest
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    from modules.checkpoints import Checkpoint
+    return Checkpoint('cli:youtube:abc', tmp_path)
+
+
+class TestResume:
+    """Test บันทึก / ทำต่อจากขั้นที่ค้าง"""
+    
+    def test_resume_in_new_process(self, checkpoint, tmp_path):
+        """สร้าง Checkpoint ใหม่ (รันใหม่) ได้ผลของขั้นที่เสร็จแล้ว"""
+        from modules.checkpoints import Checkpoint
+        
+        source = checkpoint.path('clip.mp4')
+        source.write_bytes(b'x')
+        checkpoint.save('download', path=str(source), duration=12.5)
+        checkpoint.save('script', title='ชื่อ', script='บทพากย์')
+        
+        resumed = Checkpoint('cli:youtube:abc', tmp_path)
+        assert resumed.stages() == ['download', 'script']
+        assert resumed.get('download')['duration'] == 12.5
+        assert resumed.get('script')['title'] == 'ชื่อ'
+        assert resumed.get('voice') is None
+    
+    def test_missing_file_invalidates(self, checkpoint):
+        """ไฟล์ของขั้นนั้นหาย = ต้องทำใหม่"""
+        voice = checkpoint.path('voice.mp3')
+        voice.write_bytes(b'x')
+        checkpoint.save('voice', path=str(voice))
+        voice.unlink()
+        
+        assert checkpoint.get('voice') is None
+    
+    def test_expected_values(self, checkpoint):
+        """ค่าที่ใช้สร้างเปลี่ยน (เช่นเสียงพากย์) = ใช้ไม่ได้"""
+        voice = checkpoint.path('voice.mp3')
+        voice.write_bytes(b'x')
+        checkpoint.save('voice', path=str(voice), voice=['th-TH-NiwatNeural', '+5%'])
+        
+        assert checkpoint.get('voice', voice=['th-TH-NiwatNeural', '+5%'])
+        assert checkpoint.get('voice', voice=['th-TH-PremwadeeNeural', '+5%']) is None
+    
+    def test_redo_stage_drops_later(self, checkpoint):
+        """ทำบทใหม่ = เสียงของบทเดิมใช้ไม่ได้"""
+        voice = checkpoint.path('voice.mp3')
+        voice.write_bytes(b'x')
+        checkpoint.save('script', title='a', script='old')
+        checkpoint.save('voice', path=str(voice))
+        checkpoint.save('script', title='a', script='new')
+        
+        assert checkpoint.stages() == ['script']
+    
+    def test_other_key_ignored(self, checkpoint, tmp_path):
+        """key ต่างกันไม่ใช้ checkpoint ร่วมกัน"""
+        from modules.checkpoints import Checkpoint
+        
+        checkpoint.save('script', title='a', script='b')
+        assert Checkpoint('cli:youtube:other', tmp_path).stages() == []
+    
+    def test_clear(self, checkpoint):
+        """สำเร็จ = ลบทั้งโฟลเดอร์"""
+        checkpoint.path('clip.mp4').write_bytes(b'x')
+        checkpoint.save('script', title='a', script='b')
+        checkpoint.clear()
+        
+        assert not checkpoint.dir.exists()
+        assert checkpoint.stages() == []
+
+
+class TestPrune:
+    """Test เก็บกวาด checkpoint ที่ไม่ถูกรันต่อ"""
+    
+    def test_prunes_stale(self, tmp_path):
+        """เก่ากว่า max_age ถูกลบ ตัวที่เพิ่งเขียนอยู่ต่อ"""
+        from modules.checkpoints import Checkpoint, prune_checkpoints
+        
+        stale = Checkpoint('job:old', tmp_path)
+        stale.save('script', title='a', script='b')
+        fresh = Checkpoint('job:new', tmp_path)
+        fresh.save('script', title='a', script='b')
+        past = time.time() - 7200
+        os.utime(stale.dir / 'state.json', (past, past))
+        
+        result = prune_checkpoints(tmp_path, max_age=3600)
+        
+        assert result['deleted'] == 1
+        assert not stale.dir.exists()
+        assert fresh.dir.exists()
@@ -0,0 +1,142 @@
+# =============================================================================
+# 🧪 TESTS - Download Cache Module
+# =============================================================================
+
+import pytest
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    from modules.download_cache import DownloadCache
+    return DownloadCache(tmp_path / 'cache', max_bytes=0, verify=True)
+
+
+def _source(tmp_path, name='clip.mp4', size=2048):
+    path = tmp_path / 'downloads' / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b'x' * size)
+    return path
+
+
+class TestStoreFetch:
+    """Test เก็บ / ดึงไฟล์จาก cache"""
+    
+    def test_fetch_hardlinks(self, cache, tmp_path):
+        """hit = hardlink เข้า workspace (inode เดียวกัน ไม่ copy)"""
+        source = _source(tmp_path)
+        cache.store('https://youtu.be/dQw4w9WgXcQ', source)
+        
+        workspace = tmp_path / 'job'
+        path = cache.fetch('https://www.youtube.com/shorts/dQw4w9WgXcQ', workspace)
+        
+        assert path == workspace / 'clip.mp4'
+        assert os.stat(path).st_ino == os.stat(source).st_ino
+    
+    def test_job_cleanup_keeps_cache(self, cache, tmp_path):
+        """งานลบไฟล์ของตัวเอง cache ยังอยู่"""
+        source = _source(tmp_path)
+        cache.store('https://youtu.be/abc', source)
+        cache.fetch('https://youtu.be/abc', tmp_path / 'job').unlink()
+        source.unlink()
+        
+        assert cache.fetch('https://youtu.be/abc', tmp_path / 'job2') is not None
+    
+    def test_miss(self, cache, tmp_path):
+        """ไม่เคยเก็บ = None"""
+        assert cache.fetch('https://youtu.be/missing', tmp_path) is None
+    
+    def test_format_in_key(self, cache, tmp_path, monkeypatch):
+        """เปลี่ยนขนาด output = ไม่ใช้ไฟล์ที่เลือก format ไว้สำหรับขนาดเดิม"""
+        import modules.download_cache as download_cache
+        
+        cache.store('https://youtu.be/abc', _source(tmp_path))
+        monkeypatch.setattr(download_cache, 'VIDEO_HEIGHT', 2160)
+        
+        assert cache.fetch('https://youtu.be/abc', tmp_path / 'job') is None
+
+
+class TestIntegrity:
+    """Test ตรวจไฟล์เสีย"""
+    
+    def test_corrupted_evicted(self, cache, tmp_path):
+        """เนื้อไฟล์เปลี่ยน (ขนาดเท่าเดิม) = checksum ไม่ตรง ลบ entry ทิ้ง"""
+        cached = cache.store('https://youtu.be/abc', _source(tmp_path))
+        cached.write_bytes(b'y' * 2048)
+        
+        assert cache.get('https://youtu.be/abc') is None
+        assert not cached.parent.exists()
+    
+    def test_truncated_evicted(self, tmp_path):
+        """ไฟล์ขาด = miss แม้ปิดการตรวจ checksum"""
+        from modules.download_cache import DownloadCache
+        cache = DownloadCache(tmp_path / 'cache', max_bytes=0, verify=False)
+        cached = cache.store('https://youtu.be/abc', _source(tmp_path))
+        cached.write_bytes(b'x' * 10)
+        
+        assert cache.get('https://youtu.be/abc') is None
+
+
+class TestBudget:
+    """Test disk budget"""
+    
+    def test_lru_eviction(self, tmp_path, monkeypatch):
+        """เกิน budget ลบ entry ที่ไม่ได้ใช้นานสุดก่อน"""
+        import modules.download_cache as download_cache
+        from modules.download_cache import DownloadCache
+        
+        monkeypatch.setattr(download_cache, 'CACHE_GRACE_SECONDS', 0)
+        cache = DownloadCache(tmp_path / 'cache', max_bytes=5000, verify=False)
+        
+        old = cache.store('https://youtu.be/old', _source(tmp_path, 'old.mp4'))
+        used = cache.store('https://youtu.be/used', _source(tmp_path, 'used.mp4'))
+        past = time.time() - 3600
+        os.utime(old, (past, past))
+        os.utime(used, (past - 10, past - 10))
+        cache.get('https://youtu.be/used')
+        
+        cache.store('https://youtu.be/new', _source(tmp_path, 'new.mp4'))
+        
+        assert cache.get('https://youtu.be/old') is None
+        assert cache.get('https://youtu.be/used') is not None
+        assert cache.get('https://youtu.be/new') is not None
+
+
+class TestManagerCache:
+    """Test DownloadManager ใช้ cache"""
+    
+    def test_second_download_from_cache(self, cache, tmp_path, monkeypatch):
+        """โหลดซ้ำ (retry / รันใหม่) ไม่เรียก yt-dlp"""
+        import modules.downloader as downloader
+        from tests.test_downloader import FakeSession
+        
+        calls = []
+        
+        class CountingSession(FakeSession):
+            def extract_info(self, url, download=True):
+                calls.append(url)
+                return super().extract_info(url, download)
+        
+        monkeypatch.setattr(downloader, '_Session', CountingSession)
+        manager = downloader.DownloadManager(max_workers=1, per_host=1, cache=cache)
+        try:
+            first = manager.download('https://youtu.be/abc', tmp_path / 'a')
+            events = []
+            second = manager.download(
+                'https://youtube.com/watch?v=abc', tmp_path / 'b',
+                on_progress=lambda stage, **kw: events.append(kw['status'])
+            )
+        finally:
+            manager.close()
+        
+        assert not first['cached']
+        assert second['cached']
+        assert second['bytes'] == 2048
+        assert Path(second['path']).parent == tmp_path / 'b'
+        assert calls == ['https://youtu.be/abc']
+        assert events == ['cached']
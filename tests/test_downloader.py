@@ -4,6 +4,7 @@
 
 import pytest
 import sys
+import threading
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -96,3 +97,327 @@ class TestVideoInfo:
         
         result = get_video_info('https://invalid-url.com/fake')
         assert result is None
+
+
+class TestNormalizeURL:
+    """Test URL normalization (ใช้เทียบงานซ้ำ)"""
+    
+    def test_youtube_variants_match(self):
+        """ลิงก์ YouTube หลายรูปแบบ = URL เดียวกัน"""
+        from modules.downloader import normalize_url
+        
+        expected = normalize_url('https://www.youtube.com/watch?v=abc123')
+        assert normalize_url('https://youtu.be/abc123?si=xyz') == expected
+        assert normalize_url('https://youtube.com/shorts/abc123') == expected
+        assert normalize_url('http://m.youtube.com/watch?v=abc123&feature=share') == expected
+        assert normalize_url('  https://WWW.YouTube.com/watch?v=abc123&utm_source=x ') == expected
+    
+    def test_keeps_identity_params(self):
+        """param ที่เปลี่ยนวิดีโอยังอยู่"""
+        from modules.downloader import normalize_url
+        
+        assert normalize_url('https://youtu.be/a') != normalize_url('https://youtu.be/b')
+        assert 'v=abc' in normalize_url('https://www.youtube.com/watch?v=abc')
+
+
+class TestVideoKey:
+    """Test canonical (platform, id) key"""
+    
+    def test_youtube_forms(self):
+        """ทุกรูปแบบลิงก์ของคลิปเดียวกัน = key เดียว (รวม t= / list=)"""
+        from modules.downloader import video_key
+        
+        for url in [
+            'https://youtu.be/dQw4w9WgXcQ?t=5',
+            'https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=5',
+            'https://youtube.com/shorts/dQw4w9WgXcQ',
+            'https://m.youtube.com/watch?v=dQw4w9WgXcQ&list=PL123',
+            'https://www.youtube.com/embed/dQw4w9WgXcQ',
+        ]:
+            assert video_key(url) == 'youtube:dQw4w9WgXcQ', url
+    
+    def test_tiktok_forms(self):
+        """TikTok ทั้งแบบ @user/video และ /v/ID.html"""
+        from modules.downloader import video_key
+        
+        expected = 'tiktok:7301234567890123456'
+        assert video_key('https://www.tiktok.com/@someone/video/7301234567890123456?is_from_webapp=1') == expected
+        assert video_key('https://m.tiktok.com/v/7301234567890123456.html') == expected
+    
+    def test_unknown_falls_back_to_normalized(self):
+        """URL ที่ไม่รู้จัก / short link = normalize_url"""
+        from modules.downloader import video_key, normalize_url
+        
+        for url in ['https://vm.tiktok.com/ZMabc/', 'https://example.com/clip?id=1']:
+            assert video_key(url) == normalize_url(url)
+
+
+class FakeSession:
+    """แทน yt-dlp session: เขียนไฟล์ปลอม + นับจำนวนที่โหลดพร้อมกัน"""
+    
+    created = 0
+    active = {}
+    peak = {}
+    lock = threading.Lock()
+    
+    def __init__(self, options):
+        FakeSession.created += 1
+        self.on_progress = None
+        self.ydl = self
+        self.params = {}
+    
+    def extract_info(self, url, download=True):
+        import time
+        from modules.downloader import _host_of
+        host = _host_of(url)
+        with FakeSession.lock:
+            FakeSession.active[host] = FakeSession.active.get(host, 0) + 1
+            FakeSession.peak[host] = max(FakeSession.peak.get(host, 0), FakeSession.active[host])
+        time.sleep(0.05)
+        with FakeSession.lock:
+            FakeSession.active[host] -= 1
+        if 'broken' in url:
+            raise RuntimeError('Video unavailable')
+        
+        name = url.rstrip('/').split('/')[-1]
+        info = {'title': name, 'duration': 10}
+        if download:
+            path = Path(self.params['paths']['home']) / f'{name}.mp4'
+            path.write_bytes(b'x' * 2048)
+            if self.on_progress:
+                self.on_progress({'status': 'finished', 'downloaded_bytes': 2048})
+            info['requested_downloads'] = [{'filepath': str(path)}]
+        return info
+    
+    def close(self):
+        pass
+
+
+class TestDownloadManager:
+    """Test pool ของ yt-dlp sessions + จำกัดต่อ host"""
+    
+    @pytest.fixture
+    def manager(self, monkeypatch):
+        import modules.downloader as downloader
+        
+        FakeSession.created = 0
+        FakeSession.active, FakeSession.peak = {}, {}
+        monkeypatch.setattr(downloader, '_Session', FakeSession)
+        manager = downloader.DownloadManager(max_workers=4, per_host=2)
+        yield manager
+        manager.close()
+    
+    def test_sessions_reused(self, manager, tmp_path):
+        """โหลดทีละ URL ใช้ session เดิม"""
+        for i in range(3):
+            assert manager.download(f'https://youtu.be/v{i}', tmp_path)['path']
+        assert FakeSession.created == 1
+    
+    def test_download_many_concurrent_with_host_limit(self, manager, tmp_path):
+        """โหลดพร้อมกันได้ แต่ไม่เกิน per_host ต่อ platform และคืนผลตามลำดับ"""
+        urls = [f'https://youtu.be/v{i}' for i in range(6)] + [
+            f'https://www.tiktok.com/@a/video/{i}' for i in range(2)
+        ]
+        results = manager.download_many(urls, tmp_path)
+        
+        assert [r['url'] for r in results] == urls
+        assert all(r['path'] for r in results)
+        assert FakeSession.peak['youtube'] == 2
+        assert FakeSession.created <= 4
+    
+    def test_reports_throughput(self, manager, tmp_path):
+        """ผลลัพธ์ + event "complete" มี bytes / throughput"""
+        events = []
+        result = manager.download(
+            'https://youtu.be/v1', tmp_path, on_progress=lambda event, **data: events.append(data)
+        )
+        
+        assert result['bytes'] == 2048
+        assert result['throughput'] > 0
+        assert events[-1]['status'] == 'complete'
+        assert events[-1]['throughput'] == result['throughput']
+    
+    def test_failure_returns_error(self, manager, tmp_path):
+        """โหลดไม่ได้ = path None + error (session ยังกลับเข้า pool)"""
+        result = manager.download('https://youtu.be/broken', tmp_path)
+        
+        assert result['path'] is None
+        assert 'unavailable' in result['error']
+        assert manager.download('https://youtu.be/ok', tmp_path)['path']
+        assert FakeSession.created == 1
+    
+    def test_info_many(self, manager):
+        """metadata หลาย URL พร้อมกัน (URL เสีย = None)"""
+        infos = manager.info_many(['https://youtu.be/a', 'https://youtu.be/broken'])
+        
+        assert infos['https://youtu.be/a']['duration'] == 10
+        assert infos['https://youtu.be/broken'] is None
+    
+    def test_stalled_download_restarts(self, manager, tmp_path, monkeypatch):
+        """ค้างครั้งแรก = ทิ้ง session นั้นแล้วโหลดใหม่ด้วย session ใหม่"""
+        from modules.downloader import DownloadStalled
+        
+        stalls = []
+        
+        class StallOnce(FakeSession):
+            def extract_info(self, url, download=True):
+                if not stalls:
+                    stalls.append(self)
+                    raise DownloadStalled('0 KB/s < 64 KB/s for 30s')
+                return super().extract_info(url, download)
+        
+        closed = []
+        monkeypatch.setattr(StallOnce, 'close', lambda self: closed.append(self))
+        import modules.downloader as downloader
+        monkeypatch.setattr(downloader, '_Session', StallOnce)
+        events = []
+        result = manager.download(
+            'https://youtu.be/v1', tmp_path, on_progress=lambda event, **data: events.append(data['status'])
+        )
+        
+        assert result['path'] and result['stalls'] == 1
+        assert closed == stalls
+        assert FakeSession.created == 2
+        assert events[0] == 'restarted'
+    
+    def test_stall_gives_up(self, manager, tmp_path, monkeypatch):
+        """ค้างเกิน DOWNLOAD_STALL_RETRIES = fail พร้อมเหตุผล"""
+        import modules.downloader as downloader
+        from modules.downloader import DownloadStalled
+        
+        def stall(self, url, download=True):
+            raise DownloadStalled('1 KB/s < 64 KB/s for 30s')
+        
+        monkeypatch.setattr(FakeSession, 'extract_info', stall)
+        monkeypatch.setattr(downloader, 'DOWNLOAD_STALL_RETRIES', 1)
+        result = manager.download('https://youtu.be/v1', tmp_path)
+        
+        assert result['path'] is None
+        assert result['stalls'] == 2
+        assert result['error'].startswith('Download stalled')
+
+
+class TestSourceLimits:
+    """Test ตรวจความยาว / ขนาดจาก metadata ก่อนดาวน์โหลด"""
+    
+    def test_estimate_size(self):
+        """รวม video + audio ที่ถูกเลือก / ไม่มี filesize ใช้ tbr x duration"""
+        from modules.downloader import estimate_size
+        
+        merged = {'duration': 10, 'requested_formats': [{'filesize': 1000}, {'filesize_approx': 200}]}
+        assert estimate_size(merged) == 1200
+        assert estimate_size({'duration': 10, 'tbr': 800}) == 1_000_000
+        assert estimate_size({'duration': 10}) is None
+    
+    def test_limits(self, monkeypatch):
+        """เกิน limit = เหตุผล / ไม่รู้ขนาด = ผ่าน / 0 = ไม่จำกัด"""
+        import modules.downloader as downloader
+        
+        monkeypatch.setattr(downloader, 'MAX_SOURCE_SECONDS', 600)
+        monkeypatch.setattr(downloader, 'MAX_SOURCE_MB', 100)
+        
+        assert downloader.source_limit_error({'duration': 700}).startswith('Too long')
+        assert downloader.source_limit_error({'duration': 60, 'filesize': 200 * 1024 * 1024}).startswith('Too large')
+        assert downloader.source_limit_error({'duration': 60}) is None
+        
+        monkeypatch.setattr(downloader, 'MAX_SOURCE_SECONDS', 0)
+        assert downloader.source_limit_error({'duration': 7000}) is None
+
+
+class TestStallWatchdog:
+    """Test ตรวจดาวน์โหลดค้างจาก progress hook"""
+    
+    def _watchdog(self):
+        from modules.downloader import _StallWatchdog
+        
+        now = [0.0]
+        watchdog = _StallWatchdog(min_speed=1000, window=10, clock=lambda: now[0])
+        
+        def tick(seconds, downloaded):
+            now[0] += seconds
+            watchdog({'status': 'downloading', 'downloaded_bytes': downloaded})
+        return tick
+    
+    def test_fast_download_passes(self):
+        """ได้ bytes เกิน min_speed ทุก window = ไม่ตัด"""
+        tick = self._watchdog()
+        for i in range(10):
+            tick(5, i * 20000)
+    
+    def test_slow_download_raises(self):
+        """ช้ากว่า min_speed ทั้ง window = DownloadStalled"""
+        from modules.downloader import DownloadStalled
+        
+        tick = self._watchdog()
+        tick(0, 0)
+        tick(5, 2000)
+        with pytest.raises(DownloadStalled):
+            tick(6, 4000)
+    
+    def test_new_file_resets(self):
+        """bytes ลดลง (เริ่มไฟล์เสียงต่อจากวิดีโอ) = เริ่มนับ window ใหม่"""
+        tick = self._watchdog()
+        tick(0, 50000)
+        tick(9, 60000)
+        tick(2, 100)
+        tick(5, 6000)
+
+
+def _fmt(format_id, width, height, vcodec='avc1.640028', acodec='none', fps=30, tbr=1000):
+    return {
+        'format_id': format_id, 'width': width, 'height': height, 'fps': fps,
+        'vcodec': vcodec, 'acodec': acodec, 'tbr': tbr, 'ext': 'mp4', 'protocol': 'https',
+    }
+
+
+class TestFormatSelector:
+    """Test เลือก format ตามขนาด output"""
+    
+    FORMATS = [
+        {'format_id': 'sb0', 'vcodec': 'none', 'acodec': 'none', 'ext': 'mhtml'},
+        {'format_id': 'a1', 'vcodec': 'none', 'acodec': 'opus', 'abr': 50, 'ext': 'webm', 'protocol': 'https'},
+        {'format_id': 'a2', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 128, 'ext': 'm4a', 'protocol': 'https'},
+        _fmt('muxed360', 360, 640, acodec='mp4a.40.2', tbr=500),
+        _fmt('v720', 720, 1280, tbr=1500),
+        _fmt('v1080vp9', 1080, 1920, vcodec='vp9', tbr=2500),
+        _fmt('v1080', 1080, 1920, tbr=3000),
+        _fmt('v1080p60', 1080, 1920, fps=60, tbr=4500),
+        _fmt('v2160', 2160, 3840, vcodec='av01.0.12M.08', tbr=12000),
+    ]
+    
+    def _select(self, formats, **kwargs):
+        from modules.downloader import format_selector
+        
+        selector = format_selector(width=1080, height=1920, fps=30, **kwargs)
+        return list(selector({'formats': formats}))
+    
+    def test_smallest_covering_video_only(self):
+        """ไม่ใช้เสียงต้นฉบับ = video-only 1080x1920 ที่ fps พอ + decode ถูก (ไม่เอา 4K / 60fps)"""
+        assert [f['format_id'] for f in self._select(self.FORMATS, need_audio=False)] == ['v1080']
+    
+    def test_landscape_source(self):
+        """แนวนอน 1080p ถือว่าครอบคลุม (ด้านสั้นเท่ากัน)"""
+        formats = [_fmt('h1080', 1920, 1080), _fmt('h2160', 3840, 2160)]
+        assert self._select(formats, need_audio=False)[0]['format_id'] == 'h1080'
+    
+    def test_falls_back_to_largest(self):
+        """ไม่มีตัวไหนครอบคลุม = ใช้ตัวที่ใหญ่ที่สุด"""
+        formats = self.FORMATS[:5]
+        assert self._select(formats, need_audio=False)[0]['format_id'] == 'v720'
+    
+    def test_need_audio_merges_small_audio(self):
+        """ต้องใช้เสียง + muxed ไม่ครอบคลุม = video-only + เสียงเล็กสุด"""
+        selected = self._select(self.FORMATS, need_audio=True)[0]
+        
+        assert selected['format_id'] == 'v1080+a1'
+        assert [f['format_id'] for f in selected['requested_formats']] == ['v1080', 'a1']
+    
+    def test_need_audio_prefers_covering_muxed(self):
+        """muxed ที่ครอบคลุมอยู่แล้ว = ไม่ต้อง merge"""
+        formats = self.FORMATS + [_fmt('muxed1080', 1080, 1920, acodec='mp4a.40.2', tbr=3500)]
+        assert self._select(formats, need_audio=True)[0]['format_id'] == 'muxed1080'
+    
+    def test_unknown_dimensions(self):
+        """ไม่มีข้อมูลขนาด = ตัวสุดท้าย (ดีที่สุดตาม yt-dlp)"""
+        formats = [{'format_id': 'x', 'vcodec': 'h264'}, {'format_id': 'y', 'vcodec': 'h264'}]
+        assert self._select(formats)[0]['format_id'] == 'y'
@@ -51,31 +51,38 @@ class TestScriptCleaning:
 class TestModelManagement:
     """Test model fallback functions"""
     
-    def test_get_next_model_cycles(self):
+    def test_next_model_cycles(self):
         """ทดสอบ model rotation"""
-        from modules.gemini_brain import (
-            get_next_model, reset_model_fallback, 
-            MODEL_HIERARCHY, current_model_index
-        )
-        import modules.gemini_brain as brain
+        from modules.gemini_brain import AIBrain, MODEL_HIERARCHY
         
-        reset_model_fallback()
-        assert brain.current_model_index == 0
+        brain = AIBrain(api_keys=[])
+        assert brain.current_model_idx == 0
         
         # วน models
         for i in range(len(MODEL_HIERARCHY)):
-            model = get_next_model()
+            model = brain.next_model()
             assert isinstance(model, str)
             assert model in MODEL_HIERARCHY
+        assert brain.current_model_idx == 0
     
     def test_reset_model_fallback(self):
         """ทดสอบ reset กลับไป model แรก"""
-        from modules.gemini_brain import reset_model_fallback
-        import modules.gemini_brain as brain
+        from modules.gemini_brain import AIBrain
+        
+        brain = AIBrain(api_keys=[], models=['a', 'b', 'c'])
+        brain.current_model_idx = 2
+        brain.reset_model_fallback()
+        assert brain.current_model_idx == 0
+    
+    def test_module_wrappers_use_default_brain(self):
+        """ฟังก์ชันระดับ module (CLI) ใช้ default brain"""
+        from modules.gemini_brain import get_default_brain, get_next_model, reset_model_fallback
         
-        brain.current_model_index = 2
         reset_model_fallback()
-        assert brain.current_model_index == 0
+        get_next_model()
+        assert get_default_brain().current_model_idx == 1
+        reset_model_fallback()
+        assert get_default_brain().current_model_idx == 0
 
 
 class TestKeyManagement:
@@ -110,3 +117,401 @@ class TestAIBrainClass:
         assert 'gemini_keys' in status
         assert 'current_model' in status
         assert 'current_model' in status
+
+
+
+class TestClientIsolation:
+    """Test ว่าแต่ละ AIBrain ใช้ key ของตัวเอง"""
+    
+    def test_instances_do_not_share_state(self):
+        """สลับ key/model ของ instance หนึ่ง ไม่กระทบอีก instance"""
+        from modules.gemini_brain import AIBrain
+        
+        a = AIBrain(api_keys=['key-a1', 'key-a2'])
+        b = AIBrain(api_keys=['key-b'])
+        a.initialize(validate=False)
+        b.initialize(validate=False)
+        
+        a.rotate_key()
+        a.next_model()
+        
+        assert a.current_key == 'key-a2'
+        assert b.current_key == 'key-b'
+        assert b.current_model_idx == 0
+    
+    def test_model_bound_to_instance_key(self):
+        """GenerativeModel ได้ client ที่ผูกกับ key ของ instance (ไม่ใช่ genai.configure)"""
+        from modules.gemini_brain import AIBrain
+        
+        a = AIBrain(api_keys=['key-a'])
+        b = AIBrain(api_keys=['key-b'])
+        a.initialize(validate=False)
+        b.initialize(validate=False)
+        
+        model_a = a.model('gemini-test')
+        model_b = b.model('gemini-test')
+        
+        assert model_a._client is not model_b._client
+        assert a._client_managers['key-a'].client_config['client_options'].api_key == 'key-a'
+        assert b._client_managers['key-b'].client_config['client_options'].api_key == 'key-b'
+    
+    def test_no_keys_raises(self):
+        """ไม่มี key = error ชัดเจน"""
+        from modules.gemini_brain import AIBrain
+        
+        brain = AIBrain(api_keys=[])
+        brain.initialize(validate=False)
+        with pytest.raises(RuntimeError):
+            brain.current_key
+
+
+class TestScriptCacheHit:
+    """Test ว่าบทจาก cache ไม่เรียก Gemini"""
+    
+    def test_hit_skips_gemini(self, tmp_path, monkeypatch):
+        """render ซ้ำจากคลิปเดิม = ได้บทเดิมโดยไม่ upload / ไม่ต้องมี key"""
+        import modules.gemini_brain as gb
+        import modules.script_cache as sc
+        
+        monkeypatch.setattr(gb, 'SCRIPT_CACHE', True)
+        monkeypatch.setattr(sc, 'SCRIPT_CACHE_DIR', tmp_path / 'scripts')
+        video = tmp_path / 'clip.mp4'
+        video.write_bytes(b'video')
+        
+        brain = gb.AIBrain(api_keys=[])
+        cache = sc.ScriptCache()
+        key = cache.key(
+            video, 30.0, brain.models[0], gb.PROMPT_VERSION,
+            voice=[gb.VOICE_NAME, gb.VOICE_RATE, gb.VOICE_PITCH, gb.VOICE_VOLUME]
+        )
+        cache.put(key, 'ชื่อ', 'บทเดิม', 29.5)
+        events = []
+        
+        result = brain.generate_script(str(video), 30.0, on_progress=lambda e, **d: events.append((e, d)))
+        
+        assert result == ('ชื่อ', 'บทเดิม')
+        assert events == [('calibration', {'state': 'cached', 'audio_seconds': 29.5})]
+        assert brain.initialized is False
+
+
+class TestHedgedCandidates:
+    """Test รอบแรกแบบหลายเวอร์ชัน + คำขอสำรอง"""
+    
+    def test_parse_variants(self):
+        """แยกเวอร์ชันตาม === n === / ไม่ตรง format = บทเดียว"""
+        from modules.gemini_brain import _parse_variants
+        
+        text = "ชื่อ: แมวกระโดด\n=== 1 ===\nแมว กระโดด สูง\n=== 2 ===\nแมว กระโดด\n=== 3 ===\n"
+        
+        assert _parse_variants(text, 3) == [('แมวกระโดด', 'แมว กระโดด สูง'), ('แมวกระโดด', 'แมว กระโดด')]
+        assert _parse_variants("ชื่อ: ก\n---\nบท เดียว", 3) == [('ก', 'บท เดียว')]
+    
+    def test_variant_targets(self):
+        """เป้าหมายก่อน แล้วสั้น / ยาวสลับกัน"""
+        from modules.gemini_brain import _variant_targets
+        
+        assert _variant_targets(100, 3) == [100, 85, 115]
+        assert _variant_targets(100, 1) == [100]
+    
+    def test_first_in_tolerance_wins(self, monkeypatch):
+        """ตัวที่วัดเสร็จก่อนและอยู่ใน tolerance ชนะ ไม่รอตัวที่ช้า"""
+        import time
+        import modules.gemini_brain as gb
+        
+        lengths = {'short': (0.0, 20.0), 'fit': (0.05, 29.0), 'slow': (2.0, 30.0)}
+        
+        def fake_measure(script, on_progress=None):
+            delay, seconds = lengths[script]
+            time.sleep(delay)
+            return seconds
+        
+        monkeypatch.setattr(gb, 'get_audio_duration', fake_measure)
+        brain = gb.AIBrain(api_keys=[])
+        
+        start = time.perf_counter()
+        results, winner = brain._measure_candidates(
+            [('t', 'short'), ('t', 'fit'), ('t', 'slow')], 30.0
+        )
+        
+        assert winner == ('t', 'fit', 29.0, 1)
+        assert [r[1] for r in results] == ['short', 'fit']
+        assert time.perf_counter() - start < 1.5
+    
+    def test_no_candidate_in_tolerance(self, monkeypatch):
+        """ไม่มีตัวไหนพอดี = คืนผลทั้งหมดให้ calibrate ต่อ"""
+        import modules.gemini_brain as gb
+        
+        monkeypatch.setattr(gb, 'get_audio_duration', lambda script, on_progress=None: 10.0)
+        brain = gb.AIBrain(api_keys=[])
+        
+        results, winner = brain._measure_candidates([('t', 'a'), ('t', 'b')], 30.0)
+        
+        assert winner is None
+        assert len(results) == 2
+    
+    def test_queued_candidates_cancelled(self, monkeypatch):
+        """ชนะแล้ว = เวอร์ชันที่ยังรอคิววัดเสียงไม่ถูกวัดเลย (ประหยัด TTS)"""
+        import time
+        import modules.gemini_brain as gb
+        
+        measured = []
+        
+        def fake_measure(script, on_progress=None):
+            measured.append(script)
+            time.sleep(0 if script == 'fit' else 0.3)
+            return 29.0 if script == 'fit' else 10.0
+        
+        monkeypatch.setattr(gb, 'get_audio_duration', fake_measure)
+        brain = gb.AIBrain(api_keys=[])
+        
+        results, winner = brain._measure_candidates(
+            [('t', 'fit'), ('t', 'a'), ('t', 'b'), ('t', 'c')], 30.0
+        )
+        time.sleep(0.7)
+        
+        assert winner == ('t', 'fit', 29.0, 1)
+        assert 'c' not in measured
+    
+    def test_slow_request_is_hedged(self, monkeypatch):
+        """key เดียว: ไม่ตอบในเวลา hedge = ส่งคำขอสำรองไป model ถัดไป แล้วใช้คำตอบที่มาก่อน"""
+        import time
+        import modules.gemini_brain as gb
+        
+        monkeypatch.setattr(gb, 'SCRIPT_HEDGE_SECONDS', 0.05)
+        brain = gb.AIBrain(api_keys=['k'], models=['slow-model', 'fast-model'])
+        brain.keys = ['k']
+        calls = []
+        
+        def fake_ask(model_name, video_file, prompt, key=None):
+            calls.append(model_name)
+            if model_name == 'slow-model':
+                time.sleep(1.0)
+            return f'chat-{model_name}', 'text'
+        
+        monkeypatch.setattr(brain, '_ask', fake_ask)
+        
+        result = brain._hedged_request('slow-model', 'clip.mp4', {'k': 'file-k'}, 'prompt')
+        assert result == ('chat-fast-model', 'text', 'k')
+        assert calls == ['slow-model', 'fast-model']
+    
+    def test_hedge_uses_other_key(self, monkeypatch):
+        """หลาย key: คำขอสำรองไป key ถัดไป (upload วิดีโอให้ key นั้น) แล้วสลับไปใช้ key นั้นต่อ"""
+        import time
+        import modules.gemini_brain as gb
+        
+        monkeypatch.setattr(gb, 'SCRIPT_HEDGE_SECONDS', 0.05)
+        monkeypatch.setattr(gb, '_parse_variants', lambda text, n: [('t', text)])
+        monkeypatch.setattr(gb, 'get_audio_duration', lambda script, on_progress=None: 30.0)
+        brain = gb.AIBrain(api_keys=['k1', 'k2'], models=['m1'])
+        brain.keys = ['k1', 'k2']
+        calls = []
+        
+        def fake_ask(model_name, video_file, prompt, key=None):
+            calls.append((model_name, video_file, key))
+            if key == 'k1':
+                time.sleep(1.0)
+            return f'chat-{key}', 'บท'
+        
+        monkeypatch.setattr(brain, '_ask', fake_ask)
+        monkeypatch.setattr(brain, 'upload', lambda path, key=None: f'file-{key}')
+        uploads = {'k1': 'file-k1'}
+        
+        chat, results, winner = brain._hedged_round('m1', 'clip.mp4', uploads, 30.0, 66)
+        
+        assert chat == 'chat-k2'
+        assert calls == [('m1', 'file-k1', 'k1'), ('m1', 'file-k2', 'k2')]
+        assert uploads == {'k1': 'file-k1', 'k2': 'file-k2'}
+        assert brain.current_key == 'k2'
+    
+    def test_fast_request_not_hedged(self, monkeypatch):
+        """ตอบทันเวลา = ไม่มีคำขอสำรอง / error ของคำขอเดียวถูกส่งต่อ"""
+        import modules.gemini_brain as gb
+        
+        brain = gb.AIBrain(api_keys=['k1', 'k2'], models=['m1', 'm2'])
+        brain.keys = ['k1', 'k2']
+        calls = []
+        monkeypatch.setattr(brain, '_ask', lambda m, v, p, key=None: calls.append(key) or ('chat', 'text'))
+        
+        assert brain._hedged_request('m1', 'clip.mp4', {'k1': 'f'}, 'prompt') == ('chat', 'text', 'k1')
+        assert calls == ['k1']
+        
+        def failing(m, v, p, key=None):
+            raise RuntimeError('429 quota')
+        
+        monkeypatch.setattr(brain, '_ask', failing)
+        with pytest.raises(RuntimeError):
+            brain._hedged_request('m1', 'clip.mp4', {'k1': 'f'}, 'prompt')
+
+
+class TestKeyRotation:
+    """Test สลับ key ระหว่างเขียนบท"""
+    
+    def test_rotated_key_gets_its_own_upload(self, tmp_path, monkeypatch):
+        """429 แล้วสลับ key = upload วิดีโอให้ key ใหม่ แล้วส่งไฟล์ของ key นั้น (ไม่ใช่ของ key แรก)"""
+        import modules.gemini_brain as gb
+        
+        monkeypatch.setattr(gb, 'SCRIPT_CACHE', False)
+        monkeypatch.setattr(gb, 'SCRIPT_CANDIDATES', 1)
+        monkeypatch.setattr(gb, 'get_audio_duration', lambda script, on_progress=None: 30.0)
+        sent, deleted = [], []
+        
+        class FakeChat:
+            def __init__(self, key):
+                self.key = key
+            
+            def send_message(self, message):
+                sent.append((self.key, message[0]))
+                if self.key == 'k1':
+                    raise RuntimeError('429 quota exceeded')
+                return type('Response', (), {'text': 'ชื่อ: แมว\n---\nแมว กระโดด'})()
+        
+        brain = gb.AIBrain(api_keys=['k1', 'k2'], models=['m1'])
+        brain.keys, brain.initialized = ['k1', 'k2'], True
+        monkeypatch.setattr(brain, 'upload', lambda path, on_progress=None, key=None: f'file-{key or brain.current_key}')
+        monkeypatch.setattr(brain, 'delete_upload', lambda file, key=None: deleted.append((key, file)))
+        monkeypatch.setattr(brain, 'model', lambda name, key=None: type('Model', (), {
+            'start_chat': lambda self, history: FakeChat(key or brain.current_key)
+        })())
+        
+        assert brain.generate_script(str(tmp_path / 'clip.mp4'), 30.0) == ('แมว', 'แมว กระโดด')
+        assert sent == [('k1', 'file-k1'), ('k2', 'file-k2')]
+        assert sorted(deleted) == [('k1', 'file-k1'), ('k2', 'file-k2')]
+
+
+class TestDeltaRefinement:
+    """Test calibration แบบแก้ทีละประโยค"""
+    
+    def test_parse_edits(self):
+        """แยกคำสั่งแทรก / ลบ ไม่สนบรรทัดอื่น"""
+        from modules.gemini_brain import _parse_edits
+        
+        text = "นี่คือการแก้ไข\nแทรกหลัง [2]: ฝนตกหนัก\n- ลบ [1], [3]\nแทรกหลัง 0: เริ่มต้น"
+        
+        assert _parse_edits(text) == ([(2, 'ฝนตกหนัก'), (0, 'เริ่มต้น')], {1, 3})
+        assert _parse_edits("เขียนบทใหม่ทั้งหมด ไม่มีคำสั่ง") is None
+    
+    def test_split_sentences(self):
+        """แบ่งตามเครื่องหมายจบประโยค / ย่อหน้ายาวที่ไม่มีจุด = ทีละ SENTENCE_MAX_PHRASES วลี"""
+        import modules.gemini_brain as gb
+        
+        assert gb._split_sentences('ฝนตก หนัก. รถติด ยาว!  คนเดิน') == ['ฝนตก หนัก.', 'รถติด ยาว!', 'คนเดิน']
+        phrases = [f'วลี{i}' for i in range(gb.SENTENCE_MAX_PHRASES + 2)]
+        assert gb._split_sentences(' '.join(phrases)) == [
+            ' '.join(phrases[:gb.SENTENCE_MAX_PHRASES]), ' '.join(phrases[gb.SENTENCE_MAX_PHRASES:])
+        ]
+    
+    def test_split_cleaned_thai_script(self):
+        """บทจริงหลัง clean_script_final (เว้นวรรคเดียว ไม่มีจุด) = ตัดที่คำลงท้ายประโยค"""
+        from modules.gemini_brain import _split_sentences, clean_script_final
+        
+        script = clean_script_final(
+            "แมวส้มกระโดดขึ้นโต๊ะอย่างมั่นใจ  มองซ้ายมองขวาเหมือนวางแผนอะไรอยู่นะ\n"
+            "แล้วจู่ๆ ก็ปัดแก้วน้ำตกพื้นไปเลย เจ้าของหันมามองตาค้าง แมวเดินหนีไปนอนต่อสบายใจสุดๆ ครับ"
+        )
+        
+        assert _split_sentences(script) == [
+            'แมวส้มกระโดดขึ้นโต๊ะอย่างมั่นใจ มองซ้ายมองขวาเหมือนวางแผนอะไรอยู่นะ',
+            'แล้วจู่ๆ ก็ปัดแก้วน้ำตกพื้นไปเลย',
+            'เจ้าของหันมามองตาค้าง แมวเดินหนีไปนอนต่อสบายใจสุดๆ ครับ',
+        ]
+        assert ' '.join(_split_sentences(script)) == script
+    
+    def test_apply_edits_measures_only_changes(self, monkeypatch):
+        """ความยาวใหม่ = เดิม + ที่แทรก - ที่ลบ (วัดเฉพาะประโยคที่เปลี่ยน หักช่วงเงียบต่อคลิป)"""
+        import modules.gemini_brain as gb
+        
+        measured = []
+        
+        def fake_durations(sentences, on_progress=None):
+            measured.extend(sentences)
+            return [len(s) / 10 for s in sentences]
+        
+        monkeypatch.setattr(gb, 'sentence_durations', fake_durations)
+        monkeypatch.setattr(gb, 'clip_padding', lambda: 0.1)
+        edits = ([(0, 'ก่อน'), (2, 'ใหม่ยาวมาก'), (9, 'ท้าย')], {1})
+        
+        script, seconds = gb._apply_edits('หนึ่ง ก. สอง ข. สาม ค.', 20.0, edits)
+        
+        assert script == 'ก่อน สอง ข. ใหม่ยาวมาก สาม ค. ท้าย'
+        assert sorted(measured) == sorted(['ก่อน', 'ใหม่ยาวมาก', 'ท้าย', 'หนึ่ง ก.'])
+        # แทรก 3 คลิป (0.4 + 1.0 + 0.4) / ลบ 1 คลิป (0.8) - หัก 0.1s ทุกคลิป
+        assert seconds == pytest.approx(20.0 + (0.3 + 0.9 + 0.3) - 0.7)
+    
+    def test_delta_prompt_direction(self):
+        """สั้นไป = ขอแทรก / ยาวไป = ขอลบ พร้อมหมายเลขประโยค"""
+        from modules.gemini_brain import _delta_prompt
+        
+        longer = _delta_prompt('หนึ่ง ก. สอง ข.', 20.0, 30.0, 12)
+        shorter = _delta_prompt('หนึ่ง ก. สอง ข.', 40.0, 30.0, -8)
+        
+        assert '[1] หนึ่ง ก.\n[2] สอง ข.' in longer
+        assert 'เพิ่มประมาณ 12 คำ' in longer
+        assert 'ตัดประมาณ 8 คำ' in shorter
+    
+    def test_estimate_measured_before_accept(self, tmp_path, monkeypatch):
+        """ค่าประมาณบอกว่าพอดี = วัดทั้งบทจริงก่อนรับ / cache เก็บความยาวที่วัดจริง"""
+        import modules.gemini_brain as gb
+        import modules.script_cache as sc
+        
+        monkeypatch.setattr(gb, 'SCRIPT_CACHE', True)
+        monkeypatch.setattr(gb, 'SCRIPT_CANDIDATES', 3)
+        monkeypatch.setattr(gb, 'SCRIPT_DELTA_REFINE', True)
+        monkeypatch.setattr(sc, 'SCRIPT_CACHE_DIR', tmp_path / 'scripts')
+        video = tmp_path / 'clip.mp4'
+        video.write_bytes(b'video')
+        
+        class FakeChat:
+            def send_message(self, message):
+                return type('Response', (), {'text': 'แทรกหลัง [1]: ฝนตกหนัก'})()
+        
+        brain = gb.AIBrain(api_keys=['k'], models=['m1'])
+        brain.keys, brain.initialized = ['k'], True
+        monkeypatch.setattr(brain, 'upload', lambda path, on_progress=None: 'file')
+        monkeypatch.setattr(brain, 'delete_upload', lambda file, key=None: None)
+        monkeypatch.setattr(brain, '_hedged_round', lambda *args: (FakeChat(), [('ชื่อ', 'บท เดิม', 20.0, 2)], None))
+        monkeypatch.setattr(gb, '_apply_edits', lambda *args: ('บท เดิม ฝนตกหนัก', 29.0))
+        measured = []
+        monkeypatch.setattr(gb, 'get_audio_duration', lambda script, on_progress=None: measured.append(script) or 29.5)
+        
+        assert brain.generate_script(str(video), 30.0) == ('ชื่อ', 'บท เดิม ฝนตกหนัก')
+        assert measured == ['บท เดิม ฝนตกหนัก']
+        
+        cache = sc.ScriptCache()
+        key = cache.key(video, 30.0, 'm1', gb.PROMPT_VERSION,
+                        voice=[gb.VOICE_NAME, gb.VOICE_RATE, gb.VOICE_PITCH, gb.VOICE_VOLUME])
+        assert cache.get(key)['audio_seconds'] == 29.5
+
+
+class TestSdkIsolationCheck:
+    """Test ว่า SDK ที่ไม่มี API ภายในที่ใช้แยก client = error ไม่ถอยไปใช้ client กลาง"""
+    
+    def test_current_sdk_passes(self, monkeypatch):
+        """SDK ตาม requirements ผ่าน"""
+        import modules.gemini_brain as gb
+        
+        monkeypatch.setattr(gb, '_sdk_checked', False)
+        gb._check_sdk_isolation()
+        assert gb._sdk_checked is True
+    
+    def test_missing_client_manager_fails_loudly(self, monkeypatch):
+        """ไม่มี _ClientManager = initialize error"""
+        import modules.gemini_brain as gb
+        from google.generativeai import client as genai_client
+        
+        monkeypatch.setattr(gb, '_sdk_checked', False)
+        monkeypatch.delattr(genai_client, '_ClientManager')
+        
+        with pytest.raises(RuntimeError, match='_ClientManager'):
+            gb.AIBrain(api_keys=['k']).initialize(validate=False)
+
+
+class TestUploadMimeType:
+    """Test MIME type ของไฟล์ที่ upload"""
+    
+    def test_follows_container(self):
+        """webm / mp4 ตามนามสกุล / ไม่รู้จัก = video/mp4"""
+        from modules.gemini_brain import _video_mime_type
+        
+        assert _video_mime_type('/tmp/clip.webm') == 'video/webm'
+        assert _video_mime_type('/tmp/clip.mp4') == 'video/mp4'
+        assert _video_mime_type('/tmp/clip.unknownext') == 'video/mp4'
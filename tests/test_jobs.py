@@ -0,0 +1,152 @@
+# =============================================================================
+# 🧪 TESTS - Jobs Module
+# =============================================================================
+
+import pytest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+class TestFingerprint:
+    """Test job fingerprint (idempotency)"""
+    
+    def test_same_input_same_fingerprint(self):
+        """URL คนละรูปแบบของคลิปเดียวกัน + options เดิม = fingerprint เดียวกัน"""
+        from modules.jobs import job_fingerprint
+        
+        a = job_fingerprint({'url': 'https://youtu.be/abc', 'use_avatar': True, 'api_key': 'k1'})
+        b = job_fingerprint({'url': 'https://www.youtube.com/watch?v=abc', 'api_key': 'k2'})
+        assert a == b
+    
+    def test_options_change_fingerprint(self):
+        """options ที่มีผลต่อ output = fingerprint ต่างกัน"""
+        from modules.jobs import job_fingerprint
+        
+        base = {'url': 'https://youtu.be/abc'}
+        fingerprints = {
+            job_fingerprint(base),
+            job_fingerprint({**base, 'use_avatar': False}),
+            job_fingerprint({**base, 'profiles': ['master', 'poster']}),
+        }
+        assert len(fingerprints) == 3
+    
+    def test_unused_options_ignored(self):
+        """custom_prompt ยังไม่ถูกใช้ใน pipeline = ไม่ทำให้ render ซ้ำ"""
+        from modules.jobs import job_fingerprint
+        
+        base = {'url': 'https://youtu.be/abc'}
+        assert job_fingerprint({**base, 'custom_prompt': 'ตลกๆ'}) == job_fingerprint(base)
+    
+    def test_config_changes_fingerprint(self, monkeypatch):
+        """เปลี่ยนเสียงพากย์ใน config = งานเดิมใช้ซ้ำไม่ได้"""
+        import modules.jobs as jobs
+        
+        before = jobs.job_fingerprint({'url': 'https://youtu.be/abc'})
+        monkeypatch.setattr(jobs, 'VOICE_NAME', 'th-TH-PremwadeeNeural')
+        assert jobs.job_fingerprint({'url': 'https://youtu.be/abc'}) != before
+
+
+class TestResultAvailable:
+    """Test ว่าผลลัพธ์เดิมยังใช้ได้"""
+    
+    def test_all_files_must_exist(self, tmp_path):
+        from modules.jobs import result_available
+        
+        (tmp_path / 'a.mp4').write_bytes(b'x')
+        assert result_available({'result_file': 'a.mp4'}, tmp_path)
+        assert not result_available({'result_files': {'master': 'a.mp4', 'poster': 'a.jpg'}}, tmp_path)
+        assert not result_available({'result_file': None}, tmp_path)
+
+
+class TestCheckpointKey:
+    """Test key ของ checkpoint งาน (ทำต่อข้าม job ได้ / ไม่ใช้ร่วมกับงานที่รันพร้อมกัน)"""
+    
+    def test_resubmitted_job_resumes(self):
+        """ส่งคลิปเดิมใหม่ (job_id ใหม่, key ต่างกัน) = checkpoint เดียวกัน"""
+        from modules.jobs import _checkpoint_key
+        
+        a = _checkpoint_key('j1', {'url': 'https://youtu.be/abc', 'api_key': 'k1'})
+        b = _checkpoint_key('j2', {'url': 'https://www.youtube.com/watch?v=abc', 'api_key': 'k2'})
+        assert a == b
+        assert a.startswith('job:')
+    
+    def test_output_options_separate(self):
+        """options ที่มีผลต่อ output / งานที่ไม่ผ่านการตรวจงานซ้ำ = ไม่ใช้ checkpoint ร่วมกัน"""
+        from modules.jobs import _checkpoint_key
+        
+        base = {'url': 'https://youtu.be/abc'}
+        keys = {
+            _checkpoint_key('j1', base),
+            _checkpoint_key('j1', {**base, 'use_avatar': False}),
+            _checkpoint_key('j1', {**base, 'refresh_script': True}),
+            _checkpoint_key('j2', {**base, 'refresh_script': True}),
+            _checkpoint_key('j3', {**base, 'force': True}),
+        }
+        assert len(keys) == 5
+    
+    def test_concurrent_jobs_same_clip(self, tmp_path, monkeypatch):
+        """งาน force ที่รันพร้อมงานปกติของคลิปเดียวกัน - งานที่จบก่อนไม่ลบไฟล์ของอีกงาน"""
+        import threading
+        import moviepy.editor
+        import modules.jobs as jobs
+        import modules.checkpoints as checkpoints
+        
+        monkeypatch.setattr(checkpoints, 'CHECKPOINT_DIR', tmp_path / 'checkpoints')
+        
+        class FakeBrain:
+            def __init__(self, keys):
+                pass
+            
+            def initialize(self, validate=True):
+                return True
+            
+            def generate_script(self, video_path, duration, on_progress=None, use_cache=True):
+                return 'ชื่อ', 'บท'
+        
+        class FakeDownloads:
+            def download(self, url, output_dir, on_progress=None):
+                path = Path(output_dir) / 'source.mp4'
+                path.write_bytes(b'video')
+                return {'path': str(path), 'error': None, 'bytes': 5, 'seconds': 1.0,
+                        'throughput': 5.0, 'cached': False, 'stalls': 0}
+        
+        class FakeClip:
+            duration = 10.0
+            
+            def __init__(self, path):
+                pass
+            
+            def close(self):
+                pass
+        
+        force_rendering, normal_done = threading.Event(), threading.Event()
+        seen = {}
+        
+        def fake_render(video_path, title, voice_path, **kwargs):
+            if title == 'final_forced':
+                force_rendering.set()
+                normal_done.wait(5)
+                seen['source'] = Path(video_path).exists()
+                seen['voice'] = Path(voice_path).exists()
+            return {'master': str(tmp_path / f'{title}.mp4')}
+        
+        monkeypatch.setattr(jobs, 'AIBrain', FakeBrain)
+        monkeypatch.setattr(jobs, 'get_download_manager', lambda: FakeDownloads())
+        monkeypatch.setattr(jobs, 'generate_voice_sync',
+                            lambda script, path, on_progress=None: Path(path).write_bytes(b'mp3'))
+        monkeypatch.setattr(jobs, 'process_video_renditions', fake_render)
+        monkeypatch.setattr(jobs, 'ensure_directories', lambda: None)
+        monkeypatch.setattr(moviepy.editor, 'VideoFileClip', FakeClip)
+        
+        params = {'url': 'https://youtu.be/abc', 'use_avatar': False, 'profiles': ['master']}
+        forced = threading.Thread(target=jobs.run_video_job,
+                                  args=('forced', {**params, 'force': True}, lambda **f: None))
+        forced.start()
+        assert force_rendering.wait(5)
+        jobs.run_video_job('normal', params, lambda **f: None)
+        normal_done.set()
+        forced.join(5)
+        
+        assert seen == {'source': True, 'voice': True}
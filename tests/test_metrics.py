@@ -0,0 +1,88 @@
+# =============================================================================
+# 🧪 TESTS - Metrics Module
+# =============================================================================
+
+import pytest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+@pytest.fixture
+def registry():
+    from modules.metrics import Registry, define_metrics
+    return define_metrics(Registry())
+
+
+class TestRegistry:
+    """Test counter / histogram + Prometheus text"""
+    
+    def test_histogram_buckets(self, registry):
+        """ค่าถูกนับในทุก bucket ที่ >= ค่า"""
+        registry.observe('stage_duration_seconds', 3, stage='tts')
+        registry.observe('stage_duration_seconds', 45, stage='tts')
+        text = registry.render()
+        
+        assert 'videofactory_stage_duration_seconds_bucket{stage="tts",le="2"} 0' in text
+        assert 'videofactory_stage_duration_seconds_bucket{stage="tts",le="5"} 1' in text
+        assert 'videofactory_stage_duration_seconds_bucket{stage="tts",le="60"} 2' in text
+        assert 'videofactory_stage_duration_seconds_bucket{stage="tts",le="+Inf"} 2' in text
+        assert 'videofactory_stage_duration_seconds_sum{stage="tts"} 48' in text
+        assert 'videofactory_stage_duration_seconds_count{stage="tts"} 2' in text
+    
+    def test_counter_and_types(self, registry):
+        """counter + # TYPE header"""
+        registry.inc('bytes_total', 1024, direction='download')
+        registry.inc('bytes_total', 1024, direction='download')
+        text = registry.render()
+        
+        assert '# TYPE videofactory_bytes_total counter' in text
+        assert 'videofactory_bytes_total{direction="download"} 2048' in text
+    
+    def test_merge_sums_processes(self, registry):
+        """รวม snapshot จากหลาย worker (JSON roundtrip)"""
+        import json
+        from modules.metrics import Registry, define_metrics, render_merged
+        
+        other = define_metrics(Registry())
+        registry.inc('jobs_total', status='completed')
+        other.inc('jobs_total', status='completed')
+        other.observe('stage_duration_seconds', 1, stage='render')
+        
+        snapshots = [json.loads(json.dumps(r.snapshot())) for r in (registry, other)]
+        text = render_merged(snapshots, gauges={'queue_depth': 3})
+        
+        assert 'videofactory_jobs_total{status="completed"} 2' in text
+        assert 'videofactory_stage_duration_seconds_count{stage="render"} 1' in text
+        assert 'videofactory_queue_depth 3' in text
+    
+    def test_write_file(self, registry, tmp_path):
+        """CLI เขียน metrics ลงไฟล์"""
+        registry.inc('jobs_total', status='failed')
+        registry.write(tmp_path / 'metrics.prom')
+        assert 'jobs_total{status="failed"} 1' in (tmp_path / 'metrics.prom').read_text()
+
+
+class TestHelpers:
+    """Test helper functions"""
+    
+    def test_key_label_hides_key(self):
+        """label ของ key ต้องไม่ใช่ key จริง"""
+        from modules.metrics import key_label
+        
+        assert key_label('AIzaSecretKey') != 'AIzaSecretKey'
+        assert len(key_label('AIzaSecretKey')) == 8
+        assert key_label('a') == key_label('a')
+    
+    def test_stage_timer_records_on_error(self):
+        """จับเวลาแม้ขั้นตอน error"""
+        from modules.metrics import REGISTRY, stage_timer
+        
+        before = REGISTRY.snapshot()['stage_duration_seconds']['samples']
+        count = sum(v[-2] for k, v in before if k == ['test_stage'])
+        with pytest.raises(ValueError):
+            with stage_timer('test_stage'):
+                raise ValueError()
+        after = REGISTRY.snapshot()['stage_duration_seconds']['samples']
+        assert sum(v[-2] for k, v in after if k == ['test_stage']) == count + 1
@@ -0,0 +1,94 @@
+# =============================================================================
+# 🧪 TESTS - Rate Limiter Module
+# =============================================================================
+
+import pytest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+@pytest.fixture
+def clock():
+    now = [100.0]
+    return now
+
+
+@pytest.fixture
+def limiter(clock):
+    from modules.rate_limiter import AdaptiveLimiter
+    return AdaptiveLimiter('gemini', start=30, min_rate=2, max_rate=60, step=1, clock=lambda: clock[0])
+
+
+class TestPacing:
+    """Test เว้นระยะตาม rate"""
+    
+    def test_no_wait_when_idle(self, limiter, clock):
+        """เรียกห่างกันพอ = ไม่ต้องรอเลย"""
+        assert limiter.reserve() == 0
+        clock[0] += 5
+        assert limiter.reserve() == 0
+    
+    def test_spacing_when_bursting(self, limiter):
+        """เรียกติดกัน = รอ 60/rate วินาทีต่อครั้ง"""
+        waits = [limiter.reserve() for _ in range(3)]
+        
+        assert waits == [0, 2.0, 4.0]
+
+
+class TestAIMD:
+    """Test ปรับ rate (additive increase / multiplicative decrease)"""
+    
+    def test_success_increases_to_max(self, limiter):
+        """สำเร็จ = +step ไม่เกิน max"""
+        for _ in range(50):
+            limiter.success()
+        
+        assert limiter.rate == 60
+    
+    def test_throttled_halves_and_pauses(self, limiter, clock):
+        """429 = rate ลดครึ่ง (ไม่ต่ำกว่า min) + พักตาม retry delay"""
+        limiter.throttled(retry_after=30)
+        
+        assert limiter.rate == 15
+        assert limiter.reserve() == 30
+        
+        for _ in range(10):
+            limiter.throttled()
+        assert limiter.rate == 2
+    
+    def test_retry_after_capped(self, limiter):
+        """retry delay ยาวมาก (quota รายวัน) ไม่รอเกิน MAX_RETRY_AFTER"""
+        from modules.rate_limiter import MAX_RETRY_AFTER
+        
+        limiter.throttled(retry_after=86400)
+        assert limiter.reserve() == MAX_RETRY_AFTER
+
+
+class TestHelpers:
+    """Test แยก error / retry delay / limiter กลาง"""
+    
+    def test_is_rate_limited(self):
+        """429 / quota = rate limit, error อื่นไม่ใช่"""
+        from modules.rate_limiter import is_rate_limited
+        
+        assert is_rate_limited(Exception('429 You exceeded your current quota'))
+        assert is_rate_limited(Exception("429, message='Invalid response status'"))
+        assert not is_rate_limited(Exception('404 model not found'))
+    
+    def test_retry_after(self):
+        """อ่าน retry delay จากข้อความของ Gemini"""
+        from modules.rate_limiter import retry_after
+        
+        assert retry_after(Exception('Please retry in 37.5s. retry_delay { seconds: 37 }')) == 37
+        assert retry_after(Exception('Please retry in 12.2s.')) == 12.2
+        assert retry_after(Exception('quota exceeded')) is None
+    
+    def test_limiter_per_key(self):
+        """limiter แยกต่อ key แต่ใช้ตัวเดิมทั้ง process"""
+        from modules.rate_limiter import get_limiter
+        
+        assert get_limiter('gemini', 'key-a') is get_limiter('gemini', 'key-a')
+        assert get_limiter('gemini', 'key-a') is not get_limiter('gemini', 'key-b')
+        assert get_limiter('tts').name == 'tts'
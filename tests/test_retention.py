@@ -0,0 +1,112 @@
+# =============================================================================
+# 🧪 TESTS - Retention Module
+# =============================================================================
+
+import os
+import time
+import pytest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+def _make(path: Path, size: int, age: float, now: float) -> Path:
+    """สร้างไฟล์ขนาด size ที่เขียน/ใช้ล่าสุดเมื่อ age วินาทีก่อน"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b'x' * size)
+    os.utime(path, (now - age, now - age))
+    return path
+
+
+class TestOutputBudget:
+    """Test disk budget / อายุไฟล์ output"""
+    
+    def test_deletes_expired(self, tmp_path):
+        """ไม่ได้ใช้นานเกิน max_age = ลบ"""
+        from modules.retention import enforce_output_budget
+        
+        now = time.time()
+        old = _make(tmp_path / 'old.mp4', 10, 100 * 86400, now)
+        new = _make(tmp_path / 'new.mp4', 10, 2 * 86400, now)
+        
+        result = enforce_output_budget(tmp_path, max_bytes=0, max_age=30 * 86400, grace=3600, now=now)
+        assert result['deleted'] == 1
+        assert not old.exists()
+        assert new.exists()
+    
+    def test_lru_until_under_budget(self, tmp_path):
+        """เกิน budget = ลบตัวที่ใช้ล่าสุดนานสุดก่อน"""
+        from modules.retention import enforce_output_budget
+        
+        now = time.time()
+        a = _make(tmp_path / 'a.mp4', 100, 5 * 86400, now)
+        b = _make(tmp_path / 'b.mp4', 100, 4 * 86400, now)
+        c = _make(tmp_path / 'c.mp4', 100, 3 * 86400, now)
+        
+        result = enforce_output_budget(tmp_path, max_bytes=250, max_age=0, grace=3600, now=now)
+        assert result == {'deleted': 1, 'freed_bytes': 100, 'remaining_bytes': 200}
+        assert not a.exists() and b.exists() and c.exists()
+    
+    def test_recent_download_counts_as_use(self, tmp_path):
+        """ไฟล์ที่เพิ่งถูกโหลด (mark_used) ไม่โดนลบก่อน"""
+        from modules.retention import enforce_output_budget, mark_used
+        
+        now = time.time()
+        a = _make(tmp_path / 'a.mp4', 100, 5 * 86400, now)
+        b = _make(tmp_path / 'b.mp4', 100, 4 * 86400, now)
+        mtime = a.stat().st_mtime
+        mark_used(a)
+        
+        enforce_output_budget(tmp_path, max_bytes=150, max_age=0, grace=3600, now=now)
+        assert a.exists() and not b.exists()
+        assert a.stat().st_mtime == mtime  # ETag ไม่เปลี่ยน
+    
+    def test_hls_dir_and_grace(self, tmp_path):
+        """โฟลเดอร์ HLS ลบทั้งโฟลเดอร์, ไฟล์ที่กำลังเขียนไม่ถูกลบ"""
+        from modules.retention import enforce_output_budget
+        
+        now = time.time()
+        _make(tmp_path / 'final_a_hls' / 'seg_0000.ts', 100, 5 * 86400, now)
+        _make(tmp_path / 'final_a_hls' / 'index.m3u8', 10, 5 * 86400, now)
+        rendering = _make(tmp_path / 'final_b.mp4', 500, 10, now)
+        
+        enforce_output_budget(tmp_path, max_bytes=1, max_age=0, grace=3600, now=now)
+        assert not (tmp_path / 'final_a_hls').exists()
+        assert rendering.exists()
+
+
+class TestTaskEviction:
+    """Test TTL ของสถานะงาน"""
+    
+    def test_evicts_old_finished_jobs(self, tmp_path):
+        """งานที่จบนานเกิน TTL ถูกลบพร้อม events, งานที่ยังรันอยู่ไม่ถูกลบ"""
+        from modules.broker import JobBroker
+        
+        broker = JobBroker(tmp_path / 'jobs.db')
+        broker.enqueue('done', {})
+        broker.complete('done', result_file='a.mp4')
+        broker.enqueue('open', {})
+        
+        assert broker.evict_finished(ttl_seconds=3600) == 0
+        assert broker.evict_finished(ttl_seconds=-1) == 1
+        assert broker.get('done') is None
+        assert broker.events_since('done') == []
+        assert broker.get('open') is not None
+    
+    def test_keeps_batch_until_items_finish(self, tmp_path):
+        """งานเตรียม batch อยู่จนงานย่อยจบ"""
+        from modules.broker import JobBroker
+        
+        broker = JobBroker(tmp_path / 'jobs.db')
+        broker.enqueue_batch('b', {'kind': 'batch'}, [('i1', {}, {})])
+        broker.claim('w1')
+        broker.release_batch('b')
+        broker.complete('b')
+        
+        broker.evict_finished(ttl_seconds=-1)
+        assert broker.batch_status('b') is not None
+        
+        broker.claim('w1')
+        broker.complete('i1')
+        assert broker.evict_finished(ttl_seconds=-1) == 2
@@ -0,0 +1,102 @@
+# =============================================================================
+# 🧪 TESTS - Script Cache Module
+# =============================================================================
+
+import pytest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    from modules.script_cache import ScriptCache
+    return ScriptCache(tmp_path / 'scripts')
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / 'clip.mp4'
+    path.write_bytes(b'video-bytes' * 100)
+    return path
+
+
+class TestKey:
+    """Test key ของบท"""
+    
+    def test_same_content_same_key(self, cache, video, tmp_path):
+        """ไฟล์เนื้อเดียวกันคนละ path (ดาวน์โหลดใหม่) = key เดียวกัน"""
+        copy = tmp_path / 'other' / 'renamed.mp4'
+        copy.parent.mkdir()
+        copy.write_bytes(video.read_bytes())
+        
+        assert cache.key(video, 30.1, 'm1', 1) == cache.key(copy, 30.2, 'm1', 1)
+    
+    def test_parameters_change_key(self, cache, video):
+        """model / prompt version / เสียง / ความยาว (ต่างช่วง) เปลี่ยน key"""
+        base = cache.key(video, 30.0, 'm1', 1, voice=['a'])
+        
+        assert cache.key(video, 30.0, 'm2', 1, voice=['a']) != base
+        assert cache.key(video, 30.0, 'm1', 2, voice=['a']) != base
+        assert cache.key(video, 30.0, 'm1', 1, voice=['b']) != base
+        assert cache.key(video, 31.0, 'm1', 1, voice=['a']) != base
+    
+    def test_content_changes_key(self, cache, video):
+        """เนื้อไฟล์เปลี่ยน = key ใหม่"""
+        before = cache.key(video, 30.0, 'm1', 1)
+        video.write_bytes(b'different')
+        
+        assert cache.key(video, 30.0, 'm1', 1) != before
+
+
+class TestStore:
+    """Test get / put"""
+    
+    def test_roundtrip(self, cache, video):
+        """put แล้ว get ได้ title / script / ความยาวที่วัดไว้"""
+        key = cache.key(video, 30.0, 'm1', 1)
+        assert cache.get(key) is None
+        
+        cache.put(key, 'ชื่อคลิป', 'บทพากย์', 29.4, model='m1')
+        entry = cache.get(key)
+        
+        assert (entry['title'], entry['script'], entry['audio_seconds']) == ('ชื่อคลิป', 'บทพากย์', 29.4)
+        assert entry['model'] == 'm1'
+        assert not list(cache.cache_dir.glob('.*.tmp'))
+    
+    def test_corrupt_entry_is_miss(self, cache, video):
+        """ไฟล์เสีย / บทว่าง = miss"""
+        key = cache.key(video, 30.0, 'm1', 1)
+        cache.put(key, 'title', 'script', 30.0)
+        cache._path(key).write_text('{broken', encoding='utf-8')
+        
+        assert cache.get(key) is None
+        
+        cache.put(key, 'title', '', 30.0)
+        assert cache.get(key) is None
+
+
+class TestPrune:
+    """Test prune_script_cache"""
+    
+    def test_prunes_unused_entries(self, cache, video):
+        """บทที่ไม่ได้ get นานเกิน max age ถูกลบ - ตัวที่เพิ่งใช้อยู่ต่อ"""
+        import os
+        import time
+        from modules.script_cache import prune_script_cache
+        
+        old_key = cache.key(video, 30.0, 'm1', 1)
+        used_key = cache.key(video, 60.0, 'm1', 1)
+        cache.put(old_key, 'old', 'บทเก่า', 30.0)
+        cache.put(used_key, 'used', 'บทที่ใช้', 60.0)
+        week_ago = time.time() - 7 * 24 * 3600
+        for key in (old_key, used_key):
+            os.utime(cache._path(key), (week_ago, week_ago))
+        assert cache.get(used_key) is not None  # mark_used
+        
+        result = prune_script_cache(cache.cache_dir, max_bytes=0, max_age=24 * 3600)
+        
+        assert result['deleted'] == 1
+        assert cache.get(old_key) is None
+        assert cache.get(used_key)['title'] == 'used'
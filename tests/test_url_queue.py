@@ -0,0 +1,263 @@
+# =============================================================================
+# 🧪 TESTS - URL Queue Module
+# =============================================================================
+
+import pytest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+@pytest.fixture
+def queue(tmp_path):
+    from modules.url_queue import UrlQueue
+    return UrlQueue(tmp_path / 'urls.db', max_attempts=2)
+
+
+class TestEnqueue:
+    """Test เพิ่ม URL + กันซ้ำ"""
+    
+    def test_add_dedupes(self, queue):
+        """URL ซ้ำ (รวมรูปแบบต่างกันของคลิปเดียวกัน) เข้าคิวครั้งเดียว"""
+        added = queue.add([
+            'https://youtube.com/shorts/abc123',
+            'https://www.youtube.com/shorts/abc123?si=share',
+            'https://youtube.com/shorts/def456',
+            '  ',
+        ])
+        
+        assert added == 2
+        assert queue.add(['https://youtube.com/shorts/abc123']) == 0
+        assert queue.counts()['queued'] == 2
+    
+    def test_canonical_forms_dedupe(self, queue):
+        """youtu.be / watch?v=&t= / shorts ของคลิปเดียวกัน = รายการเดียว"""
+        added = queue.add([
+            'https://youtu.be/dQw4w9WgXcQ',
+            'https://youtube.com/watch?v=dQw4w9WgXcQ&t=5',
+            'https://www.youtube.com/shorts/dQw4w9WgXcQ',
+        ])
+        
+        assert added == 1
+    
+    def test_history_blocks_completed(self, queue):
+        """คลิปที่ทำเสร็จแล้ว (ในรูป URL อื่น) ไม่กลับเข้าคิว"""
+        queue.add(['https://youtu.be/dQw4w9WgXcQ'])
+        queue.complete(queue.claim('w1')['id'], 'w1')
+        
+        assert queue.add(['https://www.youtube.com/shorts/dQw4w9WgXcQ']) == 0
+        assert queue.lookup('https://youtube.com/watch?v=dQw4w9WgXcQ')['status'] == 'done'
+        assert queue.lookup('https://youtu.be/other') is None
+    
+    def test_migrates_old_keys(self, tmp_path):
+        """DB ที่ใช้ key แบบเก่า ถูกคำนวณใหม่ + รวมรายการซ้ำ (เก็บตัวที่ done)"""
+        import sqlite3
+        from modules.url_queue import UrlQueue, SCHEMA
+        
+        db = tmp_path / 'old.db'
+        conn = sqlite3.connect(db)
+        conn.executescript(SCHEMA)
+        conn.executemany(
+            "INSERT INTO urls (queue, url, url_key, status, created_at, updated_at) "
+            "VALUES ('factory', ?, ?, ?, 0, 0)",
+            [
+                ('https://youtu.be/abc?t=5', 'https://youtube.com/watch?t=5&v=abc', 'queued'),
+                ('https://youtu.be/abc', 'https://youtube.com/watch?v=abc', 'done'),
+            ]
+        )
+        conn.commit()
+        conn.close()
+        
+        queue = UrlQueue(db)
+        assert queue.counts()['done'] == 1
+        assert queue.counts()['queued'] == 0
+        assert queue.lookup('https://youtube.com/shorts/abc')['status'] == 'done'
+    
+    def test_requeue_finished(self, queue):
+        """requeue=True ให้ URL ที่ทำเสร็จแล้วกลับเข้าคิว"""
+        queue.add(['https://youtube.com/shorts/abc123'])
+        item = queue.claim('w1')
+        queue.complete(item['id'], 'w1')
+        
+        assert queue.add(['https://youtube.com/shorts/abc123']) == 0
+        assert queue.add(['https://youtube.com/shorts/abc123'], requeue=True) == 1
+        assert queue.counts()['queued'] == 1
+    
+    def test_large_queue(self, queue):
+        """10k URLs เพิ่มได้ใน transaction เดียว"""
+        urls = [f'https://youtube.com/shorts/v{i}' for i in range(10000)]
+        
+        assert queue.add(urls) == 10000
+        assert queue.add(urls) == 0
+        assert queue.claim('w1')['url'] == urls[0]
+
+
+class TestClaim:
+    """Test claim / lease / retry"""
+    
+    def test_fifo_and_complete(self, queue):
+        """ได้ URL ตามลำดับที่เพิ่ม"""
+        queue.add(['https://youtube.com/shorts/a', 'https://youtube.com/shorts/b'])
+        first = queue.claim('w1')
+        second = queue.claim('w1')
+        
+        assert first['url'].endswith('/a')
+        assert second['url'].endswith('/b')
+        assert queue.claim('w1') is None
+        
+        queue.complete(first['id'], 'w1')
+        assert queue.counts() == {'queued': 0, 'running': 1, 'done': 1, 'failed': 0}
+    
+    def test_fail_retries_then_gives_up(self, queue):
+        """fail กลับเข้าคิวหลัง URL ใหม่ จนครบ max_attempts แล้วเป็น failed"""
+        queue.add(['https://youtube.com/shorts/a', 'https://youtube.com/shorts/b'])
+        item = queue.claim('w1')
+        
+        assert queue.fail(item['id'], 'Download failed', 'w1') == 'queued'
+        assert queue.claim('w1')['url'].endswith('/b')
+        
+        retry = queue.claim('w1')
+        assert retry['id'] == item['id']
+        assert retry['attempts'] == 2
+        assert queue.fail(retry['id'], 'Download failed', 'w1') == 'failed'
+        
+        failed = queue.items(('failed',))
+        assert failed[0]['last_error'] == 'Download failed'
+        assert queue.retry_failed() == 1
+        assert queue.counts()['queued'] == 1
+    
+    def test_expired_lease_reclaimed(self, queue):
+        """process ตาย (lease หมด) = URL ถูก claim ใหม่ได้"""
+        queue.add(['https://youtube.com/shorts/a'])
+        item = queue.claim('dead', lease_seconds=0.001)
+        import time
+        time.sleep(0.01)
+        
+        again = queue.claim('w2')
+        assert again['id'] == item['id']
+        assert again['attempts'] == 2
+    
+    def test_release_does_not_count_attempt(self, queue):
+        """release (Ctrl+C) คืนเข้าคิวโดยไม่นับ attempt"""
+        queue.add(['https://youtube.com/shorts/a'])
+        item = queue.claim('w1')
+        queue.release(item['id'], 'w1')
+        
+        assert queue.claim('w1')['attempts'] == 1
+    
+    def test_stale_worker_cannot_finish(self, queue):
+        """worker ที่ lease หลุด complete / fail / release ไม่ได้ - ไม่ทับสถานะของ worker ที่ claim ต่อ"""
+        import time
+        queue.add(['https://youtube.com/shorts/a'])
+        item = queue.claim('slow', lease_seconds=0.001)
+        time.sleep(0.01)
+        again = queue.claim('w2')
+        assert again['id'] == item['id']
+        
+        assert queue.fail(item['id'], 'Download failed', 'slow') is None
+        assert queue.complete(item['id'], 'slow') is False
+        queue.release(item['id'], 'slow')
+        assert queue.counts()['running'] == 1
+        
+        assert queue.complete(again['id'], 'w2') is True
+        assert queue.counts()['done'] == 1
+        assert queue.complete(again['id'], 'w2') is False
+
+
+class TestPrefetch:
+    """Test ดึง metadata ล่วงหน้า + คลิปสั้นก่อน + limit"""
+    
+    INFOS = {
+        'https://youtube.com/shorts/long': {'duration': 600, 'filesize': 80_000_000},
+        'https://youtube.com/shorts/short': {'duration': 20, 'filesize': 2_000_000},
+        'https://youtube.com/shorts/mid': {'duration': 45},
+        'https://youtube.com/shorts/huge': {'duration': 5000},
+    }
+    
+    def _info_many(self, calls):
+        def info_many(urls):
+            calls.append(list(urls))
+            return {url: self.INFOS.get(url) for url in urls}
+        return info_many
+    
+    def test_shortest_first(self, queue):
+        """claim เรียงตาม duration ไม่ใช่ลำดับที่เพิ่ม"""
+        queue.add([
+            'https://youtube.com/shorts/long',
+            'https://youtube.com/shorts/short',
+            'https://youtube.com/shorts/mid',
+        ])
+        result = queue.prefetch(self._info_many([]))
+        
+        assert result == {'probed': 3, 'rejected': []}
+        order = [queue.claim('w1')['url'].rsplit('/', 1)[-1] for _ in range(3)]
+        assert order == ['short', 'mid', 'long']
+    
+    def test_rejects_over_limit_before_download(self, queue):
+        """ยาวเกิน MAX_SOURCE_SECONDS = failed ทันที ไม่ถูก claim"""
+        queue.add(['https://youtube.com/shorts/huge', 'https://youtube.com/shorts/short'])
+        result = queue.prefetch(self._info_many([]))
+        
+        assert result['rejected'][0][0] == 'https://youtube.com/shorts/huge'
+        assert queue.claim('w1')['url'].endswith('/short')
+        assert queue.claim('w1') is None
+        assert queue.items(('failed',))[0]['last_error'].startswith('Too long')
+    
+    def test_probes_once(self, queue):
+        """URL ที่ดึงแล้ว (รวมที่ดึงไม่ได้) ไม่ถูกดึงซ้ำ"""
+        calls = []
+        queue.add(['https://youtube.com/shorts/short', 'https://youtube.com/shorts/gone'])
+        queue.prefetch(self._info_many(calls))
+        queue.add(['https://youtube.com/shorts/mid'])
+        queue.prefetch(self._info_many(calls))
+        
+        assert calls == [
+            ['https://youtube.com/shorts/short', 'https://youtube.com/shorts/gone'],
+            ['https://youtube.com/shorts/mid'],
+        ]
+        assert queue.prefetch(self._info_many(calls))['probed'] == 0
+    
+    def test_old_db_gets_columns(self, tmp_path):
+        """DB ก่อนมี metadata ถูกเพิ่มคอลัมน์ตอนเปิด"""
+        import sqlite3
+        from modules.url_queue import UrlQueue
+        
+        db = tmp_path / 'old.db'
+        conn = sqlite3.connect(db)
+        conn.executescript(
+            "CREATE TABLE urls (id INTEGER PRIMARY KEY AUTOINCREMENT, queue TEXT NOT NULL, "
+            "url TEXT NOT NULL, url_key TEXT NOT NULL, status TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT, worker TEXT, lease_until REAL, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL);"
+        )
+        conn.close()
+        
+        queue = UrlQueue(db)
+        queue.add(['https://youtube.com/shorts/mid'])
+        
+        assert queue.prefetch(self._info_many([]))['probed'] == 1
+        assert queue.items()[0]['duration'] == 45
+
+
+class TestUrlsFile:
+    """Test import / export urls.txt"""
+    
+    def test_import_export_roundtrip(self, queue, tmp_path):
+        """export เขียนเฉพาะ URL ที่ยังไม่เสร็จ"""
+        url_file = tmp_path / 'urls.txt'
+        url_file.write_text(
+            'https://youtube.com/shorts/a\n\nhttps://youtube.com/shorts/b\n', encoding='utf-8'
+        )
+        
+        assert queue.import_file(url_file) == 2
+        assert queue.import_file(url_file) == 0
+        
+        queue.complete(queue.claim('w1')['id'], 'w1')
+        assert queue.export_file(url_file) == 1
+        assert url_file.read_text(encoding='utf-8') == 'https://youtube.com/shorts/b\n'
+        assert not (tmp_path / 'urls.txt.tmp').exists()
+    
+    def test_import_missing_file(self, queue, tmp_path):
+        """ไม่มีไฟล์ = ไม่มี URL ใหม่"""
+        assert queue.import_file(tmp_path / 'missing.txt') == 0
@@ -0,0 +1,195 @@
+# =============================================================================
+# 🧪 TESTS - Video Processor Module
+# =============================================================================
+
+import pytest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+class TestOutputProfiles:
+    """Test output profile resolution"""
+    
+    def test_default_profiles(self):
+        """ไม่ระบุ = ใช้ DEFAULT_OUTPUT_PROFILES"""
+        from modules.video_processor import resolve_output_profiles
+        from config.settings import DEFAULT_OUTPUT_PROFILES
+        
+        profiles = resolve_output_profiles()
+        assert [p['name'] for p in profiles] == DEFAULT_OUTPUT_PROFILES
+    
+    def test_preset_names(self):
+        """ใช้ชื่อ preset ได้"""
+        from modules.video_processor import resolve_output_profiles
+        
+        profiles = resolve_output_profiles(['master', '720p', 'poster'])
+        assert profiles[1]['width'] == 720
+        assert profiles[2]['kind'] == 'thumbnail'
+        assert 'at' in profiles[2]
+    
+    def test_custom_profile_defaults(self):
+        """dict profile เติมค่า default ให้"""
+        from modules.video_processor import resolve_output_profiles
+        from config.settings import VIDEO_BITRATE
+        
+        profiles = resolve_output_profiles([{'name': 'square', 'width': 1080, 'height': 1080}])
+        assert profiles[0]['kind'] == 'video'
+        assert profiles[0]['bitrate'] == VIDEO_BITRATE
+    
+    def test_unknown_preset(self):
+        """ชื่อ preset ไม่ถูกต้อง"""
+        from modules.video_processor import resolve_output_profiles
+        
+        with pytest.raises(ValueError):
+            resolve_output_profiles(['8k'])
+    
+    def test_duplicate_names(self):
+        """ชื่อซ้ำ = error"""
+        from modules.video_processor import resolve_output_profiles
+        
+        with pytest.raises(ValueError):
+            resolve_output_profiles(['master', 'master'])
+
+
+class TestRenditionGraph:
+    """Test ffmpeg split graph"""
+    
+    def test_single_split_for_all_outputs(self):
+        """decode/composite ครั้งเดียว แล้ว split ตามจำนวน output"""
+        from modules.video_processor import resolve_output_profiles, build_rendition_graph
+        
+        profiles = resolve_output_profiles(['master', '720p', 'poster'])
+        graph, labels = build_rendition_graph(profiles, has_avatar=True)
+        
+        assert graph.count('[0:v]') == 1
+        assert graph.count('overlay=') == 1
+        assert 'split=3' in graph
+        assert labels == ['[o0]', '[o1]', '[o2]']
+    
+    def test_without_avatar(self):
+        """ไม่มี avatar = ไม่มี overlay"""
+        from modules.video_processor import resolve_output_profiles, build_rendition_graph
+        
+        graph, _ = build_rendition_graph(resolve_output_profiles(['master']), has_avatar=False)
+        assert 'overlay' not in graph
+        assert '[2:v]' not in graph
+
+
+class TestEncodingSelection:
+    """Test content-adaptive encoding"""
+    
+    def test_bitrate_mode(self):
+        """โหมด bitrate = ค่าเดิม VIDEO_BITRATE"""
+        from modules.video_processor import choose_encoding, encoding_args
+        from config.settings import VIDEO_BITRATE
+        
+        encoding = choose_encoding(mode='bitrate')
+        assert encoding['bitrate'] == VIDEO_BITRATE
+        assert encoding_args(encoding) == ['-b:v', VIDEO_BITRATE]
+    
+    def test_crf_mode_has_vbv_cap(self):
+        """โหมด crf มี maxrate/bufsize"""
+        from modules.video_processor import choose_encoding, encoding_args
+        
+        args = encoding_args(choose_encoding(mode='crf'))
+        assert '-crf' in args
+        assert '-maxrate' in args
+        assert '-bufsize' in args
+    
+    def test_adaptive_tiers(self, monkeypatch):
+        """source ซับซ้อนมากได้ CRF ต่ำกว่า + cap สูงกว่า"""
+        import modules.video_processor as vp
+        
+        monkeypatch.setattr(vp, 'probe_complexity', lambda path: 50.0)
+        static = vp.choose_encoding('static.mp4', mode='adaptive')
+        monkeypatch.setattr(vp, 'probe_complexity', lambda path: 2000.0)
+        motion = vp.choose_encoding('motion.mp4', mode='adaptive')
+        
+        assert static['crf'] > motion['crf']
+        assert vp._kbps(static['maxrate']) < vp._kbps(motion['maxrate'])
+    
+    def test_adaptive_falls_back_without_probe(self, monkeypatch):
+        """probe ไม่ได้ = fixed bitrate"""
+        import modules.video_processor as vp
+        
+        monkeypatch.setattr(vp, 'probe_complexity', lambda path: None)
+        assert vp.choose_encoding('broken.mp4', mode='adaptive')['mode'] == 'bitrate'
+    
+    def test_probe_uses_encoded_duration(self, monkeypatch):
+        """คลิปสั้นกว่า probe window = หารด้วยความยาวที่ ffmpeg encode จริง (ไม่เปิด source ซ้ำ)"""
+        import subprocess
+        import modules.video_processor as vp
+        
+        def fake_run(cmd, **kwargs):
+            stderr = b"out_time_us=1000000\nprogress=continue\nout_time_us=2000000\nprogress=end\n"
+            return subprocess.CompletedProcess(cmd, 0, stdout=b'x' * 25000, stderr=stderr)
+        
+        monkeypatch.setattr(vp.subprocess, 'run', fake_run)
+        
+        assert vp.probe_complexity('short.mp4', seconds=5.0) == 100.0
+    
+    def test_rendition_cap_scales(self):
+        """rendition เล็กได้ cap ต่ำลงตามจำนวน pixel"""
+        from modules.video_processor import encoding_args
+        
+        encoding = {'mode': 'crf', 'crf': 23, 'maxrate': '4000k', 'bufsize': '8000k'}
+        args = encoding_args(encoding, pixel_scale=0.5)
+        assert args[args.index('-maxrate') + 1] == '2000k'
+
+
+class TestHLSProfile:
+    """Test HLS output profile"""
+    
+    def test_hls_profile_in_graph(self):
+        """hls เป็นอีก branch หนึ่งของ split เดียวกัน"""
+        from modules.video_processor import resolve_output_profiles, build_rendition_graph
+        
+        profiles = resolve_output_profiles(['master', 'hls'])
+        assert profiles[1]['kind'] == 'hls'
+        assert 'bitrate' in profiles[1]
+        
+        graph, labels = build_rendition_graph(profiles, has_avatar=False)
+        assert 'split=2' in graph
+        assert len(labels) == 2
+    
+    def test_hls_dir_naming(self):
+        """playlist อยู่ใน <base>_hls/"""
+        from modules.video_processor import hls_dir_for
+        
+        assert hls_dir_for(Path('/out/final_abc')) == Path('/out/final_abc_hls')
+
+
+class TestRenderRenditions:
+    """Test คำสั่ง render (ไม่รัน ffmpeg จริง)"""
+    
+    def test_thumbnail_clamped_to_short_clip(self, tmp_path, monkeypatch):
+        """thumbnail ที่ตั้งเวลาเลยความยาวคลิป ถูกขยับมากลางคลิป"""
+        import modules.video_processor as vp
+        
+        commands = []
+        monkeypatch.setattr(vp, '_run_ffmpeg_with_progress', lambda cmd, frames, cb: commands.append(cmd))
+        monkeypatch.setattr(vp, '_count_output_bytes', lambda paths: None)
+        profiles = vp.resolve_output_profiles([{'name': 'poster', 'kind': 'thumbnail', 'at': 5.0}])
+        
+        vp.render_renditions('in.mp4', 'a.m4a', tmp_path / 'Ep.2 final', profiles, 2.0, add_avatar=False)
+        
+        graph = commands[0][commands[0].index('-filter_complex') + 1]
+        assert 'trim=start=1.0,' in graph
+        assert profiles[0]['at'] == 5.0
+    
+    def test_outputs_taken_checks_every_rendition(self, tmp_path):
+        """ไม่มี master แต่ rendition / thumbnail / โฟลเดอร์ hls ของคลิปก่อนมีอยู่ = ชื่อนี้ใช้ไม่ได้"""
+        import modules.video_processor as vp
+        
+        profiles = vp.resolve_output_profiles(['720p', 'poster', 'hls'])
+        base = tmp_path / 'Ep.2 final'
+        assert not vp._outputs_taken(base, profiles)
+        
+        (tmp_path / 'Ep.2 final_720p.mp4').write_bytes(b'x')
+        assert vp._outputs_taken(base, profiles)
+        assert not vp._outputs_taken(base, vp.resolve_output_profiles(['poster']))
+        
+        vp.hls_dir_for(base).mkdir()
+        assert vp._outputs_taken(base, vp.resolve_output_profiles(['hls']))
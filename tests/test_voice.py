@@ -78,3 +78,69 @@ class TestAudioDuration:
         duration = get_audio_duration("สวัสดีครับ นี่คือการทดสอบ")
         assert isinstance(duration, float)
         assert duration > 0
+
+
+class TestSentenceCache:
+    """Test เสียงรายประโยค (สังเคราะห์เฉพาะประโยคที่ยังไม่มี)"""
+    
+    @pytest.fixture
+    def fake_tts(self, monkeypatch):
+        import modules.voice as voice
+        
+        calls = []
+        
+        async def fake_generate(text, output_path, on_progress=None):
+            calls.append(text)
+            Path(output_path).write_text(text, encoding='utf-8')
+            return output_path
+        
+        monkeypatch.setattr(voice, 'generate_voice', fake_generate)
+        monkeypatch.setattr(voice, '_file_duration', lambda path: len(Path(path).read_text(encoding='utf-8')) / 10)
+        return calls
+    
+    def test_only_new_sentences_synthesized(self, fake_tts, tmp_path):
+        """ประโยคที่เคยวัดแล้วใช้เสียงใน cache"""
+        from modules.voice import sentence_durations
+        
+        assert sentence_durations(['aaaa', 'bb'], cache_dir=tmp_path) == [0.4, 0.2]
+        assert sentence_durations(['bb', 'cccccc'], cache_dir=tmp_path) == [0.2, 0.6]
+        
+        assert sorted(fake_tts) == ['aaaa', 'bb', 'cccccc']
+        assert not list(tmp_path.glob('.*.tmp'))
+    
+    def test_voice_settings_change_key(self, fake_tts, tmp_path, monkeypatch):
+        """เปลี่ยนเสียงพากย์ = สังเคราะห์ใหม่"""
+        import modules.voice as voice
+        
+        voice.sentence_durations(['aaaa'], cache_dir=tmp_path)
+        monkeypatch.setattr(voice, 'VOICE_RATE', '+20%')
+        voice.sentence_durations(['aaaa'], cache_dir=tmp_path)
+        
+        assert fake_tts == ['aaaa', 'aaaa']
+    
+    def test_clip_padding(self, fake_tts, tmp_path, monkeypatch):
+        """ช่วงเงียบต่อคลิป = d(A) + d(B) - d("A B") / วัดครั้งเดียว"""
+        import modules.voice as voice
+        
+        monkeypatch.setattr(voice, 'PADDING_PROBE', ('aaaa', 'bb'))
+        voice.clip_padding.cache_clear()
+        try:
+            # fake: ความยาว = จำนวนตัวอักษร / 10 -> 0.4 + 0.2 - 0.7 < 0 = ไม่มีช่วงเงียบ
+            assert voice.clip_padding(tmp_path) == 0.0
+            voice.clip_padding(tmp_path)
+            assert sorted(fake_tts) == ['aaaa', 'aaaa bb', 'bb']
+        finally:
+            voice.clip_padding.cache_clear()
+    
+    def test_measured_script_reused_for_final_voice(self, fake_tts, tmp_path, monkeypatch):
+        """บทที่วัดความยาวแล้ว = เสียงจริงใช้ไฟล์จาก cache ไม่สังเคราะห์ซ้ำ"""
+        import modules.voice as voice
+        
+        monkeypatch.setattr(voice, 'TTS_CACHE_DIR', tmp_path / 'tts')
+        
+        assert voice.get_audio_duration('บทเต็ม') == 0.6
+        voice.generate_voice_sync('บทเต็ม', str(tmp_path / 'voice.mp3'))
+        voice.generate_voice_sync('บทอื่น', str(tmp_path / 'other.mp3'))
+        
+        assert (tmp_path / 'voice.mp3').read_text(encoding='utf-8') == 'บทเต็ม'
+        assert fake_tts == ['บทเต็ม', 'บทอื่น']
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# =============================================================================
+# 👷 AI VIDEO FACTORY - RENDER WORKER
+# =============================================================================
+# รับงานจาก job broker (SQLite) แล้วรันนอก API server
+# - API server แค่ enqueue / รายงานสถานะ -> ตอบเร็วเสมอแม้กำลัง render
+# - เพิ่ม/ลด worker ได้อิสระ (ใช้ BROKER_DB เดียวกัน)
+#
+# Usage:
+#   python worker.py            # 1 worker process
+#   python worker.py -n 4       # 4 worker processes
+
+import os
+import time
+import socket
+import argparse
+import threading
+import traceback
+import multiprocessing
+
+from config.settings import (
+    API_WORKERS, WORKER_LEASE_SECONDS, WORKER_POLL_INTERVAL, ensure_directories
+)
+from modules.broker import JobBroker
+from modules.jobs import run_video_job, prepare_batch
+from modules.metrics import REGISTRY, observe_stage, count_job
+
+# =============================================================================
+# 👷 WORKER LOOP
+# =============================================================================
+
+def _heartbeat_loop(broker: JobBroker, worker_id: str, state: dict, stop: threading.Event) -> None:
+    """ต่อ lease ของงานที่กำลังทำเรื่อยๆ (ถ้า worker ตาย lease หมด งานกลับเข้าคิว)"""
+    while not stop.wait(WORKER_LEASE_SECONDS / 3):
+        try:
+            broker.heartbeat(worker_id, state.get("job_id"))
+            broker.save_metrics(worker_id, REGISTRY.snapshot())
+        except Exception as e:
+            print(f"⚠️ [{worker_id}] heartbeat error: {e}")
+
+
+def _run_batch_prep(broker: JobBroker, worker_id: str, job_id: str, payload: dict, report, emit) -> None:
+    """งานเตรียม batch: เตรียมของร่วม แล้วปล่อยงานย่อยเข้าคิว"""
+    try:
+        result = prepare_batch(job_id, payload, report, emit)
+    except Exception as e:
+        broker.release_batch(job_id, error=str(e))
+        raise
+    
+    released = broker.release_batch(job_id, result["items"], shared=result["shared"])
+    broker.complete(job_id, worker_id, released=released)
+    if released == 0:
+        _cleanup_batch(broker, job_id, result["shared"].get("avatar_path"))
+
+
+def _cleanup_batch(broker: JobBroker, batch_id: str, avatar_path: str) -> None:
+    """ลบ avatar ที่ batch ใช้ร่วมกันเมื่องานย่อยจบหมดแล้ว"""
+    if not avatar_path or broker.batch_open_items(batch_id) > 0:
+        return
+    try:
+        os.remove(avatar_path)
+    except OSError:
+        pass
+
+
+def run_worker(worker_id: str = None, once: bool = False) -> None:
+    """
+    วน claim งาน -> รัน -> complete/fail
+    
+    Args:
+        worker_id: ชื่อ worker (default: host-pid)
+        once: รันงานเดียวแล้วจบ (ใช้ทดสอบ)
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    ensure_directories()
+    broker = JobBroker()
+    broker.register_worker(worker_id, os.getpid())
+    
+    state = {"job_id": None}
+    stop = threading.Event()
+    threading.Thread(
+        target=_heartbeat_loop, args=(broker, worker_id, state, stop), daemon=True
+    ).start()
+    
+    print(f"👷 Worker {worker_id} พร้อมรับงาน")
+    
+    try:
+        while True:
+            job = broker.claim(worker_id)
+            if job is None:
+                if once:
+                    return
+                time.sleep(WORKER_POLL_INTERVAL)
+                continue
+            
+            job_id = job["id"]
+            payload = job["payload"]
+            state["job_id"] = job_id
+            print(f"🎬 [{worker_id}] เริ่มงาน {job_id} (attempt {job['attempts']})")
+            observe_stage("queue_wait", time.time() - job["created_at"])
+            job_start = time.perf_counter()
+            status = "failed"
+            
+            try:
+                broker.update(job_id, message="Starting...")
+                report = lambda **fields: broker.update(job_id, **fields)
+                if payload.get("kind") == "batch":
+                    _run_batch_prep(broker, worker_id, job_id, payload, report, broker.emitter(job_id))
+                else:
+                    result = run_video_job(job_id, payload, report=report, emit=broker.emitter(job_id))
+                    if not broker.complete(job_id, worker_id, **result):
+                        print(f"⚠️ [{worker_id}] lease ของงาน {job_id} หมดแล้ว - ไม่บันทึกผล")
+                status = "completed"
+                print(f"✅ [{worker_id}] งาน {job_id} เสร็จ")
+            except Exception as e:
+                traceback.print_exc()
+                if not broker.fail(job_id, str(e), worker_id):
+                    print(f"⚠️ [{worker_id}] lease ของงาน {job_id} หมดแล้ว - ไม่บันทึก error")
+                print(f"❌ [{worker_id}] งาน {job_id} ล้มเหลว: {e}")
+            finally:
+                state["job_id"] = None
+                if payload.get("kind") != "batch":
+                    observe_stage("job", time.perf_counter() - job_start)
+                    count_job(status)
+                broker.heartbeat(worker_id)
+                broker.save_metrics(worker_id, REGISTRY.snapshot())
+                if payload.get("batch_id"):
+                    _cleanup_batch(broker, payload["batch_id"], payload.get("avatar_path"))
+            
+            if once:
+                return
+    
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        broker.unregister_worker(worker_id)
+
+
+def run_pool(count: int) -> None:
+    """รัน worker หลาย process (แต่ละ process ทำทีละงาน)"""
+    if count <= 1:
+        run_worker()
+        return
+    
+    processes = [
+        multiprocessing.Process(target=run_worker, name=f"worker-{i+1}")
+        for i in range(count)
+    ]
+    for p in processes:
+        p.start()
+    
+    try:
+        for p in processes:
+            p.join()
+    except KeyboardInterrupt:
+        for p in processes:
+            p.terminate()
+
+
+# =============================================================================
+# 🚀 CLI
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="AI Video Factory - Render Worker")
+    parser.add_argument(
+        '--workers', '-n',
+        type=int,
+        default=1,
+        help=f'จำนวน worker processes (api.py ใช้ {API_WORKERS})'
+    )
+    args = parser.parse_args()
+    
+    run_pool(args.workers)
+
+
+if __name__ == "__main__":
+    main()